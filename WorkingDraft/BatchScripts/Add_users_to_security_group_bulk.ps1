@@ -0,0 +1,46 @@
+$ErrorActionPreference = 'STOP'
+$result = [PSCustomObject]@{
+    Status         = ""
+    OutputMessage  = ""
+    ErrorMessage   = ""
+    Results        = @()
+}
+try{   
+    
+    $Group = $ADDITIONAL_VARIABLES.uniquegroupname
+    $Members = @($ADDITIONAL_VARIABLES.Members | ForEach-Object { $_.trim() })
+    
+    try
+    {
+        # One round trip for the whole batch
+        Add-ADGroupMember $Group -Members $Members
+        $result.Results = @($Members | ForEach-Object { [PSCustomObject]@{ Member = $_; Status = "Success"; ErrorMessage = "" } })
+    }
+    catch
+    {
+        # The bulk call is all-or-nothing; retry one by one to find the failing members
+        $result.Results = @($Members | ForEach-Object {
+            $member = $_
+            try
+            {
+                Add-ADGroupMember $Group -Members $member
+                [PSCustomObject]@{ Member = $member; Status = "Success"; ErrorMessage = "" }
+            }
+            catch
+            {
+                [PSCustomObject]@{ Member = $member; Status = "Error"; ErrorMessage = "ErrorCode: "+$_.Exception.Message }
+            }
+        })
+    }
+    $result.OutputMessage = "Processed "+$Members.Count+" member(s) for "+$Group+" security group"
+    $result.Status = "Success"
+}catch
+{
+    $result.ErrorMessage= "ErrorCode: "+$_.Exception.Message
+    $result.Status = "Error"
+            
+}
+
+$result = $result | ConvertTo-Json -Depth 4
+
+$result
@@ -1,7 +1,8 @@
-from pydantic import BaseModel
+from pydantic import BaseModel, Field
 from typing import List, Optional
 
 class Task(BaseModel):
+    sys_id: Optional[str] = None
     parent: Optional[str]
     made_sla: str
     watch_list: Optional[str]
@@ -84,4 +85,18 @@ class Task(BaseModel):
     location: Optional[str]
 
 class APIResponse(BaseModel):
-    result: List[Task]
+    result: List[Task] = Field(min_length=1)
+
+class LeanTask(BaseModel):
+    """The sc_task fields the flows read; everything else in the payload is ignored."""
+    sys_id: str
+    sys_class_name: str
+    number: str
+    short_description: str
+    description: Optional[str] = None
+    # Read by the closed-ticket check, so a submission carries its own status.
+    state: Optional[str] = None
+    active: Optional[str] = None
+
+class LeanAPIResponse(BaseModel):
+    result: List[LeanTask] = Field(min_length=1)
@@ -0,0 +1,105 @@
+import os
+import json
+import time
+import asyncio
+
+import aiosqlite
+
+import metrics
+
+# -----------------------------------------------------------------------
+# Action Journal Configuration
+# -----------------------------------------------------------------------
+ACTION_JOURNAL_PATH = os.getenv("ACTION_JOURNAL_PATH", "state_db/action_journal.sqlite")
+ACTION_JOURNAL_RETENTION_DAYS = float(os.getenv("ACTION_JOURNAL_RETENTION_DAYS", "7"))
+
+journal_replays_total = metrics.counter(
+    "action_journal_replays_total", "Actions skipped on resume because the journal already had their outcome."
+)
+
+
+class ActionJournal:
+    """
+    Durable record of every action a flow run has finished.
+
+    An action's outcome is committed as soon as the action returns, before
+    the stage's checkpoint is written. A flow resumed after a crash replays
+    journaled outcomes instead of running those actions (Create_Ad_Group and
+    the like) a second time. Rows are keyed by thread_id, run_id and action,
+    so a new run of the same ticket starts with a clean slate.
+    """
+
+    def __init__(self, path: str = ACTION_JOURNAL_PATH):
+        self.path = path
+        self._conn = None
+
+    async def start(self):
+        directory = os.path.dirname(self.path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        self._conn = await aiosqlite.connect(self.path)
+        await self._conn.executescript(
+            """
+            PRAGMA journal_mode=WAL;
+            PRAGMA synchronous=FULL;
+            CREATE TABLE IF NOT EXISTS action_journal (
+                thread_id TEXT NOT NULL,
+                run_id TEXT NOT NULL,
+                action TEXT NOT NULL,
+                outcome TEXT NOT NULL,
+                completed_at REAL NOT NULL,
+                PRIMARY KEY (thread_id, run_id, action)
+            );
+            """
+        )
+        await self._conn.execute(
+            "DELETE FROM action_journal WHERE completed_at < ?", (time.time() - ACTION_JOURNAL_RETENTION_DAYS * 86400,)
+        )
+        await self._conn.commit()
+
+    async def get(self, thread_id: str, run_id: str, action: str):
+        """Return the journaled outcome of an action in this run, or None if it has not finished."""
+        async with self._conn.execute(
+            "SELECT outcome FROM action_journal WHERE thread_id = ? AND run_id = ? AND action = ?",
+            (thread_id, run_id, action),
+        ) as cursor:
+            row = await cursor.fetchone()
+        if row is None:
+            return None
+        journal_replays_total.inc()
+        return json.loads(row[0])
+
+    async def record(self, thread_id: str, run_id: str, action: str, outcome: dict):
+        await self._conn.execute(
+            "INSERT OR REPLACE INTO action_journal (thread_id, run_id, action, outcome, completed_at) VALUES (?, ?, ?, ?, ?)",
+            (thread_id, run_id, action, json.dumps(outcome, default=str), time.time()),
+        )
+        await self._conn.commit()
+
+    async def close(self):
+        if self._conn is not None:
+            await self._conn.close()
+            self._conn = None
+
+
+_journal = None
+_journal_lock = asyncio.Lock()
+
+
+async def get_action_journal() -> ActionJournal:
+    """Return the process-wide action journal, opening it on first use."""
+    global _journal
+    if _journal is None:
+        async with _journal_lock:
+            if _journal is None:
+                journal = ActionJournal()
+                await journal.start()
+                _journal = journal
+    return _journal
+
+
+async def close_action_journal():
+    global _journal
+    if _journal is not None:
+        await _journal.close()
+        _journal = None
@@ -0,0 +1,113 @@
+import os
+import asyncio
+import logging
+
+import metrics
+
+# -----------------------------------------------------------------------
+# Batching Configuration
+# -----------------------------------------------------------------------
+# How long (seconds) the first membership request for a group waits for others to join it.
+AD_BATCH_WINDOW = float(os.getenv("AD_BATCH_WINDOW", "2"))
+# A batch is sent as soon as it holds this many members.
+AD_BATCH_MAX_SIZE = int(os.getenv("AD_BATCH_MAX_SIZE", "50"))
+
+batch_members = metrics.histogram(
+    "ad_batch_members", "Members sent per bulk group membership call.",
+    buckets=(1, 2, 5, 10, 25, 50, 100, 250),
+)
+batches_total = metrics.counter(
+    "ad_batch_calls_total", "Bulk group membership calls by outcome.", ("outcome",)
+)
+
+
+class MembershipBatcher:
+    """
+    Collects pending group membership additions across tickets.
+
+    Requests for the same group arriving within `window` seconds (or until
+    `max_size` members are pending) are handed to `runner(group, members)`
+    in one call. The runner returns {member: result}; each caller gets back
+    the result for its own member. A caller cancelled (timeout, fail-fast)
+    before its batch is sent is withdrawn from it, so the bulk call does not
+    add a member whose ticket has already been reassigned.
+    """
+
+    def __init__(self, runner, window: float = AD_BATCH_WINDOW, max_size: int = AD_BATCH_MAX_SIZE):
+        self.runner = runner
+        self.window = window
+        self.max_size = max(1, max_size)
+        self._pending = {}
+        self._timers = {}
+        self._tasks = set()
+
+    async def add(self, group: str, member: str, window: float = None, max_size: int = None) -> dict:
+        """Queue `member` for `group` and wait for its result from the bulk call."""
+        loop = asyncio.get_running_loop()
+        future = loop.create_future()
+        key = group.lower()
+        batch = self._pending.setdefault(key, (group, []))[1]
+        batch.append((member, future))
+
+        if len(batch) >= (max_size or self.max_size):
+            self._dispatch(key)
+        elif key not in self._timers:
+            self._timers[key] = loop.call_later(self.window if window is None else window, self._dispatch, key)
+        try:
+            return await future
+        except asyncio.CancelledError:
+            self._withdraw(key, batch, (member, future))
+            raise
+
+    def _withdraw(self, key: str, batch: list, entry: tuple):
+        """Drop a cancelled caller's member from its batch if that batch has not been sent yet."""
+        if self._pending.get(key, (None, None))[1] is not batch or entry not in batch:
+            return
+        batch.remove(entry)
+        if not batch:
+            del self._pending[key]
+            timer = self._timers.pop(key, None)
+            if timer is not None:
+                timer.cancel()
+
+    def _dispatch(self, key: str):
+        timer = self._timers.pop(key, None)
+        if timer is not None:
+            timer.cancel()
+        group, batch = self._pending.pop(key, (None, []))
+        if batch:
+            task = asyncio.ensure_future(self._run(group, batch))
+            self._tasks.add(task)
+            task.add_done_callback(self._tasks.discard)
+
+    async def _run(self, group: str, batch: list):
+        members = list(dict.fromkeys(member for member, _ in batch))
+        batch_members.observe(len(members))
+        logging.info(f"Adding {len(members)} member(s) to {group} in one call.")
+        try:
+            results = await self.runner(group, members)
+            batches_total.inc(outcome="success")
+        except Exception as e:
+            logging.error(f"Bulk membership call for {group} failed: {e}")
+            batches_total.inc(outcome="error")
+            results = {member: {"Status": "Error", "ErrorMessage": str(e)} for member in members}
+
+        for member, future in batch:
+            if not future.done():
+                future.set_result(results.get(member) or {
+                    "Status": "Error", "ErrorMessage": f"No result returned for {member}"
+                })
+
+    def stats(self) -> dict:
+        return {
+            "pending_groups": len(self._pending),
+            "pending_members": sum(len(batch) for _, batch in self._pending.values()),
+            "in_flight": len(self._tasks),
+        }
+
+    async def close(self):
+        """Send every pending batch now and wait for the calls to finish."""
+        for key in list(self._pending):
+            self._dispatch(key)
+        if self._tasks:
+            await asyncio.gather(*list(self._tasks), return_exceptions=True)
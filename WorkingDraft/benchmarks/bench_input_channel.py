@@ -0,0 +1,137 @@
+"""
+Compare the stdin input channel with the legacy inline-JSON command line.
+
+For a ticket selecting N users it measures, per action:
+  * prepare: building the legacy -Command header (task_response and inputs
+    serialized again for every action) vs. the stdin job line that reuses the
+    ticket's cached task_response;
+  * spawn: starting a child process that parses its inputs from argv vs. stdin.
+    Large argv payloads fail once they pass the OS argument length limit.
+
+    python benchmarks/bench_input_channel.py --users 10,1000,10000 --actions 6
+"""
+import os
+import sys
+import json
+import errno
+import time
+import asyncio
+import argparse
+import statistics
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+WORKING_DRAFT = os.path.dirname(HERE)
+sys.path.insert(0, WORKING_DRAFT)
+
+from script_inputs import PayloadCache, encode_job
+import script_inputs
+
+CHILD_ARGV = "import sys, json; d = json.loads(sys.argv[1]); print(len(d['additional_variables']['Userstobeadded']))"
+CHILD_STDIN = "import sys, json; d = json.load(sys.stdin); print(len(d['additional_variables']['Userstobeadded']))"
+SCRIPT = "$ErrorActionPreference = 'STOP'\n" + "Write-Output $ADDITIONAL_VARIABLES.Userstobeadded\n" * 20
+
+
+def ticket(users: int) -> tuple:
+    emails = ",".join(f"user{i}@example.com" for i in range(users))
+    task_response = {"result": [{
+        "sys_id": "0123456789abcdef0123456789abcdef",
+        "sys_class_name": "sc_task",
+        "number": f"SCTASKBENCH{users}",
+        "short_description": "AD Group Creation - Security",
+        "description": f"Select Users Email: {emails}\nSecurity Group: grp_bench\nManaged By User: owner@example.com",
+    }]}
+    inputs = {"uniquegroupname": "grp_bench", "OwnerEmail": "owner@example.com", "Userstobeadded": emails}
+    return task_response, inputs
+
+
+def legacy_header(task_response: dict, inputs: dict) -> str:
+    # Same construction run_script uses with SCRIPT_INPUT_CHANNEL=argv.
+    header = (
+        f"$jsonObject = '{json.dumps(task_response)}' | ConvertFrom-Json; "
+        f"$SCTASK_RESPONSE = $jsonObject.result; "
+        f"$ADDITIONAL_VARIABLES = '{json.dumps(inputs)}' | ConvertFrom-Json; "
+    )
+    return header + SCRIPT
+
+
+def time_prepare(users: int, actions: int, repeat: int) -> dict:
+    task_response, inputs = ticket(users)
+    legacy, stdin = [], []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        for _ in range(actions):
+            command = legacy_header(task_response, inputs)
+        legacy.append((time.perf_counter() - start) / actions)
+
+        # A fresh cache per ticket: the first action serializes, the rest reuse it.
+        script_inputs.payload_cache = PayloadCache()
+        start = time.perf_counter()
+        for _ in range(actions):
+            payload = encode_job(SCRIPT, task_response, inputs)
+        stdin.append((time.perf_counter() - start) / actions)
+    return {
+        "legacy_us": statistics.median(legacy) * 1e6,
+        "stdin_us": statistics.median(stdin) * 1e6,
+        "command_bytes": len(command.encode("utf-8")),
+        "stdin_bytes": len(payload),
+    }
+
+
+async def spawn(code: str, argv_payload: str = None, stdin_payload: bytes = None) -> tuple:
+    command = [sys.executable, "-c", code] + ([argv_payload] if argv_payload is not None else [])
+    start = time.perf_counter()
+    try:
+        process = await asyncio.create_subprocess_exec(
+            *command,
+            stdin=asyncio.subprocess.PIPE if stdin_payload is not None else asyncio.subprocess.DEVNULL,
+            stdout=asyncio.subprocess.PIPE,
+            stderr=asyncio.subprocess.PIPE,
+        )
+    except OSError as e:
+        return None, errno.errorcode.get(e.errno, type(e).__name__)
+    stdout, stderr = await process.communicate(stdin_payload)
+    if process.returncode != 0:
+        return None, stderr.decode(errors="replace").strip().splitlines()[-1]
+    return time.perf_counter() - start, None
+
+
+async def time_spawn(users: int, repeat: int) -> dict:
+    task_response, inputs = ticket(users)
+    job = {"script": SCRIPT, "task_response": task_response, "additional_variables": inputs}
+    argv_payload = json.dumps(job)
+    stdin_payload = argv_payload.encode("utf-8")
+    row = {}
+    for channel, kwargs, code in (
+        ("argv", {"argv_payload": argv_payload}, CHILD_ARGV),
+        ("stdin", {"stdin_payload": stdin_payload}, CHILD_STDIN),
+    ):
+        samples, error = [], None
+        for _ in range(repeat):
+            elapsed, error = await spawn(code, **kwargs)
+            if error:
+                break
+            samples.append(elapsed)
+        row[channel] = f"{statistics.median(samples) * 1000:.1f} ms" if samples else f"failed ({error})"
+    return row
+
+
+async def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--users", default="10,1000,10000", help="comma separated user counts per ticket")
+    parser.add_argument("--actions", type=int, default=6, help="actions per ticket")
+    parser.add_argument("--repeat", type=int, default=20)
+    parser.add_argument("--spawn-repeat", type=int, default=5)
+    args = parser.parse_args()
+
+    print(f"{'users':>7}{'cmd bytes':>11}{'stdin bytes':>13}{'legacy prep':>13}{'stdin prep':>12}"
+          f"{'argv spawn':>14}{'stdin spawn':>14}")
+    for users in [int(u) for u in args.users.split(",") if u.strip()]:
+        prep = time_prepare(users, args.actions, args.repeat)
+        spawned = await time_spawn(users, args.spawn_repeat)
+        print(f"{users:>7}{prep['command_bytes']:>11}{prep['stdin_bytes']:>13}"
+              f"{prep['legacy_us']:>10.1f} us{prep['stdin_us']:>9.1f} us"
+              f"{spawned['argv']:>14}{spawned['stdin']:>14}")
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -0,0 +1,102 @@
+"""
+Compare per-action overhead of a .py action run as a new interpreter with the
+same action run as a plugin on a warm worker process.
+
+The action imports a few standard library modules (standing in for the
+ldap/requests imports real actions pay) and returns its inputs.
+
+    python benchmarks/bench_python_plugins.py --calls 50 --concurrency 4
+"""
+import os
+import sys
+import json
+import time
+import asyncio
+import argparse
+import tempfile
+import statistics
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+WORKING_DRAFT = os.path.dirname(HERE)
+sys.path.insert(0, WORKING_DRAFT)
+
+from python_plugins import PythonPluginPool
+
+ACTION = '''
+import sys, json, email.mime.text, http.client, xml.dom.minidom, decimal, csv
+
+
+def run(task_response, additional_variables):
+    return {"Status": "Success", "OutputMessage": "validated " + additional_variables["user"], "ErrorMessage": ""}
+
+
+if __name__ == "__main__":
+    inputs = json.load(sys.stdin)
+    print(json.dumps(run({}, inputs)))
+'''
+
+
+async def spawn_once(path: str, inputs: dict) -> float:
+    start = time.perf_counter()
+    process = await asyncio.create_subprocess_exec(
+        sys.executable, path,
+        stdin=asyncio.subprocess.PIPE, stdout=asyncio.subprocess.PIPE, stderr=asyncio.subprocess.PIPE,
+    )
+    stdout, stderr = await process.communicate(json.dumps(inputs).encode("utf-8"))
+    if process.returncode != 0 or json.loads(stdout)["Status"] != "Success":
+        raise RuntimeError(stderr.decode(errors="replace"))
+    return time.perf_counter() - start
+
+
+async def plugin_once(pool: PythonPluginPool, path: str, inputs: dict) -> float:
+    start = time.perf_counter()
+    result = await pool.run(path, "1", {}, inputs)
+    if result["Status"] != "Success":
+        raise RuntimeError(result["ErrorMessage"])
+    return time.perf_counter() - start
+
+
+async def measure(call, calls: int, concurrency: int) -> tuple:
+    gate = asyncio.Semaphore(concurrency)
+    samples = []
+
+    async def one(i: int):
+        async with gate:
+            samples.append(await call({"user": f"user{i}"}))
+
+    start = time.perf_counter()
+    await asyncio.gather(*(one(i) for i in range(calls)))
+    return samples, time.perf_counter() - start
+
+
+def report(label: str, samples: list, elapsed: float):
+    ordered = sorted(samples)
+    p95 = ordered[max(0, int(len(ordered) * 0.95) - 1)]
+    print(f"{label:<10}{statistics.median(samples) * 1000:>10.1f} ms{p95 * 1000:>10.1f} ms{len(samples) / elapsed:>12.1f}/s")
+
+
+async def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--calls", type=int, default=50)
+    parser.add_argument("--concurrency", type=int, default=4)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as directory:
+        path = os.path.join(directory, "2 - Validate_User.py")
+        with open(path, "w") as f:
+            f.write(ACTION)
+
+        pool = PythonPluginPool(size=args.concurrency)
+        start = time.perf_counter()
+        await pool.start()
+        print(f"plugin pool warm-up: {(time.perf_counter() - start) * 1000:.0f} ms for {pool.size} workers\n")
+        print(f"{'mode':<10}{'p50':>13}{'p95':>13}{'throughput':>14}")
+        try:
+            report("spawn", *await measure(lambda inputs: spawn_once(path, inputs), args.calls, args.concurrency))
+            report("plugin", *await measure(lambda inputs: plugin_once(pool, path, inputs), args.calls, args.concurrency))
+        finally:
+            pool.close()
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
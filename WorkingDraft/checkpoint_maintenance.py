@@ -0,0 +1,207 @@
+import os
+import time
+import asyncio
+import logging
+
+import metrics
+
+# -----------------------------------------------------------------------
+# Maintenance Configuration
+# -----------------------------------------------------------------------
+# Seconds between maintenance passes over the checkpoint database (0 disables the task).
+CHECKPOINT_MAINTENANCE_INTERVAL = float(os.getenv("CHECKPOINT_MAINTENANCE_INTERVAL", "300"))
+# Flow statuses whose threads are compacted down to their final checkpoint.
+CHECKPOINT_RETAIN_FINAL_ONLY = tuple(
+    status.strip() for status in os.getenv("CHECKPOINT_RETAIN_FINAL_ONLY", "completed,reassigned").split(",")
+    if status.strip()
+)
+# Free pages returned to the filesystem per pass by PRAGMA incremental_vacuum (0 = all).
+CHECKPOINT_VACUUM_PAGES = int(os.getenv("CHECKPOINT_VACUUM_PAGES", "2000"))
+
+AUTO_VACUUM_INCREMENTAL = 2
+
+maintenance_seconds = metrics.histogram(
+    "checkpoint_maintenance_seconds", "Duration of a checkpoint maintenance pass.",
+    buckets=(0.01, 0.05, 0.1, 0.5, 1, 5, 10, 30),
+)
+reclaimed_bytes_total = metrics.counter(
+    "checkpoint_maintenance_reclaimed_bytes_total", "Bytes returned to the filesystem by checkpoint maintenance."
+)
+pruned_total = metrics.counter(
+    "checkpoint_maintenance_pruned_total", "Rows deleted by checkpoint retention.", ("table",)
+)
+database_bytes_gauge = metrics.gauge(
+    "checkpoint_database_bytes", "Size of the checkpoint database plus its WAL file."
+)
+
+
+def database_size(path: str) -> int:
+    """Size of an SQLite database together with its -wal file."""
+    size = 0
+    for name in (path, path + "-wal"):
+        try:
+            size += os.path.getsize(name)
+        except OSError:
+            pass
+    return size
+
+
+class CheckpointMaintenance:
+    """
+    Background housekeeping for the AsyncSqliteSaver database.
+
+    Each pass compacts threads whose flow finished (flow_status in
+    CHECKPOINT_RETAIN_FINAL_ONLY) down to their final checkpoint, truncates
+    the WAL and returns free pages with an incremental vacuum. Statements
+    run under the saver's lock so they never interleave with its own.
+
+    New files are created in incremental auto-vacuum mode (see
+    checkpointers.sqlite_pragmas). An existing file in another mode needs
+    one full VACUUM to switch; the first pass does it in the background
+    rather than holding up startup.
+    """
+
+    def __init__(self, saver, path: str, interval: float = CHECKPOINT_MAINTENANCE_INTERVAL):
+        self.saver = saver
+        self.conn = saver.conn
+        self.path = path
+        self.interval = interval
+        self._task = None
+        self.needs_conversion = False
+        self.last_report = {}
+
+    async def prepare(self):
+        """Create the saver's tables and note whether the file still has to be switched to incremental auto-vacuum."""
+        await self.saver.setup()
+        async with self.saver.lock:
+            async with self.conn.execute("PRAGMA auto_vacuum") as cursor:
+                mode = (await cursor.fetchone())[0]
+        self.needs_conversion = mode != AUTO_VACUUM_INCREMENTAL
+        if self.needs_conversion:
+            when = "on the first maintenance pass" if self.interval > 0 else "once checkpoint maintenance is enabled"
+            logging.info(f"{self.path} is not in incremental auto-vacuum mode; it will be converted {when}.")
+
+    async def _convert(self):
+        """Switch an existing file to incremental auto-vacuum; takes one full VACUUM."""
+        logging.info(f"Converting {self.path} to incremental auto-vacuum (full VACUUM).")
+        start = time.perf_counter()
+        async with self.saver.lock:
+            await self.conn.execute("PRAGMA auto_vacuum=INCREMENTAL")
+            await self.conn.execute("VACUUM")
+        self.needs_conversion = False
+        logging.info(f"Converted {self.path} to incremental auto-vacuum in {time.perf_counter() - start:.3f}s.")
+
+    async def _finished_threads(self) -> list:
+        """Threads that still hold more than one checkpoint and whose flow has ended."""
+        async with self.saver.lock:
+            async with self.conn.execute(
+                "SELECT thread_id, MAX(checkpoint_id) FROM checkpoints WHERE checkpoint_ns = '' "
+                "GROUP BY thread_id HAVING COUNT(*) > 1"
+            ) as cursor:
+                candidates = await cursor.fetchall()
+
+        finished = []
+        for thread_id, checkpoint_id in candidates:
+            checkpoint = await self.saver.aget_tuple(
+                {"configurable": {"thread_id": thread_id, "checkpoint_ns": "", "checkpoint_id": checkpoint_id}}
+            )
+            if checkpoint is None:
+                continue
+            status = checkpoint.checkpoint["channel_values"].get("flow_status")
+            if status in CHECKPOINT_RETAIN_FINAL_ONLY:
+                finished.append((thread_id, checkpoint_id))
+        return finished
+
+    async def _compact(self, finished: list) -> tuple:
+        checkpoints = writes = 0
+        async with self.saver.lock:
+            for thread_id, checkpoint_id in finished:
+                # Only rows older than the final checkpoint: a run of the same ticket
+                # started since _finished_threads looked keeps its new checkpoints
+                # (checkpoint ids sort by creation time).
+                cursor = await self.conn.execute(
+                    "DELETE FROM checkpoints WHERE thread_id = ? AND checkpoint_id < ?", (thread_id, checkpoint_id)
+                )
+                checkpoints += cursor.rowcount
+                cursor = await self.conn.execute(
+                    "DELETE FROM writes WHERE thread_id = ? AND checkpoint_id < ?", (thread_id, checkpoint_id)
+                )
+                writes += cursor.rowcount
+            await self.conn.commit()
+        return checkpoints, writes
+
+    async def run_once(self) -> dict:
+        """Run one maintenance pass and return what it did."""
+        start = time.perf_counter()
+        size_before = database_size(self.path)
+
+        finished = await self._finished_threads()
+        checkpoints, writes = await self._compact(finished) if finished else (0, 0)
+
+        converted = self.needs_conversion
+        if converted:
+            await self._convert()
+
+        async with self.saver.lock:
+            async with self.conn.execute("PRAGMA wal_checkpoint(TRUNCATE)") as cursor:
+                busy, _, _ = await cursor.fetchone()
+            async with self.conn.execute("PRAGMA freelist_count") as cursor:
+                free_pages = (await cursor.fetchone())[0]
+            if free_pages:
+                # executescript steps the pragma to completion; a plain execute
+                # would free a single page.
+                await self.conn.executescript(f"PRAGMA incremental_vacuum({CHECKPOINT_VACUUM_PAGES});")
+                # Move the vacuumed pages out of the WAL so the file actually shrinks.
+                await self.conn.execute("PRAGMA wal_checkpoint(TRUNCATE)")
+
+        size_after = database_size(self.path)
+        duration = time.perf_counter() - start
+        reclaimed = max(0, size_before - size_after)
+
+        pruned_total.inc(checkpoints, table="checkpoints")
+        pruned_total.inc(writes, table="writes")
+        reclaimed_bytes_total.inc(reclaimed)
+        maintenance_seconds.observe(duration)
+        database_bytes_gauge.set(size_after)
+
+        self.last_report = {
+            "finished_at": time.time(),
+            "duration_seconds": round(duration, 4),
+            "threads_compacted": len(finished),
+            "checkpoints_deleted": checkpoints,
+            "writes_deleted": writes,
+            "converted_to_incremental": converted,
+            "wal_checkpoint_busy": bool(busy),
+            "bytes_before": size_before,
+            "bytes_after": size_after,
+            "bytes_reclaimed": reclaimed,
+        }
+        logging.info(
+            f"Checkpoint maintenance: compacted {len(finished)} thread(s), reclaimed {reclaimed} bytes "
+            f"in {duration:.3f}s ({size_after} bytes remaining)."
+        )
+        return self.last_report
+
+    async def _loop(self):
+        while True:
+            await asyncio.sleep(self.interval)
+            try:
+                await self.run_once()
+            except Exception as e:
+                logging.error(f"Checkpoint maintenance failed: {e}")
+
+    def start(self):
+        if self._task is None and self.interval > 0:
+            self._task = asyncio.create_task(self._loop())
+
+    async def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+
+    def stats(self) -> dict:
+        return {"database_bytes": database_size(self.path), "last_run": self.last_report}
@@ -0,0 +1,118 @@
+import os
+import json
+import time
+import asyncio
+
+import aiosqlite
+
+import metrics
+
+# -----------------------------------------------------------------------
+# Log Store Configuration
+# -----------------------------------------------------------------------
+EXECUTION_LOG_PATH = os.getenv("EXECUTION_LOG_PATH", "state_db/execution_log.sqlite")
+
+entries_total = metrics.counter(
+    "execution_log_entries_total", "Execution log entries appended to the side store."
+)
+
+
+class ExecutionLogStore:
+    """
+    Append-only execution log kept outside the checkpointed FlowState.
+
+    Each script result and ticket update is one row keyed by thread_id, the
+    flow run it belongs to and its step within that run, so checkpoints only
+    carry a counter and the last entry no matter how long a flow gets.
+    """
+
+    def __init__(self, path: str = EXECUTION_LOG_PATH):
+        self.path = path
+        self._conn = None
+
+    async def start(self):
+        directory = os.path.dirname(self.path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        self._conn = await aiosqlite.connect(self.path)
+        await self._conn.executescript(
+            """
+            PRAGMA journal_mode=WAL;
+            PRAGMA synchronous=NORMAL;
+            CREATE TABLE IF NOT EXISTS execution_log (
+                seq INTEGER PRIMARY KEY AUTOINCREMENT,
+                thread_id TEXT NOT NULL,
+                run_id TEXT NOT NULL,
+                step INTEGER NOT NULL,
+                entry TEXT NOT NULL,
+                created_at REAL NOT NULL,
+                UNIQUE (thread_id, run_id, step)
+            );
+            CREATE INDEX IF NOT EXISTS execution_log_thread ON execution_log (thread_id, seq);
+            """
+        )
+        await self._conn.commit()
+
+    async def append(self, thread_id: str, run_id: str, first_step: int, entries: list):
+        """Write `entries` as steps first_step, first_step + 1, ... of a run."""
+        now = time.time()
+        await self._conn.executemany(
+            "INSERT OR REPLACE INTO execution_log (thread_id, run_id, step, entry, created_at) VALUES (?, ?, ?, ?, ?)",
+            [(thread_id, run_id, first_step + i, json.dumps(entry), now) for i, entry in enumerate(entries)]
+        )
+        await self._conn.commit()
+        entries_total.inc(len(entries))
+
+    async def read(self, thread_id: str, run_id: str = None) -> list:
+        """
+        Return a thread's log entries in order. Without `run_id` only the most
+        recent run is returned; pass run_id="*" for every run.
+        """
+        if run_id is None:
+            async with self._conn.execute(
+                "SELECT run_id FROM execution_log WHERE thread_id = ? ORDER BY seq DESC LIMIT 1", (thread_id,)
+            ) as cursor:
+                row = await cursor.fetchone()
+            if row is None:
+                return []
+            run_id = row[0]
+
+        query = "SELECT run_id, step, entry, created_at FROM execution_log WHERE thread_id = ?"
+        params = [thread_id]
+        if run_id != "*":
+            query += " AND run_id = ?"
+            params.append(run_id)
+        async with self._conn.execute(query + " ORDER BY seq", params) as cursor:
+            rows = await cursor.fetchall()
+        return [
+            {"run_id": run, "step": step, "created_at": created_at, **json.loads(entry)}
+            for run, step, entry, created_at in rows
+        ]
+
+    async def close(self):
+        if self._conn is not None:
+            await self._conn.close()
+            self._conn = None
+
+
+_store = None
+_store_lock = asyncio.Lock()
+
+
+async def get_execution_log_store() -> ExecutionLogStore:
+    """Return the process-wide execution log store, opening it on first use."""
+    global _store
+    if _store is None:
+        async with _store_lock:
+            if _store is None:
+                store = ExecutionLogStore()
+                await store.start()
+                _store = store
+    return _store
+
+
+async def close_execution_log_store():
+    global _store
+    if _store is not None:
+        await _store.close()
+        _store = None
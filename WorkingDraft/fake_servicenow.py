@@ -0,0 +1,138 @@
+"""
+Local stand-in for the ServiceNow Table API, for exercising the poller and
+the update nodes without an instance.
+
+Supports GET /api/now/table/<table> with the sysparm_query subset the poller
+builds (active, stateIN, sys_updated_on>=, short_description= / STARTSWITH
+joined by ^OR, ORDERBY), sysparm_fields, sysparm_limit and sysparm_offset,
+and PUT /api/now/table/<table>/<sys_id>.
+
+    python fake_servicenow.py --port 8001 --tickets 200
+    SERVICENOW_ENDPOINT=http://127.0.0.1:8001 SERVICENOW_POLL_ENABLED=true python main.py
+
+In tests, hand `create_app(...)` to httpx.ASGITransport and pass it to ServiceNowClient.
+"""
+import argparse
+import time
+import uuid
+
+from fastapi import FastAPI, Request
+from fastapi.responses import JSONResponse
+
+DEFAULT_SHORT_DESCRIPTION = "AD Group Creation - Security"
+
+
+def _timestamp(offset: int = 0) -> str:
+    return time.strftime("%Y-%m-%d %H:%M:%S", time.gmtime(time.time() + offset))
+
+
+def make_ticket(index: int, short_description: str = DEFAULT_SHORT_DESCRIPTION, state: str = "1",
+                updated_on: str = None) -> dict:
+    """A full-width sc_task record (padded with the noise fields a real instance returns)."""
+    record = {
+        "sys_id": uuid.uuid4().hex,
+        "sys_class_name": "sc_task",
+        "number": f"SCTASK{index:07d}",
+        "short_description": short_description,
+        "description": f"Security Group : grp_{index}\nManaged By User : owner{index}@example.com\n"
+                       f"Select Users Email : user{index}@example.com",
+        "state": state,
+        "active": "true",
+        "sys_updated_on": updated_on or _timestamp(),
+    }
+    for field in range(70):
+        record[f"u_field_{field}"] = f"value {field} of ticket {index}"
+    return record
+
+
+def _split_query(query: str) -> list:
+    # "^^" is a literal caret inside a value.
+    terms, current, i = [], "", 0
+    while i < len(query):
+        if query[i] == "^" and query[i:i + 2] == "^^":
+            current += "^"
+            i += 2
+        elif query[i] == "^":
+            terms.append(current)
+            current = ""
+            i += 1
+        else:
+            current += query[i]
+            i += 1
+    terms.append(current)
+    return terms
+
+
+def _condition(term: str):
+    for operator, test in (
+        ("STARTSWITH", lambda value, expected: value.startswith(expected)),
+        ("IN", lambda value, expected: value in expected.split(",")),
+        (">=", lambda value, expected: value >= expected),
+        ("=", lambda value, expected: value == expected),
+    ):
+        field, found, expected = term.partition(operator)
+        if found and field and field.isidentifier():
+            return lambda record: test(str(record.get(field, "")), expected)
+    raise ValueError(f"Unsupported query term: {term}")
+
+
+def matches(record: dict, query: str) -> bool:
+    """Evaluate an encoded query: terms are ANDed, an ^OR term joins the group before it."""
+    groups = []
+    for term in _split_query(query or ""):
+        if not term or term.startswith("ORDERBY"):
+            continue
+        if term.startswith("OR") and groups:
+            groups[-1].append(_condition(term[2:]))
+        else:
+            groups.append([_condition(term)])
+    return all(any(test(record) for test in group) for group in groups)
+
+
+def create_app(tickets: list = None) -> FastAPI:
+    app = FastAPI()
+    app.state.records = {record["sys_id"]: record for record in (tickets or [])}
+    app.state.requests = []
+
+    @app.get("/api/now/table/{table}")
+    async def get_records(table: str, request: Request):
+        params = request.query_params
+        app.state.requests.append(("GET", table, dict(params)))
+        try:
+            found = [record for record in app.state.records.values()
+                     if record["sys_class_name"] == table and matches(record, params.get("sysparm_query", ""))]
+        except ValueError as e:
+            return JSONResponse({"error": {"message": str(e)}}, status_code=400)
+        found.sort(key=lambda record: (record["sys_updated_on"], record["number"]))
+        offset = int(params.get("sysparm_offset", 0))
+        limit = int(params.get("sysparm_limit", 10000))
+        page = found[offset:offset + limit]
+        fields = [field for field in params.get("sysparm_fields", "").split(",") if field]
+        if fields:
+            page = [{field: record.get(field, "") for field in fields} for record in page]
+        return {"result": page}
+
+    @app.put("/api/now/table/{table}/{sys_id}")
+    async def update_record(table: str, sys_id: str, request: Request):
+        body = await request.json()
+        app.state.requests.append(("PUT", table, body))
+        record = app.state.records.get(sys_id)
+        if record is None:
+            return JSONResponse({"error": {"message": "No Record found"}}, status_code=404)
+        for field, value in body.items():
+            if field != "work_notes":
+                record[field] = value
+        record["sys_updated_on"] = _timestamp()
+        return {"result": record}
+
+    return app
+
+
+if __name__ == "__main__":
+    import uvicorn
+
+    parser = argparse.ArgumentParser(description="Fake ServiceNow Table API")
+    parser.add_argument("--port", type=int, default=8001)
+    parser.add_argument("--tickets", type=int, default=20, help="open tickets to seed")
+    args = parser.parse_args()
+    uvicorn.run(create_app([make_ticket(i) for i in range(args.tickets)]), host="127.0.0.1", port=args.port)
@@ -0,0 +1,145 @@
+import os
+import re
+import time
+import logging
+
+import yaml
+
+import metrics
+
+# -----------------------------------------------------------------------
+# Catalog Configuration
+# -----------------------------------------------------------------------
+FLOW_CATALOG_PATH = os.getenv("FLOW_CATALOG_PATH", "flow_details.yml")
+# How often (seconds) a lookup may stat the file to look for changes.
+FLOW_CATALOG_CHECK_INTERVAL = float(os.getenv("FLOW_CATALOG_CHECK_INTERVAL", "5"))
+
+MATCH_KINDS = ("exact", "prefix", "regex")
+
+lookup_seconds = metrics.histogram(
+    "flow_catalog_lookup_seconds", "Time to resolve a short_description to a flow.", ("match",),
+    buckets=(0.000001, 0.000005, 0.00001, 0.00005, 0.0001, 0.0005, 0.001, 0.005),
+)
+reloads_total = metrics.counter(
+    "flow_catalog_reloads_total", "flow_details.yml (re)loads by outcome.", ("outcome",)
+)
+
+
+class FlowCatalog:
+    """
+    In-memory index of flow_details.yml.
+
+    Entries with `match: exact` (the default) live in a dict keyed by
+    short_description; `match: prefix` and `match: regex` entries are
+    compiled once and tried in file order when there is no exact hit.
+    The file is re-read when its mtime changes.
+    """
+
+    def __init__(self, path: str = FLOW_CATALOG_PATH):
+        self.path = path
+        self._exact = {}
+        self._rules = []
+        self._entries = []
+        self._by_flow = {}
+        self._mtime = None
+        self._last_check = 0.0
+        self._load()
+
+    def _load(self):
+        try:
+            mtime = os.stat(self.path).st_mtime_ns
+            with open(self.path, "r", encoding="utf-8") as f:
+                yaml_data = yaml.safe_load(f) or {}
+        except FileNotFoundError:
+            raise ValueError(f"{self.path} file not found.")
+
+        exact = {}
+        rules = []
+        entries = []
+        for item in yaml_data.get("flows", []):
+            try:
+                entry = dict(item)
+                pattern = item["short_description"]
+                entry["flow_name"] = item["flow_name"]
+                entry["reassignment_group"] = item["reassignment_group"]
+            except KeyError as e:
+                raise ValueError(f"Missing key in {self.path}: {e}")
+
+            match = item.get("match", "exact")
+            if match not in MATCH_KINDS:
+                raise ValueError(f"Unknown match '{match}' for {pattern} in {self.path}")
+            entry["match"] = match
+            entries.append(entry)
+
+            if match == "exact":
+                exact.setdefault(pattern, entry)
+            elif match == "prefix":
+                rules.append((match, pattern, entry))
+            else:
+                try:
+                    rules.append((match, re.compile(pattern), entry))
+                except re.error as e:
+                    raise ValueError(f"Invalid regex {pattern} in {self.path}: {e}")
+
+        by_flow = {}
+        for entry in entries:
+            by_flow.setdefault(entry["flow_name"], entry)
+
+        self._exact, self._rules, self._entries, self._by_flow = exact, rules, entries, by_flow
+        self._mtime = mtime
+        logging.debug(f"Flow catalog loaded: {len(exact)} exact and {len(rules)} rule-based flows.")
+
+    def _reload_if_changed(self):
+        now = time.monotonic()
+        if now - self._last_check < FLOW_CATALOG_CHECK_INTERVAL:
+            return
+        self._last_check = now
+        try:
+            if os.stat(self.path).st_mtime_ns == self._mtime:
+                return
+            self._load()
+            reloads_total.inc(outcome="success")
+        except (OSError, ValueError, yaml.YAMLError) as e:
+            # Keep serving the last good catalog until the file is fixed.
+            logging.error(f"Failed to reload {self.path}: {e}")
+            reloads_total.inc(outcome="error")
+
+    def lookup(self, short_description: str):
+        """Return the catalog entry for a short_description, or None."""
+        start = time.perf_counter()
+        self._reload_if_changed()
+        entry = self._exact.get(short_description)
+        match = "exact"
+        if entry is None:
+            match = "none"
+            for kind, matcher, candidate in self._rules:
+                if kind == "prefix":
+                    hit = short_description.startswith(matcher)
+                else:
+                    hit = matcher.search(short_description) is not None
+                if hit:
+                    entry, match = candidate, kind
+                    break
+        lookup_seconds.observe(time.perf_counter() - start, match=match)
+        return entry
+
+    def flow_config(self, flow_name: str) -> dict:
+        """The first catalog entry for `flow_name` (holds its optional `actions:` manifest)."""
+        self._reload_if_changed()
+        return self._by_flow.get(flow_name, {})
+
+    def entries(self) -> list:
+        """Every catalog entry in file order."""
+        self._reload_if_changed()
+        return list(self._entries)
+
+
+_catalog = None
+
+
+def get_flow_catalog() -> FlowCatalog:
+    """Return the process-wide catalog, loading it on first use."""
+    global _catalog
+    if _catalog is None:
+        _catalog = FlowCatalog()
+    return _catalog
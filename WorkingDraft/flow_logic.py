@@ -1,9 +1,12 @@
 import os
 import json
 import logging
+import time
 import asyncio
-import subprocess
-import yaml
+import uuid
+import inspect
+import functools
+from datetime import datetime, timezone
 from enum import IntEnum
 from typing import Literal
 from typing_extensions import TypedDict
@@ -12,8 +15,8 @@ from typing_extensions import TypedDict
 from dotenv import load_dotenv
  
 # LangGraph imports
+from langchain_core.runnables import RunnableConfig
 from langgraph.graph import StateGraph, START, END
-from langgraph.checkpoint.sqlite.aio import AsyncSqliteSaver
  
 # -----------------------------------------------------------------------
 # Configure Logging
@@ -27,10 +30,58 @@ logging.basicConfig(
 # Load Environment Variables
 # -----------------------------------------------------------------------
 load_dotenv()
-user = os.getenv('SERVICENOW_USER')
-pwd = os.getenv('SERVICENOW_PWD')
-endpoint = "https://hexawaretechnologiesincdemo8.service-now.com"
 db_path = os.getenv('DATABASE_PATH')
+# Seconds a ticket may spend running its actions before it is reassigned
+# (0 disables); a flow can override it with `deadline:` in flow_details.yml.
+FLOW_DEADLINE = float(os.getenv("FLOW_DEADLINE", "3600"))
+# On startup, continue flows a restart interrupted (threads whose last checkpoint
+# still has a next node and is younger than FLOW_RESUME_MAX_AGE seconds),
+# at most FLOW_RESUME_CONCURRENCY at a time.
+FLOW_RESUME_ON_STARTUP = os.getenv("FLOW_RESUME_ON_STARTUP", "true").lower() == "true"
+FLOW_RESUME_CONCURRENCY = int(os.getenv("FLOW_RESUME_CONCURRENCY", "4"))
+FLOW_RESUME_MAX_AGE = float(os.getenv("FLOW_RESUME_MAX_AGE", "86400"))
+
+# Local modules read their settings from the environment at import time,
+# so they are imported once .env has been loaded.
+from powershell_pool import POWERSHELL_POOL_ENABLED, get_powershell_pool, close_powershell_pool
+from script_scheduler import SCRIPT_TIMEOUT, get_scheduler
+from script_inputs import SCRIPT_INPUT_CHANNEL, SCRIPT_INPUT_CHANNELS, POWERSHELL_STDIN_BOOTSTRAP, encode_inputs, encode_job
+from output_capture import (
+    spool_path, prune_spool, read_spooled_fields, load_spooled_inputs, CAPTURE_DETAIL_KEYS, OUTPUT_REF_PREFIX,
+    SCRIPT_OUTPUT_PREVIEW,
+)
+from python_plugins import PYTHON_PLUGIN_ENABLED, get_python_plugin_pool, close_python_plugin_pools
+from node_pool import NODE_POOL_ENABLED, get_node_pool, close_node_pool
+from servicenow_client import get_servicenow_client, close_servicenow_client
+from flow_catalog import get_flow_catalog
+from script_registry import ActionScript, get_script_registry
+from flow_plan import build_action_plan, action_settings, cache_settings
+from result_cache import ACTION_CACHE_ENABLED, action_cache, cache_key
+from ad_batching import MembershipBatcher
+from servicenow_outbox import SERVICENOW_OUTBOX_ENABLED, get_outbox, close_outbox
+from servicenow_mirror import SERVICENOW_MIRROR_ENABLED, get_servicenow_mirror, servicenow_mirror, close_servicenow_mirror
+from single_flight import FLOW_DEDUP_WINDOW, SingleFlight, coalesced_total
+from ticket_leases import TicketLeasedError, get_lease_manager, close_lease_manager
+from execution_log_store import get_execution_log_store, close_execution_log_store
+from action_journal import get_action_journal, close_action_journal
+from checkpoint_maintenance import CheckpointMaintenance
+from checkpointers import CHECKPOINT_BACKEND, open_checkpointer
+import metrics
+
+flow_resumes_total = metrics.counter(
+    "flow_resumes_total", "Interrupted flows continued from their last checkpoint, by outcome.", ("outcome",)
+)
+node_seconds = metrics.histogram(
+    "graph_node_seconds", "Time spent in each graph node, by outcome (ok, error).", ("node", "outcome")
+)
+flow_seconds = metrics.histogram(
+    "flow_run_seconds", "Flow run duration by flow and final status (completed, reassigned, error).",
+    ("flow", "status"), buckets=(0.5, 1, 2.5, 5, 10, 30, 60, 120, 300, 600, 1800, 3600),
+)
+action_seconds = metrics.histogram(
+    "flow_action_seconds", "Action duration by flow, action and outcome (Success, Error, Timeout, Cached, ...).",
+    ("flow", "action", "outcome"),
+)
  
 # -----------------------------------------------------------------------
 # Define the FlowState
@@ -39,14 +90,20 @@ class FlowState(TypedDict):
     task_response: dict
     flow_name: str
     actions_list: list
+    action_plan: list  # stages of action names; actions in one stage run concurrently
     current_action: str
     additional_variables: dict
     worknote_content: str
-    execution_log: list  # We'll store logs & updates here
+    thread_id: str
+    run_id: str  # one id per flow run; execution log entries are grouped by it
+    execution_log_count: int  # entries live in the execution log store, not in checkpoints
+    last_log_entry: dict
     action_index: int
     next_action: bool
     error_occurred: bool
     reassignment_group: str
+    flow_status: str  # running, completed or reassigned; checkpoint retention keys off it
+    deadline: float  # epoch seconds after which remaining actions are abandoned; 0 for none
  
 # -----------------------------------------------------------------------
 # Define TicketState
@@ -62,30 +119,76 @@ class TicketState(IntEnum):
 
 
 # Asynchronous Helper Functions
-async def run_script(script_path: str, inputs: dict, task_response: dict) -> dict:
+def spool_name(task_response: dict, script_path: str) -> tuple:
+    """(ticket number, action name) used to name spool files for a script's output."""
+    try:
+        number = task_response["result"][0]["number"]
+    except (KeyError, IndexError, TypeError):
+        number = "adhoc"
+    return number, os.path.basename(script_path)
+
+def script_version(script_path: str, script: ActionScript = None) -> str:
+    """Identifies a script's current contents, so warm workers re-import it after a change."""
+    return script.sha256 if script is not None else str(os.stat(script_path).st_mtime_ns)
+
+def timed_out_result(result, timeout: float) -> dict:
+    """Status "Timeout" result for a script whose process tree was killed."""
+    return {
+        "Status": "Timeout",
+        "OutputMessage": {},
+        "ErrorMessage": f"Script timed out after {timeout:.1f} seconds",
+        **result.details(),
+    }
+
+async def run_script(script_path: str, inputs: dict, task_response: dict, script: ActionScript = None,
+                     timeout: float = None, plugin: bool = False, input_channel: str = None) -> dict:
     """
     Execute a script based on its file extension asynchronously.
     Supports:
-      - Python (.py): Runs with 'python' interpreter; inputs passed as a JSON string.
-      - Node.js (.js): Runs with 'node' interpreter; inputs passed as a JSON string.
-      - PowerShell (.ps1): Runs with 'powershell'; inputs passed as individual key-value arguments.
+      - Python (.py): Runs with 'python' interpreter; inputs passed as a JSON argument.
+        With `plugin`, the script's run(task_response, additional_variables) is called
+        on a warm worker process of its venv's plugin pool instead.
+      - Node.js (.js): Runs with 'node' interpreter; inputs passed as a JSON argument.
+        With `plugin`, the module's exported run(taskResponse, additionalVariables)
+        is called on a warm Node worker (node_worker.js) instead.
+      - PowerShell (.ps1): Runs in a fresh 'powershell' process (or on a warm PowerShell
+        pool worker with POWERSHELL_POOL_ENABLED); inputs exposed as $SCTASK_RESPONSE and
+        $ADDITIONAL_VARIABLES.
+    With input channel "stdin" (SCRIPT_INPUT_CHANNEL, or `input: stdin` on the
+    action) the inputs are written to the script's stdin instead of the command
+    line (JSON for .py/.js, a job read by a bootstrap command for .ps1).
 
     Args:
         script_path (str): Path to the script file.
         inputs (dict): Input data for the script.
+        script (ActionScript): Cached registry entry for the script; when given,
+            its contents are used instead of reading the file again.
+        timeout (float): Seconds before the script's process tree is killed (None for no limit).
+        plugin (bool): Run a .py/.js action through the plugin contract on a warm worker.
+        input_channel (str): "argv" or "stdin"; None uses SCRIPT_INPUT_CHANNEL.
 
     Returns:
         dict: Execution result containing:
-            - Status: "Success" or "Error"
+            - Status: "Success", "Error" or "Timeout"
             - OutputMessage: Parsed outputs from the script (if available)
             - ErrorMessage: Any error message encountered
+            - OutputRef/OutputBytes, ErrorRef/ErrorBytes: spool file and size of a
+              stream that exceeded SCRIPT_OUTPUT_MEMORY_CAP (OutputMessage then holds a preview)
+            - PeakRSSBytes: peak resident memory of the script process (needs psutil)
     """
-    if not os.path.exists(script_path):
+    if script is None and not os.path.exists(script_path):
         error_msg = f"Script file not found: {script_path}"
         logging.error(error_msg)
         return {"Status": "Error", "OutputMessage": {}, "ErrorMessage": error_msg}
 
+    channel = (input_channel or SCRIPT_INPUT_CHANNEL).lower()
+    if channel not in SCRIPT_INPUT_CHANNELS:
+        error_msg = f"Unknown input channel '{channel}', expected one of {', '.join(SCRIPT_INPUT_CHANNELS)}"
+        logging.error(error_msg)
+        return {"Status": "Error", "OutputMessage": {}, "ErrorMessage": error_msg}
+
     ext = os.path.splitext(script_path)[1].lower()
+    spool = spool_name(task_response, script_path)
 
     try:
         if ext == ".py":
@@ -95,76 +198,109 @@ async def run_script(script_path: str, inputs: dict, task_response: dict) -> dic
             venv_dir = os.path.abspath(venv_dir)
             logging.info(f"Using virtual environment at: {venv_dir}")
 
+            if plugin and PYTHON_PLUGIN_ENABLED:
+                pool = await get_python_plugin_pool(venv_dir if os.path.isdir(venv_dir) else None)
+                async with get_scheduler().slot("python"):
+                    return await pool.run(
+                        os.path.abspath(script_path), script_version(script_path, script), task_response, inputs,
+                        timeout=timeout,
+                    )
+
             python_executable = os.path.join(venv_dir, 'Scripts', 'python.exe')
             if not os.path.exists(python_executable):
                 return {"Status": "Error", "OutputMessage": {}, "ErrorMessage": f"Python executable not found at: {python_executable}"}
 
             # Run the script
-            inputs_json = json.dumps(inputs)
-            command = [python_executable, os.path.abspath(script_path), inputs_json]
-            logging.info(f"Executing command: {' '.join(command)}")
-
-            process = await asyncio.create_subprocess_exec(
-                *command,
-                stdout=asyncio.subprocess.PIPE,
-                stderr=asyncio.subprocess.PIPE,
-                cwd=script_dir
-            )
-            stdout, stderr = await process.communicate()
+            command = [python_executable, os.path.abspath(script_path)]
+            if channel == "argv":
+                command.append(json.dumps(inputs))
+                result = await get_scheduler().run("python", command, cwd=script_dir, spool=spool, timeout=timeout)
+            else:
+                result = await get_scheduler().run(
+                    "python", command, cwd=script_dir, stdin=encode_inputs(inputs), spool=spool, timeout=timeout
+                )
+            if result.timed_out:
+                return timed_out_result(result, timeout)
 
-            print(stderr)
-            print(stdout)
+            logging.debug(f"{os.path.basename(script_path)} stderr: {result.stderr.text()[:SCRIPT_OUTPUT_PREVIEW]}")
+            logging.debug(f"{os.path.basename(script_path)} stdout: {result.stdout.text()[:SCRIPT_OUTPUT_PREVIEW]}")
 
-            if process.returncode == 0:
+            if result.returncode == 0:
                 try:
-                    outputs = json.loads(stdout.decode().strip())
+                    outputs = json.loads(result.stdout.text().strip())
                 except json.JSONDecodeError:
-                    outputs = stdout.decode().strip()
-                return {"Status": "Success", "OutputMessage": outputs, "ErrorMessage": ""}
+                    outputs = result.stdout.text().strip()
+                return {"Status": "Success", "OutputMessage": outputs, "ErrorMessage": "", **result.details()}
             else:
-                return {"Status": "Error", "OutputMessage": {}, "ErrorMessage": stderr.decode().strip()}
+                return {"Status": "Error", "OutputMessage": {}, "ErrorMessage": result.stderr.text().strip(), **result.details()}
         
         elif ext == ".js":
-            inputs_json = json.dumps(inputs)
-            command = ["node", script_path, inputs_json]
+            if plugin and NODE_POOL_ENABLED:
+                pool = await get_node_pool()
+                async with get_scheduler().slot("node"):
+                    return await pool.run(
+                        os.path.abspath(script_path), script_version(script_path, script), task_response, inputs,
+                        timeout=timeout,
+                    )
+
+            command = ["node", script_path]
+            stdin = None
+            if channel == "argv":
+                command.append(json.dumps(inputs))
+            else:
+                stdin = encode_inputs(inputs)
 
         elif ext == ".ps1":
+            if script is not None:
+                file_content = script.content
+            else:
+                with open(script_path, 'r') as script_file:
+                    file_content = script_file.read()
+
+            if POWERSHELL_POOL_ENABLED:
+                pool = await get_powershell_pool()
+                async with get_scheduler().slot("powershell"):
+                    return await pool.run(
+                        file_content, task_response, inputs, os.path.abspath(spool_path(*spool, "stdout")),
+                        timeout=timeout,
+                    )
+
+            if channel != "argv":
+                # The script and its inputs travel on stdin; the command line stays constant.
+                return await run_powershell_command(
+                    POWERSHELL_STDIN_BOOTSTRAP, stdin=encode_job(file_content, task_response, inputs),
+                    spool=spool, timeout=timeout,
+                )
+
             header = (
                 f"$jsonObject = '{json.dumps(task_response)}' | ConvertFrom-Json; "
                 f"$SCTASK_RESPONSE = $jsonObject.result; "
                 f"$ADDITIONAL_VARIABLES = '{json.dumps(inputs)}' | ConvertFrom-Json; "
             )
-            with open(script_path, 'r') as script_file:
-                file_content = script_file.read()
-
             powershell_script = header + file_content
 
-            return await run_powershell_command(powershell_script)
+            return await run_powershell_command(powershell_script, spool=spool, timeout=timeout)
         else:
             error_msg = f"Unsupported script file type: {ext}"
             logging.error(error_msg)
             return {"Status": "Error", "OutputMessage": {}, "ErrorMessage": error_msg}
 
-        logging.info(f"Executing command: {' '.join(command)}")
-        process = await asyncio.create_subprocess_exec(
-            *command,
-            stdout=asyncio.subprocess.PIPE,
-            stderr=asyncio.subprocess.PIPE
-        )
-        stdout, stderr = await process.communicate()
+        result = await get_scheduler().run("node", command, stdin=stdin, spool=spool, timeout=timeout)
+        if result.timed_out:
+            return timed_out_result(result, timeout)
 
-        stdout_decoded = stdout.decode().strip().replace('\r\n',' ')
-        stderr_decoded = stderr.decode().strip().replace('\r\n',' ')
+        stdout_decoded = result.stdout.text().strip().replace('\r\n',' ')
+        stderr_decoded = result.stderr.text().strip().replace('\r\n',' ')
 
-        if process.returncode == 0:
+        if result.returncode == 0:
             try:
                 outputs = json.loads(stdout_decoded)
             except json.JSONDecodeError:
                 outputs = stdout_decoded
-            return {"Status": "Success", "OutputMessage": outputs, "ErrorMessage": ""}
+            return {"Status": "Success", "OutputMessage": outputs, "ErrorMessage": "", **result.details()}
         else:
             logging.error(f"Script execution error: {stderr_decoded}")
-            return {"Status": "Error", "OutputMessage": {}, "ErrorMessage": stderr_decoded}
+            return {"Status": "Error", "OutputMessage": {}, "ErrorMessage": stderr_decoded, **result.details()}
 
     except Exception as e:
         logging.error(f"Exception occurred during script execution: {e}")
@@ -174,19 +310,20 @@ async def run_script(script_path: str, inputs: dict, task_response: dict) -> dic
 # -----------------------------------------------------------------------
 # Asynchronous Helper Functions
 # -----------------------------------------------------------------------
-async def run_powershell_command(command: str):
-    """Execute a PowerShell command and return status and output."""
+async def run_powershell_command(command: str, stdin: bytes = None, spool: tuple = None, timeout: float = None):
+    """Execute a PowerShell command without blocking the event loop and return status and output."""
     try:
         logging.debug(f"Executing PowerShell command: {command}")
-        result = subprocess.run(
-            ["powershell", "-Command", command],
-            capture_output=True,
-            text=True
+        result = await get_scheduler().run(
+            "powershell", ["powershell", "-Command", command], stdin=stdin, spool=spool, timeout=timeout
         )
+        if result.timed_out:
+            return {**timed_out_result(result, timeout), "OutputMessage": ""}
         return {
             "Status": "Success" if result.returncode == 0 else "Error",
-            "OutputMessage": result.stdout.strip(),
-            "ErrorMessage": result.stderr.strip(),
+            "OutputMessage": result.stdout.text().strip(),
+            "ErrorMessage": result.stderr.text().strip(),
+            **result.details(),
         }
     except Exception as e:
         return {
@@ -195,6 +332,91 @@ async def run_powershell_command(command: str):
             "ErrorMessage": str(e)
         }
  
+# -----------------------------------------------------------------------
+# Group Membership Batching
+# -----------------------------------------------------------------------
+# Bulk variant of "Add_user_to_security_group": adds a list of members to one group.
+AD_BATCH_SCRIPT = os.getenv("AD_BATCH_SCRIPT", os.path.join("BatchScripts", "Add_users_to_security_group_bulk.ps1"))
+
+async def add_group_members_bulk(group: str, members: list) -> dict:
+    """Run the bulk membership script once for `members` and return {member: result}."""
+    ps_result = await run_script(
+        AD_BATCH_SCRIPT, {"uniquegroupname": group, "Members": members}, {"result": {}}, timeout=SCRIPT_TIMEOUT
+    )
+    if ps_result["Status"] != "Success":
+        raise RuntimeError(ps_result["ErrorMessage"])
+    output = ps_result["OutputMessage"]
+    if isinstance(output, str):
+        output = json.loads(output)
+    if output.get("Status") != "Success":
+        raise RuntimeError(output.get("ErrorMessage") or output.get("OutputMessage", ""))
+    results = output.get("Results") or []
+    if isinstance(results, dict):
+        # ConvertTo-Json collapses a single-element array into an object
+        results = [results]
+    return {item["Member"]: item for item in results}
+
+membership_batcher = MembershipBatcher(add_group_members_bulk)
+
+async def run_batched_membership(additional_vars: dict, batch_config: dict) -> dict:
+    """
+    Add the ticket's user to its group through the shared membership batcher and
+    return a result shaped like the per-ticket Add_user_to_security_group output.
+    """
+    group = additional_vars.get("uniquegroupname")
+    member = (additional_vars.get("SamAccountName") or "").strip()
+    if not group or not member:
+        return {"Status": "Error", "OutputMessage": {}, "ErrorMessage": "uniquegroupname and SamAccountName are required for a batched membership update"}
+
+    result = await membership_batcher.add(
+        group, member, window=batch_config.get("window"), max_size=batch_config.get("max_size")
+    )
+    if result.get("Status") == "Success":
+        output = {
+            "Status": "Success",
+            "OutputMessage": f"Automation has successfully added the user {member} to {group} security group\nHence closing the ticket",
+            "ErrorMessage": "",
+        }
+    else:
+        output = {
+            "Status": "Error",
+            "OutputMessage": f"Automation has failed to add the user {member} to {group} security group",
+            "ErrorMessage": result.get("ErrorMessage", ""),
+        }
+    return {"Status": "Success", "OutputMessage": output, "ErrorMessage": ""}
+ 
+async def record_execution_log(state: FlowState, *entries: dict) -> FlowState:
+    """Append entries to the ticket's execution log store and keep only a count and the last entry in state."""
+    store = await get_execution_log_store()
+    await store.append(state["thread_id"], state["run_id"], state["execution_log_count"], list(entries))
+    state["execution_log_count"] += len(entries)
+    state["last_log_entry"] = entries[-1]
+    return state
+ 
+async def push_ticket_update(task_response: dict, body: dict, failure_message: str):
+    """
+    Queue a field update for the ticket in the ServiceNow outbox, or send it
+    right away when the outbox is disabled.
+    """
+    table_name = task_response["result"][0]["sys_class_name"]
+    sys_id = task_response["result"][0]["sys_id"]
+
+    if SERVICENOW_OUTBOX_ENABLED:
+        outbox = await get_outbox()
+        await outbox.enqueue(table_name, sys_id, body)
+        return
+
+    resp = await get_servicenow_client().update_record(table_name, sys_id, body)
+    if resp.status_code != 200:
+        logging.error(f"{failure_message}: {resp.json()}")
+        raise Exception(f"{failure_message}: {resp.json()}")
+
+async def flush_ticket_updates(task_response: dict):
+    """Push any outbox updates still pending for the ticket (called when a flow ends)."""
+    if SERVICENOW_OUTBOX_ENABLED:
+        outbox = await get_outbox()
+        await outbox.flush(task_response["result"][0]["sys_id"])
+ 
 def parse_powershell_output(powershell_response: dict, additional_variables: dict):
     """
     Parse JSON output from the PowerShell script and update additional_variables.
@@ -230,12 +452,11 @@ def parse_powershell_output(powershell_response: dict, additional_variables: dic
 # -----------------------------------------------------------------------
 # Flow Node Functions (Async)
 # -----------------------------------------------------------------------
-import httpx
  
-async def initialize_flow_state(state: FlowState) -> FlowState:
+async def initialize_flow_state(state: FlowState, config: RunnableConfig) -> FlowState:
     """
     Determine the flow name from the short_description and initialize the state.
-    Now reading from a YAML file instead of CSV.
+    Flows come from the in-memory flow catalog built from flow_details.yml.
     """
     logging.debug("Checking flow name.")
     task_response = state["task_response"]
@@ -246,29 +467,12 @@ async def initialize_flow_state(state: FlowState) -> FlowState:
     if not short_description:
         raise ValueError("Short description is missing in the task response.")
  
-    # --- Load from YAML ---
-    try:
-        with open("flow_details.yml", "r", encoding="utf-8") as f:
-            yaml_data = yaml.safe_load(f)  # e.g., {"flows": [ {...}, {...} ]}
-            # Create a dict that maps a short_description -> { flow_name, reassignment_group, ... }
-            flow_map = {
-                item["short_description"]: {
-                    "flow_name": item["flow_name"],
-                    "reassignment_group": item["reassignment_group"],
-                }
-                for item in yaml_data.get("flows", [])
-            }
-    except FileNotFoundError:
-        raise ValueError("flow_details.yml file not found.")
-    except KeyError as e:
-        raise ValueError(f"Missing key in flow_details.yml: {e}")
- 
-    # Lookup the short_description
-    if short_description not in flow_map:
+    # --- Lookup in the cached flow catalog (flow_details.yml) ---
+    mapping_data = get_flow_catalog().lookup(short_description)
+    if mapping_data is None:
         logging.error(f"No flow found for: {short_description}")
         raise ValueError(f"No flow found for short description: {short_description}")
  
-    mapping_data = flow_map[short_description]
     state["flow_name"] = mapping_data["flow_name"]
     logging.debug(f"Flow name determined: {state['flow_name']}")
  
@@ -277,13 +481,20 @@ async def initialize_flow_state(state: FlowState) -> FlowState:
  
     # Initialize state fields
     state["actions_list"] = []
+    state["action_plan"] = []
     state["current_action"] = ""
     state["worknote_content"] = ""
-    state["execution_log"] = []
+    state["thread_id"] = config["configurable"]["thread_id"]
+    state["run_id"] = uuid.uuid4().hex
+    state["execution_log_count"] = 0
+    state["last_log_entry"] = {}
     state["action_index"] = 0
     state["next_action"] = False
     state["error_occurred"] = False
+    state["flow_status"] = "running"
     state["additional_variables"] = {}
+    deadline = float(mapping_data.get("deadline", FLOW_DEADLINE) or 0)
+    state["deadline"] = time.time() + deadline if deadline > 0 else 0
  
     # Mark ticket as WORK_IN_PROGRESS
     updated_state = await update_ticket_state(state, TicketState.WORK_IN_PROGRESS)
@@ -296,26 +507,12 @@ async def update_ticket_state(state: FlowState, task_state: TicketState) -> Flow
     try:
         task_response = state["task_response"]
         state_request = {"state": str(task_state.value)}
-        updated_state_json = json.dumps(state_request)
- 
-        table_name = task_response["result"][0]["sys_class_name"]
-        sys_id = task_response["result"][0]["sys_id"]
- 
-        url = f"{endpoint}/api/now/table/{table_name}/{sys_id}"
-        async with httpx.AsyncClient() as client:
-            auth = (user, pwd)
-            resp = await client.put(
-                url,
-                auth=auth,
-                headers={"Content-Type": "application/json", "Accept": "application/json"},
-                content=updated_state_json
-            )
-            if resp.status_code != 200:
-                raise Exception(f"Failed to update state: {resp.json()}")
+ 
+        await push_ticket_update(task_response, state_request, "Failed to update state")
  
         state["worknote_content"] = "Worknotes updated successfully"
-        # Log the updated ticket state in execution_log
-        state["execution_log"].append({
+        # Log the updated ticket state in the execution log
+        await record_execution_log(state, {
             "action": "update_ticket_state",
             "ticket_state_value": task_state.value,
             "ticket_state_name": task_state.name,
@@ -326,66 +523,122 @@ async def update_ticket_state(state: FlowState, task_state: TicketState) -> Flow
     return state
  
 async def retrieve_flow_scripts(state: FlowState) -> FlowState:
-    """Fetch PowerShell scripts from UseCases/<flow_name>."""
+    """Fetch the ordered action scripts of UseCases/<flow_name> from the script registry."""
     logging.debug("Fetching actions for the flow.")
-    flow_dir = "UseCases"
     try:
-        actions_dir = os.path.join(flow_dir, state["flow_name"])
-        actions_list = os.listdir(actions_dir)
+        actions_list = [action.name for action in get_script_registry().get_actions(state["flow_name"])]
     except Exception as e:
         logging.error(f"Error fetching actions: {e}")
         raise RuntimeError(f"Error fetching actions: {e}")
  
+    try:
+        manifest = get_flow_catalog().flow_config(state["flow_name"]).get("actions")
+        action_plan = build_action_plan(actions_list, manifest)
+    except ValueError as e:
+        logging.error(f"Invalid action manifest for {state['flow_name']}: {e}")
+        raise RuntimeError(f"Invalid action manifest for {state['flow_name']}: {e}")
+ 
     state["actions_list"] = actions_list
+    state["action_plan"] = action_plan
     logging.debug(f"Actions found: {actions_list}")
+    logging.debug(f"Action plan: {action_plan}")
     return state
  
 async def evaluate_flow_decision(state: FlowState) -> FlowState:
     """Decide whether to continue or end the flow."""
     logging.debug("Assistant node: deciding next step.")
+    if (not state["error_occurred"] and state.get("deadline")
+            and time.time() >= state["deadline"] and state["action_index"] < len(state["action_plan"])):
+        # Out of time: skip the remaining stages and hand the ticket to the reassignment group
+        logging.error(f"Ticket deadline passed before stage {state['action_index'] + 1}; reassigning.")
+        state["error_occurred"] = True
+        await record_execution_log(state, {
+            "action": "deadline_exceeded",
+            "Status": "Timeout",
+            "skipped": [name for stage in state["action_plan"][state["action_index"]:] for name in stage],
+        })
     if state["error_occurred"]:
         state["next_action"] = False
+        state["flow_status"] = "reassigned"
         updated_state = await update_servicenow_assignment_group(state)
+        await flush_ticket_updates(updated_state["task_response"])
         logging.debug("Assistant: error_occured=True, will end flow.")
         return updated_state
  
-    if state["action_index"] < len(state["actions_list"]):
+    if state["action_index"] < len(state["action_plan"]):
         state["next_action"] = True
-        state["current_action"] = state["actions_list"][state["action_index"]]
+        state["current_action"] = ", ".join(state["action_plan"][state["action_index"]])
         logging.debug(f"Assistant: next_action=True. Next script: {state['current_action']}")
     else:
         state["next_action"] = False
         state["current_action"] = ""
         state = await update_ticket_state(state, TicketState.CLOSED_COMPLETE)
+        state["flow_status"] = "completed"
+        await flush_ticket_updates(state["task_response"])
         logging.debug("Assistant: no more actions, ending flow.")
  
     return state
 
-async def execute_flow_script(state: FlowState) -> FlowState:
+def action_timeout(flow_name: str, settings: dict, deadline: float = 0):
     """
-    Executes the current script in the workflow and updates the FlowState accordingly.
-    Only executes .ps1, .py, and .js files.
-    
-    Args:
-        state (FlowState): The current state of the workflow, containing action index,
-                           actions list, variables, and other relevant data.
-    
+    Seconds the action may run: its own `timeout:`, else the flow's `timeout:`,
+    else SCRIPT_TIMEOUT, capped by what is left before the ticket deadline.
+    None means no limit.
+    """
+    timeout = settings.get("timeout", get_flow_catalog().flow_config(flow_name).get("timeout", SCRIPT_TIMEOUT))
+    timeout = float(timeout) if timeout else None
+    if deadline:
+        remaining = max(deadline - time.time(), 0.001)
+        timeout = min(timeout, remaining) if timeout else remaining
+    return timeout
+
+def invalidate_cached_results(flow_name: str, targets: list, settings: dict, additional_vars: dict):
+    """
+    Drop cached results made stale by a side-effecting action. When the
+    ticket's variables hold every key variable of a target, only that entry
+    goes; otherwise every cached result of the target is dropped.
+    """
+    for target in targets:
+        target_cache = cache_settings(settings[target])
+        keys = target_cache["key"] if target_cache else None
+        if keys is not None and all(key in additional_vars for key in keys):
+            script = get_script_registry().get_action(flow_name, target)
+            dropped = action_cache.invalidate(flow_name, target, cache_key(script.sha256, additional_vars, keys))
+        else:
+            dropped = action_cache.invalidate(flow_name, target)
+        logging.debug(f"Invalidated {dropped} cached result(s) of {target}.")
+
+async def run_flow_action(action_name: str, flow_name: str, additional_vars: dict, task_response: dict,
+                          deadline: float = 0) -> dict:
+    """
+    Run a single action script and interpret its output.
+    Only executes .ps1, .py, and .js files. A script that outlives its
+    timeout (see action_timeout) is killed and the action fails with Status "Timeout".
+    Actions marked `cache:` in the flow manifest reuse a recent successful
+    result for the same script and key variables instead of running again.
+    Duration and outcome are recorded in flow_action_seconds.
+
     Returns:
-        FlowState: The updated state after executing the script.
+        dict: Outcome containing:
+            - log: the execution log entry for the action
+            - variables: outputs to merge into additional_variables
+            - worknote: worknote text for the action
+            - error: True when the action failed
     """
-    logging.debug("Executing current action.")
-    
-    # Retrieve necessary variables from the state
-    idx = state["action_index"]
-    actions = state["actions_list"]
-    additional_vars = state["additional_variables"]
-    task_response = state["task_response"]
-    flow_name = state["flow_name"]
-    
-    # Get the current action to execute
-    action_name = actions[idx]
+    started_at = time.perf_counter()
+    outcome = await _run_flow_action(action_name, flow_name, additional_vars, task_response, deadline)
+    log = outcome["log"] or {}
+    status = "Cached" if log.get("Cached") else log.get("Status") or "Error"
+    if outcome["error"] and status == "Success":
+        status = "Error"
+    action_seconds.observe(time.perf_counter() - started_at, flow=flow_name, action=action_name, outcome=status)
+    return outcome
+
+async def _run_flow_action(action_name: str, flow_name: str, additional_vars: dict, task_response: dict,
+                           deadline: float = 0) -> dict:
     action_path = os.path.join("UseCases", flow_name, action_name)
     logging.debug(f"Checking action script: {action_path}")
+    outcome = {"log": None, "variables": {}, "worknote": "", "error": False}
     
     # Define allowed file extensions
     allowed_extensions = ('.ps1', '.py', '.js')
@@ -393,73 +646,216 @@ async def execute_flow_script(state: FlowState) -> FlowState:
     # Check if the file has an allowed extension
     if not action_path.lower().endswith(allowed_extensions):
         logging.warning(f"Skipping {action_name}: Unsupported file type")
-        state["execution_log"].append({
+        outcome["log"] = {
             "script": action_name,
             "Status": "Skipped",
             "OutputMessage": "Unsupported file type - only .ps1, .py, and .js are allowed",
             "ErrorMessage": ""
-        })
-        state["worknote_content"] = f"Skipped {action_name}: Unsupported file type"
-        state["action_index"] = idx + 1
-        return state
+        }
+        outcome["worknote"] = f"Skipped {action_name}: Unsupported file type"
+        return outcome
     
     try:
         logging.debug(f"Running action script: {action_path}")
-        # Execute the script asynchronously
-        ps_result = await run_script(action_path, additional_vars, task_response)
+        script = get_script_registry().get_action(flow_name, action_name)
+        flow_settings = action_settings(
+            [action.name for action in get_script_registry().get_actions(flow_name)],
+            get_flow_catalog().flow_config(flow_name).get("actions"),
+        )
+        settings = flow_settings[action_name]
+        timeout = action_timeout(flow_name, settings, deadline)
+        cache = cache_settings(settings) if ACTION_CACHE_ENABLED else None
+        cached_result = None
+        if cache is not None:
+            result_key = cache_key(script.sha256, additional_vars, cache["key"])
+            cached_result = action_cache.get(flow_name, action_name, result_key)
+        if cached_result is not None:
+            logging.debug(f"Using cached result for {action_name}.")
+            ps_result = cached_result
+        elif settings.get("batch"):
+            # Membership additions are merged with other tickets' into one bulk call
+            batch_config = settings["batch"] if isinstance(settings["batch"], dict) else {}
+            try:
+                ps_result = await asyncio.wait_for(run_batched_membership(additional_vars, batch_config), timeout)
+            except asyncio.TimeoutError:
+                ps_result = {"Status": "Timeout", "OutputMessage": {}, "ErrorMessage": f"Batched membership update timed out after {timeout:.1f} seconds"}
+        else:
+            inputs = additional_vars
+            if settings.get("spooled_inputs"):
+                # Variables earlier actions left in their spool files, loaded for this run only
+                inputs = {**additional_vars, **load_spooled_inputs(additional_vars, settings["spooled_inputs"])}
+            # Execute the script asynchronously
+            ps_result = await run_script(
+                script.path, inputs, task_response, script, timeout=timeout, plugin=bool(settings.get("plugin")),
+                input_channel=settings.get("input"),
+            )
+        if cached_result is None and settings.get("invalidates"):
+            invalidate_cached_results(flow_name, settings["invalidates"], flow_settings, additional_vars)
         
         # Log the execution result in the state's execution log
-        state["execution_log"].append({
+        outcome["log"] = {
             "script": action_name,
             "Status": ps_result["Status"],
             "OutputMessage": ps_result["OutputMessage"],
             "ErrorMessage": ps_result["ErrorMessage"]
-        })
+        }
+        # Spool references and peak memory of the script, when captured
+        outcome["log"].update(
+            {key: ps_result[key] for key in CAPTURE_DETAIL_KEYS if ps_result.get(key) is not None}
+        )
+        if cached_result is not None:
+            outcome["log"]["Cached"] = True
         
-        if ps_result["Status"] == "Error":
+        if ps_result["Status"] == "Timeout":
+            logging.error(f"Timeout executing {action_name}: {ps_result['ErrorMessage']}")
+            outcome["worknote"] = f"Timeout in {action_name}: {ps_result['ErrorMessage']}"
+            outcome["error"] = True
+        elif ps_result["Status"] == "Error":
             # Handle error case for all script types
             logging.error(f"Error executing {action_name}: {ps_result['ErrorMessage']}")
-            state["worknote_content"] = f"Error in {action_name}: {ps_result['ErrorMessage']}"
-            state["error_occurred"] = True
+            outcome["worknote"] = f"Error in {action_name}: {ps_result['ErrorMessage']}"
+            outcome["error"] = True
         else:
             # Handle success case uniformly
             output = ps_result["OutputMessage"]
-            if isinstance(output, str):
+            if isinstance(output, str) and ps_result.get("OutputRef"):
+                # Spooled stdout: OutputMessage is a truncated preview. Only the result fields are read
+                # back; the variables stay in the spool file and state keeps just its reference.
+                fields = read_spooled_fields(
+                    ps_result["OutputRef"], ("Status", "OutputMessage", "ErrorMessage"), SCRIPT_OUTPUT_PREVIEW,
+                    strict=False,
+                )
+                if fields is None:
+                    outcome["worknote"] = output
+                elif fields.get("Status") == "Success":
+                    outcome["variables"] = {OUTPUT_REF_PREFIX + action_name: ps_result["OutputRef"]}
+                    outcome["worknote"] = fields.get("OutputMessage", "Execution Successful")
+                else:
+                    outcome["worknote"] = f"{fields.get('OutputMessage', '')}\n{fields.get('ErrorMessage', '')}"
+                    outcome["error"] = True
+            elif isinstance(output, str):
                 try:
                     # Attempt to parse as JSON (e.g., PowerShell output)
                     output = json.loads(output)
                 except json.JSONDecodeError:
                     # If not JSON, use the string directly as the success message
-                    state["worknote_content"] = output
-                    state["error_occurred"] = False
+                    outcome["worknote"] = output
                 else:
                     # Parsed as dictionary
                     if output.get("Status") == "Success":
-                        state["additional_variables"].update(output)
-                        state["worknote_content"] = output.get("OutputMessage", "Execution Successful")
-                        state["error_occurred"] = False
+                        outcome["variables"] = output
+                        outcome["worknote"] = output.get("OutputMessage", "Execution Successful")
                     else:
-                        state["worknote_content"] = f"{output.get('OutputMessage', '')}\n{output.get('ErrorMessage', '')}"
-                        state["error_occurred"] = True
+                        outcome["worknote"] = f"{output.get('OutputMessage', '')}\n{output.get('ErrorMessage', '')}"
+                        outcome["error"] = True
             elif isinstance(output, dict):
                 # Output is already a dictionary (e.g., Python/Node.js JSON output)
                 if output.get("Status") == "Success":
-                    state["additional_variables"].update(output)
-                    state["worknote_content"] = output.get("OutputMessage", "Execution Successful")
-                    state["error_occurred"] = False
+                    outcome["variables"] = output
+                    outcome["worknote"] = output.get("OutputMessage", "Execution Successful")
                 else:
-                    state["worknote_content"] = f"{output.get('OutputMessage', '')}\n{output.get('ErrorMessage', '')}"
-                    state["error_occurred"] = True
+                    outcome["worknote"] = f"{output.get('OutputMessage', '')}\n{output.get('ErrorMessage', '')}"
+                    outcome["error"] = True
             else:
                 # Fallback: convert unexpected types to string
-                state["worknote_content"] = str(output)
-                state["error_occurred"] = False
+                outcome["worknote"] = str(output)
+            # A spooled result is not cached: it is only a reference to a file prune_spool removes
+            if cache is not None and cached_result is None and not outcome["error"] and not ps_result.get("OutputRef"):
+                action_cache.put(flow_name, action_name, result_key, {
+                    "Status": ps_result["Status"],
+                    "OutputMessage": output,
+                    "ErrorMessage": ps_result["ErrorMessage"],
+                }, ttl=cache["ttl"])
     
     except Exception as e:
         # Handle any exceptions during execution
         logging.error(f"Execution failed for {action_name}: {e}")
-        state["worknote_content"] = f"Execution failed for {action_name}: {e}"
-        state["error_occurred"] = True
+        outcome["worknote"] = f"Execution failed for {action_name}: {e}"
+        outcome["error"] = True
+    
+    return outcome
+
+async def run_journaled_action(state: FlowState, action_name: str, additional_vars: dict) -> dict:
+    """
+    Run an action through the action journal: an action this flow run already
+    finished (before a crash and resume) returns its journaled outcome instead
+    of running again; otherwise its outcome is journaled as soon as it returns.
+    """
+    journal = await get_action_journal()
+    outcome = await journal.get(state["thread_id"], state["run_id"], action_name)
+    if outcome is not None:
+        logging.info(f"{action_name} already finished in run {state['run_id']}; replaying its journaled outcome.")
+        return outcome
+    outcome = await run_flow_action(
+        action_name, state["flow_name"], additional_vars, state["task_response"], state.get("deadline", 0)
+    )
+    await journal.record(state["thread_id"], state["run_id"], action_name, outcome)
+    return outcome
+
+async def run_action_stage(stage: list, state: FlowState) -> list:
+    """
+    Run the independent actions of one stage concurrently and return their
+    outcomes in stage order. The first failing action cancels the rest.
+    """
+    tasks = {
+        asyncio.create_task(run_journaled_action(state, name, dict(state["additional_variables"]))): name
+        for name in stage
+    }
+    outcomes = {}
+    pending = set(tasks)
+    while pending:
+        done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+        for task in done:
+            outcomes[tasks[task]] = task.result()
+        if pending and any(outcomes[tasks[task]]["error"] for task in done):
+            for task in pending:
+                task.cancel()
+            await asyncio.gather(*pending, return_exceptions=True)
+            for task in pending:
+                outcomes[tasks[task]] = {
+                    "log": {
+                        "script": tasks[task],
+                        "Status": "Cancelled",
+                        "OutputMessage": "",
+                        "ErrorMessage": "Cancelled because another action in the same stage failed"
+                    },
+                    "variables": {},
+                    "worknote": "",
+                    "error": False,
+                }
+            break
+    return [outcomes[name] for name in stage]
+
+async def execute_flow_script(state: FlowState) -> FlowState:
+    """
+    Executes the current stage of the workflow and updates the FlowState accordingly.
+    A stage is usually a single script; actions declared independent in the
+    flow manifest share a stage and run concurrently. Their outputs are merged
+    into additional_variables in stage order, so the result is deterministic.
+    
+    Args:
+        state (FlowState): The current state of the workflow, containing action index,
+                           action plan, variables, and other relevant data.
+    
+    Returns:
+        FlowState: The updated state after executing the stage.
+    """
+    logging.debug("Executing current action.")
+    
+    # Retrieve necessary variables from the state
+    idx = state["action_index"]
+    stage = state["action_plan"][idx]
+    
+    if len(stage) == 1:
+        outcomes = [await run_journaled_action(state, stage[0], state["additional_variables"])]
+    else:
+        outcomes = await run_action_stage(stage, state)
+    
+    await record_execution_log(state, *(outcome["log"] for outcome in outcomes))
+    for outcome in outcomes:
+        state["additional_variables"].update(outcome["variables"])
+    state["worknote_content"] = "\n\n".join(outcome["worknote"] for outcome in outcomes if outcome["worknote"])
+    state["error_occurred"] = any(outcome["error"] for outcome in outcomes)
     
     # Increment the action index for the next iteration
     state["action_index"] = idx + 1
@@ -473,23 +869,9 @@ async def update_servicenow_worknotes(state: FlowState) -> FlowState:
         task_response = state["task_response"]
         content = state["worknote_content"]
  
-        table_name = task_response["result"][0]["sys_class_name"]
-        sys_id = task_response["result"][0]["sys_id"]
-        url = f"{endpoint}/api/now/table/{table_name}/{sys_id}"
- 
         body = {"work_notes": content}
  
-        async with httpx.AsyncClient() as client:
-            auth = (user, pwd)
-            resp = await client.put(
-                url,
-                auth=auth,
-                headers={"Content-Type": "application/json", "Accept": "application/json"},
-                json=body
-            )
-            if resp.status_code != 200:
-                logging.error(f"Failed to update worknotes: {resp.json()}")
-                raise Exception(f"Failed to update worknotes: {resp.json()}")
+        await push_ticket_update(task_response, body, "Failed to update worknotes")
  
         state["worknote_content"] = "Worknotes updated successfully"
     except Exception as e:
@@ -506,24 +888,11 @@ async def update_servicenow_assignment_group(state: FlowState):
         reassignment_group_sys_id = state["reassignment_group"]
         data = {"assignment_group": reassignment_group_sys_id}
  
-        table_name = task_response["result"][0]["sys_class_name"]
-        sys_id = task_response["result"][0]["sys_id"]
-        url = f"{endpoint}/api/now/table/{table_name}/{sys_id}"
- 
-        async with httpx.AsyncClient() as client:
-            auth = (user, pwd)
-            resp = await client.put(
-                url,
-                auth=auth,
-                headers={"Content-Type": "application/json", "Accept": "application/json"},
-                data=json.dumps(data)
-            )
-            if resp.status_code != 200:
-                raise Exception(f"Failed to update assignment group: {resp.json()}")
+        await push_ticket_update(task_response, data, "Failed to update assignment group")
  
         state["worknote_content"] = "Worknotes updated successfully"
-        # Log the updated ticket state in execution_log
-        state["execution_log"].append({
+        # Log the reassignment in the execution log
+        await record_execution_log(state, {
             "action": "update_servicenow_assignment_group",
         })
     except Exception as e:
@@ -539,13 +908,29 @@ def determine_flow_outcome(state: FlowState) -> Literal["execute_flow_script", E
 # -----------------------------------------------------------------------
 # Build and Compile the StateGraph
 # -----------------------------------------------------------------------
+def timed_node(name: str, node):
+    """Wrap a node function so its latency is recorded in graph_node_seconds."""
+    takes_config = "config" in inspect.signature(node).parameters
+
+    @functools.wraps(node)
+    async def wrapper(state: FlowState, config: RunnableConfig = None):
+        start = time.perf_counter()
+        outcome = "error"
+        try:
+            result = await (node(state, config) if takes_config else node(state))
+            outcome = "ok"
+            return result
+        finally:
+            node_seconds.observe(time.perf_counter() - start, node=name, outcome=outcome)
+    return wrapper
+
 builder = StateGraph(FlowState)
  
-builder.add_node("initialize_flow_state", initialize_flow_state)
-builder.add_node("retrieve_flow_scripts", retrieve_flow_scripts)
-builder.add_node("evaluate_flow_decision", evaluate_flow_decision)
-builder.add_node("execute_flow_script", execute_flow_script)
-builder.add_node("update_servicenow_worknotes", update_servicenow_worknotes)
+builder.add_node("initialize_flow_state", timed_node("initialize_flow_state", initialize_flow_state))
+builder.add_node("retrieve_flow_scripts", timed_node("retrieve_flow_scripts", retrieve_flow_scripts))
+builder.add_node("evaluate_flow_decision", timed_node("evaluate_flow_decision", evaluate_flow_decision))
+builder.add_node("execute_flow_script", timed_node("execute_flow_script", execute_flow_script))
+builder.add_node("update_servicenow_worknotes", timed_node("update_servicenow_worknotes", update_servicenow_worknotes))
  
 builder.add_edge(START, "initialize_flow_state")
 builder.add_edge("initialize_flow_state", "retrieve_flow_scripts")
@@ -556,16 +941,266 @@ builder.add_edge("update_servicenow_worknotes", "evaluate_flow_decision")
  
 # We will keep a reference to a compiled graph, but we initialize it via `init_graph()`.
 _graph = None
+_close_checkpointer = None
+_maintenance = None
+# Concurrent (and just-repeated) submissions of a ticket share one flow run.
+flow_runs = SingleFlight()
+# Bounds flows resumed at startup or taken over from a dead worker.
+_resume_slots = asyncio.Semaphore(max(1, FLOW_RESUME_CONCURRENCY))
  
 async def init_graph():
     """
-    Initialize and return the compiled StateGraph with the AsyncSqliteSaver.
+    Initialize and return the compiled StateGraph with the checkpointer chosen
+    by CHECKPOINT_BACKEND (sqlite by default).
     This will be called once in the FastAPI startup event.
     """
-    global _graph
+    global _graph, _close_checkpointer, _maintenance
     if _graph is None:
-        import aiosqlite
-        conn = await aiosqlite.connect(db_path, check_same_thread=False)
-        memory = AsyncSqliteSaver(conn)
+        memory, _close_checkpointer = await open_checkpointer(CHECKPOINT_BACKEND, db_path)
+        if CHECKPOINT_BACKEND == "sqlite":
+            _maintenance = CheckpointMaintenance(memory, db_path)
+            await _maintenance.prepare()
+            _maintenance.start()
         _graph = builder.compile(checkpointer=memory)
+        get_flow_catalog()
+        await asyncio.to_thread(prune_spool)
+        get_script_registry().start_watching()
+        get_servicenow_client()
+        if SERVICENOW_MIRROR_ENABLED:
+            await get_servicenow_mirror()
+        await get_execution_log_store()
+        await get_action_journal()
+        leases = await get_lease_manager()
+        leases.on_expired = resume_thread
+        if SERVICENOW_OUTBOX_ENABLED:
+            await get_outbox()
+        if POWERSHELL_POOL_ENABLED:
+            await get_powershell_pool()
     return _graph
+
+CLOSED_TICKET_STATES = {
+    str(state.value) for state in (
+        TicketState.CLOSED_COMPLETE, TicketState.CLOSED_INCOMPLETE, TicketState.CLOSED_SKIPPED, TicketState.RESOLVED
+    )
+}
+
+async def closed_in_servicenow(task_response: dict, submitted: bool = False) -> bool:
+    """
+    True when the ticket is closed in ServiceNow according to the local mirror
+    (no call to the instance). A `submitted` payload is decided by its own
+    state and active fields only: the mirror row may predate it (the payload
+    is mirrored in the background), e.g. when a closed ticket was reopened.
+    """
+    mirror = servicenow_mirror()
+    try:
+        record = task_response["result"][0]
+    except (KeyError, IndexError, TypeError):
+        return False
+    if mirror is None or not isinstance(record, dict) or not record.get("sys_id"):
+        return False
+    if submitted:
+        return str(record.get("active")) == "false" or str(record.get("state")) in CLOSED_TICKET_STATES
+    return await mirror.ticket_closed(record.get("sys_class_name") or "sc_task", record["sys_id"], CLOSED_TICKET_STATES)
+
+def thread_id_for(task_response: dict) -> str:
+    """Build the checkpoint thread_id for a ticket, e.g. "task_SCTASK0013188"."""
+    return "task_" + task_response["result"][0]["number"]
+
+async def run_flow(task_response: dict) -> dict:
+    """
+    Run the whole flow for one ticket and return the final FlowState.
+    Shared by the synchronous API route, the job queue workers and the poller.
+    A submission for a ticket whose flow is already running (e.g. a ServiceNow
+    retry of a slow POST) attaches to that run instead of starting a second
+    one on the same thread; one arriving within FLOW_DEDUP_WINDOW after it
+    finished gets its final state. A ticket whose last run was interrupted
+    continues from its last checkpoint instead of starting over.
+    With several worker processes, the ticket's lease decides which one runs
+    it; the others wait for the lease (see run_leased).
+    """
+    graph = await init_graph()
+    thread_id = thread_id_for(task_response)
+    return await flow_runs.run(thread_id, lambda: run_leased(graph, thread_id, task_response))
+
+async def run_leased(graph, thread_id: str, task_response: dict = None, wait: bool = True):
+    """
+    Start or resume the thread while holding its lease. When another process
+    held the lease and finished the flow within FLOW_DEDUP_WINDOW, its final
+    state is returned instead of running the ticket again.
+    Raises TicketLeasedError when the lease cannot be had (at once if not `wait`).
+    """
+    leases = await get_lease_manager()
+    async with leases.hold(thread_id, wait=wait) as waited:
+        if waited:
+            snapshot = await graph.aget_state({"configurable": {"thread_id": thread_id}})
+            if (snapshot.values and not snapshot.next and snapshot.created_at
+                    and datetime.now(timezone.utc).timestamp()
+                    - datetime.fromisoformat(snapshot.created_at).timestamp() < FLOW_DEDUP_WINDOW):
+                coalesced_total.inc(state="other_worker")
+                return snapshot.values
+        started_at = time.perf_counter()
+        try:
+            result = await start_or_resume(graph, thread_id, task_response)
+        except Exception:
+            flow_seconds.observe(time.perf_counter() - started_at, flow="unknown", status="error")
+            raise
+        if result is not None:
+            flow_seconds.observe(time.perf_counter() - started_at, flow=result.get("flow_name") or "unknown",
+                                 status=result.get("flow_status") or "unknown")
+        return result
+
+async def start_or_resume(graph, thread_id: str, task_response: dict = None):
+    """
+    Continue the thread from its last checkpoint when a run was interrupted
+    there (the checkpoint still has a next node), else start a new run.
+    Without a task_response only a resume is possible; None is returned
+    when there is nothing to resume.
+    Closed tickets are not run again: an interrupted run is not resumed, and
+    a repeat submission of a ticket whose last run finished gets that run's
+    final state. A new submission is checked on its own fields, a resume
+    without one on the ServiceNow mirror.
+    """
+    config = {"configurable": {"thread_id": thread_id}, "recursion_limit": 100}
+    snapshot = await graph.aget_state(config)
+    if snapshot.next and snapshot.values.get("run_id"):
+        if task_response is not None:
+            closed = await closed_in_servicenow(task_response, submitted=True)
+        else:
+            closed = await closed_in_servicenow(snapshot.values.get("task_response"))
+        if closed:
+            logging.info(f"Not resuming {thread_id}: the ticket has been closed in ServiceNow.")
+            return snapshot.values if task_response is not None else None
+        logging.info(f"Resuming {thread_id} at {', '.join(snapshot.next)} (run {snapshot.values['run_id']}).")
+        return await graph.ainvoke(None, config=config)
+    if task_response is None:
+        return None
+    if snapshot.values and await closed_in_servicenow(task_response, submitted=True):
+        logging.info(f"Ignoring a repeat submission for {thread_id}: its flow finished and the ticket is closed.")
+        coalesced_total.inc(state="closed")
+        return snapshot.values
+    return await graph.ainvoke({"task_response": task_response}, config=config)
+
+async def interrupted_threads(graph, max_age: float = FLOW_RESUME_MAX_AGE) -> list:
+    """
+    Thread ids whose latest checkpoint is an interrupted run (a next node is
+    still pending), written within the last `max_age` seconds.
+    """
+    thread_ids = []
+    async for checkpoint in graph.checkpointer.alist(None):
+        thread_id = checkpoint.config["configurable"]["thread_id"]
+        if thread_id not in thread_ids:
+            thread_ids.append(thread_id)
+    interrupted = []
+    cutoff = datetime.now(timezone.utc).timestamp() - max_age if max_age > 0 else None
+    for thread_id in thread_ids:
+        snapshot = await graph.aget_state({"configurable": {"thread_id": thread_id}})
+        if not snapshot.next or not snapshot.values.get("run_id"):
+            continue
+        if cutoff is not None and snapshot.created_at and datetime.fromisoformat(snapshot.created_at).timestamp() < cutoff:
+            continue
+        interrupted.append(thread_id)
+    return interrupted
+
+async def resume_thread(thread_id: str) -> str:
+    """
+    Resume one interrupted thread if its lease is free (FLOW_RESUME_CONCURRENCY
+    at a time). Also the lease manager's handler for leases a dead worker left
+    behind. Returns the outcome: resumed, nothing, busy or failed.
+    """
+    graph = await init_graph()
+    async with _resume_slots:
+        try:
+            result = await flow_runs.run(thread_id, lambda: run_leased(graph, thread_id, wait=False))
+        except asyncio.CancelledError:
+            raise
+        except TicketLeasedError:
+            outcome = "busy"
+        except Exception as e:
+            logging.error(f"Failed to resume {thread_id}: {e}")
+            outcome = "failed"
+        else:
+            outcome = "resumed" if result is not None else "nothing"
+    flow_resumes_total.inc(outcome=outcome)
+    return outcome
+
+async def resume_interrupted_flows() -> dict:
+    """
+    Continue every interrupted flow from its last checkpoint, a bounded number
+    at a time so a restart does not start them all at once. Threads another
+    worker holds the lease for are left to it.
+    Called in the background at startup; returns counts by outcome.
+    """
+    graph = await init_graph()
+    thread_ids = await interrupted_threads(graph)
+    if thread_ids:
+        logging.info(f"Resuming {len(thread_ids)} interrupted flow(s).")
+    counts = {}
+    for outcome in await asyncio.gather(*(resume_thread(thread_id) for thread_id in thread_ids)):
+        counts[outcome] = counts.get(outcome, 0) + 1
+    return counts
+
+async def get_flow_progress(number: str):
+    """
+    Read a ticket's progress from the checkpointer.
+    Returns None when no checkpoint exists for the ticket.
+    """
+    graph = await init_graph()
+    snapshot = await graph.aget_state({"configurable": {"thread_id": "task_" + number}})
+    if not snapshot.values:
+        return None
+    values = snapshot.values
+    action_plan = values.get("action_plan") or []
+    return {
+        "flow_name": values.get("flow_name"),
+        "actions_total": len(values.get("actions_list") or []),
+        "actions_completed": sum(len(stage) for stage in action_plan[:values.get("action_index", 0)]),
+        "current_action": values.get("current_action"),
+        "error_occurred": values.get("error_occurred", False),
+        "flow_status": values.get("flow_status"),
+        "log_entries": values.get("execution_log_count", 0),
+        "finished": not snapshot.next,
+        "next_nodes": list(snapshot.next),
+        "updated_at": snapshot.created_at,
+    }
+
+async def get_execution_log(number: str, run_id: str = None) -> list:
+    """
+    Read a ticket's execution log from the side store.
+    Defaults to the latest run; run_id="*" returns every run.
+    """
+    store = await get_execution_log_store()
+    return await store.read("task_" + number, run_id)
+
+def get_checkpoint_maintenance():
+    """The checkpoint maintenance task created by init_graph(), or None before startup."""
+    return _maintenance
+
+async def close_graph():
+    """
+    Cancel flow runs still in flight (leaving their leases expired for
+    another worker) and close the lease manager, send pending membership batches,
+    release the PowerShell, Python plugin and Node pools, flush the
+    ServiceNow outbox and close the ServiceNow mirror and client, the execution
+    log store, the action journal and the checkpoint connection.
+    This will be called once in the FastAPI shutdown event.
+    """
+    global _graph, _close_checkpointer, _maintenance
+    if _maintenance is not None:
+        await _maintenance.stop()
+        _maintenance = None
+    await flow_runs.close()
+    await close_lease_manager()
+    await get_script_registry().stop_watching()
+    await membership_batcher.close()
+    await close_powershell_pool()
+    await close_python_plugin_pools()
+    await close_node_pool()
+    await close_outbox()
+    await close_servicenow_mirror()
+    await close_servicenow_client()
+    await close_execution_log_store()
+    await close_action_journal()
+    if _close_checkpointer is not None:
+        await _close_checkpointer()
+        _close_checkpointer = None
+    _graph = None
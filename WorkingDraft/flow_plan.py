@@ -0,0 +1,97 @@
+from script_registry import action_order
+
+# -----------------------------------------------------------------------
+# Action manifest helpers
+# -----------------------------------------------------------------------
+# A flow entry in flow_details.yml may carry an `actions:` manifest keyed by
+# action file name or by its numeric prefix, e.g.
+#
+#   actions:
+#     2:
+#       depends_on: [1]
+#     3:
+#       depends_on: [1]
+#       cache:
+#         key: [OwnerEmail]
+#     4:
+#       invalidates: [2]
+
+
+def _resolve(ref, actions: list) -> str:
+    """Map a manifest reference (file name or numeric prefix) to an action name."""
+    if ref in actions:
+        return ref
+    if isinstance(ref, int) or (isinstance(ref, str) and ref.strip().isdigit()):
+        matches = [name for name in actions if action_order(name) == int(ref)]
+        if len(matches) == 1:
+            return matches[0]
+        if len(matches) > 1:
+            raise ValueError(f"Action number {ref} is ambiguous: {matches}")
+    raise ValueError(f"Unknown action in flow manifest: {ref}")
+
+
+def action_settings(actions: list, manifest: dict = None) -> dict:
+    """
+    Return {action name: settings dict} for every action, resolving numeric
+    keys and the references listed under `invalidates`.
+    """
+    settings = {name: {} for name in actions}
+    for ref, config in (manifest or {}).items():
+        config = dict(config or {})
+        if "invalidates" in config:
+            config["invalidates"] = [_resolve(target, actions) for target in config["invalidates"] or []]
+        settings[_resolve(ref, actions)] = config
+    return settings
+
+
+def cache_settings(settings: dict):
+    """
+    Normalized `cache:` setting of an action: None when it is not cacheable,
+    else {"key": list of input variables or None for all, "ttl": seconds or None}.
+    """
+    cache = settings.get("cache")
+    if not cache:
+        return None
+    cache = cache if isinstance(cache, dict) else {}
+    key = cache.get("key")
+    return {"key": [key] if isinstance(key, str) else key, "ttl": cache.get("ttl")}
+
+
+def build_action_plan(actions: list, manifest: dict = None) -> list:
+    """
+    Group a flow's ordered actions into stages.
+
+    Actions in the same stage have no dependency on each other and may run
+    concurrently; stages run one after another. An action without
+    `depends_on` depends on every action before it, so a flow without a
+    manifest keeps its strictly sequential order.
+    """
+    settings = action_settings(actions, manifest)
+    if not any("depends_on" in config for config in settings.values()):
+        return [[name] for name in actions]
+
+    dependencies = {}
+    for position, name in enumerate(actions):
+        config = settings[name]
+        if "depends_on" in config:
+            dependencies[name] = [_resolve(ref, actions) for ref in config["depends_on"] or []]
+        else:
+            dependencies[name] = actions[:position]
+
+    levels = {}
+
+    def level(name: str, visiting: tuple) -> int:
+        if name in levels:
+            return levels[name]
+        if name in visiting:
+            raise ValueError(f"Dependency cycle in flow manifest: {' -> '.join(visiting + (name,))}")
+        depth = 0
+        for dependency in dependencies[name]:
+            depth = max(depth, level(dependency, visiting + (name,)) + 1)
+        levels[name] = depth
+        return depth
+
+    stages = {}
+    for name in actions:
+        stages.setdefault(level(name, ()), []).append(name)
+    return [stages[depth] for depth in sorted(stages)]
@@ -0,0 +1,143 @@
+import os
+import json
+import time
+import asyncio
+import logging
+
+import aiosqlite
+
+import metrics
+from DataModel.ServiceNowAPI import APIResponse, LeanAPIResponse, LeanTask
+from flow_catalog import get_flow_catalog
+
+# -----------------------------------------------------------------------
+# Ingest Configuration
+# -----------------------------------------------------------------------
+# lean: validate and keep only the fields flows read (plus each flow's ingest_fields);
+# full: validate the whole ServiceNow Task model as before.
+TASK_INGEST_MODE = os.getenv("TASK_INGEST_MODE", "lean").lower()
+RAW_PAYLOAD_STORE_ENABLED = os.getenv("RAW_PAYLOAD_STORE_ENABLED", "true").lower() == "true"
+RAW_PAYLOAD_PATH = os.getenv("RAW_PAYLOAD_PATH", "state_db/raw_payloads.sqlite")
+RAW_PAYLOAD_RETENTION_DAYS = float(os.getenv("RAW_PAYLOAD_RETENTION_DAYS", "7"))
+
+CORE_FIELDS = tuple(LeanTask.model_fields)
+
+ingest_seconds = metrics.histogram(
+    "task_ingest_seconds", "Time to validate and project a submitted ticket payload.", ("mode",),
+    buckets=(0.00005, 0.0001, 0.0005, 0.001, 0.005, 0.01, 0.05),
+)
+ingest_bytes = metrics.histogram(
+    "task_ingest_bytes", "Size of the task_response kept for a flow.", ("mode",),
+    buckets=(256, 512, 1024, 2048, 4096, 8192, 16384),
+)
+
+
+def parse_task_payload(body: bytes, mode: str = TASK_INGEST_MODE) -> dict:
+    """
+    Validate a /api/task request body and return the task_response dict the flow runs on.
+    Raises pydantic.ValidationError for invalid payloads, including an empty result list.
+    """
+    start = time.perf_counter()
+    if mode == "full":
+        task_response = APIResponse.model_validate_json(body).model_dump()
+    else:
+        lean = LeanAPIResponse.model_validate_json(body)
+        task_response = lean.model_dump()
+        extra_fields = set()
+        for task in lean.result:
+            entry = get_flow_catalog().lookup(task.short_description) or {}
+            extra_fields.update(entry.get("ingest_fields") or [])
+        extra_fields.difference_update(CORE_FIELDS)
+        if extra_fields:
+            # Only flows that ask for more fields pay for a second parse of the raw body.
+            raw = json.loads(body)
+            for projected, task in zip(task_response["result"], raw["result"]):
+                for field in extra_fields:
+                    if field in task:
+                        projected[field] = task[field]
+    ingest_seconds.observe(time.perf_counter() - start, mode=mode)
+    ingest_bytes.observe(len(json.dumps(task_response)), mode=mode)
+    return task_response
+
+
+class RawPayloadStore:
+    """
+    Keeps each submitted request body once, as received, for audits and debugging.
+
+    save() only queues the body; a background writer inserts queued bodies in
+    batches so the request path never waits on the disk.
+    """
+
+    def __init__(self, path: str = RAW_PAYLOAD_PATH):
+        self.path = path
+        self._conn = None
+        self._queue = asyncio.Queue()
+        self._task = None
+
+    async def start(self):
+        directory = os.path.dirname(self.path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        self._conn = await aiosqlite.connect(self.path)
+        await self._conn.executescript(
+            """
+            PRAGMA journal_mode=WAL;
+            PRAGMA synchronous=NORMAL;
+            CREATE TABLE IF NOT EXISTS raw_payloads (
+                seq INTEGER PRIMARY KEY AUTOINCREMENT,
+                number TEXT NOT NULL,
+                payload BLOB NOT NULL,
+                received_at REAL NOT NULL
+            );
+            CREATE INDEX IF NOT EXISTS raw_payloads_number ON raw_payloads (number, seq);
+            """
+        )
+        await self._conn.execute(
+            "DELETE FROM raw_payloads WHERE received_at < ?", (time.time() - RAW_PAYLOAD_RETENTION_DAYS * 86400,)
+        )
+        await self._conn.commit()
+        self._task = asyncio.create_task(self._writer())
+
+    def save(self, number: str, body: bytes):
+        self._queue.put_nowait((number, body, time.time()))
+
+    def _drain(self, rows: list) -> list:
+        while not self._queue.empty():
+            rows.append(self._queue.get_nowait())
+        return rows
+
+    async def _write(self, rows: list):
+        if rows:
+            await self._conn.executemany(
+                "INSERT INTO raw_payloads (number, payload, received_at) VALUES (?, ?, ?)", rows
+            )
+            await self._conn.commit()
+
+    async def _writer(self):
+        while True:
+            rows = self._drain([await self._queue.get()])
+            try:
+                await self._write(rows)
+            except Exception as e:
+                logging.error(f"Failed to store {len(rows)} raw payload(s): {e}")
+
+    async def get_latest(self, number: str):
+        """Return the most recent raw body for a ticket number (as parsed JSON), or None."""
+        async with self._conn.execute(
+            "SELECT payload FROM raw_payloads WHERE number = ? ORDER BY seq DESC LIMIT 1", (number,)
+        ) as cursor:
+            row = await cursor.fetchone()
+        return json.loads(row[0]) if row else None
+
+    async def close(self):
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+        if self._conn is not None:
+            await self._write(self._drain([]))
+            await self._conn.close()
+            self._conn = None
@@ -0,0 +1,257 @@
+import os
+import json
+import time
+import uuid
+import asyncio
+import logging
+
+import aiosqlite
+
+import metrics
+from ticket_leases import make_owner_id
+
+# -----------------------------------------------------------------------
+# Queue Configuration
+# -----------------------------------------------------------------------
+TASK_QUEUE_PATH = os.getenv("TASK_QUEUE_PATH", "state_db/task_queue.sqlite")
+TASK_QUEUE_WORKERS = int(os.getenv("TASK_QUEUE_WORKERS", "4"))
+# Idle workers re-check the table this often, so jobs queued by another process are picked up.
+TASK_QUEUE_POLL_INTERVAL = float(os.getenv("TASK_QUEUE_POLL_INTERVAL", "1"))
+# Finished jobs older than this are removed when the queue starts.
+TASK_QUEUE_RETENTION_DAYS = float(os.getenv("TASK_QUEUE_RETENTION_DAYS", "7"))
+# A running job whose process has not renewed its lease for this many seconds
+# is put back in the queue (the process died); leases are renewed every third of it.
+TASK_QUEUE_LEASE_TTL = float(os.getenv("TASK_QUEUE_LEASE_TTL", "60"))
+
+jobs_total = metrics.counter(
+    "task_queue_jobs_total", "Queued flow jobs by final status.", ("status",)
+)
+queue_depth_gauge = metrics.gauge(
+    "task_queue_depth", "Flow jobs waiting for a queue worker."
+)
+
+
+class JobQueue:
+    """
+    Durable queue of ticket submissions backed by SQLite.
+
+    Jobs are claimed with a conditional UPDATE, so several workers (or
+    processes sharing the file) never pick up the same job twice. A claimed
+    job records its owner process and a lease the owner keeps renewing; only
+    running jobs whose lease has expired are put back in the queue, so a
+    restarting process never takes over jobs a live sibling is still running.
+    """
+
+    def __init__(self, handler, path: str = TASK_QUEUE_PATH, workers: int = TASK_QUEUE_WORKERS,
+                 lease_ttl: float = TASK_QUEUE_LEASE_TTL):
+        self.handler = handler
+        self.path = path
+        self.workers = max(1, workers)
+        self.lease_ttl = lease_ttl
+        self.owner = make_owner_id()
+        self._conn = None
+        self._wakeup = asyncio.Event()
+        self._tasks = []
+        self._closed = False
+
+    async def start(self):
+        directory = os.path.dirname(self.path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        self._conn = await aiosqlite.connect(self.path)
+        await self._conn.executescript(
+            """
+            PRAGMA journal_mode=WAL;
+            PRAGMA busy_timeout=5000;
+            CREATE TABLE IF NOT EXISTS jobs (
+                job_id TEXT PRIMARY KEY,
+                number TEXT NOT NULL,
+                payload TEXT NOT NULL,
+                status TEXT NOT NULL,
+                error TEXT,
+                created_at REAL NOT NULL,
+                started_at REAL,
+                finished_at REAL,
+                owner TEXT,
+                lease_expires_at REAL
+            );
+            CREATE INDEX IF NOT EXISTS jobs_status ON jobs (status, created_at);
+            CREATE INDEX IF NOT EXISTS jobs_number ON jobs (number, created_at);
+            """
+        )
+        columns = {row[1] for row in await self._conn.execute_fetchall("PRAGMA table_info(jobs)")}
+        for column, kind in (("owner", "TEXT"), ("lease_expires_at", "REAL")):
+            if column not in columns:
+                await self._conn.execute(f"ALTER TABLE jobs ADD COLUMN {column} {kind}")
+        await self._requeue_expired()
+        await self._conn.execute(
+            "DELETE FROM jobs WHERE status IN ('completed', 'failed') AND finished_at < ?",
+            (time.time() - TASK_QUEUE_RETENTION_DAYS * 86400,)
+        )
+        await self._conn.commit()
+        await self._update_depth()
+        self._tasks = [asyncio.create_task(self._worker(i)) for i in range(self.workers)]
+        self._tasks.append(asyncio.create_task(self._heartbeat()))
+
+    async def _requeue_expired(self) -> int:
+        """Put running jobs whose owner stopped renewing their lease (a dead process) back in the queue."""
+        cursor = await self._conn.execute(
+            "UPDATE jobs SET status = 'queued', started_at = NULL, owner = NULL, lease_expires_at = NULL "
+            "WHERE status = 'running' AND (lease_expires_at IS NULL OR lease_expires_at < ?)",
+            (time.time(),)
+        )
+        requeued = cursor.rowcount
+        await self._conn.commit()
+        if requeued > 0:
+            logging.info(f"Requeued {requeued} job(s) whose worker process stopped renewing their lease.")
+            await self._update_depth()
+            self._wakeup.set()
+        return requeued
+
+    async def _heartbeat(self):
+        while not self._closed:
+            await asyncio.sleep(self.lease_ttl / 3)
+            try:
+                await self._conn.execute(
+                    "UPDATE jobs SET lease_expires_at = ? WHERE owner = ? AND status = 'running'",
+                    (time.time() + self.lease_ttl, self.owner)
+                )
+                await self._conn.commit()
+                await self._requeue_expired()
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                logging.error(f"Task queue lease heartbeat failed: {e}")
+
+    async def _update_depth(self):
+        rows = await self._conn.execute_fetchall("SELECT COUNT(*) FROM jobs WHERE status = 'queued'")
+        queue_depth_gauge.set(rows[0][0])
+
+    async def submit(self, number: str, task_response: dict) -> str:
+        """Persist a ticket submission and return its job id."""
+        job_id = uuid.uuid4().hex
+        await self._conn.execute(
+            "INSERT INTO jobs (job_id, number, payload, status, created_at) VALUES (?, ?, ?, 'queued', ?)",
+            (job_id, number, json.dumps(task_response), time.time())
+        )
+        await self._conn.commit()
+        await self._update_depth()
+        self._wakeup.set()
+        return job_id
+
+    async def submit_unless_pending(self, number: str, task_response: dict) -> str:
+        """
+        Like submit(), but a ticket that already has a queued or running job
+        gets that job's id instead of a second job.
+        """
+        job_id = uuid.uuid4().hex
+        # One statement, so two processes cannot both decide the ticket has no job.
+        cursor = await self._conn.execute(
+            "INSERT INTO jobs (job_id, number, payload, status, created_at) "
+            "SELECT ?, ?, ?, 'queued', ? WHERE NOT EXISTS ("
+            "SELECT 1 FROM jobs WHERE number = ? AND status IN ('queued', 'running'))",
+            (job_id, number, json.dumps(task_response), time.time(), number)
+        )
+        inserted = cursor.rowcount == 1
+        await self._conn.commit()
+        if not inserted:
+            rows = await self._conn.execute_fetchall(
+                "SELECT job_id FROM jobs WHERE number = ? AND status IN ('queued', 'running') "
+                "ORDER BY created_at DESC LIMIT 1",
+                (number,)
+            )
+            if rows:
+                return rows[0][0]
+            # The pending job finished in between; queue a new one.
+            return await self.submit(number, task_response)
+        await self._update_depth()
+        self._wakeup.set()
+        return job_id
+
+    async def _claim(self):
+        # One statement: a SELECT followed by an UPDATE can fail with "database
+        # is locked" when another process commits in between (WAL snapshot upgrade).
+        now = time.time()
+        rows = await self._conn.execute_fetchall(
+            "UPDATE jobs SET status = 'running', started_at = ?, owner = ?, lease_expires_at = ? WHERE job_id = ("
+            "SELECT job_id FROM jobs WHERE status = 'queued' ORDER BY created_at LIMIT 1"
+            ") AND status = 'queued' RETURNING job_id, payload",
+            (now, self.owner, now + self.lease_ttl)
+        )
+        await self._conn.commit()
+        if not rows:
+            return None
+        await self._update_depth()
+        job_id, payload = rows[0]
+        return job_id, json.loads(payload)
+
+    async def _finish(self, job_id: str, status: str, error: str = None):
+        cursor = await self._conn.execute(
+            "UPDATE jobs SET status = ?, error = ?, finished_at = ?, lease_expires_at = NULL "
+            "WHERE job_id = ? AND owner = ?",
+            (status, error, time.time(), job_id, self.owner)
+        )
+        await self._conn.commit()
+        if cursor.rowcount != 1:
+            # This process stalled past its lease and the job was requeued for another worker.
+            logging.warning(f"Job {job_id} finished ({status}) after its lease was taken over.")
+            return
+        jobs_total.inc(status=status)
+
+    async def _worker(self, index: int):
+        # Checked as well as cancelled: on Python 3.11 a wait_for() whose wakeup
+        # fires at the same moment swallows the cancellation from close().
+        while not self._closed:
+            try:
+                job = await self._claim()
+            except Exception as e:
+                logging.error(f"Task queue worker {index} could not claim a job: {e}")
+                job = None
+            if job is None:
+                try:
+                    await asyncio.wait_for(self._wakeup.wait(), TASK_QUEUE_POLL_INTERVAL)
+                except asyncio.TimeoutError:
+                    pass
+                self._wakeup.clear()
+                continue
+
+            job_id, task_response = job
+            logging.debug(f"Task queue worker {index} running job {job_id}.")
+            try:
+                await self.handler(task_response)
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                logging.error(f"Queued job {job_id} failed: {e}")
+                await self._finish(job_id, "failed", str(e))
+            else:
+                await self._finish(job_id, "completed")
+
+    async def get_latest_job(self, number: str):
+        """Return the most recent job for a ticket number, or None."""
+        rows = await self._conn.execute_fetchall(
+            "SELECT job_id, status, error, created_at, started_at, finished_at FROM jobs "
+            "WHERE number = ? ORDER BY created_at DESC LIMIT 1",
+            (number,)
+        )
+        if not rows:
+            return None
+        keys = ("job_id", "status", "error", "created_at", "started_at", "finished_at")
+        return dict(zip(keys, rows[0]))
+
+    async def close(self):
+        self._closed = True
+        for task in self._tasks:
+            task.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+        self._tasks = []
+        if self._conn is not None:
+            # Jobs interrupted by the shutdown go back to the queue now rather than when their lease runs out.
+            await self._conn.execute(
+                "UPDATE jobs SET status = 'queued', started_at = NULL, owner = NULL, lease_expires_at = NULL "
+                "WHERE status = 'running' AND owner = ?",
+                (self.owner,)
+            )
+            await self._conn.commit()
+            await self._conn.close()
+            self._conn = None
@@ -1,54 +1,216 @@
+import os
 import json
+import asyncio
 import logging
-from DataModel.ServiceNowAPI import APIResponse
-from fastapi import FastAPI, HTTPException
+from typing import Optional
+from fastapi import FastAPI, HTTPException, Request
+from fastapi.responses import JSONResponse, Response
 import uvicorn
  
 # Import our flow logic
-from flow_logic import init_graph
+from flow_logic import (
+    init_graph, close_graph, run_flow, get_flow_progress, get_execution_log,
+    get_checkpoint_maintenance, membership_batcher, flow_runs,
+    FLOW_RESUME_ON_STARTUP, resume_interrupted_flows,
+)
+from job_queue import JobQueue
+from script_scheduler import get_scheduler
+from servicenow_client import get_servicenow_client
+from pydantic import ValidationError
+from ingest import TASK_INGEST_MODE, RAW_PAYLOAD_STORE_ENABLED, RawPayloadStore, parse_task_payload
+from result_cache import action_cache
+from python_plugins import python_plugin_stats
+from node_pool import node_pool_stats
+from servicenow_poller import SERVICENOW_POLL_ENABLED, ServiceNowPoller
+from servicenow_mirror import servicenow_mirror
+from ticket_leases import TicketLeasedError, lease_stats
+import metrics
+
+# "sync" waits for the whole flow; "async" answers 202 and runs it from the job queue.
+TASK_SUBMISSION_MODE = os.getenv("TASK_SUBMISSION_MODE", "sync").lower()
+# Mirrored ServiceNow fields reported by the status route.
+TICKET_STATUS_FIELDS = ("state", "active", "assignment_group", "sys_updated_on")
+# Worker processes started by `python main.py`; tickets are shared between
+# them through per-ticket leases (see ticket_leases.py), and queued jobs,
+# outbox rows and the poller are each claimed by one worker at a time.
+UVICORN_HOST = os.getenv("UVICORN_HOST", "127.0.0.1")
+UVICORN_PORT = int(os.getenv("UVICORN_PORT", "8000"))
+UVICORN_WORKERS = int(os.getenv("UVICORN_WORKERS", "1"))
  
 app = FastAPI()
 graph = None  # We'll initialize this on startup
+job_queue = None  # Durable queue for asynchronous submissions
+raw_payloads = None  # Request bodies as received, kept outside the flow state
+poller = None  # Pulls open tickets from ServiceNow when SERVICENOW_POLL_ENABLED
+resume_task = None  # Continues flows interrupted by the last shutdown or crash
  
 @app.on_event("startup")
 async def startup_event():
     """
-    On application startup, initialize our StateGraph by calling init_graph().
+    On application startup, initialize our StateGraph by calling init_graph()
+    and continue interrupted flows in the background.
     """
-    global graph
+    global graph, job_queue, raw_payloads, poller, resume_task
     graph = await init_graph()  # This ensures the graph is compiled once.
+    if FLOW_RESUME_ON_STARTUP:
+        resume_task = asyncio.create_task(resume_interrupted_flows())
+    job_queue = JobQueue(run_flow)
+    await job_queue.start()
+    if RAW_PAYLOAD_STORE_ENABLED:
+        raw_payloads = RawPayloadStore()
+        await raw_payloads.start()
+    if SERVICENOW_POLL_ENABLED:
+        # Polled tickets go through the durable queue before the poller moves its mark past them.
+        # Every worker starts one; only the holder of the poll lease polls.
+        poller = ServiceNowPoller(job_queue.submit_unless_pending)
+        await poller.start()
+
+@app.on_event("shutdown")
+async def shutdown_event():
+    """
+    On application shutdown, stop resuming flows, the poller and queue workers and release flow resources.
+    """
+    if resume_task is not None:
+        resume_task.cancel()
+        try:
+            await resume_task
+        except (asyncio.CancelledError, Exception):
+            pass
+    if poller is not None:
+        await poller.close()
+    if job_queue is not None:
+        await job_queue.close()
+    if raw_payloads is not None:
+        await raw_payloads.close()
+    await close_graph()
  
 @app.get("/")
 async def read_root():
     return {"message": "LangGraph Assistant is Running (Async)!"}
 
+@app.get("/api/stats")
+async def read_stats():
+    """
+    Report script scheduler load, ServiceNow connection usage and mirror,
+    coalesced flow runs, pending group membership batches, the action result
+    cache and checkpoint database maintenance.
+    """
+    maintenance = get_checkpoint_maintenance()
+    mirror = servicenow_mirror()
+    return {
+        "scheduler": get_scheduler().stats(),
+        "servicenow": get_servicenow_client().stats(),
+        "servicenow_mirror": await mirror.stats() if mirror is not None else None,
+        "flow_runs": flow_runs.stats(),
+        "leases": lease_stats(),
+        "membership_batches": membership_batcher.stats(),
+        "action_cache": action_cache.stats(),
+        "python_plugins": python_plugin_stats(),
+        "node_pool": node_pool_stats(),
+        "poller": poller.stats() if poller is not None else None,
+        "checkpoints": maintenance.stats() if maintenance is not None else None,
+    }
+
+@app.get("/metrics")
+async def read_metrics():
+    """
+    Expose every registered metric in the Prometheus text format: graph node
+    and flow/action latencies, script subprocess times, ServiceNow request
+    latency and status codes, in-flight tickets, queues, pools and caches.
+    """
+    return Response(content=metrics.render_prometheus(), media_type=metrics.PROMETHEUS_CONTENT_TYPE)
+
 @app.post("/api/task")
-async def execute_flow(task_data: APIResponse):
+async def execute_flow(request: Request, mode: Optional[str] = None):
     """
     Endpoint to handle the flow for a given "number" (e.g. the ServiceNow Task Number).
     We will parse the JSON, create a thread_id, and invoke the graph.
+    With mode=async (or TASK_SUBMISSION_MODE=async) the ticket is queued and a
+    job id is returned immediately with status 202.
+    With TASK_INGEST_MODE=lean (the default) only the fields the flows read are
+    validated and kept; the raw body is stored separately.
     """
+    mode = (mode or TASK_SUBMISSION_MODE).lower()
+    if mode not in ("sync", "async"):
+        raise HTTPException(status_code=400, detail=f"Unknown submission mode: {mode}")
+
+    # Build the dict in the same format as the original code expects:
+    body = await request.body()
     try:
-        # Build the dict in the same format as the original code expects:
-        task_response = task_data.model_dump()
-        
-        # Construct a unique thread_id. For example:
-        thread_id = "task_" + task_response["result"][0]["number"]
- 
-        # Now invoke the graph asynchronously
-        output = graph.ainvoke(
-            {"task_response": task_response},
-            config={"configurable": {"thread_id": thread_id},"recurion_limit": 100}
+        task_response = parse_task_payload(body, TASK_INGEST_MODE)
+    except ValidationError as e:
+        raise HTTPException(status_code=422, detail=e.errors(include_url=False))
+    number = task_response["result"][0]["number"]
+    if raw_payloads is not None:
+        raw_payloads.save(number, body)
+    mirror = servicenow_mirror()
+    if mirror is not None:
+        mirror.observe_payload(body)
+
+    if mode == "async":
+        job_id = await job_queue.submit(number, task_response)
+        return JSONResponse(
+            status_code=202,
+            content={"job_id": job_id, "number": number, "status": "queued", "status_url": f"/api/task/{number}"},
         )
- 
-        # Since ainvoke returns an Awaitable, we either await it in an async route
-        # or wrap it in a sync call. Because this route is sync, let's do:
-        return await output
- 
+
+    # Backpressure: refuse new tickets while the script queue is saturated.
+    if get_scheduler().saturated():
+        raise HTTPException(
+            status_code=503,
+            detail="Script scheduler is saturated, retry later.",
+            headers={"Retry-After": "30"},
+        )
+
+    try:
+        result = await run_flow(task_response)
+        # The log is kept out of the checkpointed state; return this run's entries as before.
+        result["execution_log"] = await get_execution_log(number, result.get("run_id"))
+        return result
+    except TicketLeasedError as e:
+        raise HTTPException(status_code=409, detail=str(e), headers={"Retry-After": "30"})
     except Exception as e:
         logging.error(f"Error executing flow: {e}")
         raise HTTPException(status_code=500, detail=str(e))
+
+@app.get("/api/task/{number}")
+async def read_task_status(number: str):
+    """
+    Report a ticket's job status, flow progress from the checkpointer and
+    its ServiceNow fields from the local mirror (no call to the instance).
+    """
+    job = await job_queue.get_latest_job(number)
+    progress = await get_flow_progress(number)
+    if job is None and progress is None:
+        raise HTTPException(status_code=404, detail=f"No job or flow found for {number}")
+    mirror = servicenow_mirror()
+    record = await mirror.get(number) if mirror is not None else None
+    ticket = {field: record.get(field) for field in TICKET_STATUS_FIELDS} if record else None
+    return {"number": number, "job": job, "progress": progress, "ticket": ticket}
+
+@app.get("/api/task/{number}/payload")
+async def read_task_payload(number: str):
+    """
+    Return the last request body received for a ticket, exactly as it was submitted.
+    """
+    payload = await raw_payloads.get_latest(number) if raw_payloads is not None else None
+    if payload is None:
+        raise HTTPException(status_code=404, detail=f"No stored payload for {number}")
+    return payload
+
+@app.get("/api/task/{number}/log")
+async def read_task_log(number: str, all_runs: bool = False):
+    """
+    Return a ticket's execution log: the latest flow run, or every run with all_runs=true.
+    """
+    entries = await get_execution_log(number, "*" if all_runs else None)
+    if not entries:
+        raise HTTPException(status_code=404, detail=f"No execution log found for {number}")
+    return {"number": number, "entries": entries}
  
 if __name__ == "__main__":
-    # Run the app using uvicorn
-    uvicorn.run(app, host="127.0.0.1", port=8000)
+    # Run the app using uvicorn; several workers need the app as an import string.
+    if UVICORN_WORKERS > 1:
+        uvicorn.run("main:app", host=UVICORN_HOST, port=UVICORN_PORT, workers=UVICORN_WORKERS)
+    else:
+        uvicorn.run(app, host=UVICORN_HOST, port=UVICORN_PORT)
@@ -0,0 +1,180 @@
+import threading
+import time
+from bisect import bisect_left
+from contextlib import contextmanager
+
+# -----------------------------------------------------------------------
+# Process-wide metrics registry
+# -----------------------------------------------------------------------
+# Counters, gauges and histograms keep their samples in plain dicts keyed by
+# label values, so recording a sample costs one dict lookup and an add.
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 120, 300)
+
+_lock = threading.Lock()
+_registry = {}
+
+
+class _Metric:
+    kind = ""
+
+    def __init__(self, name: str, description: str, labels: tuple = ()):
+        self.name = name
+        self.description = description
+        self.labels = tuple(labels)
+        self._values = {}
+
+    def _key(self, labels: dict) -> tuple:
+        return tuple(str(labels.get(label, "")) for label in self.labels)
+
+    def values(self) -> dict:
+        """Return a copy of the recorded samples keyed by label values."""
+        with _lock:
+            return {key: (list(value) if isinstance(value, list) else value) for key, value in self._values.items()}
+
+
+class Counter(_Metric):
+    kind = "counter"
+
+    def inc(self, amount: float = 1.0, **labels):
+        key = self._key(labels)
+        with _lock:
+            self._values[key] = self._values.get(key, 0.0) + amount
+
+
+class Gauge(_Metric):
+    kind = "gauge"
+
+    def set(self, value: float, **labels):
+        key = self._key(labels)
+        with _lock:
+            self._values[key] = float(value)
+
+    def inc(self, amount: float = 1.0, **labels):
+        key = self._key(labels)
+        with _lock:
+            self._values[key] = self._values.get(key, 0.0) + amount
+
+    def dec(self, amount: float = 1.0, **labels):
+        self.inc(-amount, **labels)
+
+
+class Histogram(_Metric):
+    kind = "histogram"
+
+    def __init__(self, name: str, description: str, labels: tuple = (), buckets: tuple = DEFAULT_BUCKETS):
+        super().__init__(name, description, labels)
+        self.buckets = tuple(sorted(buckets))
+
+    def observe(self, value: float, **labels):
+        key = self._key(labels)
+        index = bisect_left(self.buckets, value)
+        with _lock:
+            entry = self._values.get(key)
+            if entry is None:
+                # [per-bucket counts, sum, count]
+                entry = [[0] * len(self.buckets), 0.0, 0]
+                self._values[key] = entry
+            if index < len(self.buckets):
+                entry[0][index] += 1
+            entry[1] += value
+            entry[2] += 1
+
+    @contextmanager
+    def time(self, **labels):
+        """Observe the wall time spent inside the `with` block."""
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(time.perf_counter() - start, **labels)
+
+
+def _get_or_create(cls, name: str, description: str, labels: tuple, **kwargs):
+    with _lock:
+        metric = _registry.get(name)
+        if metric is None:
+            metric = cls(name, description, labels, **kwargs)
+            _registry[name] = metric
+        elif not isinstance(metric, cls):
+            raise ValueError(f"Metric {name} is already registered as a {metric.kind}")
+        return metric
+
+
+def counter(name: str, description: str, labels: tuple = ()) -> Counter:
+    return _get_or_create(Counter, name, description, labels)
+
+
+def gauge(name: str, description: str, labels: tuple = ()) -> Gauge:
+    return _get_or_create(Gauge, name, description, labels)
+
+
+def histogram(name: str, description: str, labels: tuple = (), buckets: tuple = DEFAULT_BUCKETS) -> Histogram:
+    return _get_or_create(Histogram, name, description, labels, buckets=buckets)
+
+
+def snapshot() -> dict:
+    """Return every registered metric as a JSON-friendly dict."""
+    with _lock:
+        metrics = list(_registry.values())
+    result = {}
+    for metric in metrics:
+        samples = []
+        for key, value in metric.values().items():
+            sample = {"labels": dict(zip(metric.labels, key))}
+            if metric.kind == "histogram":
+                sample.update({"count": value[2], "sum": value[1]})
+            else:
+                sample["value"] = value
+            samples.append(sample)
+        result[metric.name] = {"type": metric.kind, "help": metric.description, "samples": samples}
+    return result
+
+
+PROMETHEUS_CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+
+
+def _escape_label(value: str) -> str:
+    return value.replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _labels_text(names: tuple, values: tuple, extra: str = "") -> str:
+    pairs = [f'{name}="{_escape_label(value)}"' for name, value in zip(names, values)]
+    if extra:
+        pairs.append(extra)
+    return "{" + ",".join(pairs) + "}" if pairs else ""
+
+
+def _number(value: float) -> str:
+    if value == float("inf"):
+        return "+Inf"
+    return repr(float(value)) if isinstance(value, float) and not value.is_integer() else str(int(value))
+
+
+def render_prometheus() -> str:
+    """
+    Render every registered metric in the Prometheus text exposition format.
+    Histogram buckets are stored per bucket and made cumulative here, so the
+    cost stays on the scrape and not on observe().
+    """
+    with _lock:
+        metrics = sorted(_registry.values(), key=lambda metric: metric.name)
+    lines = []
+    for metric in metrics:
+        description = metric.description.replace("\\", "\\\\").replace("\n", " ")
+        lines.append(f"# HELP {metric.name} {description}")
+        lines.append(f"# TYPE {metric.name} {metric.kind}")
+        for key, value in sorted(metric.values().items()):
+            if metric.kind != "histogram":
+                lines.append(f"{metric.name}{_labels_text(metric.labels, key)} {_number(value)}")
+                continue
+            counts, total, count = value
+            cumulative = 0
+            for bound, bucket_count in zip(metric.buckets, counts):
+                cumulative += bucket_count
+                le = f'le="{_number(bound)}"'
+                lines.append(f"{metric.name}_bucket{_labels_text(metric.labels, key, le)} {cumulative}")
+            inf = 'le="+Inf"'
+            lines.append(f"{metric.name}_bucket{_labels_text(metric.labels, key, inf)} {count}")
+            lines.append(f"{metric.name}_sum{_labels_text(metric.labels, key)} {_number(total)}")
+            lines.append(f"{metric.name}_count{_labels_text(metric.labels, key)} {count}")
+    return "\n".join(lines) + "\n"
@@ -0,0 +1,106 @@
+import os
+import json
+
+import metrics
+from worker_pool import HostPool, HostWorker, HostWorkerError
+
+# -----------------------------------------------------------------------
+# Node Pool Configuration
+# -----------------------------------------------------------------------
+# .js actions marked `plugin: true` export run(taskResponse, additionalVariables)
+# and run on these warm Node hosts instead of a new `node` process per step.
+NODE_EXECUTABLE = os.getenv("NODE_EXECUTABLE", "node")
+NODE_POOL_ENABLED = os.getenv("NODE_POOL_ENABLED", "true").lower() == "true"
+NODE_POOL_SIZE = int(os.getenv("NODE_POOL_SIZE", "2"))
+NODE_POOL_MAX_JOBS = int(os.getenv("NODE_POOL_MAX_JOBS", "500"))
+NODE_POOL_START_TIMEOUT = float(os.getenv("NODE_POOL_START_TIMEOUT", "30"))
+
+HOST_SCRIPT = os.path.join(os.path.dirname(os.path.abspath(__file__)), "node_worker.js")
+RESPONSE_MARKER = b"##NODEHOST##"
+
+node_pool_wait_seconds = metrics.histogram(
+    "node_pool_wait_seconds", "Time a Node.js job waited for a free pool worker."
+)
+node_pool_jobs_total = metrics.counter(
+    "node_pool_jobs_total", "Node.js jobs executed on pool workers.", ("status",)
+)
+node_pool_recycles_total = metrics.counter(
+    "node_pool_recycles_total", "Node.js pool workers recycled.", ("reason",)
+)
+
+
+class NodeWorkerError(HostWorkerError):
+    """Raised when a Node host dies or answers with something unreadable."""
+
+
+class NodeWorker(HostWorker):
+    """A single long-lived Node host running node_worker.js."""
+
+    label = "Node"
+    marker = RESPONSE_MARKER
+    error = NodeWorkerError
+
+    def __init__(self, executable: str):
+        super().__init__(executable, NODE_POOL_START_TIMEOUT)
+
+    def command(self) -> list:
+        return [self.executable, HOST_SCRIPT]
+
+    async def run(self, module: str, version: str, task_response: dict, inputs: dict) -> dict:
+        """Send one job to the host and wait for its Status/OutputMessage/ErrorMessage reply."""
+        job = {"module": module, "version": version, "task_response": task_response, "additional_variables": inputs}
+        response = await self.request(json.dumps(job).encode("utf-8"))
+        return {
+            "Status": response.get("Status", "Error"),
+            "OutputMessage": response.get("OutputMessage", {}),
+            "ErrorMessage": response.get("ErrorMessage") or "",
+        }
+
+
+class NodePool(HostPool):
+    """Fixed-size pool of warm Node hosts; see HostPool for slots and recycling."""
+
+    label = "Node"
+    empty_output = dict
+    wait_seconds = node_pool_wait_seconds
+    jobs_total = node_pool_jobs_total
+    recycles_total = node_pool_recycles_total
+
+    def __init__(self, size: int = NODE_POOL_SIZE, max_jobs: int = NODE_POOL_MAX_JOBS,
+                 executable: str = NODE_EXECUTABLE):
+        super().__init__(size, max_jobs)
+        self.executable = executable
+
+    def _new_worker(self) -> NodeWorker:
+        return NodeWorker(self.executable)
+
+    async def run(self, module: str, version: str, task_response: dict, inputs: dict,
+                  timeout: float = None) -> dict:
+        """
+        Run `module`'s run() on a free worker. A job still running after
+        `timeout` seconds gets Status "Timeout" and its host is killed.
+        """
+        return await self._run_job(lambda worker: worker.run(module, version, task_response, inputs), timeout)
+
+
+_node_pool = None
+
+
+async def get_node_pool() -> NodePool:
+    """Return the process-wide Node pool, creating and pre-warming it on first use."""
+    global _node_pool
+    if _node_pool is None:
+        _node_pool = NodePool()
+        await _node_pool.start()
+    return _node_pool
+
+
+def node_pool_stats():
+    return _node_pool.stats() if _node_pool is not None else None
+
+
+async def close_node_pool():
+    global _node_pool
+    if _node_pool is not None:
+        await _node_pool.close()
+        _node_pool = None
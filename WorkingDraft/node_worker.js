@@ -0,0 +1,70 @@
+// Long-lived Node.js host used by node_pool.py.
+// Reads one JSON job per line from stdin:
+//   {"module": "/abs/path/action.js", "version": "<sha256>", "task_response": {...}, "additional_variables": {...}}
+// loads the action module once (again when its version changes), calls its
+//   run(taskResponse, additionalVariables)   (may return a Promise)
+// and answers with one line prefixed by the response marker:
+//   ##NODEHOST## {"Status": "...", "OutputMessage": ..., "ErrorMessage": "..."}
+// console.log from actions goes to stderr so it cannot corrupt the protocol.
+"use strict";
+
+const readline = require("readline");
+
+const MARKER = "##NODEHOST##";
+const loaded = new Map();
+
+function write(message) {
+  let line;
+  try {
+    line = JSON.stringify(message);
+  } catch (err) {
+    line = JSON.stringify({ Status: "Error", OutputMessage: {}, ErrorMessage: "Unserializable output: " + err.message });
+  }
+  process.stdout.write(MARKER + " " + line + "\n");
+}
+
+console.log = console.info = console.debug = console.error;
+
+function load(modulePath, version) {
+  const cached = loaded.get(modulePath);
+  if (cached && cached.version === version) {
+    return cached.module;
+  }
+  delete require.cache[require.resolve(modulePath)];
+  const module = require(modulePath);
+  loaded.set(modulePath, { version, module });
+  return module;
+}
+
+async function handle(line) {
+  let job;
+  try {
+    job = JSON.parse(line);
+  } catch (err) {
+    return { Status: "Error", OutputMessage: {}, ErrorMessage: "Invalid job: " + err.message };
+  }
+  try {
+    const action = load(job.module, job.version);
+    const run = typeof action === "function" ? action : action && action.run;
+    if (typeof run !== "function") {
+      return { Status: "Error", OutputMessage: {}, ErrorMessage: job.module + " does not export run()" };
+    }
+    const output = await run(job.task_response, job.additional_variables || {});
+    return { Status: "Success", OutputMessage: output === undefined ? {} : output, ErrorMessage: "" };
+  } catch (err) {
+    return { Status: "Error", OutputMessage: {}, ErrorMessage: (err && err.stack) || String(err) };
+  }
+}
+
+// Jobs are handled one at a time, in arrival order.
+let queue = Promise.resolve();
+const input = readline.createInterface({ input: process.stdin, terminal: false });
+input.on("line", (line) => {
+  if (!line.trim()) {
+    return;
+  }
+  queue = queue.then(() => handle(line)).then(write);
+});
+input.on("close", () => queue.then(() => process.exit(0)));
+
+write({ Ready: true });
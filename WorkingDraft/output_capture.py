@@ -0,0 +1,302 @@
+import os
+import re
+import json
+import time
+import uuid
+import shutil
+import asyncio
+import logging
+import importlib.util
+from dataclasses import dataclass
+from typing import Optional
+
+import metrics
+
+# -----------------------------------------------------------------------
+# Capture Configuration
+# -----------------------------------------------------------------------
+# Bytes of a script's stdout/stderr held in memory; the rest is spooled to disk.
+SCRIPT_OUTPUT_MEMORY_CAP = int(os.getenv("SCRIPT_OUTPUT_MEMORY_CAP", str(1024 * 1024)))
+# Bytes of a spooled stream kept as a preview in the flow state.
+SCRIPT_OUTPUT_PREVIEW = int(os.getenv("SCRIPT_OUTPUT_PREVIEW", "4096"))
+SCRIPT_SPOOL_DIR = os.getenv("SCRIPT_SPOOL_DIR", "state_db/spool")
+SCRIPT_SPOOL_RETENTION_DAYS = float(os.getenv("SCRIPT_SPOOL_RETENTION_DAYS", "7"))
+# Bytes a single variable loaded back from a spooled output may take (see read_spooled_fields).
+SCRIPT_SPOOLED_INPUT_LIMIT = int(os.getenv("SCRIPT_SPOOLED_INPUT_LIMIT", str(16 * 1024 * 1024)))
+# How often (seconds) a running script's resident memory is sampled.
+SCRIPT_RSS_SAMPLE_INTERVAL = float(os.getenv("SCRIPT_RSS_SAMPLE_INTERVAL", "0.05"))
+
+READ_CHUNK = 64 * 1024
+# Keys a script result may carry beyond Status/OutputMessage/ErrorMessage.
+CAPTURE_DETAIL_KEYS = ("OutputRef", "OutputBytes", "ErrorRef", "ErrorBytes", "PeakRSSBytes")
+# A spooled action output is kept in additional_variables only as "OutputRef:<action>" -> spool path.
+OUTPUT_REF_PREFIX = "OutputRef:"
+# JSON structure characters the spool scanner stops at; everything between them is skipped in bulk.
+_JSON_EVENTS = re.compile(rb'["\\{}\[\],:]')
+PSUTIL_AVAILABLE = importlib.util.find_spec("psutil") is not None
+if PSUTIL_AVAILABLE:
+    import psutil
+
+spooled_total = metrics.counter(
+    "script_output_spooled_total", "Script output streams that exceeded the memory cap.", ("stream",)
+)
+peak_rss_bytes = metrics.histogram(
+    "script_peak_rss_bytes", "Peak resident memory of a script process per action.", ("interpreter",),
+    buckets=(16e6, 32e6, 64e6, 128e6, 256e6, 512e6, 1e9, 2e9),
+)
+
+
+def _safe(name: str) -> str:
+    return re.sub(r"[^A-Za-z0-9_.-]+", "_", name).strip("_") or "output"
+
+
+def spool_path(ticket: str, label: str, stream: str) -> str:
+    """Per-ticket spool file for one stream of one action."""
+    return os.path.join(
+        SCRIPT_SPOOL_DIR, _safe(ticket), f"{_safe(label)}.{stream}.{uuid.uuid4().hex[:8]}.log"
+    )
+
+
+class CapturedOutput:
+    """
+    One captured stdout/stderr stream.
+
+    Up to `cap` bytes stay in memory. Past that the stream is written to
+    `spool` (created on first overflow) and only the first `preview` bytes
+    are kept in memory.
+    """
+
+    def __init__(self, spool: str = None, cap: int = SCRIPT_OUTPUT_MEMORY_CAP, preview: int = SCRIPT_OUTPUT_PREVIEW):
+        self.spool = spool
+        self.cap = cap
+        self.preview_size = preview
+        self.size = 0
+        self.path = None
+        self._buffer = bytearray()
+        self._file = None
+
+    @property
+    def spooled(self) -> bool:
+        return self.path is not None
+
+    def write(self, chunk: bytes):
+        self.size += len(chunk)
+        if self._file is not None:
+            self._file.write(chunk)
+        elif self.spool is not None and len(self._buffer) + len(chunk) > self.cap:
+            os.makedirs(os.path.dirname(self.spool), exist_ok=True)
+            self._file = open(self.spool, "wb")
+            self._file.write(self._buffer)
+            self._file.write(chunk)
+            self.path = self.spool
+            if len(self._buffer) < self.preview_size:
+                self._buffer.extend(chunk[:self.preview_size - len(self._buffer)])
+            del self._buffer[self.preview_size:]
+        else:
+            self._buffer.extend(chunk)
+
+    async def consume(self, reader: asyncio.StreamReader, stream: str = "stdout"):
+        try:
+            while True:
+                chunk = await reader.read(READ_CHUNK)
+                if not chunk:
+                    break
+                self.write(chunk)
+        finally:
+            if self._file is not None:
+                self._file.close()
+                self._file = None
+                spooled_total.inc(stream=stream)
+                logging.info(f"Script {stream} exceeded {self.cap} bytes; {self.size} bytes spooled to {self.path}.")
+
+    def text(self) -> str:
+        """Whole output when it fit in memory, otherwise the preview plus a pointer to the spool file."""
+        text = self._buffer.decode(errors="replace")
+        if self.spooled:
+            text += f"\n... [truncated: {self.size} bytes, full output in {self.path}]"
+        return text
+
+
+@dataclass
+class CapturedProcess:
+    returncode: int
+    stdout: CapturedOutput
+    stderr: CapturedOutput
+    peak_rss: Optional[int] = None
+    timed_out: bool = False
+
+    def details(self) -> dict:
+        """Spool references and peak memory, for the action's execution log entry."""
+        details = {}
+        if self.stdout.spooled:
+            details["OutputRef"] = self.stdout.path
+            details["OutputBytes"] = self.stdout.size
+        if self.stderr.spooled:
+            details["ErrorRef"] = self.stderr.path
+            details["ErrorBytes"] = self.stderr.size
+        if self.peak_rss is not None:
+            details["PeakRSSBytes"] = self.peak_rss
+        return details
+
+
+class PeakRssSampler:
+    """Samples a process's resident memory until stopped; needs the optional psutil package."""
+
+    def __init__(self, pid: int, interval: float = SCRIPT_RSS_SAMPLE_INTERVAL):
+        self.pid = pid
+        self.interval = interval
+        self.peak = None
+        self._task = None
+
+    def _sample(self, process) -> bool:
+        try:
+            rss = process.memory_info().rss
+        except (psutil.NoSuchProcess, psutil.AccessDenied):
+            return False
+        self.peak = max(self.peak or 0, rss)
+        return True
+
+    async def _run(self):
+        try:
+            process = psutil.Process(self.pid)
+        except psutil.NoSuchProcess:
+            return
+        while self._sample(process):
+            await asyncio.sleep(self.interval)
+
+    def start(self):
+        if PSUTIL_AVAILABLE and self.interval > 0:
+            self._task = asyncio.create_task(self._run())
+        return self
+
+    async def stop(self, interpreter: str = None) -> Optional[int]:
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+        if self.peak is not None and interpreter:
+            peak_rss_bytes.observe(self.peak, interpreter=interpreter)
+        return self.peak
+
+
+class SpooledValueTooLarge(ValueError):
+    """Raised when a variable read from a spool file is larger than the allowed limit."""
+
+
+def read_spooled_fields(path: str, keys, limit: int = SCRIPT_SPOOLED_INPUT_LIMIT, strict: bool = True):
+    """
+    The top-level `keys` of the JSON object in a spool file, read in chunks:
+    every other value is scanned past without being kept, so a multi-MB
+    output never sits in memory as a whole. A wanted value longer than
+    `limit` bytes raises SpooledValueTooLarge, or with `strict=False` is
+    left out. Returns None when the file is not a complete JSON object.
+    """
+    wanted = set(keys)
+    found = {}
+    depth = 0
+    in_string = escape = False
+    reading_key = True
+    key = None
+    capture = None  # "key" or "value" while the bytes being scanned are kept
+    buffer = bytearray()
+    start = 0
+
+    def keep(data: bytes) -> bool:
+        buffer.extend(data)
+        return len(buffer) <= limit
+
+    with open(path, "rb") as spool:
+        while True:
+            chunk = spool.read(READ_CHUNK)
+            if not chunk:
+                return None
+            pos = start = 0
+            if depth == 0:
+                stripped = chunk.lstrip()
+                if not stripped:
+                    continue
+                if stripped[:1] != b"{":
+                    return None
+                pos = chunk.index(b"{") + 1
+                depth = 1
+            while pos < len(chunk):
+                if escape:
+                    escape = False
+                    pos += 1
+                    continue
+                match = _JSON_EVENTS.search(chunk, pos)
+                if match is None:
+                    break
+                index = match.start()
+                char = chunk[index:index + 1]
+                pos = index + 1
+                if in_string:
+                    if char == b"\\":
+                        escape = True
+                    elif char == b'"':
+                        in_string = False
+                        if capture == "key":
+                            key = json.loads(b'"' + bytes(buffer) + chunk[start:index] + b'"')
+                            capture = None
+                    continue
+                if char == b'"':
+                    in_string = True
+                    if depth == 1 and reading_key:
+                        capture, start = "key", pos
+                        buffer.clear()
+                elif char == b":" and depth == 1:
+                    reading_key = False
+                    if key in wanted:
+                        capture, start = "value", pos
+                        buffer.clear()
+                elif (char == b"," or char == b"}") and depth == 1:
+                    if capture == "value":
+                        if keep(chunk[start:index]):
+                            found[key] = json.loads(bytes(buffer))
+                        elif strict:
+                            raise SpooledValueTooLarge(f"{key} in {path} is larger than {limit} bytes")
+                        capture = None
+                    if char == b"}":
+                        return found
+                    reading_key = True
+                elif char in b"{[":
+                    depth += 1
+                elif char in b"}]":
+                    depth -= 1
+            if capture is not None:
+                if not keep(chunk[start:]):
+                    if capture == "value" and strict:
+                        raise SpooledValueTooLarge(f"{key} in {path} is larger than {limit} bytes")
+                    # Too long to keep: scan past it and leave it out.
+                    key = None if capture == "key" else key
+                    capture = None
+                    buffer.clear()
+
+
+def load_spooled_inputs(variables: dict, keys, limit: int = SCRIPT_SPOOLED_INPUT_LIMIT) -> dict:
+    """
+    Load `keys` for one action run from the spooled outputs referenced in
+    `variables` (latest action first). Keys no spooled output has are left out.
+    """
+    refs = [value for name, value in sorted(variables.items(), reverse=True) if name.startswith(OUTPUT_REF_PREFIX)]
+    loaded = {}
+    for ref in refs:
+        missing = [key for key in keys if key not in loaded]
+        if not missing:
+            break
+        loaded.update(read_spooled_fields(ref, missing, limit) or {})
+    return loaded
+
+
+def prune_spool(retention_days: float = SCRIPT_SPOOL_RETENTION_DAYS):
+    """Delete per-ticket spool directories not touched within the retention window."""
+    if not os.path.isdir(SCRIPT_SPOOL_DIR):
+        return
+    cutoff = time.time() - retention_days * 86400
+    with os.scandir(SCRIPT_SPOOL_DIR) as it:
+        for entry in it:
+            if entry.is_dir() and entry.stat().st_mtime < cutoff:
+                shutil.rmtree(entry.path, ignore_errors=True)
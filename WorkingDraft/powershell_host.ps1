@@ -0,0 +1,120 @@
+param (
+    [string]$Modules = "",
+    [long]$OutputCap = 0,
+    [int]$OutputPreview = 4096
+)
+
+# Long-lived PowerShell host used by powershell_pool.py.
+# Reads one JSON job per line from stdin:
+#   {"script": "...", "task_response": {...}, "additional_variables": {...}}
+# and answers with one line prefixed by the response marker:
+#   ##PSHOST## {"Status": "...", "OutputMessage": "...", "ErrorMessage": "..."}
+# Any other line on stdout (e.g. Write-Host) is ignored by the pool.
+# When a job carries "spool" and its output is larger than -OutputCap bytes,
+# the output is written to that file and only a preview is sent back, with
+# OutputRef/OutputBytes pointing at the file.
+
+$__marker = "##PSHOST##"
+
+try {
+    [Console]::InputEncoding = [System.Text.Encoding]::UTF8
+    [Console]::OutputEncoding = [System.Text.Encoding]::UTF8
+}
+catch {
+}
+
+# Jobs run in a child runspace without a host, so a script calling `exit`
+# ends its own pipeline instead of this process. Modules are imported into
+# that runspace once; each script runs in its own local scope, as with `&`.
+$__runspace = [System.Management.Automation.Runspaces.RunspaceFactory]::CreateRunspace()
+$__runspace.Open()
+foreach ($__module in ($Modules -split ",")) {
+    if ($__module.Trim() -ne "") {
+        $__import = [PowerShell]::Create()
+        $__import.Runspace = $__runspace
+        $null = $__import.AddCommand("Import-Module").AddParameter("Name", $__module.Trim()).AddParameter("ErrorAction", "SilentlyContinue")
+        $null = $__import.Invoke()
+        $__import.Dispose()
+    }
+}
+
+[Console]::Out.WriteLine($__marker + ' {"Ready": true}')
+[Console]::Out.Flush()
+
+while ($true) {
+    $__line = [Console]::In.ReadLine()
+    if ($null -eq $__line) {
+        break
+    }
+    if ($__line.Trim() -eq "") {
+        continue
+    }
+
+    $__status = "Success"
+    $__job = $null
+    $__shell = $null
+    $__inputObjects = New-Object 'System.Management.Automation.PSDataCollection[psobject]'
+    $__inputObjects.Complete()
+    $__outputObjects = New-Object 'System.Management.Automation.PSDataCollection[psobject]'
+    $__errorLines = New-Object System.Collections.Generic.List[string]
+
+    try {
+        $__job = $__line | ConvertFrom-Json
+        $__runspace.SessionStateProxy.SetVariable("SCTASK_RESPONSE", $__job.task_response.result)
+        $__runspace.SessionStateProxy.SetVariable("ADDITIONAL_VARIABLES", $__job.additional_variables)
+        $__shell = [PowerShell]::Create()
+        $__shell.Runspace = $__runspace
+        $null = $__shell.AddScript($__job.script, $true)
+        $__shell.Invoke($__inputObjects, $__outputObjects)
+    }
+    catch {
+        $__exit = $_.Exception
+        while ($__exit -and -not ($__exit -is [System.Management.Automation.ExitException])) {
+            $__exit = $__exit.InnerException
+        }
+        if ($__exit) {
+            # `exit N`: as with a separate process, only a non-zero code is an error.
+            if ($__exit.Argument -and [int]$__exit.Argument -ne 0) {
+                $__status = "Error"
+                $__errorLines.Add("Script exited with code $($__exit.Argument)")
+            }
+        }
+        else {
+            $__status = "Error"
+            $__errorLines.Add($_.ToString())
+        }
+    }
+    finally {
+        if ($__shell) {
+            foreach ($__record in $__shell.Streams.Error) {
+                $__errorLines.Add($__record.ToString())
+            }
+            $__shell.Dispose()
+        }
+    }
+
+    $__response = @{
+        Status        = $__status
+        OutputMessage = ($__outputObjects | Out-String).Trim()
+        ErrorMessage  = ($__errorLines -join [Environment]::NewLine).Trim()
+    }
+    $__bytes = [System.Text.Encoding]::UTF8.GetByteCount($__response.OutputMessage)
+    if ($OutputCap -gt 0 -and $__job -and $__job.spool -and $__bytes -gt $OutputCap) {
+        try {
+            $null = New-Item -ItemType Directory -Force -Path (Split-Path -Parent $__job.spool)
+            [System.IO.File]::WriteAllText($__job.spool, $__response.OutputMessage, (New-Object System.Text.UTF8Encoding($false)))
+            $__preview = $__response.OutputMessage.Substring(0, [Math]::Min($OutputPreview, $__response.OutputMessage.Length))
+            $__response.OutputMessage = $__preview + "`n... [truncated: $__bytes bytes, full output in $($__job.spool)]"
+            $__response.OutputRef = $__job.spool
+            $__response.OutputBytes = $__bytes
+        }
+        catch {
+            $__response.ErrorMessage = ($__response.ErrorMessage + [Environment]::NewLine + "Output spool failed: " + $_.ToString()).Trim()
+        }
+    }
+    [Console]::Out.WriteLine($__marker + " " + ($__response | ConvertTo-Json -Compress))
+    [Console]::Out.Flush()
+
+    Remove-Variable -Name __response, __outputObjects, __shell -ErrorAction SilentlyContinue
+    $Error.Clear()
+}
@@ -0,0 +1,125 @@
+import os
+
+import metrics
+from script_inputs import encode_job
+from worker_pool import HostPool, HostWorker, HostWorkerError
+from output_capture import SCRIPT_OUTPUT_MEMORY_CAP, SCRIPT_OUTPUT_PREVIEW, PeakRssSampler
+
+# -----------------------------------------------------------------------
+# Pool Configuration
+# -----------------------------------------------------------------------
+POWERSHELL_EXECUTABLE = os.getenv("POWERSHELL_EXECUTABLE", "powershell")
+# Opt-in: .ps1 actions run in a fresh powershell process unless enabled.
+POWERSHELL_POOL_ENABLED = os.getenv("POWERSHELL_POOL_ENABLED", "false").lower() == "true"
+POWERSHELL_POOL_SIZE = int(os.getenv("POWERSHELL_POOL_SIZE", "4"))
+POWERSHELL_POOL_MAX_JOBS = int(os.getenv("POWERSHELL_POOL_MAX_JOBS", "100"))
+POWERSHELL_POOL_MODULES = os.getenv("POWERSHELL_POOL_MODULES", "ActiveDirectory")
+POWERSHELL_POOL_START_TIMEOUT = float(os.getenv("POWERSHELL_POOL_START_TIMEOUT", "60"))
+
+HOST_SCRIPT = os.path.join(os.path.dirname(os.path.abspath(__file__)), "powershell_host.ps1")
+RESPONSE_MARKER = b"##PSHOST##"
+
+pool_wait_seconds = metrics.histogram(
+    "powershell_pool_wait_seconds", "Time a PowerShell job waited for a free pool worker."
+)
+pool_jobs_total = metrics.counter(
+    "powershell_pool_jobs_total", "PowerShell jobs executed on pool workers.", ("status",)
+)
+pool_recycles_total = metrics.counter(
+    "powershell_pool_recycles_total", "PowerShell pool workers recycled.", ("reason",)
+)
+
+
+class PowerShellWorkerError(HostWorkerError):
+    """Raised when a PowerShell host dies or answers with something unreadable."""
+
+
+class PowerShellWorker(HostWorker):
+    """A single long-lived PowerShell host running powershell_host.ps1."""
+
+    label = "PowerShell"
+    marker = RESPONSE_MARKER
+    error = PowerShellWorkerError
+
+    def __init__(self, executable: str, modules: str):
+        super().__init__(executable, POWERSHELL_POOL_START_TIMEOUT)
+        self.modules = modules
+
+    def command(self) -> list:
+        return [
+            self.executable, "-NoLogo", "-NoProfile", "-NonInteractive",
+            "-ExecutionPolicy", "Bypass", "-File", HOST_SCRIPT, "-Modules", self.modules,
+            "-OutputCap", str(SCRIPT_OUTPUT_MEMORY_CAP), "-OutputPreview", str(SCRIPT_OUTPUT_PREVIEW),
+        ]
+
+    async def run(self, script: str, task_response: dict, inputs: dict, spool: str = None) -> dict:
+        """
+        Send one job to the host and wait for its Status/OutputMessage/ErrorMessage reply.
+        Output larger than the host's -OutputCap is written to `spool` and only a preview comes back.
+        """
+        response = await self.request(encode_job(script, task_response, inputs, spool))
+        result = {
+            "Status": response.get("Status", "Error"),
+            "OutputMessage": response.get("OutputMessage") or "",
+            "ErrorMessage": response.get("ErrorMessage") or "",
+        }
+        if response.get("OutputRef"):
+            result["OutputRef"] = response["OutputRef"]
+            result["OutputBytes"] = response.get("OutputBytes")
+        return result
+
+
+class PowerShellPool(HostPool):
+    """Fixed-size pool of warm PowerShell hosts; see HostPool for slots and recycling."""
+
+    label = "PowerShell"
+    wait_seconds = pool_wait_seconds
+    jobs_total = pool_jobs_total
+    recycles_total = pool_recycles_total
+
+    def __init__(self, size: int = POWERSHELL_POOL_SIZE, max_jobs: int = POWERSHELL_POOL_MAX_JOBS,
+                 executable: str = POWERSHELL_EXECUTABLE, modules: str = POWERSHELL_POOL_MODULES):
+        super().__init__(size, max_jobs)
+        self.executable = executable
+        self.modules = modules
+
+    def _new_worker(self) -> PowerShellWorker:
+        return PowerShellWorker(self.executable, self.modules)
+
+    async def run(self, script: str, task_response: dict, inputs: dict, spool: str = None,
+                  timeout: float = None) -> dict:
+        """
+        Run one job on a free worker, recording the host's peak memory. A job
+        still running after `timeout` seconds gets Status "Timeout" and its
+        host is killed together with any processes the script started.
+        """
+        async def job(worker: PowerShellWorker) -> dict:
+            sampler = PeakRssSampler(worker.process.pid).start()
+            try:
+                result = await worker.run(script, task_response, inputs, spool)
+            finally:
+                peak_rss = await sampler.stop("powershell")
+            if peak_rss is not None:
+                result["PeakRSSBytes"] = peak_rss
+            return result
+
+        return await self._run_job(job, timeout)
+
+
+_pool = None
+
+
+async def get_powershell_pool() -> PowerShellPool:
+    """Return the process-wide pool, creating and pre-warming it on first use."""
+    global _pool
+    if _pool is None:
+        _pool = PowerShellPool()
+        await _pool.start()
+    return _pool
+
+
+async def close_powershell_pool():
+    global _pool
+    if _pool is not None:
+        await _pool.close()
+        _pool = None
@@ -0,0 +1,295 @@
+import os
+import sys
+import glob
+import time
+import asyncio
+import logging
+import traceback
+import importlib.util
+import multiprocessing
+import multiprocessing.spawn
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+
+import metrics
+
+# -----------------------------------------------------------------------
+# Plugin Configuration
+# -----------------------------------------------------------------------
+# A .py action marked `plugin: true` in flow_details.yml defines
+#
+#   def run(task_response: dict, additional_variables: dict) -> dict   (or async def)
+#
+# returning {"Status", "OutputMessage", "ErrorMessage", ...} like the JSON a
+# script action prints. It runs inside a warm worker process instead of a new
+# interpreter per step.
+PYTHON_PLUGIN_ENABLED = os.getenv("PYTHON_PLUGIN_ENABLED", "true").lower() == "true"
+PYTHON_PLUGIN_ENTRYPOINT = os.getenv("PYTHON_PLUGIN_ENTRYPOINT", "run")
+# Worker processes per venv pool. Each runs the venv's own interpreter
+# (Scripts/python.exe or bin/python) when it has one.
+PYTHON_PLUGIN_POOL_SIZE = int(os.getenv("PYTHON_PLUGIN_POOL_SIZE", "2"))
+# A worker is replaced after this many calls, releasing whatever its plugins leaked.
+PYTHON_PLUGIN_MAX_TASKS = int(os.getenv("PYTHON_PLUGIN_MAX_TASKS", "200"))
+
+plugin_calls_total = metrics.counter(
+    "python_plugin_calls_total", "Python plugin invocations by status.", ("status",)
+)
+plugin_seconds = metrics.histogram(
+    "python_plugin_seconds", "Time to run a Python plugin call, including the pool hand-off."
+)
+plugin_pool_restarts_total = metrics.counter(
+    "python_plugin_pool_restarts_total", "Python plugin workers replaced, by reason.", ("reason",)
+)
+
+
+# -----------------------------------------------------------------------
+# Worker side
+# -----------------------------------------------------------------------
+_modules = {}
+
+
+def venv_python(venv_dir: str):
+    """The venv's interpreter, or None when there is no venv or it has none."""
+    if not venv_dir:
+        return None
+    for candidate in (os.path.join(venv_dir, "Scripts", "python.exe"), os.path.join(venv_dir, "bin", "python")):
+        if os.path.isfile(candidate):
+            return candidate
+    return None
+
+
+def _init_worker(venv_dir: str, service_site: list):
+    """
+    Make the venv's packages importable in this worker, ahead of anything else.
+    Spawned workers inherit the service's sys.path, so under the venv's own
+    interpreter the service's site-packages are dropped from it; a venv
+    without an interpreter has its site-packages added to the service's.
+    """
+    if not venv_dir:
+        return
+    import site
+    if os.path.realpath(sys.prefix) == os.path.realpath(venv_dir):
+        sys.path[:] = [entry for entry in sys.path if entry not in service_site]
+        candidates = site.getsitepackages()
+    else:
+        candidates = [os.path.join(venv_dir, "Lib", "site-packages")]
+        candidates += glob.glob(os.path.join(venv_dir, "lib", "python*", "site-packages"))
+    for path in candidates:
+        if os.path.isdir(path):
+            before = [entry for entry in sys.path if entry != path]
+            site.addsitedir(path)
+            added = [entry for entry in sys.path if entry not in before]
+            sys.path[:] = added + before
+
+
+def _warm() -> int:
+    return os.getpid()
+
+
+def _load(path: str, version: str):
+    """Import a plugin module once per worker; a changed script (new version) is imported again."""
+    cached = _modules.get(path)
+    if cached is not None and cached[0] == version:
+        return cached[1]
+    name = f"action_plugin_{abs(hash(path))}"
+    spec = importlib.util.spec_from_file_location(name, path)
+    module = importlib.util.module_from_spec(spec)
+    script_dir = os.path.dirname(path)
+    if script_dir not in sys.path:
+        sys.path.insert(0, script_dir)
+    spec.loader.exec_module(module)
+    _modules[path] = (version, module)
+    return module
+
+
+def _invoke(path: str, version: str, entrypoint: str, task_response: dict, inputs: dict) -> dict:
+    try:
+        module = _load(path, version)
+        function = getattr(module, entrypoint, None)
+        if not callable(function):
+            return {"Status": "Error", "OutputMessage": {}, "ErrorMessage": f"{os.path.basename(path)} does not define {entrypoint}()"}
+        output = function(task_response, inputs)
+        if asyncio.iscoroutine(output):
+            output = asyncio.run(output)
+        return {"Status": "Success", "OutputMessage": output, "ErrorMessage": ""}
+    except Exception:
+        return {"Status": "Error", "OutputMessage": {}, "ErrorMessage": traceback.format_exc().strip()}
+
+
+# -----------------------------------------------------------------------
+# Service side
+# -----------------------------------------------------------------------
+class PluginWorker:
+    """
+    One warm worker process, held in a single-process ProcessPoolExecutor so a
+    call that times out or is cancelled can be killed without touching the
+    other workers of the pool.
+    """
+
+    def __init__(self, venv_dir: str = None):
+        self.venv_dir = venv_dir
+        self.python = venv_python(venv_dir) or sys.executable
+        self.calls = 0
+        self.executor = None
+
+    def start(self):
+        """Spawn the process; returns the future of its warm-up call (the worker's pid)."""
+        context = multiprocessing.get_context("spawn")
+        previous = multiprocessing.spawn.get_executable()
+        context.set_executable(self.python)
+        try:
+            self.executor = ProcessPoolExecutor(
+                max_workers=1,
+                mp_context=context,
+                initializer=_init_worker,
+                initargs=(self.venv_dir, _service_site_packages()),
+            )
+            # submit() spawns the process right away, while the venv's interpreter is selected.
+            return self.executor.submit(_warm)
+        finally:
+            context.set_executable(previous)
+
+    def kill(self):
+        """Kill the process outright; a running call cannot be interrupted on its own."""
+        executor, self.executor = self.executor, None
+        if executor is None:
+            return
+        for process in list((executor._processes or {}).values()):
+            try:
+                process.kill()
+            except Exception:
+                pass
+        executor.shutdown(wait=False, cancel_futures=True)
+
+    def close(self, wait: bool = True):
+        executor, self.executor = self.executor, None
+        if executor is not None:
+            executor.shutdown(wait=wait, cancel_futures=True)
+
+
+def _service_site_packages() -> list:
+    import site
+    return site.getsitepackages() + [site.getusersitepackages()]
+
+
+class PythonPluginPool:
+    """
+    Warm worker processes for the plugins of one venv, managed like the Node
+    pool: `size` idle slots holding a PluginWorker or None (started on
+    checkout).
+
+    Workers import each plugin once and keep it until the script changes.
+    A worker is replaced after `max_tasks` calls, and killed when its call
+    times out, is cancelled or crashes it; the other workers keep running.
+    """
+
+    def __init__(self, venv_dir: str = None, size: int = PYTHON_PLUGIN_POOL_SIZE,
+                 max_tasks: int = PYTHON_PLUGIN_MAX_TASKS):
+        self.venv_dir = venv_dir
+        self.size = max(1, size)
+        self.max_tasks = max_tasks
+        self._idle = asyncio.Queue()
+        self._workers = set()
+        self._calls = 0
+        for _ in range(self.size):
+            self._idle.put_nowait(None)
+
+    async def _spawn(self) -> PluginWorker:
+        worker = PluginWorker(self.venv_dir)
+        self._workers.add(worker)
+        try:
+            await asyncio.wrap_future(worker.start())
+        except BaseException:
+            self._retire(worker, kill=True)
+            raise
+        return worker
+
+    def _retire(self, worker: PluginWorker, kill: bool = False, reason: str = None):
+        self._workers.discard(worker)
+        if reason:
+            plugin_pool_restarts_total.inc(reason=reason)
+        if kill:
+            worker.kill()
+        else:
+            worker.close(wait=False)
+
+    async def start(self):
+        """Start every worker up front so the first actions do not pay the interpreter start."""
+        slots = [self._idle.get_nowait() for _ in range(self._idle.qsize())]
+        started = await asyncio.gather(*(self._spawn() for _ in slots), return_exceptions=True)
+        for worker in started:
+            if isinstance(worker, BaseException):
+                logging.error(f"Failed to pre-warm Python plugin worker: {worker}")
+                worker = None
+            self._idle.put_nowait(worker)
+
+    async def run(self, path: str, version: str, task_response: dict, inputs: dict, timeout: float = None) -> dict:
+        start = time.perf_counter()
+        self._calls += 1
+        worker = await self._idle.get()
+        try:
+            if worker is None or worker.executor is None:
+                worker = await self._spawn()
+            loop = asyncio.get_running_loop()
+            try:
+                result = await asyncio.wait_for(
+                    loop.run_in_executor(
+                        worker.executor, _invoke, path, version, PYTHON_PLUGIN_ENTRYPOINT, task_response, inputs
+                    ),
+                    timeout or None,
+                )
+            except asyncio.TimeoutError:
+                logging.error(f"Python plugin {path} exceeded its {timeout:.1f}s timeout; killing its worker.")
+                self._retire(worker, kill=True, reason="timeout")
+                worker = None
+                result = {"Status": "Timeout", "OutputMessage": {}, "ErrorMessage": f"Script timed out after {timeout:.1f} seconds"}
+            except BrokenProcessPool as e:
+                logging.error(f"Python plugin worker died while running {path}: {e}")
+                self._retire(worker, kill=True, reason="crash")
+                worker = None
+                result = {"Status": "Error", "OutputMessage": {}, "ErrorMessage": f"Plugin worker crashed: {e}"}
+            except asyncio.CancelledError:
+                self._retire(worker, kill=True, reason="cancelled")
+                worker = None
+                raise
+            if worker is not None:
+                worker.calls += 1
+                if self.max_tasks and worker.calls >= self.max_tasks:
+                    self._retire(worker, reason="max_tasks")
+                    worker = None
+        finally:
+            self._idle.put_nowait(worker)
+        plugin_calls_total.inc(status=result["Status"])
+        plugin_seconds.observe(time.perf_counter() - start)
+        return result
+
+    def stats(self) -> dict:
+        return {"venv": self.venv_dir, "size": self.size, "calls": self._calls, "running": len(self._workers)}
+
+    def close(self):
+        workers, self._workers = list(self._workers), set()
+        for worker in workers:
+            worker.close()
+
+
+_pools = {}
+
+
+async def get_python_plugin_pool(venv_dir: str = None) -> PythonPluginPool:
+    """Return the pool for `venv_dir`, creating and pre-warming it on first use."""
+    pool = _pools.get(venv_dir)
+    if pool is None:
+        pool = _pools[venv_dir] = PythonPluginPool(venv_dir)
+        await pool.start()
+    return pool
+
+
+def python_plugin_stats() -> list:
+    return [pool.stats() for pool in _pools.values()]
+
+
+async def close_python_plugin_pools():
+    pools = list(_pools.values())
+    _pools.clear()
+    for pool in pools:
+        await asyncio.to_thread(pool.close)
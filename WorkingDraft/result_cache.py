@@ -0,0 +1,113 @@
+import os
+import json
+import time
+import hashlib
+from collections import OrderedDict
+
+import metrics
+
+# -----------------------------------------------------------------------
+# Result Cache Configuration
+# -----------------------------------------------------------------------
+# The cache lives in each worker process's memory: an `invalidates:` action only
+# clears the results cached by its own process, so another worker can keep
+# serving a stale lookup until its TTL runs out. It is therefore off by default
+# when UVICORN_WORKERS > 1; only enable it for several workers (or several
+# instances sharing one state_db) on lookups that tolerate ACTION_CACHE_TTL of staleness.
+ACTION_CACHE_ENABLED = os.getenv(
+    "ACTION_CACHE_ENABLED", "true" if int(os.getenv("UVICORN_WORKERS", "1")) <= 1 else "false"
+).lower() == "true"
+# Seconds a cached result stays valid unless the action's `cache: ttl:` overrides it.
+ACTION_CACHE_TTL = float(os.getenv("ACTION_CACHE_TTL", "300"))
+ACTION_CACHE_MAX_ENTRIES = int(os.getenv("ACTION_CACHE_MAX_ENTRIES", "1024"))
+
+cache_lookups_total = metrics.counter(
+    "action_cache_lookups_total", "Cacheable action lookups by result (hit, miss, expired).", ("flow", "action", "result")
+)
+cache_evictions_total = metrics.counter(
+    "action_cache_evictions_total", "Cached action results dropped, by reason.", ("reason",)
+)
+
+
+def cache_key(script_sha256: str, inputs: dict, keys: list = None) -> str:
+    """
+    Digest of the script contents and the input variables the result depends on.
+    `keys` selects those variables; None means every input variable.
+    """
+    selected = inputs if keys is None else {key: inputs.get(key) for key in keys}
+    payload = json.dumps(selected, sort_keys=True, default=str)
+    return hashlib.sha256(f"{script_sha256}\n{payload}".encode("utf-8")).hexdigest()
+
+
+class ResultCache:
+    """
+    Size-bounded LRU of action results with a per-entry TTL.
+
+    Entries are stored per (flow, action) so a side-effecting action can
+    drop the results it makes stale, either for one key or for the whole action.
+    Single-process only: invalidations do not reach other worker processes.
+    """
+
+    def __init__(self, ttl: float = ACTION_CACHE_TTL, max_entries: int = ACTION_CACHE_MAX_ENTRIES):
+        self.ttl = ttl
+        self.max_entries = max(1, max_entries)
+        self._entries = OrderedDict()
+        self._hits = 0
+        self._misses = 0
+
+    def get(self, flow: str, action: str, key: str):
+        """Return the cached result, or None when absent or expired."""
+        entry = self._entries.get((flow, action, key))
+        if entry is None:
+            self._misses += 1
+            cache_lookups_total.inc(flow=flow, action=action, result="miss")
+            return None
+        expires_at, result = entry
+        if expires_at <= time.monotonic():
+            del self._entries[(flow, action, key)]
+            self._misses += 1
+            cache_lookups_total.inc(flow=flow, action=action, result="expired")
+            cache_evictions_total.inc(reason="expired")
+            return None
+        self._entries.move_to_end((flow, action, key))
+        self._hits += 1
+        cache_lookups_total.inc(flow=flow, action=action, result="hit")
+        return dict(result)
+
+    def put(self, flow: str, action: str, key: str, result: dict, ttl: float = None):
+        ttl = self.ttl if ttl is None else ttl
+        if ttl <= 0:
+            return
+        self._entries[(flow, action, key)] = (time.monotonic() + ttl, dict(result))
+        self._entries.move_to_end((flow, action, key))
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+            cache_evictions_total.inc(reason="size")
+
+    def invalidate(self, flow: str, action: str, key: str = None) -> int:
+        """Drop the entry for `key`, or every entry of the action when key is None."""
+        if key is not None:
+            dropped = [(flow, action, key)] if (flow, action, key) in self._entries else []
+        else:
+            dropped = [entry for entry in self._entries if entry[0] == flow and entry[1] == action]
+        for entry in dropped:
+            del self._entries[entry]
+        if dropped:
+            cache_evictions_total.inc(len(dropped), reason="invalidated")
+        return len(dropped)
+
+    def clear(self):
+        self._entries.clear()
+
+    def stats(self) -> dict:
+        lookups = self._hits + self._misses
+        return {
+            "entries": len(self._entries),
+            "max_entries": self.max_entries,
+            "hits": self._hits,
+            "misses": self._misses,
+            "hit_ratio": self._hits / lookups if lookups else 0.0,
+        }
+
+
+action_cache = ResultCache()
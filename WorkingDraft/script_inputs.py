@@ -0,0 +1,94 @@
+import os
+import json
+from collections import OrderedDict
+
+import metrics
+
+# -----------------------------------------------------------------------
+# Input Channel Configuration
+# -----------------------------------------------------------------------
+# argv: inline JSON in the command line (.py/.js argv, .ps1 -Command header),
+# what existing scripts read; stdin: inputs are written to the script's stdin.
+# An action can opt in to stdin on its own with `input: stdin` in flow_details.yml.
+SCRIPT_INPUT_CHANNEL = os.getenv("SCRIPT_INPUT_CHANNEL", "argv").lower()
+SCRIPT_INPUT_CHANNELS = ("argv", "stdin")
+# Tickets whose serialized task_response is kept for reuse by their next actions.
+SCRIPT_PAYLOAD_CACHE_SIZE = int(os.getenv("SCRIPT_PAYLOAD_CACHE_SIZE", "256"))
+
+# Reads one job ({script, task_response, additional_variables}) from stdin and runs it
+# with the same variables the PowerShell host exposes.
+POWERSHELL_STDIN_BOOTSTRAP = (
+    "[Console]::InputEncoding = [System.Text.Encoding]::UTF8; "
+    "$__job = [Console]::In.ReadToEnd() | ConvertFrom-Json; "
+    "$SCTASK_RESPONSE = $__job.task_response.result; "
+    "$ADDITIONAL_VARIABLES = $__job.additional_variables; "
+    "& ([scriptblock]::Create($__job.script))"
+)
+
+payload_cache_total = metrics.counter(
+    "script_payload_cache_total", "Serialized task_response lookups by result.", ("result",)
+)
+input_bytes = metrics.histogram(
+    "script_input_bytes", "Bytes of input handed to a script.", ("channel",),
+    buckets=(256, 1024, 4096, 16384, 65536, 262144, 1048576),
+)
+
+
+class PayloadCache:
+    """
+    LRU of json.dumps(task_response) per ticket number.
+
+    A ticket's task_response does not change while its flow runs, so every
+    action after the first reuses the serialized form. An entry is only
+    reused for the same (or an equal) task_response object.
+    """
+
+    def __init__(self, size: int = SCRIPT_PAYLOAD_CACHE_SIZE):
+        self.size = max(1, size)
+        self._entries = OrderedDict()
+
+    def encode(self, task_response: dict) -> str:
+        try:
+            key = task_response["result"][0]["number"]
+        except (KeyError, IndexError, TypeError):
+            payload_cache_total.inc(result="uncacheable")
+            return json.dumps(task_response)
+
+        entry = self._entries.get(key)
+        if entry is not None and (entry[0] is task_response or entry[0] == task_response):
+            self._entries.move_to_end(key)
+            payload_cache_total.inc(result="hit")
+            return entry[1]
+
+        encoded = json.dumps(task_response)
+        self._entries[key] = (task_response, encoded)
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.size:
+            self._entries.popitem(last=False)
+        payload_cache_total.inc(result="miss")
+        return encoded
+
+
+payload_cache = PayloadCache()
+
+
+def encode_job(script: str, task_response: dict, inputs: dict, spool: str = None) -> bytes:
+    """
+    One-line JSON job for a PowerShell host or the stdin bootstrap, reusing the cached task_response.
+    `spool` is the file a pool host writes oversized output to.
+    """
+    line = (
+        '{"script": ' + json.dumps(script)
+        + ', "task_response": ' + payload_cache.encode(task_response)
+        + ', "additional_variables": ' + json.dumps(inputs)
+        + (', "spool": ' + json.dumps(spool) if spool else "") + "}"
+    ).encode("utf-8")
+    input_bytes.observe(len(line), channel="powershell")
+    return line
+
+
+def encode_inputs(inputs: dict) -> bytes:
+    """stdin payload for .py/.js scripts: the additional variables as JSON."""
+    data = json.dumps(inputs).encode("utf-8")
+    input_bytes.observe(len(data), channel="stdin")
+    return data
@@ -0,0 +1,182 @@
+import os
+import re
+import asyncio
+import hashlib
+import locale
+import logging
+from dataclasses import dataclass
+
+import metrics
+
+# -----------------------------------------------------------------------
+# Registry Configuration
+# -----------------------------------------------------------------------
+USECASES_DIR = os.getenv("USECASES_DIR", "UseCases")
+# How often (seconds) the background watcher looks for changed scripts.
+SCRIPT_REGISTRY_POLL_INTERVAL = float(os.getenv("SCRIPT_REGISTRY_POLL_INTERVAL", "10"))
+
+ALLOWED_EXTENSIONS = (".ps1", ".py", ".js")
+ORDER_PREFIX = re.compile(r"^\s*(\d+)\s*-")
+
+rescans_total = metrics.counter(
+    "script_registry_rescans_total", "Flow directories re-read because their scripts changed."
+)
+
+
+@dataclass(frozen=True)
+class ActionScript:
+    name: str
+    path: str
+    extension: str
+    order: int
+    content: str
+    sha256: str
+    mtime_ns: int
+    size: int
+
+
+def action_order(name: str) -> int:
+    """Numeric prefix of an action file ("3 - Check_Owner.ps1" -> 3); unnumbered files sort last."""
+    match = ORDER_PREFIX.match(name)
+    return int(match.group(1)) if match else 1_000_000
+
+
+def _decode(raw: bytes) -> str:
+    try:
+        return raw.decode("utf-8-sig")
+    except UnicodeDecodeError:
+        return raw.decode(locale.getpreferredencoding(False), errors="replace")
+
+
+def _signature(flow_dir: str) -> tuple:
+    """Cheap change detector for a flow directory: names, sizes and mtimes of its files."""
+    entries = []
+    with os.scandir(flow_dir) as it:
+        for entry in it:
+            if entry.is_file():
+                stat = entry.stat()
+                entries.append((entry.name, stat.st_size, stat.st_mtime_ns))
+    return tuple(sorted(entries))
+
+
+def _load_flow(flow_dir: str) -> list:
+    actions = []
+    with os.scandir(flow_dir) as it:
+        for entry in it:
+            if not entry.is_file():
+                continue
+            extension = os.path.splitext(entry.name)[1].lower()
+            stat = entry.stat()
+            content = ""
+            digest = ""
+            if extension in ALLOWED_EXTENSIONS:
+                with open(entry.path, "rb") as f:
+                    raw = f.read()
+                content = _decode(raw)
+                digest = hashlib.sha256(raw).hexdigest()
+            actions.append(ActionScript(
+                name=entry.name,
+                path=entry.path,
+                extension=extension,
+                order=action_order(entry.name),
+                content=content,
+                sha256=digest,
+                mtime_ns=stat.st_mtime_ns,
+                size=stat.st_size,
+            ))
+    actions.sort(key=lambda action: (action.order, action.name))
+    return actions
+
+
+class ScriptRegistry:
+    """
+    In-memory copy of UseCases/<flow>/ scripts.
+
+    Each flow's actions are kept in execution order (by their "N - " prefix)
+    together with their contents and hashes, so building a ticket's plan and
+    running a .ps1 action need no filesystem access. A background watcher
+    re-reads a flow directory whenever its files change.
+    """
+
+    def __init__(self, root: str = USECASES_DIR):
+        self.root = root
+        self._flows = {}
+        self._signatures = {}
+        self._task = None
+
+    def scan(self):
+        """(Re)load every flow directory whose contents changed since the last scan."""
+        if not os.path.isdir(self.root):
+            logging.error(f"Use case directory not found: {self.root}")
+            return
+        seen = set()
+        with os.scandir(self.root) as it:
+            flow_dirs = [entry for entry in it if entry.is_dir()]
+        for entry in flow_dirs:
+            seen.add(entry.name)
+            self._refresh_flow(entry.name, entry.path)
+        for flow_name in set(self._flows) - seen:
+            logging.debug(f"Flow directory removed: {flow_name}")
+            self._flows.pop(flow_name, None)
+            self._signatures.pop(flow_name, None)
+
+    def _refresh_flow(self, flow_name: str, flow_dir: str):
+        signature = _signature(flow_dir)
+        if self._signatures.get(flow_name) == signature:
+            return
+        self._flows[flow_name] = _load_flow(flow_dir)
+        if flow_name in self._signatures:
+            rescans_total.inc()
+            logging.info(f"Reloaded scripts for flow {flow_name}.")
+        self._signatures[flow_name] = signature
+
+    def get_actions(self, flow_name: str) -> list:
+        """Ordered ActionScript list for a flow."""
+        actions = self._flows.get(flow_name)
+        if actions is None:
+            # A flow added since the last poll: load it once on the spot.
+            flow_dir = os.path.join(self.root, flow_name)
+            if not os.path.isdir(flow_dir):
+                raise FileNotFoundError(f"No such flow directory: {flow_dir}")
+            self._refresh_flow(flow_name, flow_dir)
+            actions = self._flows[flow_name]
+        return actions
+
+    def get_action(self, flow_name: str, action_name: str) -> ActionScript:
+        for action in self.get_actions(flow_name):
+            if action.name == action_name:
+                return action
+        raise FileNotFoundError(f"Script file not found: {os.path.join(self.root, flow_name, action_name)}")
+
+    async def _watch(self):
+        while True:
+            await asyncio.sleep(SCRIPT_REGISTRY_POLL_INTERVAL)
+            try:
+                await asyncio.to_thread(self.scan)
+            except Exception as e:
+                logging.error(f"Script registry rescan failed: {e}")
+
+    def start_watching(self):
+        if self._task is None:
+            self._task = asyncio.create_task(self._watch())
+
+    async def stop_watching(self):
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+
+
+_registry = None
+
+
+def get_script_registry() -> ScriptRegistry:
+    """Return the process-wide registry, scanning UseCases/ on first use."""
+    global _registry
+    if _registry is None:
+        _registry = ScriptRegistry()
+        _registry.scan()
+    return _registry
@@ -0,0 +1,263 @@
+import os
+import sys
+import time
+import signal
+import asyncio
+import logging
+from collections import deque
+from contextlib import asynccontextmanager
+
+import metrics
+from output_capture import CapturedOutput, CapturedProcess, PeakRssSampler, spool_path
+
+# -----------------------------------------------------------------------
+# Scheduler Configuration
+# -----------------------------------------------------------------------
+SCRIPT_MAX_CONCURRENCY = int(os.getenv("SCRIPT_MAX_CONCURRENCY", "8"))
+# e.g. "powershell=4,python=4,node=4"; interpreters not listed share the global cap.
+SCRIPT_INTERPRETER_LIMITS = os.getenv("SCRIPT_INTERPRETER_LIMITS", "powershell=4,python=4,node=4")
+# Above this many queued jobs the API starts turning away new tickets.
+SCRIPT_MAX_QUEUE_DEPTH = int(os.getenv("SCRIPT_MAX_QUEUE_DEPTH", "50"))
+# Seconds an action script may run before its process tree is killed (0 disables).
+# Flows and actions can override it with `timeout:` in flow_details.yml.
+SCRIPT_TIMEOUT = float(os.getenv("SCRIPT_TIMEOUT", "600"))
+
+queue_depth_gauge = metrics.gauge(
+    "script_scheduler_queue_depth", "Script jobs waiting for a scheduler slot."
+)
+running_gauge = metrics.gauge(
+    "script_scheduler_running", "Script jobs currently holding a scheduler slot.", ("interpreter",)
+)
+wait_seconds = metrics.histogram(
+    "script_scheduler_wait_seconds", "Time a script job waited for a scheduler slot.", ("interpreter",)
+)
+process_seconds = metrics.histogram(
+    "script_process_seconds", "Script subprocess spawn-to-exit time by interpreter and outcome.", ("interpreter", "outcome")
+)
+timeouts_total = metrics.counter(
+    "script_timeouts_total", "Script processes killed after exceeding their timeout.", ("interpreter",)
+)
+
+
+def process_group_options() -> dict:
+    """
+    create_subprocess_exec() options that start the child in its own process
+    group, so the whole tree it spawns can be killed together.
+    """
+    if sys.platform == "win32":
+        import subprocess
+        return {"creationflags": subprocess.CREATE_NEW_PROCESS_GROUP}
+    return {"start_new_session": True}
+
+
+async def kill_process_tree(process: asyncio.subprocess.Process):
+    """Kill `process` and every process it started (killpg on POSIX, taskkill /T on Windows)."""
+    if process.returncode is not None:
+        return
+    try:
+        if sys.platform == "win32":
+            killer = await asyncio.create_subprocess_exec(
+                "taskkill", "/F", "/T", "/PID", str(process.pid),
+                stdout=asyncio.subprocess.DEVNULL, stderr=asyncio.subprocess.DEVNULL,
+            )
+            await killer.wait()
+        else:
+            os.killpg(process.pid, signal.SIGKILL)
+    except (ProcessLookupError, PermissionError, OSError) as e:
+        logging.debug(f"Process group kill failed for pid {process.pid}: {e}")
+    try:
+        process.kill()
+    except ProcessLookupError:
+        pass
+
+
+def parse_interpreter_limits(value: str) -> dict:
+    """Parse "powershell=4,python=2" into {"powershell": 4, "python": 2}."""
+    limits = {}
+    for item in value.split(","):
+        if "=" not in item:
+            continue
+        name, limit = item.split("=", 1)
+        limits[name.strip()] = int(limit)
+    return limits
+
+
+class ScriptScheduler:
+    """
+    Bounded, non-blocking scheduler for script subprocesses.
+
+    Jobs acquire a slot that respects both the global cap and the cap of their
+    interpreter. Waiters are served first-in first-out among those whose
+    interpreter has room, so a burst of PowerShell jobs does not starve Python
+    or Node actions.
+    """
+
+    def __init__(self, max_concurrency: int = SCRIPT_MAX_CONCURRENCY,
+                 interpreter_limits: dict = None, max_queue_depth: int = SCRIPT_MAX_QUEUE_DEPTH):
+        self.max_concurrency = max(1, max_concurrency)
+        self.interpreter_limits = (
+            interpreter_limits if interpreter_limits is not None
+            else parse_interpreter_limits(SCRIPT_INTERPRETER_LIMITS)
+        )
+        self.max_queue_depth = max_queue_depth
+        self._running = {}
+        self._total_running = 0
+        self._waiters = deque()
+        self._completed = 0
+        self._total_wait = 0.0
+
+    def _has_capacity(self, interpreter: str) -> bool:
+        if self._total_running >= self.max_concurrency:
+            return False
+        limit = self.interpreter_limits.get(interpreter)
+        return limit is None or self._running.get(interpreter, 0) < limit
+
+    def _grant(self, interpreter: str):
+        self._total_running += 1
+        self._running[interpreter] = self._running.get(interpreter, 0) + 1
+        running_gauge.set(self._running[interpreter], interpreter=interpreter)
+
+    def _wake(self):
+        for waiter in list(self._waiters):
+            interpreter, future = waiter
+            if future.done():
+                self._waiters.remove(waiter)
+                continue
+            if self._has_capacity(interpreter):
+                self._waiters.remove(waiter)
+                self._grant(interpreter)
+                future.set_result(None)
+        queue_depth_gauge.set(len(self._waiters))
+
+    async def _acquire(self, interpreter: str):
+        start = time.perf_counter()
+        if self._has_capacity(interpreter):
+            # Anyone still queued is blocked on a cap this job does not need.
+            self._grant(interpreter)
+        else:
+            future = asyncio.get_running_loop().create_future()
+            waiter = (interpreter, future)
+            self._waiters.append(waiter)
+            queue_depth_gauge.set(len(self._waiters))
+            try:
+                await future
+            except asyncio.CancelledError:
+                if future.done() and not future.cancelled():
+                    self._release(interpreter)
+                elif waiter in self._waiters:
+                    self._waiters.remove(waiter)
+                    queue_depth_gauge.set(len(self._waiters))
+                raise
+        waited = time.perf_counter() - start
+        self._total_wait += waited
+        wait_seconds.observe(waited, interpreter=interpreter)
+
+    def _release(self, interpreter: str):
+        self._total_running -= 1
+        self._running[interpreter] -= 1
+        self._completed += 1
+        running_gauge.set(self._running[interpreter], interpreter=interpreter)
+        self._wake()
+
+    @asynccontextmanager
+    async def slot(self, interpreter: str):
+        """Hold one scheduler slot for `interpreter` for the duration of the block."""
+        await self._acquire(interpreter)
+        try:
+            yield
+        finally:
+            self._release(interpreter)
+
+    async def run(self, interpreter: str, command: list, cwd: str = None, stdin: bytes = None,
+                  spool: tuple = None, timeout: float = None) -> CapturedProcess:
+        """
+        Run `command` as a subprocess once a slot is free.
+        `stdin`, when given, is written to the process's standard input.
+        stdout/stderr are read as they arrive and spill to per-ticket spool
+        files past SCRIPT_OUTPUT_MEMORY_CAP; `spool` is (ticket, label) naming them.
+        After `timeout` seconds (time spent waiting for the slot excluded) the
+        process tree is killed and the result is marked timed_out; it is also
+        killed when the caller is cancelled. The slot is freed either way.
+
+        Returns:
+            CapturedProcess: returncode, captured stdout/stderr, peak RSS and timed_out
+        """
+        async with self.slot(interpreter):
+            logging.debug(f"Executing command: {' '.join(command)}")
+            spawned_at = time.perf_counter()
+            process = await asyncio.create_subprocess_exec(
+                *command,
+                stdin=asyncio.subprocess.PIPE if stdin is not None else asyncio.subprocess.DEVNULL,
+                stdout=asyncio.subprocess.PIPE,
+                stderr=asyncio.subprocess.PIPE,
+                cwd=cwd,
+                **process_group_options()
+            )
+            sampler = PeakRssSampler(process.pid).start()
+            stdout = CapturedOutput(spool_path(*spool, "stdout") if spool else None)
+            stderr = CapturedOutput(spool_path(*spool, "stderr") if spool else None)
+
+            async def feed():
+                if stdin is None:
+                    return
+                try:
+                    process.stdin.write(stdin)
+                    await process.stdin.drain()
+                except (BrokenPipeError, ConnectionResetError):
+                    pass
+                finally:
+                    process.stdin.close()
+
+            async def communicate():
+                await asyncio.gather(
+                    feed(), stdout.consume(process.stdout, "stdout"), stderr.consume(process.stderr, "stderr")
+                )
+                return await process.wait()
+
+            timed_out = False
+            outcome = "cancelled"
+            try:
+                returncode = await asyncio.wait_for(communicate(), timeout or None)
+                outcome = "ok" if returncode == 0 else "error"
+            except asyncio.TimeoutError:
+                timed_out = True
+                outcome = "timeout"
+                timeouts_total.inc(interpreter=interpreter)
+                logging.error(f"Script exceeded its {timeout:.1f}s timeout; killing process tree {process.pid}.")
+                await kill_process_tree(process)
+                returncode = await process.wait()
+            except asyncio.CancelledError:
+                await kill_process_tree(process)
+                await process.wait()
+                raise
+            finally:
+                process_seconds.observe(time.perf_counter() - spawned_at, interpreter=interpreter, outcome=outcome)
+                peak_rss = await sampler.stop(interpreter)
+            return CapturedProcess(returncode, stdout, stderr, peak_rss, timed_out)
+
+    def saturated(self) -> bool:
+        """True when the wait queue is deep enough that new tickets should be deferred."""
+        return len(self._waiters) >= self.max_queue_depth
+
+    def stats(self) -> dict:
+        return {
+            "running": self._total_running,
+            "running_by_interpreter": dict(self._running),
+            "queue_depth": len(self._waiters),
+            "max_concurrency": self.max_concurrency,
+            "max_queue_depth": self.max_queue_depth,
+            "completed": self._completed,
+            "average_wait_seconds": self._total_wait / self._completed if self._completed else 0.0,
+            "saturated": self.saturated(),
+        }
+
+
+_scheduler = None
+
+
+def get_scheduler() -> ScriptScheduler:
+    """Return the process-wide scheduler."""
+    global _scheduler
+    if _scheduler is None:
+        _scheduler = ScriptScheduler()
+    return _scheduler
@@ -0,0 +1,145 @@
+import os
+import time
+import logging
+import importlib.util
+
+import httpx
+
+import metrics
+
+# -----------------------------------------------------------------------
+# Client Configuration
+# -----------------------------------------------------------------------
+SERVICENOW_ENDPOINT = os.getenv("SERVICENOW_ENDPOINT", "https://hexawaretechnologiesincdemo8.service-now.com")
+SERVICENOW_HTTP2 = os.getenv("SERVICENOW_HTTP2", "false").lower() == "true"
+SERVICENOW_MAX_CONNECTIONS = int(os.getenv("SERVICENOW_MAX_CONNECTIONS", "20"))
+SERVICENOW_MAX_KEEPALIVE = int(os.getenv("SERVICENOW_MAX_KEEPALIVE", "10"))
+SERVICENOW_KEEPALIVE_EXPIRY = float(os.getenv("SERVICENOW_KEEPALIVE_EXPIRY", "60"))
+SERVICENOW_TIMEOUT = float(os.getenv("SERVICENOW_TIMEOUT", "30"))
+SERVICENOW_CONNECT_TIMEOUT = float(os.getenv("SERVICENOW_CONNECT_TIMEOUT", "10"))
+
+JSON_HEADERS = {"Content-Type": "application/json", "Accept": "application/json"}
+
+requests_total = metrics.counter(
+    "servicenow_requests_total", "ServiceNow HTTP requests by method and status code.", ("method", "status")
+)
+request_seconds = metrics.histogram(
+    "servicenow_request_seconds", "ServiceNow HTTP request latency by method and status code.", ("method", "status"),
+    buckets=(0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30),
+)
+connections_total = metrics.counter(
+    "servicenow_connections_total", "ServiceNow connection handshakes by kind (tcp, tls).", ("kind",)
+)
+
+
+class ServiceNowClient:
+    """
+    Process-wide ServiceNow REST client.
+
+    Wraps a single httpx.AsyncClient so every update_* node reuses pooled
+    keep-alive connections instead of paying a TCP+TLS handshake per request.
+    When a `mirror` is attached, successful reads and writes are passed to it.
+    """
+
+    def __init__(self, endpoint: str = SERVICENOW_ENDPOINT, user: str = None, pwd: str = None,
+                 http2: bool = SERVICENOW_HTTP2, transport: httpx.AsyncBaseTransport = None):
+        self.endpoint = endpoint.rstrip("/")
+        if http2 and importlib.util.find_spec("h2") is None:
+            logging.warning("SERVICENOW_HTTP2 is enabled but the 'h2' package is not installed; using HTTP/1.1.")
+            http2 = False
+        user = user or os.getenv("SERVICENOW_USER")
+        pwd = pwd or os.getenv("SERVICENOW_PWD")
+        self.stats_counters = {"requests": 0, "errors": 0, "tcp_connects": 0, "tls_handshakes": 0}
+        self.mirror = None
+        self._client = httpx.AsyncClient(
+            base_url=self.endpoint,
+            auth=(user, pwd or "") if user else None,
+            headers=JSON_HEADERS,
+            http2=http2,
+            limits=httpx.Limits(
+                max_connections=SERVICENOW_MAX_CONNECTIONS,
+                max_keepalive_connections=SERVICENOW_MAX_KEEPALIVE,
+                keepalive_expiry=SERVICENOW_KEEPALIVE_EXPIRY,
+            ),
+            timeout=httpx.Timeout(SERVICENOW_TIMEOUT, connect=SERVICENOW_CONNECT_TIMEOUT),
+            transport=transport,
+        )
+
+    async def _trace(self, event_name: str, info: dict):
+        # httpcore reports each new connection; reused keep-alive connections emit nothing here.
+        if event_name == "connection.connect_tcp.complete":
+            self.stats_counters["tcp_connects"] += 1
+            connections_total.inc(kind="tcp")
+        elif event_name == "connection.start_tls.complete":
+            self.stats_counters["tls_handshakes"] += 1
+            connections_total.inc(kind="tls")
+
+    async def request(self, method: str, path: str, **kwargs) -> httpx.Response:
+        self.stats_counters["requests"] += 1
+        start = time.perf_counter()
+        try:
+            resp = await self._client.request(method, path, extensions={"trace": self._trace}, **kwargs)
+        except httpx.HTTPError:
+            self.stats_counters["errors"] += 1
+            requests_total.inc(method=method, status="error")
+            request_seconds.observe(time.perf_counter() - start, method=method, status="error")
+            raise
+        requests_total.inc(method=method, status=str(resp.status_code))
+        request_seconds.observe(time.perf_counter() - start, method=method, status=str(resp.status_code))
+        return resp
+
+    async def update_record(self, table_name: str, sys_id: str, body: dict) -> httpx.Response:
+        """PUT `body` onto /api/now/table/<table_name>/<sys_id>."""
+        resp = await self.request("PUT", f"/api/now/table/{table_name}/{sys_id}", json=body)
+        if self.mirror is not None and resp.status_code == 200:
+            await self._mirror_call(self.mirror.record_write(table_name, sys_id, body, self._result(resp)))
+        return resp
+
+    async def get_records(self, table_name: str, params: dict = None) -> httpx.Response:
+        """GET /api/now/table/<table_name> with the given sysparm_* query parameters."""
+        resp = await self.request("GET", f"/api/now/table/{table_name}", params=params)
+        if self.mirror is not None and resp.status_code == 200:
+            records = self._result(resp)
+            if isinstance(records, list):
+                partial = bool((params or {}).get("sysparm_fields"))
+                await self._mirror_call(self.mirror.record_read(table_name, records, partial))
+        return resp
+
+    @staticmethod
+    def _result(resp: httpx.Response):
+        try:
+            return resp.json().get("result")
+        except (ValueError, AttributeError):
+            return None
+
+    @staticmethod
+    async def _mirror_call(call):
+        # The instance already has the change; a mirror failure must not fail the request.
+        try:
+            await call
+        except Exception as e:
+            logging.error(f"Failed to update the ServiceNow mirror: {e}")
+
+    def stats(self) -> dict:
+        return dict(self.stats_counters)
+
+    async def close(self):
+        await self._client.aclose()
+
+
+_client = None
+
+
+def get_servicenow_client() -> ServiceNowClient:
+    """Return the process-wide ServiceNow client, creating it on first use."""
+    global _client
+    if _client is None:
+        _client = ServiceNowClient()
+    return _client
+
+
+async def close_servicenow_client():
+    global _client
+    if _client is not None:
+        await _client.close()
+        _client = None
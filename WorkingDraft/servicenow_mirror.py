@@ -0,0 +1,352 @@
+import os
+import json
+import time
+import asyncio
+import logging
+
+import aiosqlite
+
+import metrics
+from servicenow_client import get_servicenow_client
+
+# -----------------------------------------------------------------------
+# Mirror Configuration
+# -----------------------------------------------------------------------
+# Local copy of the ServiceNow records the flows handle, kept up to date by
+# every read and write that goes through the ServiceNow client.
+SERVICENOW_MIRROR_ENABLED = os.getenv("SERVICENOW_MIRROR_ENABLED", "true").lower() == "true"
+SERVICENOW_DB_PATH = os.getenv("SERVICENOW_DB_PATH", "servicenow_db/sn_database.db")
+# How often (seconds) mirrored rows are checked against the instance; 0 disables the reconcile job.
+SERVICENOW_MIRROR_RECONCILE_INTERVAL = float(os.getenv("SERVICENOW_MIRROR_RECONCILE_INTERVAL", "300"))
+# Only active rows synced within this many days are reconciled.
+SERVICENOW_MIRROR_RECONCILE_DAYS = float(os.getenv("SERVICENOW_MIRROR_RECONCILE_DAYS", "7"))
+# Inactive rows synced within this many days are reconciled too, so a reopened ticket is picked up.
+SERVICENOW_MIRROR_RECONCILE_CLOSED_DAYS = float(os.getenv("SERVICENOW_MIRROR_RECONCILE_CLOSED_DAYS", "1"))
+# sys_ids per reconcile request.
+SERVICENOW_MIRROR_RECONCILE_BATCH = int(os.getenv("SERVICENOW_MIRROR_RECONCILE_BATCH", "100"))
+
+STAMP_FIELDS = ("sys_updated_on", "sys_mod_count")
+
+mirror_reads_total = metrics.counter(
+    "servicenow_mirror_reads_total", "Ticket reads answered from the local ServiceNow mirror.", ("result",)
+)
+mirror_writes_total = metrics.counter(
+    "servicenow_mirror_writes_total", "Records written to the local ServiceNow mirror, by source.", ("source",)
+)
+reconciled_total = metrics.counter(
+    "servicenow_mirror_reconciled_total", "Mirrored rows checked by the reconcile job, by outcome.", ("result",)
+)
+
+
+def _text(value):
+    # Reference fields come back as {"link": ..., "value": ...} unless excluded.
+    if isinstance(value, dict):
+        value = value.get("value")
+    return None if value is None or value == "" else str(value)
+
+
+class ServiceNowMirror:
+    """
+    Local mirror of ServiceNow records, keyed by table and sys_id and indexed
+    by number.
+
+    The ServiceNow client hands every successful read and write to the mirror
+    (write-through), so the status route, repeat submissions and resumes can
+    check a ticket locally instead of calling the instance. A full record
+    carries its sys_updated_on/sys_mod_count stamps; rows read with
+    sysparm_fields only merge the fields they contain and leave the stamps
+    alone, so the reconcile job still fetches the whole row once. The reconcile job asks the instance
+    for just the stamps of the active rows and refreshes the ones that moved.
+
+    Rows of the legacy wide `sc_task` table shipped in sn_database.db are
+    imported once on first start.
+    """
+
+    def __init__(self, path: str = SERVICENOW_DB_PATH, reconcile_interval: float = SERVICENOW_MIRROR_RECONCILE_INTERVAL,
+                 reconcile_batch: int = SERVICENOW_MIRROR_RECONCILE_BATCH):
+        self.path = path
+        self.reconcile_interval = reconcile_interval
+        self.reconcile_batch = max(1, reconcile_batch)
+        self._conn = None
+        self._queue = asyncio.Queue()
+        self._writer_task = None
+        self._reconcile_task = None
+        self._counts = {"hits": 0, "misses": 0, "writes": 0, "reconciles": 0, "refreshed": 0}
+
+    async def start(self):
+        directory = os.path.dirname(self.path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        self._conn = await aiosqlite.connect(self.path)
+        await self._conn.executescript(
+            """
+            PRAGMA journal_mode=WAL;
+            PRAGMA synchronous=NORMAL;
+            CREATE TABLE IF NOT EXISTS records (
+                table_name TEXT NOT NULL,
+                sys_id TEXT NOT NULL,
+                number TEXT,
+                state TEXT,
+                active TEXT,
+                sys_updated_on TEXT,
+                sys_mod_count TEXT,
+                data TEXT NOT NULL,
+                synced_at REAL NOT NULL,
+                PRIMARY KEY (table_name, sys_id)
+            );
+            CREATE INDEX IF NOT EXISTS records_number ON records (number);
+            CREATE INDEX IF NOT EXISTS records_reconcile ON records (active, synced_at);
+            """
+        )
+        await self._import_legacy()
+        self._writer_task = asyncio.create_task(self._writer())
+        if self.reconcile_interval > 0:
+            self._reconcile_task = asyncio.create_task(self._reconcile_loop())
+
+    async def _import_legacy(self):
+        async with self._conn.execute(
+            "SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = 'sc_task'"
+        ) as cursor:
+            legacy = await cursor.fetchone()
+        async with self._conn.execute("SELECT 1 FROM records LIMIT 1") as cursor:
+            populated = await cursor.fetchone()
+        if legacy is None or populated is not None:
+            return
+        self._conn.row_factory = aiosqlite.Row
+        try:
+            async with self._conn.execute("SELECT * FROM sc_task WHERE sys_id IS NOT NULL") as cursor:
+                rows = [dict(row) for row in await cursor.fetchall()]
+        finally:
+            self._conn.row_factory = None
+        if rows:
+            by_table = {}
+            for row in rows:
+                by_table.setdefault(row.get("sys_class_name") or "sc_task", []).append(row)
+            for table_name, records in by_table.items():
+                await self.upsert(table_name, records, source="import")
+            logging.info(f"Imported {len(rows)} legacy sc_task row(s) into the ServiceNow mirror.")
+
+    async def upsert(self, table_name: str, records: list, partial: bool = False, source: str = "read"):
+        """
+        Merge records into the mirror. A `partial` record (read with
+        sysparm_fields) only updates the fields it carries, never the stamps;
+        a full record older than the mirrored row is ignored.
+        """
+        rows = []
+        now = time.time()
+        for record in records:
+            sys_id = _text(record.get("sys_id"))
+            if not sys_id:
+                continue
+            if partial:
+                record = {field: value for field, value in record.items() if field not in STAMP_FIELDS}
+            data = {field: value for field, value in record.items() if value is not None and field != "work_notes"}
+            rows.append((
+                table_name, sys_id, _text(record.get("number")), _text(record.get("state")),
+                _text(record.get("active")), _text(record.get("sys_updated_on")), _text(record.get("sys_mod_count")),
+                json.dumps(data, default=str), now,
+            ))
+        if not rows:
+            return
+        await self._conn.executemany(
+            """
+            INSERT INTO records (table_name, sys_id, number, state, active, sys_updated_on, sys_mod_count, data, synced_at)
+            VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)
+            ON CONFLICT(table_name, sys_id) DO UPDATE SET
+                number = COALESCE(excluded.number, records.number),
+                state = COALESCE(excluded.state, records.state),
+                active = COALESCE(excluded.active, records.active),
+                sys_updated_on = COALESCE(excluded.sys_updated_on, records.sys_updated_on),
+                sys_mod_count = COALESCE(excluded.sys_mod_count, records.sys_mod_count),
+                data = json_patch(records.data, excluded.data),
+                synced_at = excluded.synced_at
+            WHERE excluded.sys_updated_on IS NULL OR records.sys_updated_on IS NULL
+                OR excluded.sys_updated_on >= records.sys_updated_on
+            """,
+            rows,
+        )
+        await self._conn.commit()
+        self._counts["writes"] += len(rows)
+        mirror_writes_total.inc(len(rows), source=source)
+
+    async def record_read(self, table_name: str, records: list, partial: bool):
+        """Called by the ServiceNow client with the result of every successful GET."""
+        await self.upsert(table_name, records, partial=partial, source="read")
+
+    async def record_write(self, table_name: str, sys_id: str, body: dict, result: dict = None):
+        """
+        Called by the ServiceNow client after a successful PUT: the record the
+        instance answered with is stored, or the fields sent when it had none.
+        """
+        if result and _text(result.get("sys_id")) == sys_id:
+            await self.upsert(table_name, [result], source="write")
+        else:
+            await self.upsert(table_name, [{**body, "sys_id": sys_id}], partial=True, source="write")
+
+    def observe_payload(self, body: bytes):
+        """Queue a submitted /api/task body; a background writer parses and mirrors it off the request path."""
+        self._queue.put_nowait(body)
+
+    async def _writer(self):
+        while True:
+            bodies = [await self._queue.get()]
+            while not self._queue.empty():
+                bodies.append(self._queue.get_nowait())
+            await self._mirror_payloads(bodies)
+
+    async def _mirror_payloads(self, bodies: list):
+        for body in bodies:
+            try:
+                records = json.loads(body).get("result") or []
+                if isinstance(records, dict):
+                    records = [records]
+                for record in records:
+                    await self.upsert(record.get("sys_class_name") or "sc_task", [record], source="ingest")
+            except Exception as e:
+                logging.error(f"Failed to mirror a submitted ticket: {e}")
+
+    async def _fetch_one(self, query: str, params: tuple) -> dict:
+        async with self._conn.execute(query, params) as cursor:
+            row = await cursor.fetchone()
+        if row is None:
+            self._counts["misses"] += 1
+            mirror_reads_total.inc(result="miss")
+            return None
+        self._counts["hits"] += 1
+        mirror_reads_total.inc(result="hit")
+        return json.loads(row[0])
+
+    async def get(self, number: str) -> dict:
+        """Return the mirrored record for a ticket number, or None."""
+        return await self._fetch_one(
+            "SELECT data FROM records WHERE number = ? ORDER BY synced_at DESC LIMIT 1", (number,)
+        )
+
+    async def get_by_sys_id(self, table_name: str, sys_id: str) -> dict:
+        """Return the mirrored record for a table and sys_id, or None."""
+        return await self._fetch_one(
+            "SELECT data FROM records WHERE table_name = ? AND sys_id = ?", (table_name, sys_id)
+        )
+
+    async def ticket_closed(self, table_name: str, sys_id: str, closed_states) -> bool:
+        """True when the mirrored record is inactive or in one of `closed_states`; False when it is not mirrored."""
+        record = await self.get_by_sys_id(table_name, sys_id)
+        if record is None:
+            return False
+        return _text(record.get("active")) == "false" or _text(record.get("state")) in closed_states
+
+    async def _reconcile_loop(self):
+        while True:
+            await asyncio.sleep(self.reconcile_interval)
+            try:
+                await self.reconcile_once()
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                logging.error(f"ServiceNow mirror reconcile failed: {e}")
+
+    async def _fetch_records(self, table_name: str, sys_ids: list, fields: list = None) -> list:
+        params = {
+            "sysparm_query": "sys_idIN" + ",".join(sys_ids),
+            "sysparm_limit": len(sys_ids),
+            "sysparm_display_value": "false",
+            "sysparm_exclude_reference_link": "true",
+        }
+        if fields:
+            params["sysparm_fields"] = ",".join(fields)
+        resp = await get_servicenow_client().get_records(table_name, params)
+        if resp.status_code != 200:
+            raise RuntimeError(f"ServiceNow returned {resp.status_code} for {table_name}: {resp.text[:200]}")
+        return resp.json().get("result") or []
+
+    async def reconcile_once(self) -> int:
+        """
+        Compare the stamps of active and recently closed mirrored rows with the
+        instance and fetch full records only for rows whose sys_updated_on or
+        sys_mod_count changed. Returns the number of rows refreshed.
+        """
+        now = time.time()
+        async with self._conn.execute(
+            "SELECT table_name, sys_id, sys_updated_on, sys_mod_count FROM records "
+            "WHERE ((active IS NULL OR active != 'false') AND synced_at >= ?) "
+            "OR (active = 'false' AND synced_at >= ?) ORDER BY table_name",
+            (now - SERVICENOW_MIRROR_RECONCILE_DAYS * 86400, now - SERVICENOW_MIRROR_RECONCILE_CLOSED_DAYS * 86400),
+        ) as cursor:
+            rows = await cursor.fetchall()
+        by_table = {}
+        for table_name, sys_id, updated_on, mod_count in rows:
+            by_table.setdefault(table_name, {})[sys_id] = (updated_on, mod_count)
+
+        refreshed = 0
+        for table_name, local in by_table.items():
+            sys_ids = list(local)
+            for start in range(0, len(sys_ids), self.reconcile_batch):
+                batch = sys_ids[start:start + self.reconcile_batch]
+                stamps = await self._fetch_records(table_name, batch, ["sys_id", *STAMP_FIELDS])
+                changed = [
+                    stamp["sys_id"] for stamp in stamps
+                    if (_text(stamp.get("sys_updated_on")), _text(stamp.get("sys_mod_count"))) != local.get(stamp["sys_id"])
+                ]
+                reconciled_total.inc(len(stamps) - len(changed), result="unchanged")
+                if changed:
+                    # The full rows reach the mirror through the client's read hook.
+                    await self._fetch_records(table_name, changed)
+                    reconciled_total.inc(len(changed), result="refreshed")
+                    refreshed += len(changed)
+        self._counts["reconciles"] += 1
+        self._counts["refreshed"] += refreshed
+        return refreshed
+
+    async def stats(self) -> dict:
+        async with self._conn.execute("SELECT COUNT(*) FROM records") as cursor:
+            (rows,) = await cursor.fetchone()
+        return {**self._counts, "rows": rows, "pending": self._queue.qsize()}
+
+    async def close(self):
+        for task in (self._reconcile_task, self._writer_task):
+            if task is not None:
+                task.cancel()
+                try:
+                    await task
+                except asyncio.CancelledError:
+                    pass
+        self._reconcile_task = self._writer_task = None
+        if self._conn is not None:
+            pending = []
+            while not self._queue.empty():
+                pending.append(self._queue.get_nowait())
+            await self._mirror_payloads(pending)
+            await self._conn.close()
+            self._conn = None
+
+
+_mirror = None
+_mirror_lock = asyncio.Lock()
+
+
+async def get_servicenow_mirror() -> ServiceNowMirror:
+    """Return the process-wide mirror, opening it and attaching it to the ServiceNow client on first use."""
+    global _mirror
+    if _mirror is None:
+        async with _mirror_lock:
+            if _mirror is None:
+                mirror = ServiceNowMirror()
+                await mirror.start()
+                get_servicenow_client().mirror = mirror
+                _mirror = mirror
+    return _mirror
+
+
+def servicenow_mirror():
+    """The mirror if it has been opened, else None (for callers that must not open it)."""
+    return _mirror
+
+
+async def close_servicenow_mirror():
+    global _mirror
+    if _mirror is not None:
+        client = get_servicenow_client()
+        if client.mirror is _mirror:
+            client.mirror = None
+        await _mirror.close()
+        _mirror = None
@@ -0,0 +1,271 @@
+import os
+import json
+import time
+import asyncio
+import logging
+
+import aiosqlite
+
+import metrics
+from servicenow_client import get_servicenow_client
+from ticket_leases import make_owner_id
+
+# -----------------------------------------------------------------------
+# Outbox Configuration
+# -----------------------------------------------------------------------
+SERVICENOW_OUTBOX_ENABLED = os.getenv("SERVICENOW_OUTBOX_ENABLED", "true").lower() == "true"
+SERVICENOW_OUTBOX_PATH = os.getenv("SERVICENOW_OUTBOX_PATH", "state_db/servicenow_outbox.sqlite")
+# Flush whatever is pending at least this often (seconds) ...
+SERVICENOW_OUTBOX_FLUSH_INTERVAL = float(os.getenv("SERVICENOW_OUTBOX_FLUSH_INTERVAL", "2"))
+# ... or as soon as this many updates are waiting.
+SERVICENOW_OUTBOX_BATCH_SIZE = int(os.getenv("SERVICENOW_OUTBOX_BATCH_SIZE", "50"))
+# Updates for a record that keeps failing are parked in outbox_dead after this many attempts.
+SERVICENOW_OUTBOX_MAX_ATTEMPTS = int(os.getenv("SERVICENOW_OUTBOX_MAX_ATTEMPTS", "20"))
+# A record's updates are claimed by one worker process while it sends them; a
+# claim left by a process that died is free again after this many seconds.
+SERVICENOW_OUTBOX_CLAIM_TTL = float(os.getenv("SERVICENOW_OUTBOX_CLAIM_TTL", "120"))
+
+WORK_NOTE_SEPARATOR = "\n\n"
+
+enqueued_total = metrics.counter(
+    "servicenow_outbox_enqueued_total", "Ticket field updates written to the outbox."
+)
+flushed_requests_total = metrics.counter(
+    "servicenow_outbox_requests_total", "Coalesced ServiceNow requests sent by the outbox.", ("outcome",)
+)
+pending_gauge = metrics.gauge(
+    "servicenow_outbox_pending", "Ticket field updates waiting in the outbox."
+)
+
+
+def merge_updates(bodies: list) -> dict:
+    """
+    Coalesce field updates for one record in queue order.
+    Plain fields keep their latest value; work notes are appended.
+    """
+    merged = {}
+    notes = []
+    for body in bodies:
+        for field, value in body.items():
+            if field == "work_notes":
+                if value:
+                    notes.append(str(value))
+            else:
+                merged[field] = value
+    if notes:
+        merged["work_notes"] = WORK_NOTE_SEPARATOR.join(notes)
+    return merged
+
+
+class ServiceNowOutbox:
+    """
+    Durable write-behind queue for ServiceNow record updates.
+
+    Every update is appended as its own row so nothing is lost if the process
+    dies mid-flush; rows for the same sys_id are merged into a single PUT at
+    flush time and deleted only once ServiceNow accepted it.
+
+    Worker processes share the file: before sending a record's updates a
+    process claims its rows (owner and claimed_until), and no one claims a
+    record while another process holds a live claim on any of its rows, so
+    each update is sent once and in order.
+    """
+
+    def __init__(self, path: str = SERVICENOW_OUTBOX_PATH, claim_ttl: float = SERVICENOW_OUTBOX_CLAIM_TTL):
+        self.path = path
+        self.claim_ttl = claim_ttl
+        self.owner = make_owner_id()
+        self._conn = None
+        self._flush_lock = asyncio.Lock()
+        self._wakeup = asyncio.Event()
+        self._pending = 0
+        self._task = None
+
+    async def start(self):
+        directory = os.path.dirname(self.path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        self._conn = await aiosqlite.connect(self.path)
+        await self._conn.executescript(
+            """
+            PRAGMA journal_mode=WAL;
+            CREATE TABLE IF NOT EXISTS outbox (
+                seq INTEGER PRIMARY KEY AUTOINCREMENT,
+                sys_id TEXT NOT NULL,
+                table_name TEXT NOT NULL,
+                body TEXT NOT NULL,
+                attempts INTEGER NOT NULL DEFAULT 0,
+                next_attempt_at REAL NOT NULL DEFAULT 0,
+                queued_at REAL NOT NULL,
+                owner TEXT,
+                claimed_until REAL NOT NULL DEFAULT 0
+            );
+            CREATE INDEX IF NOT EXISTS outbox_sys_id ON outbox (sys_id, seq);
+            CREATE TABLE IF NOT EXISTS outbox_dead (
+                sys_id TEXT NOT NULL,
+                table_name TEXT NOT NULL,
+                body TEXT NOT NULL,
+                error TEXT,
+                failed_at REAL NOT NULL
+            );
+            """
+        )
+        async with self._conn.execute("PRAGMA table_info(outbox)") as cursor:
+            columns = {row[1] for row in await cursor.fetchall()}
+        if "owner" not in columns:
+            await self._conn.execute("ALTER TABLE outbox ADD COLUMN owner TEXT")
+        if "claimed_until" not in columns:
+            await self._conn.execute("ALTER TABLE outbox ADD COLUMN claimed_until REAL NOT NULL DEFAULT 0")
+        await self._conn.commit()
+        async with self._conn.execute("SELECT COUNT(*) FROM outbox") as cursor:
+            self._pending = (await cursor.fetchone())[0]
+        pending_gauge.set(self._pending)
+        if self._pending:
+            logging.info(f"Replaying {self._pending} ServiceNow update(s) left in the outbox.")
+            self._wakeup.set()
+        self._task = asyncio.create_task(self._flush_loop())
+
+    async def enqueue(self, table_name: str, sys_id: str, body: dict):
+        """Persist one field update; it is sent on the next flush."""
+        await self._conn.execute(
+            "INSERT INTO outbox (sys_id, table_name, body, queued_at) VALUES (?, ?, ?, ?)",
+            (sys_id, table_name, json.dumps(body), time.time())
+        )
+        await self._conn.commit()
+        self._pending += 1
+        enqueued_total.inc()
+        pending_gauge.set(self._pending)
+        if self._pending >= SERVICENOW_OUTBOX_BATCH_SIZE:
+            self._wakeup.set()
+
+    async def _flush_loop(self):
+        while True:
+            try:
+                await asyncio.wait_for(self._wakeup.wait(), SERVICENOW_OUTBOX_FLUSH_INTERVAL)
+            except asyncio.TimeoutError:
+                pass
+            self._wakeup.clear()
+            try:
+                await self.flush()
+            except Exception as e:
+                logging.error(f"ServiceNow outbox flush failed: {e}")
+
+    async def flush(self, sys_id: str = None):
+        """Send every pending update (or only those for `sys_id`), one request per record."""
+        async with self._flush_lock:
+            now = time.time()
+            # A record in retry backoff, or being sent by another process, is held
+            # back as a whole so updates never go out of order.
+            query = (
+                "SELECT sys_id FROM outbox{} GROUP BY sys_id "
+                "HAVING MAX(next_attempt_at) <= ? AND MAX(claimed_until) < ? ORDER BY MIN(seq)"
+            ).format(" WHERE sys_id = ?" if sys_id is not None else "")
+            params = (sys_id, now, now) if sys_id is not None else (now, now)
+            async with self._conn.execute(query, params) as cursor:
+                record_ids = [row[0] for row in await cursor.fetchall()]
+            for record_id in record_ids:
+                record = await self._claim(record_id)
+                if record is not None:
+                    await self._flush_record(record_id, record)
+
+    async def _claim(self, sys_id: str):
+        """Claim every pending row of one record for this process, or return None if it is not free."""
+        now = time.time()
+        # One statement, so two processes cannot both find the record free.
+        async with self._conn.execute(
+            "UPDATE outbox SET owner = ?, claimed_until = ? WHERE sys_id = ? AND NOT EXISTS ("
+            "SELECT 1 FROM outbox AS held WHERE held.sys_id = ? AND (held.claimed_until >= ? OR held.next_attempt_at > ?)"
+            ") RETURNING seq, table_name, body, attempts",
+            (self.owner, now + self.claim_ttl, sys_id, sys_id, now, now)
+        ) as cursor:
+            rows = sorted(await cursor.fetchall())
+        await self._conn.commit()
+        if not rows:
+            return None
+        return {
+            "table_name": rows[0][1],
+            "seqs": [row[0] for row in rows],
+            "bodies": [json.loads(row[2]) for row in rows],
+            "attempts": max(row[3] for row in rows),
+        }
+
+    async def _flush_record(self, sys_id: str, record: dict):
+        seqs = record["seqs"]
+        placeholders = ",".join("?" * len(seqs))
+        body = merge_updates(record["bodies"])
+        error = None
+        try:
+            resp = await get_servicenow_client().update_record(record["table_name"], sys_id, body)
+            if resp.status_code != 200:
+                error = f"HTTP {resp.status_code}: {resp.text}"
+        except Exception as e:
+            error = str(e)
+
+        if error is None:
+            await self._conn.execute(f"DELETE FROM outbox WHERE seq IN ({placeholders})", seqs)
+            flushed_requests_total.inc(outcome="success")
+            logging.debug(f"Flushed {len(seqs)} update(s) for {sys_id} in one request.")
+        elif record["attempts"] + 1 >= SERVICENOW_OUTBOX_MAX_ATTEMPTS:
+            logging.error(f"Giving up on ServiceNow update for {sys_id}: {error}")
+            await self._conn.execute(
+                "INSERT INTO outbox_dead (sys_id, table_name, body, error, failed_at) VALUES (?, ?, ?, ?, ?)",
+                (sys_id, record["table_name"], json.dumps(body), error, time.time())
+            )
+            await self._conn.execute(f"DELETE FROM outbox WHERE seq IN ({placeholders})", seqs)
+            flushed_requests_total.inc(outcome="dead")
+        else:
+            logging.warning(f"ServiceNow update for {sys_id} failed, will retry: {error}")
+            retry_at = time.time() + min(300, 2 ** record["attempts"])
+            await self._conn.execute(
+                f"UPDATE outbox SET attempts = attempts + 1, next_attempt_at = ?, owner = NULL, claimed_until = 0 "
+                f"WHERE seq IN ({placeholders})",
+                [retry_at, *seqs]
+            )
+            flushed_requests_total.inc(outcome="retry")
+            await self._conn.commit()
+            return
+        await self._conn.commit()
+        self._pending = max(0, self._pending - len(seqs))
+        pending_gauge.set(self._pending)
+
+    def stats(self) -> dict:
+        return {"pending": self._pending}
+
+    async def close(self):
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+        if self._conn is not None:
+            try:
+                await self.flush()
+            except Exception as e:
+                logging.error(f"Final ServiceNow outbox flush failed: {e}")
+            await self._conn.close()
+            self._conn = None
+
+
+_outbox = None
+_outbox_lock = asyncio.Lock()
+
+
+async def get_outbox() -> ServiceNowOutbox:
+    """Return the process-wide outbox, opening it and replaying leftovers on first use."""
+    global _outbox
+    if _outbox is None:
+        async with _outbox_lock:
+            if _outbox is None:
+                outbox = ServiceNowOutbox()
+                await outbox.start()
+                _outbox = outbox
+    return _outbox
+
+
+async def close_outbox():
+    global _outbox
+    if _outbox is not None:
+        await _outbox.close()
+        _outbox = None
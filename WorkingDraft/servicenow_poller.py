@@ -0,0 +1,301 @@
+import os
+import json
+import time
+import asyncio
+import logging
+
+import aiosqlite
+from pydantic import ValidationError
+
+import metrics
+from flow_catalog import get_flow_catalog
+from ingest import CORE_FIELDS, parse_task_payload
+from servicenow_client import get_servicenow_client
+from ticket_leases import make_owner_id
+
+# -----------------------------------------------------------------------
+# Poller Configuration
+# -----------------------------------------------------------------------
+# Pull mode: query ServiceNow for open tickets instead of (or as well as)
+# waiting for pushes to /api/task.
+SERVICENOW_POLL_ENABLED = os.getenv("SERVICENOW_POLL_ENABLED", "false").lower() == "true"
+SERVICENOW_POLL_INTERVAL = float(os.getenv("SERVICENOW_POLL_INTERVAL", "30"))
+SERVICENOW_POLL_TABLE = os.getenv("SERVICENOW_POLL_TABLE", "sc_task")
+# Ticket states picked up by the poller (1 = Open); tickets the flow has moved on are left alone.
+SERVICENOW_POLL_STATES = os.getenv("SERVICENOW_POLL_STATES", "1")
+SERVICENOW_POLL_PAGE_SIZE = int(os.getenv("SERVICENOW_POLL_PAGE_SIZE", "100"))
+SERVICENOW_POLL_STATE_PATH = os.getenv("SERVICENOW_POLL_STATE_PATH", "state_db/servicenow_poller.sqlite")
+# Only the worker process holding the poll lease polls; a holder that stops
+# polling for this many seconds (it died) is replaced by another worker.
+SERVICENOW_POLL_LEASE_TTL = float(os.getenv("SERVICENOW_POLL_LEASE_TTL", str(max(120.0, 3 * SERVICENOW_POLL_INTERVAL))))
+
+polls_total = metrics.counter(
+    "servicenow_polls_total", "ServiceNow poll cycles by outcome.", ("outcome",)
+)
+polled_tickets_total = metrics.counter(
+    "servicenow_polled_tickets_total", "Tickets returned by the poller, by what happened to them.", ("result",)
+)
+poll_seconds = metrics.histogram(
+    "servicenow_poll_seconds", "Time to page through one ServiceNow poll cycle."
+)
+
+
+def _escape(value: str) -> str:
+    # "^" separates encoded query terms; a literal caret is written twice.
+    return value.replace("^", "^^")
+
+
+def build_query(entries: list, high_water: str = None, states: str = SERVICENOW_POLL_STATES) -> str:
+    """
+    Encoded query for open tickets whose short_description matches an exact
+    or prefix catalog entry, updated at or after `high_water`, oldest first.
+    Regex entries cannot be expressed server-side and are not polled.
+    """
+    terms = ["active=true"]
+    if states:
+        terms.append(f"stateIN{states}")
+    if high_water:
+        terms.append(f"sys_updated_on>={high_water}")
+    matches = []
+    for entry in entries:
+        pattern = _escape(entry["short_description"])
+        if entry.get("match", "exact") == "exact":
+            matches.append(f"short_description={pattern}")
+        elif entry["match"] == "prefix":
+            matches.append(f"short_descriptionSTARTSWITH{pattern}")
+    # ^OR binds to the term before it, so the alternatives go last as one group.
+    query = "^".join(terms) + ("^" + "^OR".join(matches) if matches else "")
+    return query + "^ORDERBYsys_updated_on"
+
+
+def poll_fields(entries: list) -> list:
+    """The columns flows read: the lean task fields, each flow's ingest_fields and sys_updated_on."""
+    fields = list(CORE_FIELDS)
+    for entry in entries:
+        for field in entry.get("ingest_fields") or []:
+            if field not in fields:
+                fields.append(field)
+    return fields + ["sys_updated_on"]
+
+
+class ServiceNowPoller:
+    """
+    Periodically pages through open tickets that match the flow catalog and
+    hands each new one to `dispatch(number, task_response)`, which queues it
+    durably (JobQueue.submit_unless_pending); the queue's workers run the flows.
+
+    The newest sys_updated_on seen is kept as a high-water mark in SQLite, so
+    a restart resumes where it left off. The mark only moves past a ticket
+    once dispatch has returned for it, so a crash or a failed hand-off
+    polls the ticket again instead of losing it. The query uses >= on the
+    mark; the sys_ids already handed off at exactly that timestamp are skipped.
+
+    Every worker process starts a poller, but a cycle only runs in the one
+    holding the table's lease (owner and lease_expires_at on its poller_state
+    row), renewed at the start of each cycle; the others stand by and take
+    over once it expires. The holder reloads the mark with the lease, so a
+    takeover continues from where the last holder stopped.
+    """
+
+    def __init__(self, dispatch, interval: float = SERVICENOW_POLL_INTERVAL, table: str = SERVICENOW_POLL_TABLE,
+                 page_size: int = SERVICENOW_POLL_PAGE_SIZE, path: str = SERVICENOW_POLL_STATE_PATH,
+                 lease_ttl: float = SERVICENOW_POLL_LEASE_TTL):
+        self.dispatch = dispatch
+        self.interval = interval
+        self.table = table
+        self.page_size = max(1, page_size)
+        self.path = path
+        self.lease_ttl = lease_ttl
+        self.owner = make_owner_id()
+        self.leader = False
+        self.high_water = None
+        self._seen_at_mark = set()
+        self._conn = None
+        self._task = None
+        self._counts = {"polls": 0, "dispatched": 0, "skipped": 0, "errors": 0, "standby": 0}
+
+    async def start(self):
+        directory = os.path.dirname(self.path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        self._conn = await aiosqlite.connect(self.path)
+        await self._conn.executescript(
+            """
+            PRAGMA journal_mode=WAL;
+            PRAGMA busy_timeout=5000;
+            CREATE TABLE IF NOT EXISTS poller_state (
+                table_name TEXT PRIMARY KEY,
+                high_water TEXT,
+                seen_at_mark TEXT NOT NULL DEFAULT '[]',
+                owner TEXT,
+                lease_expires_at REAL NOT NULL DEFAULT 0
+            );
+            """
+        )
+        async with self._conn.execute("PRAGMA table_info(poller_state)") as cursor:
+            columns = {row[1] for row in await cursor.fetchall()}
+        if "owner" not in columns:
+            await self._conn.execute("ALTER TABLE poller_state ADD COLUMN owner TEXT")
+        if "lease_expires_at" not in columns:
+            await self._conn.execute("ALTER TABLE poller_state ADD COLUMN lease_expires_at REAL NOT NULL DEFAULT 0")
+        await self._conn.execute("INSERT OR IGNORE INTO poller_state (table_name) VALUES (?)", (self.table,))
+        await self._conn.commit()
+        if self.interval > 0:
+            self._task = asyncio.create_task(self._loop())
+
+    async def _acquire_lease(self) -> bool:
+        """Take or renew the poll lease and load the mark; False while another process holds it."""
+        now = time.time()
+        # One statement, so two processes cannot both take an expired lease.
+        async with self._conn.execute(
+            "UPDATE poller_state SET owner = ?, lease_expires_at = ? "
+            "WHERE table_name = ? AND (owner = ? OR owner IS NULL OR lease_expires_at < ?) "
+            "RETURNING high_water, seen_at_mark",
+            (self.owner, now + self.lease_ttl, self.table, self.owner, now)
+        ) as cursor:
+            row = await cursor.fetchone()
+        await self._conn.commit()
+        if row is None:
+            if self.leader:
+                logging.info(f"Another worker took over polling {self.table}.")
+            self.leader = False
+            return False
+        if not self.leader:
+            logging.info(f"This worker now polls {self.table}.")
+        self.leader = True
+        self.high_water, seen = row
+        self._seen_at_mark = set(json.loads(seen))
+        return True
+
+    async def _save_mark(self):
+        cursor = await self._conn.execute(
+            "UPDATE poller_state SET high_water = ?, seen_at_mark = ? WHERE table_name = ? AND owner = ?",
+            (self.high_water, json.dumps(sorted(self._seen_at_mark)), self.table, self.owner)
+        )
+        await self._conn.commit()
+        if cursor.rowcount != 1:
+            # The cycle outlived the lease; the new holder keeps its own mark.
+            logging.warning(f"Lost the {self.table} poll lease during a cycle; its mark was not saved.")
+            self.leader = False
+
+    async def _loop(self):
+        while True:
+            try:
+                await self.poll_once()
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                logging.error(f"ServiceNow poll failed: {e}")
+            await asyncio.sleep(self.interval)
+
+    async def _fetch_page(self, query: str, fields: list, offset: int) -> list:
+        resp = await get_servicenow_client().get_records(self.table, {
+            "sysparm_query": query,
+            "sysparm_fields": ",".join(fields),
+            "sysparm_limit": self.page_size,
+            "sysparm_offset": offset,
+            "sysparm_display_value": "false",
+            "sysparm_exclude_reference_link": "true",
+        })
+        if resp.status_code != 200:
+            raise RuntimeError(f"ServiceNow returned {resp.status_code} for {self.table}: {resp.text[:200]}")
+        return resp.json().get("result") or []
+
+    async def poll_once(self) -> int:
+        """Run one poll cycle and return the number of tickets dispatched."""
+        start = time.perf_counter()
+        entries = get_flow_catalog().entries()
+        if not any(entry.get("match", "exact") in ("exact", "prefix") for entry in entries):
+            return 0
+        if not await self._acquire_lease():
+            self._counts["standby"] += 1
+            polls_total.inc(outcome="standby")
+            return 0
+        query = build_query(entries, self.high_water)
+        fields = poll_fields(entries)
+        records = []
+        dispatched = 0
+        try:
+            # Page through the whole result first: dispatched tickets leave the
+            # result set as their state changes, which would shift later offsets.
+            while True:
+                page = await self._fetch_page(query, fields, len(records))
+                records.extend(page)
+                if len(page) < self.page_size:
+                    break
+            for record in records:
+                dispatched += await self._handle(record)
+        except Exception:
+            self._counts["errors"] += 1
+            polls_total.inc(outcome="error")
+            raise
+        finally:
+            # Only tickets already handed off (or skipped) have moved the mark.
+            await self._save_mark()
+            poll_seconds.observe(time.perf_counter() - start)
+        self._counts["polls"] += 1
+        polls_total.inc(outcome="ok")
+        return dispatched
+
+    def _advance(self, record: dict):
+        updated_on = record.get("sys_updated_on")
+        if not updated_on:
+            return
+        if self.high_water is None or updated_on > self.high_water:
+            self.high_water = updated_on
+            self._seen_at_mark = set()
+        if updated_on == self.high_water:
+            self._seen_at_mark.add(record.get("sys_id"))
+
+    async def _handle(self, record: dict) -> int:
+        sys_id = record.get("sys_id")
+        number = record.get("number")
+        if record.get("sys_updated_on") == self.high_water and sys_id in self._seen_at_mark:
+            self._counts["skipped"] += 1
+            polled_tickets_total.inc(result="skipped")
+            return 0
+        if get_flow_catalog().lookup(record.get("short_description") or "") is None:
+            self._advance(record)
+            polled_tickets_total.inc(result="no_flow")
+            return 0
+        try:
+            fields = {key: value for key, value in record.items() if key != "sys_updated_on"}
+            task_response = parse_task_payload(json.dumps({"result": [fields]}).encode("utf-8"))
+        except ValidationError as e:
+            logging.error(f"Skipping polled ticket {number}: {e}")
+            self._advance(record)
+            polled_tickets_total.inc(result="invalid")
+            return 0
+
+        # A failure here propagates and ends the cycle with the mark still before this ticket.
+        await self.dispatch(number, task_response)
+        self._advance(record)
+        self._counts["dispatched"] += 1
+        polled_tickets_total.inc(result="dispatched")
+        return 1
+
+    def stats(self) -> dict:
+        return {
+            **self._counts,
+            "table": self.table,
+            "leader": self.leader,
+            "high_water": self.high_water,
+        }
+
+    async def close(self):
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+        if self._conn is not None:
+            # Hand the lease on at once instead of after SERVICENOW_POLL_LEASE_TTL.
+            await self._conn.execute(
+                "UPDATE poller_state SET lease_expires_at = 0 WHERE table_name = ? AND owner = ?",
+                (self.table, self.owner)
+            )
+            await self._conn.commit()
+            await self._conn.close()
+            self._conn = None
@@ -0,0 +1,102 @@
+import os
+import time
+import asyncio
+from collections import OrderedDict
+
+import metrics
+
+# -----------------------------------------------------------------------
+# Single-Flight Configuration
+# -----------------------------------------------------------------------
+# A submission for a ticket whose flow finished less than this many seconds
+# ago gets that flow's final state instead of a new run; 0 only coalesces
+# submissions that arrive while the flow is still running.
+FLOW_DEDUP_WINDOW = float(os.getenv("FLOW_DEDUP_WINDOW", "300"))
+FLOW_DEDUP_MAX_ENTRIES = int(os.getenv("FLOW_DEDUP_MAX_ENTRIES", "1000"))
+
+runs_in_flight_gauge = metrics.gauge(
+    "flow_runs_in_flight", "Ticket flow runs currently executing in this process."
+)
+callers_waiting_gauge = metrics.gauge(
+    "flow_submissions_in_flight", "Ticket submissions waiting for a flow run (including coalesced duplicates)."
+)
+coalesced_total = metrics.counter(
+    "flow_submissions_coalesced_total",
+    "Duplicate ticket submissions answered by a running or just-finished flow.", ("state",)
+)
+
+
+class SingleFlight:
+    """
+    In-process single-flight coalescing of flow runs by key (the thread_id).
+
+    The first caller starts the run as its own task; callers arriving while
+    it runs await the same task, and callers arriving within `window`
+    seconds after it succeeded get its result. Failed runs are not kept, so
+    a retry after an error starts over. Each caller gets its own shallow copy
+    of the result.
+    """
+
+    def __init__(self, window: float = FLOW_DEDUP_WINDOW, max_entries: int = FLOW_DEDUP_MAX_ENTRIES):
+        self.window = window
+        self.max_entries = max(1, max_entries)
+        self._running = {}
+        self._finished = OrderedDict()
+        self._counts = {"started": 0, "coalesced_running": 0, "coalesced_finished": 0}
+
+    def _recent(self, key: str):
+        entry = self._finished.get(key)
+        if entry is None:
+            return None
+        finished_at, result = entry
+        if time.monotonic() - finished_at >= self.window:
+            del self._finished[key]
+            return None
+        return result
+
+    async def run(self, key: str, factory) -> dict:
+        """Return the result of `factory()` for `key`, sharing a run already in flight or just finished."""
+        task = self._running.get(key)
+        if task is not None:
+            self._counts["coalesced_running"] += 1
+            coalesced_total.inc(state="running")
+        else:
+            result = self._recent(key)
+            if result is not None:
+                self._counts["coalesced_finished"] += 1
+                coalesced_total.inc(state="finished")
+                return dict(result)
+            task = asyncio.ensure_future(factory())
+            self._running[key] = task
+            self._counts["started"] += 1
+            runs_in_flight_gauge.set(len(self._running))
+            task.add_done_callback(lambda done: self._done(key, done))
+        # A caller that goes away (client disconnect) must not cancel the run others are waiting on.
+        callers_waiting_gauge.inc()
+        try:
+            result = await asyncio.shield(task)
+        finally:
+            callers_waiting_gauge.dec()
+        return dict(result) if result is not None else None
+
+    def _done(self, key: str, task: asyncio.Task):
+        if self._running.get(key) is task:
+            del self._running[key]
+            runs_in_flight_gauge.set(len(self._running))
+        if self.window > 0 and not task.cancelled() and task.exception() is None:
+            self._finished[key] = (time.monotonic(), task.result())
+            self._finished.move_to_end(key)
+            while len(self._finished) > self.max_entries:
+                self._finished.popitem(last=False)
+
+    def stats(self) -> dict:
+        return {**self._counts, "running": len(self._running), "finished": len(self._finished)}
+
+    async def close(self):
+        """Cancel runs still in flight (at shutdown, before their resources are released)."""
+        tasks = list(self._running.values())
+        for task in tasks:
+            task.cancel()
+        if tasks:
+            await asyncio.gather(*tasks, return_exceptions=True)
+        self._finished.clear()
@@ -0,0 +1,21 @@
+import os
+import sys
+import stat
+import textwrap
+
+import pytest
+
+# The service modules import each other as top-level modules from WorkingDraft.
+WORKING_DRAFT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, WORKING_DRAFT)
+
+
+@pytest.fixture
+def make_executable(tmp_path):
+    """Write a Python script as an executable file (a stand-in for powershell, node, ...)."""
+    def make(name: str, source: str) -> str:
+        path = tmp_path / name
+        path.write_text(f"#!{sys.executable}\n" + textwrap.dedent(source))
+        path.chmod(path.stat().st_mode | stat.S_IXUSR | stat.S_IXGRP | stat.S_IXOTH)
+        return str(path)
+    return make
@@ -0,0 +1,194 @@
+import time
+import sqlite3
+import asyncio
+from typing import TypedDict
+
+import pytest
+from langgraph.graph import StateGraph, END
+from langgraph.checkpoint.memory import MemorySaver
+
+import flow_logic
+import action_journal
+from action_journal import ActionJournal
+
+
+def run(coroutine):
+    return asyncio.run(coroutine)
+
+
+def with_journal(tmp_path, scenario):
+    async def wrapper():
+        journal = ActionJournal(str(tmp_path / "action_journal.sqlite"))
+        await journal.start()
+        try:
+            return await scenario(journal)
+        finally:
+            await journal.close()
+
+    return run(wrapper())
+
+
+def outcome(name, error=False):
+    return {"log": {"script": name, "Status": "Success"}, "variables": {name: "done"}, "worknote": name,
+            "error": error}
+
+
+def test_recorded_outcomes_survive_a_restart(tmp_path):
+    async def record(journal):
+        await journal.record("task_1", "run-1", "1 - Create_Ad_Group.ps1", outcome("1"))
+
+    async def read(journal):
+        return (await journal.get("task_1", "run-1", "1 - Create_Ad_Group.ps1"),
+                await journal.get("task_1", "run-2", "1 - Create_Ad_Group.ps1"),
+                await journal.get("task_1", "run-1", "2 - Notify.ps1"))
+
+    with_journal(tmp_path, record)
+    assert with_journal(tmp_path, read) == (outcome("1"), None, None)
+
+
+def test_rows_past_the_retention_are_dropped_at_start(tmp_path, monkeypatch):
+    monkeypatch.setattr(action_journal, "ACTION_JOURNAL_RETENTION_DAYS", 1)
+
+    async def record(journal):
+        await journal.record("task_old", "run-1", "1 - a.ps1", outcome("1"))
+        await journal.record("task_new", "run-1", "1 - a.ps1", outcome("1"))
+
+    with_journal(tmp_path, record)
+    with sqlite3.connect(tmp_path / "action_journal.sqlite") as conn:
+        conn.execute("UPDATE action_journal SET completed_at = ? WHERE thread_id = 'task_old'", (time.time() - 2 * 86400,))
+
+    async def read(journal):
+        return (await journal.get("task_old", "run-1", "1 - a.ps1"), await journal.get("task_new", "run-1", "1 - a.ps1"))
+
+    assert with_journal(tmp_path, read) == (None, outcome("1"))
+
+
+class Ran(list):
+    """Names of the actions run_flow_action was called for, plus the journal used."""
+    journal = None
+
+
+@pytest.fixture
+def actions(tmp_path, monkeypatch):
+    """run_flow_action recorded in memory, with a real journal behind run_journaled_action."""
+    ran = Ran()
+    journal = ActionJournal(str(tmp_path / "action_journal.sqlite"))
+
+    async def get_action_journal():
+        if journal._conn is None:
+            await journal.start()
+        return journal
+
+    async def run_flow_action(action_name, flow_name, additional_vars, task_response, deadline):
+        ran.append(action_name)
+        return outcome(action_name, error=action_name.endswith("fail.ps1"))
+
+    monkeypatch.setattr(flow_logic, "get_action_journal", get_action_journal)
+    monkeypatch.setattr(flow_logic, "run_flow_action", run_flow_action)
+    ran.journal = journal
+    return ran
+
+
+def flow_state(run_id="run-1", stage=("1 - Create_Ad_Group.ps1",)):
+    return {
+        "thread_id": "task_SCTASK0000001",
+        "run_id": run_id,
+        "flow_name": "SecurityGroupCreation",
+        "task_response": {"result": [{"number": "SCTASK0000001"}]},
+        "additional_variables": {},
+        "action_plan": [list(stage)],
+        "action_index": 0,
+        "deadline": 0,
+    }
+
+
+def scenario_in(actions, scenario):
+    async def wrapper():
+        try:
+            return await scenario()
+        finally:
+            await actions.journal.close()
+
+    return run(wrapper())
+
+
+@pytest.fixture(autouse=True)
+def no_execution_log(monkeypatch):
+    async def record_execution_log(state, *entries):
+        pass
+
+    monkeypatch.setattr(flow_logic, "record_execution_log", record_execution_log)
+
+
+def test_resumed_run_replays_finished_actions(actions):
+    async def scenario():
+        first = await flow_logic.execute_flow_script(flow_state())
+        resumed = await flow_logic.execute_flow_script(flow_state())
+        return first, resumed
+
+    first, resumed = scenario_in(actions, scenario)
+    assert actions == ["1 - Create_Ad_Group.ps1"]
+    assert resumed["additional_variables"] == first["additional_variables"] == {"1 - Create_Ad_Group.ps1": "done"}
+    assert resumed["action_index"] == 1
+
+
+def test_a_new_run_of_the_ticket_runs_its_actions_again(actions):
+    async def scenario():
+        await flow_logic.execute_flow_script(flow_state("run-1"))
+        await flow_logic.execute_flow_script(flow_state("run-2"))
+
+    scenario_in(actions, scenario)
+    assert actions == ["1 - Create_Ad_Group.ps1"] * 2
+
+
+def test_only_unfinished_actions_of_a_stage_run_on_resume(actions):
+    stage = ("2 - Add_Members.ps1", "3 - Notify.ps1")
+
+    async def scenario():
+        await actions.journal.start()
+        await actions.journal.record("task_SCTASK0000001", "run-1", "2 - Add_Members.ps1", outcome("2 - Add_Members.ps1"))
+        return await flow_logic.execute_flow_script(flow_state(stage=stage))
+
+    state = scenario_in(actions, scenario)
+    assert actions == ["3 - Notify.ps1"]
+    assert state["worknote_content"] == "2 - Add_Members.ps1\n\n3 - Notify.ps1"
+
+
+def test_failed_outcomes_are_journaled_too(actions):
+    async def scenario():
+        await flow_logic.execute_flow_script(flow_state(stage=("1 - fail.ps1",)))
+        return await flow_logic.execute_flow_script(flow_state(stage=("1 - fail.ps1",)))
+
+    state = scenario_in(actions, scenario)
+    assert actions == ["1 - fail.ps1"]
+    assert state["error_occurred"] is True
+
+
+class Progress(TypedDict, total=False):
+    run_id: str
+    step: int
+
+
+def progress_graph():
+    builder = StateGraph(Progress)
+    builder.add_node("first", lambda state: {"step": 1})
+    builder.add_node("second", lambda state: {"step": 2})
+    builder.set_entry_point("first")
+    builder.add_edge("first", "second")
+    builder.add_edge("second", END)
+    return builder.compile(checkpointer=MemorySaver(), interrupt_before=["second"])
+
+
+def test_interrupted_threads_lists_runs_stopped_before_a_node():
+    async def scenario():
+        graph = progress_graph()
+        await graph.ainvoke({"run_id": "run-1"}, config={"configurable": {"thread_id": "task_stopped"}})
+        finished = {"configurable": {"thread_id": "task_finished"}}
+        await graph.ainvoke({"run_id": "run-2"}, config=finished)
+        await graph.ainvoke(None, config=finished)
+        await graph.ainvoke({}, config={"configurable": {"thread_id": "task_no_run_id"}})
+        return await flow_logic.interrupted_threads(graph), await flow_logic.interrupted_threads(graph, max_age=1e-9)
+
+    recent, too_old = run(scenario())
+    assert recent == ["task_stopped"]
+    assert too_old == []
@@ -0,0 +1,129 @@
+import os
+import asyncio
+
+import pytest
+
+import flow_logic
+from ad_batching import MembershipBatcher
+from flow_catalog import FlowCatalog
+
+
+def run(coroutine):
+    return asyncio.run(coroutine)
+
+
+class FakeRunner:
+    def __init__(self, fail=False, delay=0):
+        self.calls = []
+        self.fail = fail
+        self.delay = delay
+
+    async def __call__(self, group, members):
+        self.calls.append((group, list(members)))
+        await asyncio.sleep(self.delay)
+        if self.fail:
+            raise RuntimeError("AD unreachable")
+        return {member: {"Member": member, "Status": "Success"} for member in members if member != "ghost"}
+
+
+def test_requests_for_one_group_share_a_call():
+    runner = FakeRunner()
+
+    async def scenario():
+        batcher = MembershipBatcher(runner, window=0.05)
+        return await asyncio.gather(
+            batcher.add("Group-A", "alice"), batcher.add("group-a", "bob"),
+            batcher.add("Group-B", "carol"), batcher.add("Group-A", "alice"), batcher.add("Group-A", "ghost"),
+        )
+
+    results = run(scenario())
+    assert sorted(runner.calls) == [("Group-A", ["alice", "bob", "ghost"]), ("Group-B", ["carol"])]
+    assert [result["Status"] for result in results] == ["Success", "Success", "Success", "Success", "Error"]
+    assert results[4]["ErrorMessage"] == "No result returned for ghost"
+
+
+def test_full_batch_is_sent_without_waiting_for_the_window():
+    runner = FakeRunner()
+
+    async def scenario():
+        batcher = MembershipBatcher(runner, window=30, max_size=2)
+        return await asyncio.wait_for(asyncio.gather(batcher.add("G", "a"), batcher.add("G", "b")), 5)
+
+    run(scenario())
+    assert runner.calls == [("G", ["a", "b"])]
+
+
+def test_failed_bulk_call_fails_every_member():
+    async def scenario():
+        batcher = MembershipBatcher(FakeRunner(fail=True), window=0.01)
+        return await asyncio.gather(batcher.add("G", "a"), batcher.add("G", "b"))
+
+    results = run(scenario())
+    assert [result["ErrorMessage"] for result in results] == ["AD unreachable", "AD unreachable"]
+
+
+def test_timed_out_member_is_withdrawn_from_the_pending_batch():
+    runner = FakeRunner()
+
+    async def scenario():
+        batcher = MembershipBatcher(runner, window=0.2)
+        staying = asyncio.create_task(batcher.add("G", "stays"))
+        with pytest.raises(asyncio.TimeoutError):
+            await asyncio.wait_for(batcher.add("G", "leaves"), 0.05)
+        return await staying
+
+    assert run(scenario())["Status"] == "Success"
+    assert runner.calls == [("G", ["stays"])]
+
+
+def test_last_cancelled_member_drops_the_batch():
+    runner = FakeRunner()
+
+    async def scenario():
+        batcher = MembershipBatcher(runner, window=0.05)
+        task = asyncio.create_task(batcher.add("G", "only"))
+        await asyncio.sleep(0)
+        task.cancel()
+        await asyncio.gather(task, return_exceptions=True)
+        await asyncio.sleep(0.1)
+        return batcher.stats()
+
+    assert run(scenario()) == {"pending_groups": 0, "pending_members": 0, "in_flight": 0}
+    assert runner.calls == []
+
+
+def test_close_sends_pending_batches():
+    runner = FakeRunner()
+
+    async def scenario():
+        batcher = MembershipBatcher(runner, window=30)
+        task = asyncio.create_task(batcher.add("G", "a"))
+        await asyncio.sleep(0)
+        await batcher.close()
+        return await task
+
+    assert run(scenario())["Status"] == "Success"
+    assert runner.calls == [("G", ["a"])]
+
+
+def test_batched_membership_needs_group_and_member():
+    result = run(flow_logic.run_batched_membership({"uniquegroupname": "G"}, {}))
+    assert result["Status"] == "Error"
+
+
+def test_batched_membership_reports_each_member(monkeypatch):
+    async def add(group, member, window=None, max_size=None):
+        return {"Status": "Success"}
+
+    monkeypatch.setattr(flow_logic.membership_batcher, "add", add)
+    result = run(flow_logic.run_batched_membership({"uniquegroupname": "G", "SamAccountName": " jdoe "}, {}))
+    assert result["OutputMessage"]["OutputMessage"] == (
+        "Automation has successfully added the user jdoe to G security group\nHence closing the ticket"
+    )
+
+
+def test_shipped_flows_do_not_batch():
+    catalog = FlowCatalog(os.path.join(os.path.dirname(os.path.dirname(__file__)), "flow_details.yml"))
+    for entry in catalog.entries():
+        for settings in (entry.get("actions") or {}).values():
+            assert "batch" not in (settings or {})
@@ -0,0 +1,141 @@
+import sqlite3
+import asyncio
+from typing import TypedDict
+
+from langgraph.graph import StateGraph, START, END
+
+from checkpointers import open_checkpointer
+from checkpoint_maintenance import CheckpointMaintenance, AUTO_VACUUM_INCREMENTAL
+
+
+def run(coroutine):
+    return asyncio.run(coroutine)
+
+
+class State(TypedDict):
+    count: int
+    flow_status: str
+
+
+def build_graph(saver):
+    async def step(state):
+        return {"count": state["count"] + 1}
+
+    async def finish(state):
+        return {"flow_status": state["flow_status"]}
+
+    builder = StateGraph(State)
+    builder.add_node("step", step)
+    builder.add_node("finish", finish)
+    builder.add_edge(START, "step")
+    builder.add_edge("step", "finish")
+    builder.add_edge("finish", END)
+    return builder.compile(checkpointer=saver)
+
+
+def checkpoints_per_thread(path):
+    with sqlite3.connect(path) as conn:
+        return dict(conn.execute("SELECT thread_id, COUNT(*) FROM checkpoints GROUP BY thread_id").fetchall())
+
+
+def auto_vacuum_mode(path):
+    with sqlite3.connect(path) as conn:
+        return conn.execute("PRAGMA auto_vacuum").fetchone()[0]
+
+
+def test_new_database_starts_in_incremental_mode(tmp_path):
+    path = str(tmp_path / "checkpoints.sqlite")
+
+    async def scenario():
+        saver, close = await open_checkpointer("sqlite", path)
+        try:
+            maintenance = CheckpointMaintenance(saver, path, interval=0)
+            await maintenance.prepare()
+            return maintenance.needs_conversion
+        finally:
+            await close()
+
+    assert run(scenario()) is False
+    assert auto_vacuum_mode(path) == AUTO_VACUUM_INCREMENTAL
+
+
+def test_existing_database_is_converted_by_maintenance_not_at_startup(tmp_path):
+    path = str(tmp_path / "checkpoints.sqlite")
+    with sqlite3.connect(path) as conn:
+        conn.execute("PRAGMA journal_mode=WAL")
+        conn.execute("CREATE TABLE legacy (x)")
+
+    async def scenario():
+        saver, close = await open_checkpointer("sqlite", path)
+        try:
+            maintenance = CheckpointMaintenance(saver, path, interval=0)
+            await maintenance.prepare()
+            mode_after_prepare = auto_vacuum_mode(path)
+            needed = maintenance.needs_conversion
+            report = await maintenance.run_once()
+            return needed, mode_after_prepare, report, maintenance.needs_conversion
+        finally:
+            await close()
+
+    needed, mode_after_prepare, report, still_needed = run(scenario())
+    assert needed is True
+    assert mode_after_prepare != AUTO_VACUUM_INCREMENTAL
+    assert report["converted_to_incremental"] is True
+    assert still_needed is False
+    assert auto_vacuum_mode(path) == AUTO_VACUUM_INCREMENTAL
+
+
+def test_finished_threads_are_compacted_to_their_final_checkpoint(tmp_path):
+    path = str(tmp_path / "checkpoints.sqlite")
+
+    async def scenario():
+        saver, close = await open_checkpointer("sqlite", path)
+        try:
+            maintenance = CheckpointMaintenance(saver, path, interval=0)
+            await maintenance.prepare()
+            graph = build_graph(saver)
+            for thread_id, status in (("done", "completed"), ("moved", "reassigned"), ("busy", "running")):
+                await graph.ainvoke({"count": 0, "flow_status": status}, {"configurable": {"thread_id": thread_id}})
+            before = checkpoints_per_thread(path)
+            report = await maintenance.run_once()
+            final = await graph.aget_state({"configurable": {"thread_id": "done"}})
+            return before, report, final.values
+        finally:
+            await close()
+
+    before, report, final = run(scenario())
+    after = checkpoints_per_thread(path)
+    assert before["done"] > 1
+    assert after == {"done": 1, "moved": 1, "busy": before["busy"]}
+    assert report["threads_compacted"] == 2
+    assert report["checkpoints_deleted"] == before["done"] + before["moved"] - 2
+    assert final == {"count": 1, "flow_status": "completed"}
+
+
+def test_a_run_started_after_selection_keeps_its_checkpoints(tmp_path):
+    path = str(tmp_path / "checkpoints.sqlite")
+    config = {"configurable": {"thread_id": "done"}}
+
+    async def scenario():
+        saver, close = await open_checkpointer("sqlite", path)
+        try:
+            maintenance = CheckpointMaintenance(saver, path, interval=0)
+            await maintenance.prepare()
+            graph = build_graph(saver)
+            await graph.ainvoke({"count": 0, "flow_status": "completed"}, config)
+            finished = await maintenance._finished_threads()
+            # The ticket is resubmitted before the compaction runs.
+            await graph.ainvoke({"count": 10, "flow_status": "running"}, config)
+            newest = [checkpoint.config["configurable"]["checkpoint_id"] async for checkpoint in saver.alist(config)]
+            await maintenance._compact(finished)
+            kept = [checkpoint.config["configurable"]["checkpoint_id"] async for checkpoint in saver.alist(config)]
+            final = await graph.aget_state(config)
+            return finished, newest, kept, final.values
+        finally:
+            await close()
+
+    finished, newest, kept, final = run(scenario())
+    selected = finished[0][1]
+    assert kept == [checkpoint_id for checkpoint_id in newest if checkpoint_id >= selected]
+    assert len(kept) > 1
+    assert final == {"count": 11, "flow_status": "running"}
@@ -0,0 +1,63 @@
+import asyncio
+import importlib.util
+
+import pytest
+
+import checkpointers
+from checkpointers import open_checkpointer, sqlite_pragmas
+
+
+def run(coroutine):
+    return asyncio.run(coroutine)
+
+
+def test_memory_backend():
+    async def scenario():
+        saver, close = await open_checkpointer("MEMORY")
+        await close()
+        return saver
+
+    assert type(run(scenario())).__name__ == "InMemorySaver"
+
+
+def test_sqlite_backend_applies_the_pragmas(tmp_path):
+    path = str(tmp_path / "nested" / "checkpoints.sqlite")
+
+    async def scenario():
+        saver, close = await open_checkpointer("sqlite", path)
+        try:
+            results = {}
+            for pragma in ("journal_mode", "synchronous", "busy_timeout"):
+                async with saver.conn.execute(f"PRAGMA {pragma}") as cursor:
+                    results[pragma] = (await cursor.fetchone())[0]
+            return type(saver).__name__, results
+        finally:
+            await close()
+
+    name, pragmas = run(scenario())
+    assert name == "AsyncSqliteSaver"
+    assert pragmas == {"journal_mode": "wal", "synchronous": 1, "busy_timeout": 5000}
+
+
+def test_sqlite_backend_needs_a_path(monkeypatch):
+    monkeypatch.delenv("DATABASE_PATH", raising=False)
+    with pytest.raises(ValueError, match="DATABASE_PATH"):
+        run(open_checkpointer("sqlite"))
+
+
+def test_unknown_backend_is_rejected():
+    with pytest.raises(ValueError, match="Unknown CHECKPOINT_BACKEND"):
+        run(open_checkpointer("redis"))
+
+
+@pytest.mark.skipif(importlib.util.find_spec("langgraph.checkpoint.postgres") is not None,
+                    reason="postgres checkpointer is installed")
+def test_postgres_backend_explains_missing_packages():
+    with pytest.raises(RuntimeError, match="langgraph-checkpoint-postgres"):
+        run(open_checkpointer("postgres"))
+
+
+def test_invalid_synchronous_mode_is_rejected(monkeypatch):
+    monkeypatch.setattr(checkpointers, "CHECKPOINT_SQLITE_SYNCHRONOUS", "SOMETIMES")
+    with pytest.raises(ValueError, match="CHECKPOINT_SQLITE_SYNCHRONOUS"):
+        sqlite_pragmas()
@@ -0,0 +1,78 @@
+import asyncio
+
+import flow_logic
+from execution_log_store import ExecutionLogStore
+
+
+def run(coroutine):
+    return asyncio.run(coroutine)
+
+
+def test_entries_are_read_back_per_run_in_order(tmp_path):
+    async def scenario():
+        store = ExecutionLogStore(str(tmp_path / "log.sqlite"))
+        await store.start()
+        try:
+            await store.append("t1", "run-1", 0, [{"script": "1 - a.ps1"}, {"script": "2 - b.ps1"}])
+            await store.append("t1", "run-2", 0, [{"script": "1 - a.ps1", "Status": "Error"}])
+            await store.append("t2", "run-3", 0, [{"script": "other"}])
+            return await store.read("t1"), await store.read("t1", "run-1"), await store.read("t1", "*")
+        finally:
+            await store.close()
+
+    latest, first, every = run(scenario())
+    assert [(entry["run_id"], entry["step"], entry["Status"]) for entry in latest] == [("run-2", 0, "Error")]
+    assert [entry["script"] for entry in first] == ["1 - a.ps1", "2 - b.ps1"]
+    assert [(entry["run_id"], entry["step"]) for entry in every] == [("run-1", 0), ("run-1", 1), ("run-2", 0)]
+
+
+def test_rewriting_a_step_replaces_it(tmp_path):
+    async def scenario():
+        store = ExecutionLogStore(str(tmp_path / "log.sqlite"))
+        await store.start()
+        try:
+            await store.append("t1", "run-1", 0, [{"Status": "Error"}])
+            # A resumed run replays the same step.
+            await store.append("t1", "run-1", 0, [{"Status": "Success"}])
+            return await store.read("t1")
+        finally:
+            await store.close()
+
+    entries = run(scenario())
+    assert [entry["Status"] for entry in entries] == ["Success"]
+
+
+def test_unknown_thread_has_no_entries(tmp_path):
+    async def scenario():
+        store = ExecutionLogStore(str(tmp_path / "log.sqlite"))
+        await store.start()
+        try:
+            return await store.read("missing")
+        finally:
+            await store.close()
+
+    assert run(scenario()) == []
+
+
+def test_flow_state_keeps_only_a_count_and_the_last_entry(tmp_path, monkeypatch):
+    store = ExecutionLogStore(str(tmp_path / "log.sqlite"))
+
+    async def get_store():
+        return store
+
+    monkeypatch.setattr(flow_logic, "get_execution_log_store", get_store)
+
+    async def scenario():
+        await store.start()
+        try:
+            state = {"thread_id": "t1", "run_id": "run-1", "execution_log_count": 0}
+            await flow_logic.record_execution_log(state, {"script": "1"}, {"script": "2"})
+            await flow_logic.record_execution_log(state, {"script": "3"})
+            return state, await store.read("t1")
+        finally:
+            await store.close()
+
+    state, entries = run(scenario())
+    assert state["execution_log_count"] == 3
+    assert state["last_log_entry"] == {"script": "3"}
+    assert [(entry["step"], entry["script"]) for entry in entries] == [(0, "1"), (1, "2"), (2, "3")]
@@ -0,0 +1,110 @@
+import os
+import textwrap
+
+import pytest
+
+import flow_catalog
+from flow_catalog import FlowCatalog
+
+CATALOG = """
+flows:
+  - short_description: "AD Group Creation - Security"
+    flow_name: "SecurityGroupCreation"
+    reassignment_group: "grp-1"
+    actions:
+      2:
+        depends_on: [1]
+  - short_description: "AD Group"
+    match: prefix
+    flow_name: "GenericGroup"
+    reassignment_group: "grp-2"
+  - short_description: "^Domain Account (Creation|Request)$"
+    match: regex
+    flow_name: "ADAccountCreation"
+    reassignment_group: "grp-3"
+  - short_description: "AD Group Creation"
+    match: prefix
+    flow_name: "NeverReached"
+    reassignment_group: "grp-4"
+"""
+
+
+def write(path, text):
+    path.write_text(textwrap.dedent(text))
+    return str(path)
+
+
+@pytest.fixture(autouse=True)
+def check_every_lookup(monkeypatch):
+    monkeypatch.setattr(flow_catalog, "FLOW_CATALOG_CHECK_INTERVAL", 0)
+
+
+def test_exact_entries_win_over_rules(tmp_path):
+    catalog = FlowCatalog(write(tmp_path / "flows.yml", CATALOG))
+    assert catalog.lookup("AD Group Creation - Security")["flow_name"] == "SecurityGroupCreation"
+
+
+def test_rules_are_tried_in_file_order(tmp_path):
+    catalog = FlowCatalog(write(tmp_path / "flows.yml", CATALOG))
+    assert catalog.lookup("AD Group Creation - Distribution")["flow_name"] == "GenericGroup"
+    assert catalog.lookup("Domain Account Request")["flow_name"] == "ADAccountCreation"
+    assert catalog.lookup("Domain Account Requests") is None
+    assert catalog.lookup("Something else") is None
+
+
+def test_flow_config_returns_the_first_entry_of_a_flow(tmp_path):
+    catalog = FlowCatalog(write(tmp_path / "flows.yml", CATALOG))
+    assert catalog.flow_config("SecurityGroupCreation")["actions"] == {2: {"depends_on": [1]}}
+    assert catalog.flow_config("Unknown") == {}
+    assert [entry["match"] for entry in catalog.entries()] == ["exact", "prefix", "regex", "prefix"]
+
+
+def test_changed_file_is_reloaded(tmp_path):
+    path = write(tmp_path / "flows.yml", CATALOG)
+    catalog = FlowCatalog(path)
+    write(tmp_path / "flows.yml", """
+        flows:
+          - short_description: "New flow"
+            flow_name: "NewFlow"
+            reassignment_group: "grp-5"
+    """)
+    stat = os.stat(path)
+    os.utime(path, ns=(stat.st_atime_ns, stat.st_mtime_ns + 1_000_000_000))
+    assert catalog.lookup("New flow")["flow_name"] == "NewFlow"
+    assert catalog.lookup("AD Group Creation - Security") is None
+
+
+def test_broken_reload_keeps_the_last_good_catalog(tmp_path):
+    path = write(tmp_path / "flows.yml", CATALOG)
+    catalog = FlowCatalog(path)
+    write(tmp_path / "flows.yml", """
+        flows:
+          - short_description: "No flow name"
+            reassignment_group: "grp-5"
+    """)
+    stat = os.stat(path)
+    os.utime(path, ns=(stat.st_atime_ns, stat.st_mtime_ns + 1_000_000_000))
+    assert catalog.lookup("AD Group Creation - Security")["flow_name"] == "SecurityGroupCreation"
+
+
+@pytest.mark.parametrize("text, message", [
+    ('flows:\n  - short_description: "x"\n    flow_name: "X"\n', "Missing key"),
+    ('flows:\n  - short_description: "x"\n    flow_name: "X"\n    reassignment_group: "g"\n    match: glob\n',
+     "Unknown match"),
+    ('flows:\n  - short_description: "("\n    flow_name: "X"\n    reassignment_group: "g"\n    match: regex\n',
+     "Invalid regex"),
+])
+def test_invalid_catalogs_are_rejected(tmp_path, text, message):
+    with pytest.raises(ValueError, match=message):
+        FlowCatalog(write(tmp_path / "flows.yml", text))
+
+
+def test_missing_file_is_rejected(tmp_path):
+    with pytest.raises(ValueError, match="not found"):
+        FlowCatalog(str(tmp_path / "missing.yml"))
+
+
+def test_shipped_catalog_loads():
+    catalog = FlowCatalog(os.path.join(os.path.dirname(os.path.dirname(__file__)), "flow_details.yml"))
+    assert catalog.lookup("AD Group Creation - Security")["flow_name"] == "SecurityGroupCreation"
+    assert catalog.lookup("Domain Account Creation")["flow_name"] == "ADAccountCreation"
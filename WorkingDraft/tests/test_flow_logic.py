@@ -0,0 +1,95 @@
+import time
+import asyncio
+from types import SimpleNamespace
+
+import pytest
+
+import flow_logic
+
+
+@pytest.fixture
+def flow_config(monkeypatch):
+    config = {}
+    monkeypatch.setattr(flow_logic, "get_flow_catalog", lambda: SimpleNamespace(flow_config=lambda flow: config))
+    monkeypatch.setattr(flow_logic, "SCRIPT_TIMEOUT", 600)
+    return config
+
+
+def test_action_timeout_prefers_action_then_flow_then_default(flow_config):
+    assert flow_logic.action_timeout("Flow", {}) == 600
+    flow_config["timeout"] = 120
+    assert flow_logic.action_timeout("Flow", {}) == 120
+    assert flow_logic.action_timeout("Flow", {"timeout": 30}) == 30
+
+
+def test_action_timeout_zero_means_no_limit(flow_config):
+    flow_config["timeout"] = 0
+    assert flow_logic.action_timeout("Flow", {}) is None
+
+
+def test_action_timeout_is_capped_by_the_deadline(flow_config):
+    assert flow_logic.action_timeout("Flow", {}, deadline=time.time() + 10) <= 10
+    assert flow_logic.action_timeout("Flow", {"timeout": 0}, deadline=time.time() + 10) <= 10
+    assert flow_logic.action_timeout("Flow", {}, deadline=time.time() - 5) == pytest.approx(0.001)
+
+
+@pytest.fixture
+def decision(monkeypatch):
+    """evaluate_flow_decision with ServiceNow updates and the execution log recorded in memory."""
+    calls = SimpleNamespace(log=[], reassigned=0, states=[])
+
+    async def record_execution_log(state, entry):
+        calls.log.append(entry)
+
+    async def update_servicenow_assignment_group(state):
+        calls.reassigned += 1
+        return state
+
+    async def update_ticket_state(state, task_state):
+        calls.states.append(task_state)
+        return state
+
+    async def flush_ticket_updates(task_response):
+        pass
+
+    monkeypatch.setattr(flow_logic, "record_execution_log", record_execution_log)
+    monkeypatch.setattr(flow_logic, "update_servicenow_assignment_group", update_servicenow_assignment_group)
+    monkeypatch.setattr(flow_logic, "update_ticket_state", update_ticket_state)
+    monkeypatch.setattr(flow_logic, "flush_ticket_updates", flush_ticket_updates)
+    return calls
+
+
+def state(deadline, action_index=1):
+    return {
+        "error_occurred": False,
+        "deadline": deadline,
+        "action_index": action_index,
+        "action_plan": [["1 - a.ps1"], ["2 - b.ps1", "3 - c.ps1"], ["4 - d.ps1"]],
+        "task_response": {"result": []},
+    }
+
+
+def test_passed_deadline_skips_remaining_stages_and_reassigns(decision):
+    result = asyncio.run(flow_logic.evaluate_flow_decision(state(time.time() - 1)))
+    assert result["flow_status"] == "reassigned"
+    assert result["next_action"] is False
+    assert decision.reassigned == 1
+    assert decision.log == [{
+        "action": "deadline_exceeded",
+        "Status": "Timeout",
+        "skipped": ["2 - b.ps1", "3 - c.ps1", "4 - d.ps1"],
+    }]
+
+
+def test_flow_within_its_deadline_continues(decision):
+    result = asyncio.run(flow_logic.evaluate_flow_decision(state(time.time() + 60)))
+    assert result["next_action"] is True
+    assert result["current_action"] == "2 - b.ps1, 3 - c.ps1"
+    assert decision.reassigned == 0
+
+
+def test_deadline_after_the_last_stage_completes_the_ticket(decision):
+    result = asyncio.run(flow_logic.evaluate_flow_decision(state(time.time() - 1, action_index=3)))
+    assert result["flow_status"] == "completed"
+    assert decision.states == [flow_logic.TicketState.CLOSED_COMPLETE]
+    assert decision.log == []
@@ -0,0 +1,88 @@
+import asyncio
+
+import pytest
+
+import flow_logic
+from flow_plan import action_settings, build_action_plan, cache_settings
+
+ACTIONS = [
+    "1 - parse_variables.ps1",
+    "2 - Check_Ad_Group_Existence.ps1",
+    "3 - Check_Owner_Existance.ps1",
+    "4 - Create_Ad_Group.ps1",
+    "5 - Check_User_existence_output_samaccount.ps1",
+]
+
+
+def test_flow_without_manifest_stays_sequential():
+    assert build_action_plan(ACTIONS) == [[name] for name in ACTIONS]
+
+
+def test_independent_actions_share_a_stage():
+    plan = build_action_plan(ACTIONS, {2: {"depends_on": [1]}, "3 - Check_Owner_Existance.ps1": {"depends_on": ["1"]}})
+    assert plan == [[ACTIONS[0]], [ACTIONS[1], ACTIONS[2]], [ACTIONS[3]], [ACTIONS[4]]]
+
+
+def test_action_without_depends_on_waits_for_everything_before_it():
+    plan = build_action_plan(ACTIONS, {5: {"depends_on": [1]}})
+    assert plan == [[ACTIONS[0]], [ACTIONS[1], ACTIONS[4]], [ACTIONS[2]], [ACTIONS[3]]]
+
+
+@pytest.mark.parametrize("manifest, message", [
+    ({1: {"depends_on": [2]}, 2: {"depends_on": [1]}}, "cycle"),
+    ({9: {"depends_on": [1]}}, "Unknown action"),
+])
+def test_invalid_manifests_are_rejected(manifest, message):
+    with pytest.raises(ValueError, match=message):
+        build_action_plan(ACTIONS, manifest)
+
+
+def test_ambiguous_action_number_is_rejected():
+    with pytest.raises(ValueError, match="ambiguous"):
+        build_action_plan(["1 - a.ps1", "1 - b.ps1"], {1: {"depends_on": []}})
+
+
+def test_settings_resolve_invalidates_and_cache():
+    settings = action_settings(ACTIONS, {4: {"invalidates": [2, 3]}, 2: {"cache": {"key": "uniquegroupname"}}, 3: {"cache": True}})
+    assert settings[ACTIONS[3]]["invalidates"] == [ACTIONS[1], ACTIONS[2]]
+    assert cache_settings(settings[ACTIONS[1]]) == {"key": ["uniquegroupname"], "ttl": None}
+    assert cache_settings(settings[ACTIONS[2]]) == {"key": None, "ttl": None}
+    assert cache_settings(settings[ACTIONS[0]]) is None
+
+
+def test_failing_action_cancels_the_rest_of_its_stage(monkeypatch):
+    cancelled = []
+
+    async def fake_action(state, action_name, additional_vars):
+        if action_name == "fails":
+            await asyncio.sleep(0.01)
+            return {"log": {"script": action_name, "Status": "Error"}, "variables": {}, "worknote": "boom", "error": True}
+        if action_name == "quick":
+            return {"log": {"script": action_name, "Status": "Success"}, "variables": {"a": 1}, "worknote": "", "error": False}
+        try:
+            await asyncio.sleep(30)
+        except asyncio.CancelledError:
+            cancelled.append(action_name)
+            raise
+
+    monkeypatch.setattr(flow_logic, "run_journaled_action", fake_action)
+    state = {"additional_variables": {}}
+    outcomes = asyncio.run(asyncio.wait_for(flow_logic.run_action_stage(["slow", "quick", "fails"], state), 5))
+    assert cancelled == ["slow"]
+    assert [outcome["log"]["Status"] for outcome in outcomes] == ["Cancelled", "Success", "Error"]
+    assert outcomes[0]["error"] is False
+
+
+def test_stage_actions_get_their_own_copy_of_the_variables(monkeypatch):
+    seen = []
+
+    async def fake_action(state, action_name, additional_vars):
+        additional_vars[action_name] = True
+        seen.append(dict(additional_vars))
+        return {"log": {}, "variables": {}, "worknote": "", "error": False}
+
+    monkeypatch.setattr(flow_logic, "run_journaled_action", fake_action)
+    state = {"additional_variables": {"shared": 1}}
+    asyncio.run(flow_logic.run_action_stage(["a", "b"], state))
+    assert seen == [{"shared": 1, "a": True}, {"shared": 1, "b": True}]
+    assert state["additional_variables"] == {"shared": 1}
@@ -0,0 +1,102 @@
+import json
+import asyncio
+import textwrap
+
+import pytest
+from pydantic import ValidationError
+from fastapi.testclient import TestClient
+
+import ingest
+import flow_catalog
+from flow_catalog import FlowCatalog
+
+CATALOG = """
+flows:
+  - short_description: "AD Group Creation"
+    flow_name: "SecurityGroupCreation"
+    reassignment_group: "grp-1"
+    ingest_fields: [assignment_group, opened_by]
+"""
+
+
+def task(number="SCTASK0010001", short_description="Other request", **extra):
+    return {
+        "sys_id": f"sys-{number}",
+        "sys_class_name": "sc_task",
+        "number": number,
+        "short_description": short_description,
+        "description": "Group Name: grp-x",
+        "priority": "4",
+        "assignment_group": {"value": "g1"},
+        "opened_by": {"value": "u1"},
+        **extra,
+    }
+
+
+def body(*tasks):
+    return json.dumps({"result": list(tasks)}).encode()
+
+
+@pytest.fixture(autouse=True)
+def catalog(tmp_path, monkeypatch):
+    path = tmp_path / "flow_details.yml"
+    path.write_text(textwrap.dedent(CATALOG))
+    loaded = FlowCatalog(str(path))
+    monkeypatch.setattr(ingest, "get_flow_catalog", lambda: loaded)
+    monkeypatch.setattr(flow_catalog, "FLOW_CATALOG_CHECK_INTERVAL", 0)
+    return loaded
+
+
+def test_lean_mode_keeps_only_core_fields():
+    result = ingest.parse_task_payload(body(task()), mode="lean")["result"][0]
+    assert set(result) == set(ingest.CORE_FIELDS)
+    assert result["number"] == "SCTASK0010001"
+
+
+def test_lean_mode_adds_ingest_fields_of_the_matching_flow():
+    result = ingest.parse_task_payload(body(task(short_description="AD Group Creation")), mode="lean")["result"][0]
+    assert result["assignment_group"] == {"value": "g1"}
+    assert result["opened_by"] == {"value": "u1"}
+    assert "priority" not in result
+
+
+def test_lean_mode_rejects_missing_core_fields():
+    broken = task()
+    del broken["number"]
+    with pytest.raises(ValidationError):
+        ingest.parse_task_payload(body(broken), mode="lean")
+
+
+@pytest.mark.parametrize("mode", ["lean", "full"])
+def test_empty_result_list_is_a_validation_error(mode):
+    with pytest.raises(ValidationError):
+        ingest.parse_task_payload(body(), mode=mode)
+
+
+def test_api_answers_422_for_an_empty_result_list():
+    import main
+
+    # Without the context manager the startup hooks (queues, poller) do not run.
+    client = TestClient(main.app, raise_server_exceptions=False)
+    response = client.post("/api/task", content=body())
+    assert response.status_code == 422
+
+
+def test_raw_payload_store_keeps_the_latest_body(tmp_path):
+    async def scenario():
+        store = ingest.RawPayloadStore(str(tmp_path / "raw.sqlite"))
+        await store.start()
+        try:
+            store.save("SCTASK0010001", body(task(priority="1")))
+            store.save("SCTASK0010001", body(task(priority="2")))
+            await store.close()
+            await store.start()
+            latest = await store.get_latest("SCTASK0010001")
+            missing = await store.get_latest("SCTASK0099999")
+        finally:
+            await store.close()
+        return latest, missing
+
+    latest, missing = asyncio.run(scenario())
+    assert latest["result"][0]["priority"] == "2"
+    assert missing is None
@@ -0,0 +1,222 @@
+import asyncio
+
+from job_queue import JobQueue
+
+
+def run(coroutine):
+    return asyncio.run(coroutine)
+
+
+async def wait_for_status(queue: JobQueue, number: str, status: str, timeout: float = 5):
+    deadline = asyncio.get_running_loop().time() + timeout
+    while True:
+        job = await queue.get_latest_job(number)
+        if job is not None and job["status"] == status:
+            return job
+        if asyncio.get_running_loop().time() > deadline:
+            raise AssertionError(f"{number} never reached {status}: {job}")
+        await asyncio.sleep(0.01)
+
+
+def task(number: str) -> dict:
+    return {"result": [{"number": number}]}
+
+
+def test_submitted_job_runs_and_completes(tmp_path):
+    handled = []
+
+    async def handler(task_response):
+        handled.append(task_response["result"][0]["number"])
+
+    async def scenario():
+        queue = JobQueue(handler, str(tmp_path / "queue.sqlite"), workers=2)
+        await queue.start()
+        try:
+            job_id = await queue.submit("SCTASK1", task("SCTASK1"))
+            job = await wait_for_status(queue, "SCTASK1", "completed")
+        finally:
+            await queue.close()
+        return job_id, job
+
+    job_id, job = run(scenario())
+    assert handled == ["SCTASK1"]
+    assert job["job_id"] == job_id
+    assert job["finished_at"] >= job["started_at"] >= job["created_at"]
+
+
+def test_failed_job_records_its_error(tmp_path):
+    async def handler(task_response):
+        raise RuntimeError("script exploded")
+
+    async def scenario():
+        queue = JobQueue(handler, str(tmp_path / "queue.sqlite"), workers=1)
+        await queue.start()
+        try:
+            await queue.submit("SCTASK1", task("SCTASK1"))
+            return await wait_for_status(queue, "SCTASK1", "failed")
+        finally:
+            await queue.close()
+
+    assert run(scenario())["error"] == "script exploded"
+
+
+def test_each_job_is_claimed_once(tmp_path):
+    handled = []
+
+    async def handler(task_response):
+        handled.append(task_response["result"][0]["number"])
+        await asyncio.sleep(0.01)
+
+    async def scenario():
+        path = str(tmp_path / "queue.sqlite")
+        queues = [JobQueue(handler, path, workers=3) for _ in range(2)]
+        for queue in queues:
+            await queue.start()
+        try:
+            for i in range(20):
+                await queues[i % 2].submit(f"SCTASK{i}", task(f"SCTASK{i}"))
+            for i in range(20):
+                await wait_for_status(queues[0], f"SCTASK{i}", "completed")
+        finally:
+            for queue in queues:
+                await queue.close()
+
+    run(scenario())
+    assert sorted(handled) == sorted(f"SCTASK{i}" for i in range(20))
+
+
+def test_job_interrupted_by_a_shutdown_is_run_again(tmp_path):
+    path = str(tmp_path / "queue.sqlite")
+    started = []
+    finished = []
+
+    async def hanging_handler(task_response):
+        started.append(task_response["result"][0]["number"])
+        await asyncio.Event().wait()
+
+    async def handler(task_response):
+        finished.append(task_response["result"][0]["number"])
+
+    async def stopped_process():
+        queue = JobQueue(hanging_handler, path, workers=1)
+        await queue.start()
+        await queue.submit("SCTASK1", task("SCTASK1"))
+        await wait_for_status(queue, "SCTASK1", "running")
+        while not started:
+            await asyncio.sleep(0.01)
+        await queue.close()
+
+    async def restarted_process():
+        queue = JobQueue(handler, path, workers=1)
+        await queue.start()
+        try:
+            return await wait_for_status(queue, "SCTASK1", "completed")
+        finally:
+            await queue.close()
+
+    run(stopped_process())
+    run(restarted_process())
+    assert started == ["SCTASK1"]
+    assert finished == ["SCTASK1"]
+
+
+async def crash(queue: JobQueue):
+    """Stop a queue the way a killed process would: no requeue, its leases are left to expire."""
+    queue._closed = True
+    for worker in queue._tasks:
+        worker.cancel()
+    await asyncio.gather(*queue._tasks, return_exceptions=True)
+    await queue._conn.close()
+    queue._conn = None
+
+
+def test_job_of_a_dead_process_is_run_again_once_its_lease_expires(tmp_path):
+    path = str(tmp_path / "queue.sqlite")
+    finished = []
+
+    async def hanging_handler(task_response):
+        await asyncio.Event().wait()
+
+    async def handler(task_response):
+        finished.append(task_response["result"][0]["number"])
+
+    async def scenario():
+        dead = JobQueue(hanging_handler, path, workers=1, lease_ttl=0.3)
+        await dead.start()
+        await dead.submit("SCTASK1", task("SCTASK1"))
+        await wait_for_status(dead, "SCTASK1", "running")
+        await crash(dead)
+        survivor = JobQueue(handler, path, workers=1, lease_ttl=0.3)
+        await survivor.start()
+        try:
+            still_running = (await survivor.get_latest_job("SCTASK1"))["status"]
+            await wait_for_status(survivor, "SCTASK1", "completed")
+        finally:
+            await survivor.close()
+        return still_running
+
+    assert run(scenario()) == "running"
+    assert finished == ["SCTASK1"]
+
+
+def test_starting_process_leaves_a_live_siblings_job_running(tmp_path):
+    path = str(tmp_path / "queue.sqlite")
+    handled = []
+    release = asyncio.Event()
+
+    async def slow_handler(task_response):
+        handled.append("sibling")
+        await release.wait()
+
+    async def handler(task_response):
+        handled.append("newcomer")
+
+    async def scenario():
+        sibling = JobQueue(slow_handler, path, workers=1, lease_ttl=0.3)
+        await sibling.start()
+        try:
+            await sibling.submit("SCTASK1", task("SCTASK1"))
+            await wait_for_status(sibling, "SCTASK1", "running")
+            newcomer = JobQueue(handler, path, workers=1, lease_ttl=0.3)
+            await newcomer.start()
+            try:
+                # Several lease periods: the sibling's heartbeat keeps the job its own.
+                await asyncio.sleep(1)
+                status = (await newcomer.get_latest_job("SCTASK1"))["status"]
+                release.set()
+                await wait_for_status(newcomer, "SCTASK1", "completed")
+            finally:
+                await newcomer.close()
+        finally:
+            await sibling.close()
+        return status
+
+    assert run(scenario()) == "running"
+    assert handled == ["sibling"]
+
+
+def test_submit_unless_pending_reuses_the_queued_or_running_job(tmp_path):
+    release = asyncio.Event()
+
+    async def handler(task_response):
+        await release.wait()
+
+    async def scenario():
+        queue = JobQueue(handler, str(tmp_path / "queue.sqlite"), workers=1)
+        await queue.start()
+        try:
+            running = await queue.submit_unless_pending("SCTASK1", task("SCTASK1"))
+            await wait_for_status(queue, "SCTASK1", "running")
+            again = await queue.submit_unless_pending("SCTASK1", task("SCTASK1"))
+            other = await queue.submit_unless_pending("SCTASK2", task("SCTASK2"))
+            release.set()
+            await wait_for_status(queue, "SCTASK1", "completed")
+            after = await queue.submit_unless_pending("SCTASK1", task("SCTASK1"))
+        finally:
+            await queue.close()
+        return running, again, other, after
+
+    running, again, other, after = run(scenario())
+    assert again == running
+    assert other != running
+    assert after not in (running, other)
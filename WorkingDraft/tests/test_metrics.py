@@ -0,0 +1,72 @@
+import pytest
+from fastapi.testclient import TestClient
+
+import metrics
+
+
+def lines_for(name: str) -> list:
+    """The rendered lines (HELP, TYPE and samples) of the metrics whose name starts with `name`."""
+    return [line for line in metrics.render_prometheus().splitlines()
+            if line.removeprefix("# HELP ").removeprefix("# TYPE ").startswith(name)]
+
+
+def test_counter_renders_help_type_and_labelled_samples():
+    counter = metrics.counter("test_render_counter_total", "Requests by route.", ("route",))
+    counter.inc(route="/api/task")
+    counter.inc(2, route="/api/task")
+    counter.inc(0.5, route="/health")
+    assert lines_for("test_render_counter_total") == [
+        "# HELP test_render_counter_total Requests by route.",
+        "# TYPE test_render_counter_total counter",
+        'test_render_counter_total{route="/api/task"} 3',
+        'test_render_counter_total{route="/health"} 0.5',
+    ]
+
+
+def test_gauge_without_labels_has_no_braces():
+    gauge = metrics.gauge("test_render_gauge", "Jobs waiting.")
+    gauge.set(4)
+    gauge.dec()
+    assert lines_for("test_render_gauge")[-1] == "test_render_gauge 3"
+
+
+def test_histogram_buckets_are_cumulative_with_sum_and_count():
+    histogram = metrics.histogram("test_render_seconds", "Flow time.", ("flow",), buckets=(0.1, 1, 10))
+    for value in (0.05, 0.1, 0.5, 20):
+        histogram.observe(value, flow="Mailbox")
+    assert lines_for("test_render_seconds")[2:] == [
+        'test_render_seconds_bucket{flow="Mailbox",le="0.1"} 2',
+        'test_render_seconds_bucket{flow="Mailbox",le="1"} 3',
+        'test_render_seconds_bucket{flow="Mailbox",le="10"} 3',
+        'test_render_seconds_bucket{flow="Mailbox",le="+Inf"} 4',
+        'test_render_seconds_sum{flow="Mailbox"} 20.65',
+        'test_render_seconds_count{flow="Mailbox"} 4',
+    ]
+
+
+def test_label_values_and_help_text_are_escaped():
+    counter = metrics.counter("test_render_escaped_total", "Line one\nline two \\ end.", ("error",))
+    counter.inc(error='say "hi"\\\n')
+    assert lines_for("test_render_escaped_total") == [
+        "# HELP test_render_escaped_total Line one line two \\\\ end.",
+        "# TYPE test_render_escaped_total counter",
+        'test_render_escaped_total{error="say \\"hi\\"\\\\\\n"} 1',
+    ]
+
+
+def test_registering_a_name_again_returns_the_same_metric():
+    first = metrics.counter("test_render_shared_total", "Shared.")
+    assert metrics.counter("test_render_shared_total", "Shared.") is first
+    with pytest.raises(ValueError):
+        metrics.gauge("test_render_shared_total", "Shared.")
+
+
+def test_metrics_route_serves_the_text_format():
+    import main
+
+    metrics.counter("test_render_route_total", "Served by /metrics.").inc()
+    # Without the context manager the startup hooks (queues, poller) do not run.
+    response = TestClient(main.app).get("/metrics")
+    assert response.status_code == 200
+    assert response.headers["content-type"] == metrics.PROMETHEUS_CONTENT_TYPE
+    assert "test_render_route_total 1\n" in response.text
@@ -0,0 +1,137 @@
+import shutil
+import asyncio
+
+import pytest
+
+from node_pool import NodePool
+
+pytestmark = pytest.mark.skipif(shutil.which("node") is None, reason="node is not installed")
+
+ACTION = """
+module.exports.run = async function (taskResponse, additionalVariables) {
+  const mode = additionalVariables.mode;
+  console.log("noise that must not reach the protocol");
+  if (mode === "hang") { await new Promise(() => {}); }
+  if (mode === "exit") { process.exit(3); }
+  if (mode === "throw") { throw new Error("lookup failed"); }
+  return {Status: "Success", pid: process.pid, version: VERSION, number: taskResponse.result[0].number,
+          echo: additionalVariables};
+};
+"""
+
+TASK = {"result": [{"number": "SCTASK0010001"}]}
+
+
+@pytest.fixture
+def action(tmp_path):
+    path = tmp_path / "2 - Lookup.js"
+
+    def write(version):
+        path.write_text(f"const VERSION = {version};\n" + ACTION)
+        return str(path)
+
+    write(1)
+    return write
+
+
+def with_pool(scenario, **options):
+    async def wrapper():
+        pool = NodePool(**options)
+        await pool.start()
+        try:
+            return await scenario(pool)
+        finally:
+            await pool.close()
+
+    return asyncio.run(wrapper())
+
+
+def test_runs_exported_run_and_returns_its_output(action):
+    async def scenario(pool):
+        return await pool.run(action(1), "v1", TASK, {"user": "a"})
+
+    result = with_pool(scenario, size=1)
+    assert result["Status"] == "Success"
+    assert result["OutputMessage"]["number"] == "SCTASK0010001"
+    assert result["OutputMessage"]["echo"] == {"user": "a"}
+
+
+def test_changed_module_is_reloaded_on_a_new_version(action):
+    async def scenario(pool):
+        first = await pool.run(action(1), "v1", TASK, {})
+        action(2)
+        same = await pool.run(action(2), "v1", TASK, {})
+        reloaded = await pool.run(action(2), "v2", TASK, {})
+        return [result["OutputMessage"]["version"] for result in (first, same, reloaded)]
+
+    assert with_pool(scenario, size=1) == [1, 1, 2]
+
+
+def test_errors_are_reported_and_the_worker_is_kept(action):
+    async def scenario(pool):
+        failed = await pool.run(action(1), "v1", TASK, {"mode": "throw"})
+        after = await pool.run(action(1), "v1", TASK, {})
+        return failed, after, pool.stats()
+
+    failed, after, stats = with_pool(scenario, size=1)
+    assert failed["Status"] == "Error"
+    assert "lookup failed" in failed["ErrorMessage"]
+    assert after["Status"] == "Success"
+    assert stats["idle"] == 1
+
+
+def test_timeout_kills_the_worker_and_the_slot_recovers(action):
+    async def scenario(pool):
+        first = await pool.run(action(1), "v1", TASK, {})
+        timed_out = await pool.run(action(1), "v1", TASK, {"mode": "hang"}, timeout=0.5)
+        after = await pool.run(action(1), "v1", TASK, {})
+        return first, timed_out, after
+
+    first, timed_out, after = with_pool(scenario, size=1)
+    assert timed_out["Status"] == "Timeout"
+    assert after["Status"] == "Success"
+    assert after["OutputMessage"]["pid"] != first["OutputMessage"]["pid"]
+
+
+def test_crashed_worker_is_replaced(action):
+    async def scenario(pool):
+        crashed = await pool.run(action(1), "v1", TASK, {"mode": "exit"})
+        after = await pool.run(action(1), "v1", TASK, {})
+        return crashed, after
+
+    crashed, after = with_pool(scenario, size=1)
+    assert crashed["Status"] == "Error"
+    assert after["Status"] == "Success"
+
+
+def test_cancelled_job_frees_its_slot(action):
+    async def scenario(pool):
+        job = asyncio.create_task(pool.run(action(1), "v1", TASK, {"mode": "hang"}))
+        await asyncio.sleep(0.3)
+        job.cancel()
+        await asyncio.gather(job, return_exceptions=True)
+        after = await asyncio.wait_for(pool.run(action(1), "v1", TASK, {}), 10)
+        return after, pool.stats()
+
+    after, stats = with_pool(scenario, size=1)
+    assert after["Status"] == "Success"
+    assert stats["busy"] == 0
+
+
+def test_worker_is_recycled_after_max_jobs(action):
+    async def scenario(pool):
+        return [(await pool.run(action(1), "v1", TASK, {}))["OutputMessage"]["pid"] for _ in range(3)]
+
+    pids = with_pool(scenario, size=1, max_jobs=2)
+    assert pids[0] == pids[1] != pids[2]
+
+
+def test_jobs_beyond_the_pool_size_wait_for_a_worker(action):
+    async def scenario(pool):
+        results = await asyncio.gather(*(pool.run(action(1), "v1", TASK, {"i": i}) for i in range(6)))
+        return results, pool.stats()
+
+    results, stats = with_pool(scenario, size=2)
+    assert all(result["Status"] == "Success" for result in results)
+    assert len({result["OutputMessage"]["pid"] for result in results}) <= 2
+    assert stats == {"size": 2, "busy": 0, "idle": 2, "waiting": 0}
@@ -0,0 +1,184 @@
+import json
+import asyncio
+from types import SimpleNamespace
+
+import pytest
+
+import flow_logic
+import output_capture
+from output_capture import CapturedOutput, CapturedProcess, SpooledValueTooLarge, read_spooled_fields
+
+ACTION = "2 - Lookup.py"
+
+
+def capture(tmp_path, data: bytes, cap=64, preview=16):
+    async def scenario():
+        output = CapturedOutput(str(tmp_path / "out.log"), cap=cap, preview=preview)
+        reader = asyncio.StreamReader()
+        for start in range(0, len(data), 10):
+            reader.feed_data(data[start:start + 10])
+        reader.feed_eof()
+        await output.consume(reader)
+        return output
+
+    return asyncio.run(scenario())
+
+
+def test_output_under_the_cap_stays_in_memory(tmp_path):
+    output = capture(tmp_path, b"hello world")
+    assert not output.spooled
+    assert output.text() == "hello world"
+    assert not (tmp_path / "out.log").exists()
+
+
+def test_output_over_the_cap_is_spooled_with_a_preview(tmp_path):
+    data = b"x" * 200
+    output = capture(tmp_path, data)
+    assert output.spooled
+    assert (tmp_path / "out.log").read_bytes() == data
+    assert output.size == 200
+    assert output.text().startswith("x" * 16 + "\n... [truncated: 200 bytes")
+
+    details = CapturedProcess(0, output, CapturedOutput()).details()
+    assert details == {"OutputRef": output.path, "OutputBytes": 200}
+
+
+def test_read_spooled_fields_picks_top_level_keys_and_skips_the_rest(tmp_path, monkeypatch):
+    monkeypatch.setattr(output_capture, "READ_CHUNK", 7)
+    path = tmp_path / "spool.log"
+    tricky = 'a "quoted", {braced} \\ value'
+    path.write_text(json.dumps({"Members": [tricky] * 50, "Nested": {"Status": "inner"}, "Status": "Success",
+                                "OutputMessage": tricky}))
+    fields = read_spooled_fields(str(path), ("Status", "OutputMessage", "ErrorMessage"), limit=100)
+    assert fields == {"Status": "Success", "OutputMessage": tricky}
+
+
+def test_read_spooled_fields_enforces_the_limit_while_reading(tmp_path):
+    path = tmp_path / "spool.log"
+    path.write_text(json.dumps({"Members": ["user%d" % i for i in range(1000)], "Status": "Success"}))
+    with pytest.raises(SpooledValueTooLarge):
+        read_spooled_fields(str(path), ("Members",), limit=1024)
+    assert read_spooled_fields(str(path), ("Members", "Status"), limit=1024, strict=False) == {"Status": "Success"}
+
+
+def test_read_spooled_fields_is_none_for_anything_but_a_json_object(tmp_path):
+    path = tmp_path / "spool.log"
+    path.write_text("plain log line\n" * 100)
+    assert read_spooled_fields(str(path), ("Status",)) is None
+    path.write_text('{"Status": "Success", "rows": [1, 2')
+    assert read_spooled_fields(str(path), ("Status",)) is None
+
+
+@pytest.fixture
+def action(monkeypatch):
+    """_run_flow_action for one Python action whose run_script result is `action.result`."""
+    script = SimpleNamespace(name=ACTION, path=f"UseCases/Flow/{ACTION}", sha256="abc")
+    registry = SimpleNamespace(get_action=lambda flow, name: script, get_actions=lambda flow: [script])
+    catalog = SimpleNamespace(flow_config=lambda flow: {})
+    monkeypatch.setattr(flow_logic, "get_script_registry", lambda: registry)
+    monkeypatch.setattr(flow_logic, "get_flow_catalog", lambda: catalog)
+    monkeypatch.setattr(flow_logic, "ACTION_CACHE_ENABLED", False)
+    state = SimpleNamespace(result=None)
+
+    async def run_script(*args, **kwargs):
+        return state.result
+
+    monkeypatch.setattr(flow_logic, "run_script", run_script)
+    state.run = lambda: asyncio.run(flow_logic._run_flow_action(ACTION, "Flow", {}, {"result": []}))
+    return state
+
+
+def spooled_result(tmp_path, payload: bytes) -> dict:
+    output = capture(tmp_path, payload)
+    return {
+        "Status": "Success",
+        "OutputMessage": output.text(),
+        "ErrorMessage": "",
+        **CapturedProcess(0, output, CapturedOutput()).details(),
+    }
+
+
+def test_spooled_json_output_keeps_only_a_reference(tmp_path, action):
+    variables = {"Status": "Success", "OutputMessage": "found", "Members": ["user%d" % i for i in range(50)]}
+    action.result = spooled_result(tmp_path, json.dumps(variables).encode())
+    outcome = action.run()
+    assert not outcome["error"]
+    assert outcome["variables"] == {f"OutputRef:{ACTION}": str(tmp_path / "out.log")}
+    assert outcome["worknote"] == "found"
+    assert outcome["log"]["OutputRef"] == str(tmp_path / "out.log")
+
+
+def test_spooled_json_error_output_fails_the_action(tmp_path, action):
+    failure = {"Status": "Error", "OutputMessage": "", "ErrorMessage": "lookup failed " + "x" * 100}
+    action.result = spooled_result(tmp_path, json.dumps(failure).encode())
+    outcome = action.run()
+    assert outcome["error"]
+    assert "lookup failed" in outcome["worknote"]
+
+
+def test_spooled_plain_output_becomes_the_preview_worknote(tmp_path, action):
+    action.result = spooled_result(tmp_path, b"log line\n" * 50)
+    outcome = action.run()
+    assert not outcome["error"]
+    assert outcome["variables"] == {}
+    assert "[truncated: 450 bytes" in outcome["worknote"]
+
+
+def test_missing_spool_file_fails_the_action(tmp_path, action):
+    action.result = spooled_result(tmp_path, b'{"Status": "Success"' + b" " * 100 + b"}")
+    (tmp_path / "out.log").unlink()
+    outcome = action.run()
+    assert outcome["error"]
+    assert outcome["worknote"].startswith(f"Execution failed for {ACTION}")
+
+
+def test_multi_mb_spooled_output_stays_out_of_the_checkpointed_state(tmp_path, monkeypatch):
+    lookup = SimpleNamespace(name=ACTION, path="lookup.py", sha256="a")
+    add = SimpleNamespace(name="3 - Add.py", path="add.py", sha256="b")
+    registry = SimpleNamespace(get_action=lambda flow, name: {ACTION: lookup, add.name: add}[name],
+                               get_actions=lambda flow: [lookup, add])
+    catalog = SimpleNamespace(flow_config=lambda flow: {"actions": {3: {"spooled_inputs": ["Members"]}}})
+    members = ["CN=user%d,OU=Users,DC=example,DC=com" % i for i in range(100_000)]
+    output = {"Status": "Success", "OutputMessage": "found", "Members": members}
+    spooled = spooled_result(tmp_path, json.dumps(output).encode())
+    received, journaled = {}, []
+
+    async def run_script(path, additional_vars, *args, **kwargs):
+        if path == lookup.path:
+            return spooled
+        received.update(additional_vars)
+        return {"Status": "Success", "OutputMessage": {"Status": "Success", "OutputMessage": "added"}, "ErrorMessage": ""}
+
+    class Journal:
+        async def get(self, *key):
+            return None
+
+        async def record(self, *key_and_outcome):
+            journaled.append(key_and_outcome[-1])
+
+    async def get_action_journal():
+        return Journal()
+
+    async def record_execution_log(state, *entries):
+        pass
+
+    monkeypatch.setattr(flow_logic, "get_script_registry", lambda: registry)
+    monkeypatch.setattr(flow_logic, "get_flow_catalog", lambda: catalog)
+    monkeypatch.setattr(flow_logic, "ACTION_CACHE_ENABLED", False)
+    monkeypatch.setattr(flow_logic, "run_script", run_script)
+    monkeypatch.setattr(flow_logic, "get_action_journal", get_action_journal)
+    monkeypatch.setattr(flow_logic, "record_execution_log", record_execution_log)
+    state = {"thread_id": "task_SCTASK0000001", "run_id": "run-1", "flow_name": "Flow", "task_response": {"result": []},
+             "additional_variables": {}, "action_plan": [[ACTION], [add.name]], "action_index": 0, "deadline": 0}
+
+    async def scenario():
+        for _ in state["action_plan"]:
+            state.update(await flow_logic.execute_flow_script(state))
+
+    asyncio.run(scenario())
+    assert (tmp_path / "out.log").stat().st_size > 4 * 1024 * 1024
+    assert state["additional_variables"][f"OutputRef:{ACTION}"] == str(tmp_path / "out.log")
+    assert "Members" not in state["additional_variables"]
+    assert len(json.dumps(state, default=str)) < 64 * 1024
+    assert all(len(json.dumps(outcome)) < 64 * 1024 for outcome in journaled)
+    assert received["Members"] == members
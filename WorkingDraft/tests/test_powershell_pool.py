@@ -0,0 +1,128 @@
+import json
+import shutil
+import asyncio
+
+import pytest
+
+from powershell_pool import PowerShellPool
+
+# Answers like powershell_host.ps1: "sleep" scripts hang, "crash" scripts kill the host,
+# anything else is echoed back together with the host's pid and job count.
+FAKE_HOST = """
+import os, sys, json, time
+print("##PSHOST## " + json.dumps({"Ready": True}), flush=True)
+jobs = 0
+for line in sys.stdin:
+    job = json.loads(line)
+    jobs += 1
+    if "crash" in job["script"]:
+        sys.exit(3)
+    if "sleep" in job["script"]:
+        time.sleep(30)
+    print("noise from Write-Host", flush=True)
+    output = json.dumps({"script": job["script"], "pid": os.getpid(), "jobs": jobs,
+                         "ticket": job["task_response"]["result"][0]["number"]})
+    print("##PSHOST## " + json.dumps({"Status": "Success", "OutputMessage": output, "ErrorMessage": ""}), flush=True)
+"""
+
+TASK = {"result": [{"number": "SCTASK0010001"}]}
+
+
+@pytest.fixture
+def fake_host(make_executable):
+    return make_executable("powershell", FAKE_HOST)
+
+
+def run(coroutine):
+    return asyncio.run(coroutine)
+
+
+def test_pool_reuses_warm_workers(fake_host):
+    async def scenario():
+        pool = PowerShellPool(size=1, executable=fake_host, modules="")
+        await pool.start()
+        try:
+            first = await pool.run("one", TASK, {})
+            second = await pool.run("two", TASK, {})
+        finally:
+            await pool.close()
+        return json.loads(first["OutputMessage"]), json.loads(second["OutputMessage"])
+
+    first, second = run(scenario())
+    assert first["ticket"] == "SCTASK0010001"
+    assert first["pid"] == second["pid"]
+    assert (first["jobs"], second["jobs"]) == (1, 2)
+
+
+def test_pool_recycles_after_max_jobs(fake_host):
+    async def scenario():
+        pool = PowerShellPool(size=1, max_jobs=1, executable=fake_host, modules="")
+        try:
+            first = await pool.run("one", TASK, {})
+            second = await pool.run("two", TASK, {})
+        finally:
+            await pool.close()
+        return json.loads(first["OutputMessage"]), json.loads(second["OutputMessage"])
+
+    first, second = run(scenario())
+    assert first["pid"] != second["pid"]
+    assert second["jobs"] == 1
+
+
+def test_crashed_worker_is_replaced(fake_host):
+    async def scenario():
+        pool = PowerShellPool(size=1, executable=fake_host, modules="")
+        try:
+            crashed = await pool.run("crash", TASK, {})
+            after = await pool.run("next", TASK, {})
+        finally:
+            await pool.close()
+        return crashed, after
+
+    crashed, after = run(scenario())
+    assert crashed["Status"] == "Error"
+    assert "exited unexpectedly" in crashed["ErrorMessage"]
+    assert after["Status"] == "Success"
+
+
+def test_timed_out_job_kills_its_worker(fake_host):
+    async def scenario():
+        pool = PowerShellPool(size=1, executable=fake_host, modules="")
+        try:
+            timed_out = await pool.run("sleep", TASK, {}, timeout=0.5)
+            after = await pool.run("next", TASK, {})
+        finally:
+            await pool.close()
+        return timed_out, after
+
+    timed_out, after = run(scenario())
+    assert timed_out["Status"] == "Timeout"
+    assert after["Status"] == "Success"
+
+
+POWERSHELL = shutil.which("pwsh") or shutil.which("powershell")
+
+
+@pytest.mark.skipif(POWERSHELL is None, reason="needs PowerShell")
+def test_script_calling_exit_keeps_its_output_and_the_host():
+    script = '@{ Status = "Success"; Number = $SCTASK_RESPONSE[0].number } | ConvertTo-Json -Compress\nexit\n"not reached"'
+
+    async def scenario():
+        pool = PowerShellPool(size=1, executable=POWERSHELL, modules="")
+        await pool.start()
+        try:
+            worker = pool._idle._queue[0]
+            pid = worker.process.pid
+            exited = await pool.run(script, TASK, {})
+            failed = await pool.run("'partial'\nexit 3", TASK, {})
+            after = await pool.run("'still here'", TASK, {})
+            return pid, worker.process.pid, exited, failed, after
+        finally:
+            await pool.close()
+
+    pid, pid_after, exited, failed, after = run(scenario())
+    assert exited["Status"] == "Success"
+    assert json.loads(exited["OutputMessage"]) == {"Status": "Success", "Number": "SCTASK0010001"}
+    assert failed["OutputMessage"] == "partial"
+    assert after["OutputMessage"] == "still here"
+    assert pid == pid_after
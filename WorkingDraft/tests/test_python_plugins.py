@@ -0,0 +1,132 @@
+import os
+import sys
+import asyncio
+import subprocess
+
+import pytest
+
+import python_plugins
+from python_plugins import PythonPluginPool, venv_python
+
+PLUGIN = """
+import os
+import sys
+import time
+
+
+def run(task_response, additional_variables):
+    mode = additional_variables.get("mode")
+    if mode == "sleep":
+        time.sleep(30)
+    if mode == "crash":
+        os._exit(3)
+    if mode == "import":
+        import venv_only_package
+        return {"Status": "Success", "value": venv_only_package.VALUE, "path": sys.path}
+    return {"Status": "Success", "pid": os.getpid(), "prefix": sys.prefix, "echo": additional_variables}
+"""
+
+
+@pytest.fixture(scope="module")
+def venv(tmp_path_factory):
+    venv_dir = tmp_path_factory.mktemp("plugin") / "venv"
+    subprocess.run([sys.executable, "-m", "venv", "--without-pip", str(venv_dir)], check=True)
+    site_packages = subprocess.run(
+        [venv_python(str(venv_dir)), "-c", "import site; print(site.getsitepackages()[0])"],
+        check=True, capture_output=True, text=True,
+    ).stdout.strip()
+    with open(os.path.join(site_packages, "venv_only_package.py"), "w") as module:
+        module.write("VALUE = 42\n")
+    return str(venv_dir)
+
+
+@pytest.fixture
+def plugin(tmp_path):
+    path = tmp_path / "2 - Plugin.py"
+    path.write_text(PLUGIN)
+    return str(path)
+
+
+def worker_pids(pool):
+    return {pid for worker in pool._workers for pid in worker.executor._processes}
+
+
+def with_pool(scenario, **options):
+    async def wrapper():
+        pool = PythonPluginPool(**options)
+        await pool.start()
+        try:
+            return await scenario(pool)
+        finally:
+            await asyncio.to_thread(pool.close)
+
+    return asyncio.run(wrapper())
+
+
+def test_venv_python_finds_the_interpreter(venv, tmp_path):
+    assert venv_python(venv).startswith(venv)
+    assert venv_python(str(tmp_path)) is None
+    assert venv_python(None) is None
+
+
+def test_workers_run_the_venvs_interpreter_and_packages(venv, plugin):
+    async def scenario(pool):
+        return (await pool.run(plugin, "1", {}, {"user": "a"}), await pool.run(plugin, "1", {}, {"mode": "import"}))
+
+    plain, imported = with_pool(scenario, venv_dir=venv, size=1)
+    assert plain["Status"] == "Success"
+    assert os.path.realpath(plain["OutputMessage"]["prefix"]) == os.path.realpath(venv)
+    assert plain["OutputMessage"]["echo"] == {"user": "a"}
+    assert imported["OutputMessage"]["value"] == 42
+    assert not set(python_plugins._service_site_packages()) & set(imported["OutputMessage"]["path"])
+
+
+def test_timeout_only_replaces_the_worker_that_ran_the_call(plugin):
+    async def scenario(pool):
+        before = worker_pids(pool)
+        timed_out = await pool.run(plugin, "1", {}, {"mode": "sleep"}, timeout=0.5)
+        answers = await asyncio.gather(*(pool.run(plugin, "1", {}, {}) for _ in range(2)))
+        return before, timed_out, {answer["OutputMessage"]["pid"] for answer in answers}, worker_pids(pool)
+
+    before, timed_out, served_by, after = with_pool(scenario, size=2)
+    assert timed_out["Status"] == "Timeout"
+    assert len(before & after) == 1
+    assert served_by == after
+
+
+def test_crashed_worker_is_replaced_and_the_others_keep_running(plugin):
+    async def scenario(pool):
+        before = worker_pids(pool)
+        crashed = await pool.run(plugin, "1", {}, {"mode": "crash"})
+        recovered = await pool.run(plugin, "1", {}, {})
+        return before, crashed, recovered, worker_pids(pool)
+
+    before, crashed, recovered, after = with_pool(scenario, size=2)
+    assert crashed["Status"] == "Error"
+    assert "crashed" in crashed["ErrorMessage"]
+    assert recovered["Status"] == "Success"
+    assert len(before & after) == 1
+
+
+def test_cancelled_call_kills_only_its_worker(plugin):
+    async def scenario(pool):
+        before = worker_pids(pool)
+        call = asyncio.create_task(pool.run(plugin, "1", {}, {"mode": "sleep"}))
+        await asyncio.sleep(0.5)
+        call.cancel()
+        await asyncio.gather(call, return_exceptions=True)
+        survivors = worker_pids(pool)
+        await asyncio.gather(*(pool.run(plugin, "1", {}, {}) for _ in range(2)))
+        return before, survivors, worker_pids(pool)
+
+    before, survivors, after = with_pool(scenario, size=2)
+    assert len(survivors) == 1 and survivors < before
+    assert len(after) == 2
+
+
+def test_worker_is_recycled_after_max_tasks(plugin):
+    async def scenario(pool):
+        return [(await pool.run(plugin, "1", {}, {}))["OutputMessage"]["pid"] for _ in range(3)]
+
+    pids = with_pool(scenario, size=1, max_tasks=2)
+    assert pids[0] == pids[1] != pids[2]
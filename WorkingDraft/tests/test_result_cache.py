@@ -0,0 +1,93 @@
+import os
+import sys
+import time
+import subprocess
+from types import SimpleNamespace
+
+import pytest
+
+import flow_logic
+import result_cache
+from result_cache import ResultCache, cache_key
+
+WORKING_DRAFT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def test_cache_key_depends_on_script_and_selected_inputs():
+    inputs = {"uniquegroupname": "grp", "OwnerEmail": "a@example.com"}
+    assert cache_key("sha", inputs) == cache_key("sha", dict(reversed(list(inputs.items()))))
+    assert cache_key("sha", inputs) != cache_key("other", inputs)
+    assert cache_key("sha", inputs, ["uniquegroupname"]) == cache_key("sha", {"uniquegroupname": "grp"}, ["uniquegroupname"])
+    assert cache_key("sha", inputs, ["uniquegroupname"]) != cache_key("sha", inputs)
+
+
+def test_put_get_returns_a_copy_until_the_ttl_runs_out(monkeypatch):
+    now = [1000.0]
+    monkeypatch.setattr(result_cache.time, "monotonic", lambda: now[0])
+    cache = ResultCache(ttl=10)
+    cache.put("Flow", "2 - a.ps1", "k", {"Status": "Success"})
+    hit = cache.get("Flow", "2 - a.ps1", "k")
+    hit["Status"] = "changed"
+    assert cache.get("Flow", "2 - a.ps1", "k") == {"Status": "Success"}
+    now[0] += 10
+    assert cache.get("Flow", "2 - a.ps1", "k") is None
+    assert cache.stats()["entries"] == 0
+    assert cache.stats()["hits"] == 2
+
+
+def test_zero_ttl_is_not_cached():
+    cache = ResultCache(ttl=10)
+    cache.put("Flow", "a", "k", {"Status": "Success"}, ttl=0)
+    assert cache.get("Flow", "a", "k") is None
+
+
+def test_least_recently_used_entries_are_evicted():
+    cache = ResultCache(ttl=60, max_entries=2)
+    cache.put("Flow", "a", "1", {})
+    cache.put("Flow", "a", "2", {})
+    cache.get("Flow", "a", "1")
+    cache.put("Flow", "a", "3", {})
+    assert cache.get("Flow", "a", "2") is None
+    assert cache.get("Flow", "a", "1") == {}
+
+
+def test_invalidate_one_key_or_the_whole_action():
+    cache = ResultCache(ttl=60)
+    for key in ("1", "2"):
+        cache.put("Flow", "a", key, {})
+    cache.put("Flow", "b", "1", {})
+    assert cache.invalidate("Flow", "a", "1") == 1
+    assert cache.invalidate("Flow", "a", "missing") == 0
+    assert cache.invalidate("Flow", "a") == 1
+    assert cache.get("Flow", "b", "1") == {}
+
+
+def test_invalidate_cached_results_drops_only_the_matching_key(monkeypatch):
+    cache = ResultCache(ttl=60)
+    script = SimpleNamespace(sha256="sha")
+    registry = SimpleNamespace(get_action=lambda flow, name: script)
+    monkeypatch.setattr(flow_logic, "action_cache", cache)
+    monkeypatch.setattr(flow_logic, "get_script_registry", lambda: registry)
+    settings = {"2 - lookup.ps1": {"cache": {"key": ["uniquegroupname"]}}}
+    for group in ("grp-1", "grp-2"):
+        cache.put("Flow", "2 - lookup.ps1", cache_key("sha", {"uniquegroupname": group}, ["uniquegroupname"]), {})
+
+    flow_logic.invalidate_cached_results("Flow", ["2 - lookup.ps1"], settings, {"uniquegroupname": "grp-1"})
+    assert cache.stats()["entries"] == 1
+    flow_logic.invalidate_cached_results("Flow", ["2 - lookup.ps1"], settings, {})
+    assert cache.stats()["entries"] == 0
+
+
+@pytest.mark.parametrize("env, enabled", [
+    ({}, "True"),
+    ({"UVICORN_WORKERS": "4"}, "False"),
+    ({"UVICORN_WORKERS": "4", "ACTION_CACHE_ENABLED": "true"}, "True"),
+])
+def test_cache_is_off_by_default_with_several_workers(env, enabled):
+    environment = {key: value for key, value in os.environ.items()
+                   if key not in ("UVICORN_WORKERS", "ACTION_CACHE_ENABLED")}
+    output = subprocess.run(
+        [sys.executable, "-c", "import result_cache; print(result_cache.ACTION_CACHE_ENABLED)"],
+        cwd=WORKING_DRAFT, env={**environment, **env}, capture_output=True, text=True, check=True,
+    ).stdout
+    assert output.strip() == enabled
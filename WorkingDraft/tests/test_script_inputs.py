@@ -0,0 +1,97 @@
+import json
+import shutil
+import asyncio
+
+import pytest
+
+import flow_logic
+import output_capture
+import script_inputs
+from script_inputs import PayloadCache, encode_job, encode_inputs
+from script_scheduler import ScriptScheduler
+
+NODE = shutil.which("node")
+
+# Echoes the additional variables it was given, from argv when present, else from stdin.
+ECHO_SCRIPT = """
+const fs = require("fs");
+const source = process.argv.length > 2 ? "argv" : "stdin";
+const raw = source === "argv" ? process.argv[2] : fs.readFileSync(0, "utf8");
+console.log(JSON.stringify({source: source, inputs: JSON.parse(raw)}));
+"""
+
+
+def task_response(number="SCTASK0010001"):
+    return {"result": [{"number": number, "short_description": "AD Group Creation"}]}
+
+
+def test_default_channel_is_argv():
+    assert script_inputs.SCRIPT_INPUT_CHANNEL == "argv"
+
+
+def test_payload_cache_reuses_the_encoding_for_the_same_ticket():
+    cache = PayloadCache(size=2)
+    response = task_response()
+    first = cache.encode(response)
+    assert cache.encode(response) is first
+    assert cache.encode(dict(response)) is first
+    changed = task_response()
+    changed["result"][0]["short_description"] = "Other"
+    assert cache.encode(changed) != first
+
+
+def test_payload_cache_evicts_least_recently_used_tickets():
+    cache = PayloadCache(size=2)
+    cache.encode(task_response("A"))
+    cache.encode(task_response("B"))
+    cache.encode(task_response("A"))
+    cache.encode(task_response("C"))
+    assert list(cache._entries) == ["A", "C"]
+
+
+def test_payload_cache_encodes_responses_without_a_number():
+    assert json.loads(PayloadCache().encode({"result": {}})) == {"result": {}}
+
+
+def test_encode_job_is_one_json_line():
+    line = encode_job("Write-Output 1", task_response(), {"uniquegroupname": "grp"}, spool="/tmp/out")
+    assert b"\n" not in line
+    job = json.loads(line)
+    assert job == {
+        "script": "Write-Output 1",
+        "task_response": task_response(),
+        "additional_variables": {"uniquegroupname": "grp"},
+        "spool": "/tmp/out",
+    }
+    assert json.loads(encode_inputs({"a": 1})) == {"a": 1}
+
+
+@pytest.fixture
+def echo_script(tmp_path, monkeypatch):
+    monkeypatch.setattr(flow_logic, "get_scheduler", lambda: ScriptScheduler(max_concurrency=2))
+    monkeypatch.setattr(output_capture, "SCRIPT_SPOOL_DIR", str(tmp_path / "spool"))
+    path = tmp_path / "echo.js"
+    path.write_text(ECHO_SCRIPT)
+    return str(path)
+
+
+@pytest.mark.skipif(NODE is None, reason="node is not installed")
+@pytest.mark.parametrize("channel", ["argv", "stdin"])
+def test_run_script_passes_inputs_on_the_chosen_channel(echo_script, channel):
+    inputs = {"uniquegroupname": "grp", "Userstobeadded": ["a@example.com"]}
+    result = asyncio.run(flow_logic.run_script(echo_script, inputs, task_response(), input_channel=channel))
+    assert result["Status"] == "Success"
+    assert result["OutputMessage"] == {"source": channel, "inputs": inputs}
+
+
+@pytest.mark.skipif(NODE is None, reason="node is not installed")
+def test_run_script_falls_back_to_the_configured_channel(echo_script, monkeypatch):
+    monkeypatch.setattr(flow_logic, "SCRIPT_INPUT_CHANNEL", "stdin")
+    result = asyncio.run(flow_logic.run_script(echo_script, {"a": 1}, task_response()))
+    assert result["OutputMessage"]["source"] == "stdin"
+
+
+def test_run_script_rejects_unknown_channels(echo_script):
+    result = asyncio.run(flow_logic.run_script(echo_script, {}, task_response(), input_channel="pipe"))
+    assert result["Status"] == "Error"
+    assert "pipe" in result["ErrorMessage"]
@@ -0,0 +1,83 @@
+import os
+import hashlib
+
+import pytest
+
+from script_registry import ScriptRegistry, action_order
+
+
+def make_flow(root, flow_name, files: dict):
+    flow_dir = root / flow_name
+    flow_dir.mkdir(parents=True, exist_ok=True)
+    for name, content in files.items():
+        (flow_dir / name).write_bytes(content if isinstance(content, bytes) else content.encode("utf-8"))
+    return flow_dir
+
+
+def bump_mtime(path):
+    stat = os.stat(path)
+    os.utime(path, ns=(stat.st_atime_ns, stat.st_mtime_ns + 1_000_000_000))
+
+
+def test_action_order():
+    assert action_order("3 - Check_Owner.ps1") == 3
+    assert action_order(" 12-Add.ps1") == 12
+    assert action_order("README.md") == 1_000_000
+
+
+def test_actions_are_ordered_by_number_with_contents(tmp_path):
+    make_flow(tmp_path, "Flow", {
+        "10 - last.py": "print('last')",
+        "2 - second.ps1": b"\xef\xbb\xbfWrite-Output 'second'",
+        "1 - first.js": "console.log('first')",
+        "notes.txt": "not a script",
+    })
+    registry = ScriptRegistry(str(tmp_path))
+    registry.scan()
+    actions = registry.get_actions("Flow")
+    assert [action.name for action in actions] == ["1 - first.js", "2 - second.ps1", "10 - last.py", "notes.txt"]
+    second = actions[1]
+    assert second.content == "Write-Output 'second'"
+    assert second.sha256 == hashlib.sha256(b"\xef\xbb\xbfWrite-Output 'second'").hexdigest()
+    assert actions[3].content == ""
+
+
+def test_changed_and_removed_flows_are_picked_up_by_scan(tmp_path):
+    flow_dir = make_flow(tmp_path, "Flow", {"1 - a.ps1": "'old'"})
+    make_flow(tmp_path, "Other", {"1 - b.ps1": "'b'"})
+    registry = ScriptRegistry(str(tmp_path))
+    registry.scan()
+    (flow_dir / "1 - a.ps1").write_text("'new'")
+    bump_mtime(flow_dir / "1 - a.ps1")
+    for name in os.listdir(tmp_path / "Other"):
+        os.remove(tmp_path / "Other" / name)
+    os.rmdir(tmp_path / "Other")
+    registry.scan()
+    assert registry.get_action("Flow", "1 - a.ps1").content == "'new'"
+    assert "Other" not in registry._flows
+
+
+def test_unscanned_flow_is_loaded_on_first_use(tmp_path):
+    registry = ScriptRegistry(str(tmp_path))
+    registry.scan()
+    make_flow(tmp_path, "Late", {"1 - a.ps1": "'late'"})
+    assert registry.get_action("Late", "1 - a.ps1").content == "'late'"
+
+
+def test_unknown_flow_and_action_raise(tmp_path):
+    make_flow(tmp_path, "Flow", {"1 - a.ps1": "'a'"})
+    registry = ScriptRegistry(str(tmp_path))
+    registry.scan()
+    with pytest.raises(FileNotFoundError):
+        registry.get_actions("Missing")
+    with pytest.raises(FileNotFoundError):
+        registry.get_action("Flow", "2 - b.ps1")
+
+
+def test_shipped_use_cases_are_registered():
+    root = os.path.join(os.path.dirname(os.path.dirname(__file__)), "UseCases")
+    registry = ScriptRegistry(root)
+    registry.scan()
+    names = [action.name for action in registry.get_actions("SecurityGroupCreation")]
+    assert names[0] == "1 - parse_variables.ps1"
+    assert [action_order(name) for name in names] == sorted(action_order(name) for name in names)
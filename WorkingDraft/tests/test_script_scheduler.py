@@ -0,0 +1,239 @@
+import sys
+import time
+import asyncio
+
+import pytest
+
+from script_scheduler import ScriptScheduler, parse_interpreter_limits
+
+
+def run(coroutine):
+    return asyncio.run(coroutine)
+
+
+def test_parse_interpreter_limits():
+    assert parse_interpreter_limits("powershell=4, python=2,bogus") == {"powershell": 4, "python": 2}
+
+
+def test_global_and_interpreter_caps_are_respected():
+    async def scenario():
+        scheduler = ScriptScheduler(max_concurrency=3, interpreter_limits={"powershell": 2})
+        peak = {"total": 0, "powershell": 0}
+        running = {"total": 0, "powershell": 0}
+
+        async def job(interpreter):
+            async with scheduler.slot(interpreter):
+                running["total"] += 1
+                running[interpreter] = running.get(interpreter, 0) + 1
+                peak["total"] = max(peak["total"], running["total"])
+                peak[interpreter] = max(peak.get(interpreter, 0), running[interpreter])
+                await asyncio.sleep(0.01)
+                running["total"] -= 1
+                running[interpreter] -= 1
+
+        await asyncio.gather(*(job("powershell") for _ in range(6)), *(job("python") for _ in range(6)))
+        return peak, scheduler.stats()
+
+    peak, stats = run(scenario())
+    assert peak["total"] == 3
+    assert peak["powershell"] == 2
+    assert stats["completed"] == 12
+    assert stats["running"] == 0
+
+
+def test_waiters_are_served_fifo():
+    async def scenario():
+        scheduler = ScriptScheduler(max_concurrency=1, interpreter_limits={})
+        order = []
+        gate = asyncio.Event()
+
+        async def job(name):
+            async with scheduler.slot("python"):
+                if name == "first":
+                    await gate.wait()
+                order.append(name)
+
+        first = asyncio.create_task(job("first"))
+        await asyncio.sleep(0)
+        waiters = []
+        for name in ("a", "b", "c"):
+            waiters.append(asyncio.create_task(job(name)))
+            await asyncio.sleep(0)
+        gate.set()
+        await asyncio.gather(first, *waiters)
+        return order
+
+    assert run(scenario()) == ["first", "a", "b", "c"]
+
+
+def test_full_interpreter_does_not_block_other_interpreters():
+    async def scenario():
+        scheduler = ScriptScheduler(max_concurrency=4, interpreter_limits={"powershell": 1})
+        order = []
+        gate = asyncio.Event()
+
+        async def job(interpreter, name):
+            async with scheduler.slot(interpreter):
+                if name == "ps1":
+                    await gate.wait()
+                order.append(name)
+
+        tasks = [asyncio.create_task(job("powershell", "ps1"))]
+        await asyncio.sleep(0)
+        tasks.append(asyncio.create_task(job("powershell", "ps2")))
+        await asyncio.sleep(0)
+        tasks.append(asyncio.create_task(job("python", "py")))
+        await asyncio.sleep(0.01)
+        gate.set()
+        await asyncio.gather(*tasks)
+        return order
+
+    assert run(scenario()) == ["py", "ps1", "ps2"]
+
+
+def test_cancelled_waiter_leaves_the_queue():
+    async def scenario():
+        scheduler = ScriptScheduler(max_concurrency=1, interpreter_limits={})
+        gate = asyncio.Event()
+
+        async def holder():
+            async with scheduler.slot("python"):
+                await gate.wait()
+
+        held = asyncio.create_task(holder())
+        await asyncio.sleep(0)
+        waiter = asyncio.create_task(scheduler.slot("python").__aenter__())
+        await asyncio.sleep(0)
+        depth_while_waiting = scheduler.stats()["queue_depth"]
+        waiter.cancel()
+        await asyncio.gather(waiter, return_exceptions=True)
+        gate.set()
+        await held
+        return depth_while_waiting, scheduler.stats()
+
+    depth, stats = run(scenario())
+    assert depth == 1
+    assert stats["queue_depth"] == 0
+    assert stats["running"] == 0
+
+
+def test_saturated_once_queue_reaches_its_limit():
+    async def scenario():
+        scheduler = ScriptScheduler(max_concurrency=1, interpreter_limits={}, max_queue_depth=2)
+        gate = asyncio.Event()
+
+        async def job():
+            async with scheduler.slot("python"):
+                await gate.wait()
+
+        tasks = [asyncio.create_task(job()) for _ in range(3)]
+        await asyncio.sleep(0)
+        saturated = scheduler.saturated()
+        gate.set()
+        await asyncio.gather(*tasks)
+        return saturated, scheduler.saturated()
+
+    assert run(scenario()) == (True, False)
+
+
+def test_run_captures_output_and_exit_code():
+    async def scenario():
+        scheduler = ScriptScheduler(max_concurrency=2, interpreter_limits={})
+        code = "import sys; data = sys.stdin.read(); print(data.upper()); sys.stderr.write('warn'); sys.exit(2)"
+        return await scheduler.run("python", [sys.executable, "-c", code], stdin=b"hello")
+
+    result = run(scenario())
+    assert result.returncode == 2
+    assert result.stdout.text().strip() == "HELLO"
+    assert result.stderr.text() == "warn"
+    assert not result.timed_out
+
+
+def test_run_kills_process_after_timeout():
+    async def scenario():
+        scheduler = ScriptScheduler(max_concurrency=1, interpreter_limits={})
+        started = time.monotonic()
+        result = await scheduler.run("python", [sys.executable, "-c", "import time; time.sleep(30)"], timeout=0.3)
+        return result, time.monotonic() - started, scheduler.stats()
+
+    result, elapsed, stats = run(scenario())
+    assert result.timed_out
+    assert elapsed < 10
+    assert stats["running"] == 0
+
+
+# Starts a grandchild that would outlive a plain kill of the direct child and
+# prints its pid (also to the file named by argv[1], when given).
+SPAWN_TREE = (
+    "import subprocess, sys, time; "
+    "child = subprocess.Popen([sys.executable, '-c', 'import time; time.sleep(30)']); "
+    "print(child.pid, flush=True); "
+    "sys.argv[1:] and open(sys.argv[1], 'w').write(str(child.pid)); "
+    "time.sleep(30)"
+)
+
+
+def alive(pid):
+    try:
+        with open(f"/proc/{pid}/status") as status:
+            return "\nState:\tZ" not in status.read()
+    except FileNotFoundError:
+        return False
+
+
+def wait_dead(pid, seconds=5):
+    give_up = time.monotonic() + seconds
+    while alive(pid) and time.monotonic() < give_up:
+        time.sleep(0.05)
+    return not alive(pid)
+
+
+@pytest.mark.skipif(not sys.platform.startswith("linux"), reason="reads /proc")
+def test_timeout_kills_the_whole_process_tree():
+    async def scenario():
+        scheduler = ScriptScheduler(max_concurrency=1, interpreter_limits={})
+        return await scheduler.run("python", [sys.executable, "-c", SPAWN_TREE], timeout=1)
+
+    result = run(scenario())
+    assert result.timed_out
+    assert wait_dead(int(result.stdout.text().split()[0]))
+
+
+@pytest.mark.skipif(not sys.platform.startswith("linux"), reason="reads /proc")
+def test_cancelled_run_kills_the_process_tree_and_frees_the_slot(tmp_path):
+    pid_file = tmp_path / "child.pid"
+
+    async def scenario():
+        scheduler = ScriptScheduler(max_concurrency=1, interpreter_limits={})
+        task = asyncio.create_task(scheduler.run("python", [sys.executable, "-c", SPAWN_TREE, str(pid_file)]))
+        while not pid_file.exists() or not pid_file.read_text():
+            await asyncio.sleep(0.05)
+        task.cancel()
+        await asyncio.gather(task, return_exceptions=True)
+        return scheduler.stats()
+
+    stats = run(scenario())
+    assert stats["running"] == 0
+    assert wait_dead(int(pid_file.read_text()))
+
+
+def test_run_script_keeps_action_output_off_the_server_stdout(tmp_path, monkeypatch, capfd):
+    import flow_logic
+    import output_capture
+
+    monkeypatch.setattr(flow_logic, "get_scheduler", lambda: ScriptScheduler(max_concurrency=1))
+    monkeypatch.setattr(output_capture, "SCRIPT_SPOOL_DIR", str(tmp_path / "spool"))
+    scripts = tmp_path / "Flow" / "venv" / "Scripts"
+    scripts.mkdir(parents=True)
+    (scripts / "python.exe").symlink_to(sys.executable)
+    script = tmp_path / "Flow" / "1 - Lookup.py"
+    script.write_text(
+        "import sys, json\n"
+        "print('secret-stderr-line', file=sys.stderr)\n"
+        "print(json.dumps({'members': ['secret-stdout-member']}))\n"
+    )
+
+    result = run(flow_logic.run_script(str(script), {}, {"result": [{"number": "SCTASK0000001"}]}))
+    assert result["OutputMessage"] == {"members": ["secret-stdout-member"]}
+    captured = capfd.readouterr()
+    assert "secret" not in captured.out + captured.err
@@ -0,0 +1,91 @@
+import json
+import asyncio
+
+import httpx
+import pytest
+
+import servicenow_client
+from servicenow_client import ServiceNowClient, get_servicenow_client, close_servicenow_client
+
+
+def run(coroutine):
+    return asyncio.run(coroutine)
+
+
+def recording_transport(requests: list, status: int = 200):
+    def handler(request: httpx.Request) -> httpx.Response:
+        requests.append(request)
+        body = json.loads(request.content) if request.content else None
+        return httpx.Response(status, json={"result": body if body is not None else []})
+    return httpx.MockTransport(handler)
+
+
+def test_update_record_puts_json_to_the_table_api():
+    requests = []
+
+    async def scenario():
+        client = ServiceNowClient("https://instance.example/", user="svc", pwd="secret",
+                                  transport=recording_transport(requests))
+        try:
+            resp = await client.update_record("sc_task", "abc123", {"work_notes": "done"})
+        finally:
+            await client.close()
+        return resp, client.stats()
+
+    resp, stats = run(scenario())
+    assert resp.status_code == 200
+    request = requests[0]
+    assert request.method == "PUT"
+    assert str(request.url) == "https://instance.example/api/now/table/sc_task/abc123"
+    assert json.loads(request.content) == {"work_notes": "done"}
+    assert request.headers["Accept"] == "application/json"
+    assert request.headers["Authorization"].startswith("Basic ")
+    assert stats["requests"] == 1
+
+
+def test_get_records_passes_query_parameters():
+    requests = []
+
+    async def scenario():
+        client = ServiceNowClient("https://instance.example", transport=recording_transport(requests))
+        try:
+            await client.get_records("sc_task", {"sysparm_query": "active=true", "sysparm_limit": "5"})
+        finally:
+            await client.close()
+
+    run(scenario())
+    assert requests[0].url.params["sysparm_query"] == "active=true"
+    assert requests[0].url.params["sysparm_limit"] == "5"
+
+
+def test_transport_errors_are_counted_and_raised():
+    def handler(request):
+        raise httpx.ConnectError("refused", request=request)
+
+    async def scenario():
+        client = ServiceNowClient("https://instance.example", transport=httpx.MockTransport(handler))
+        try:
+            with pytest.raises(httpx.ConnectError):
+                await client.update_record("sc_task", "abc123", {})
+        finally:
+            await client.close()
+        return client.stats()
+
+    stats = run(scenario())
+    assert stats == {"requests": 1, "errors": 1, "tcp_connects": 0, "tls_handshakes": 0}
+
+
+def test_process_wide_client_is_shared_until_closed(monkeypatch):
+    monkeypatch.setattr(servicenow_client, "_client", None)
+
+    async def scenario():
+        first = get_servicenow_client()
+        second = get_servicenow_client()
+        await close_servicenow_client()
+        third = get_servicenow_client()
+        await close_servicenow_client()
+        return first, second, third
+
+    first, second, third = run(scenario())
+    assert first is second
+    assert third is not first
@@ -0,0 +1,248 @@
+import json
+import sqlite3
+import asyncio
+from types import SimpleNamespace
+
+import httpx
+import pytest
+
+import flow_logic
+import servicenow_mirror
+from fake_servicenow import create_app, make_ticket
+from servicenow_client import ServiceNowClient
+from servicenow_mirror import ServiceNowMirror
+
+
+def run(coroutine):
+    return asyncio.run(coroutine)
+
+
+def with_mirror(tmp_path, scenario, **options):
+    async def wrapper():
+        mirror = ServiceNowMirror(path=str(tmp_path / "sn_database.db"), reconcile_interval=0, **options)
+        await mirror.start()
+        try:
+            return await scenario(mirror)
+        finally:
+            await mirror.close()
+
+    return run(wrapper())
+
+
+def record(sys_id="abc", number="SCTASK0000001", state="1", updated_on="2026-01-01 00:00:01", **fields):
+    return {"sys_id": sys_id, "number": number, "state": state, "active": "true",
+            "sys_updated_on": updated_on, "sys_mod_count": "1", **fields}
+
+
+def test_upsert_merges_partial_reads_and_ignores_older_full_records(tmp_path):
+    async def scenario(mirror):
+        await mirror.upsert("sc_task", [record(description="first")])
+        await mirror.upsert("sc_task", [{"sys_id": "abc", "state": "2", "sys_updated_on": "2026-01-09 00:00:00"}],
+                            partial=True)
+        await mirror.upsert("sc_task", [record(state="1", updated_on="2025-12-31 00:00:00")])
+        return await mirror.get("SCTASK0000001"), await mirror.get_by_sys_id("sc_task", "abc")
+
+    by_number, by_sys_id = with_mirror(tmp_path, scenario)
+    assert by_number == by_sys_id
+    assert by_number["state"] == "2"
+    assert by_number["description"] == "first"
+    assert by_number["sys_updated_on"] == "2026-01-01 00:00:01"
+
+
+def test_lookups_count_hits_and_misses(tmp_path):
+    async def scenario(mirror):
+        await mirror.upsert("sc_task", [record()])
+        missing = await mirror.get_by_sys_id("sc_req_item", "abc")
+        return missing, await mirror.stats()
+
+    missing, stats = with_mirror(tmp_path, scenario)
+    assert missing is None
+    assert (stats["hits"], stats["misses"], stats["rows"]) == (0, 1, 1)
+
+
+@pytest.mark.parametrize("fields, closed", [
+    ({"state": "1"}, False),
+    ({"state": "3"}, True),
+    ({"state": "2", "active": "false"}, True),
+    ({"state": {"value": "4", "link": "https://instance.example/x"}}, True),
+])
+def test_ticket_closed_reads_state_and_active(tmp_path, fields, closed):
+    async def scenario(mirror):
+        await mirror.upsert("sc_task", [{**record(), **fields}])
+        return await mirror.ticket_closed("sc_task", "abc", flow_logic.CLOSED_TICKET_STATES)
+
+    assert with_mirror(tmp_path, scenario) is closed
+
+
+def test_unmirrored_ticket_is_not_closed(tmp_path):
+    async def scenario(mirror):
+        return await mirror.ticket_closed("sc_task", "unknown", flow_logic.CLOSED_TICKET_STATES)
+
+    assert with_mirror(tmp_path, scenario) is False
+
+
+def test_submitted_payloads_are_mirrored_in_the_background(tmp_path):
+    async def scenario(mirror):
+        mirror.observe_payload(json.dumps({"result": [record(sys_class_name="sc_task")]}).encode())
+        mirror.observe_payload(b"not json")
+        while (await mirror.stats())["rows"] == 0:
+            await asyncio.sleep(0.01)
+        return await mirror.get("SCTASK0000001")
+
+    assert with_mirror(tmp_path, scenario)["state"] == "1"
+
+
+def test_legacy_sc_task_rows_are_imported_once(tmp_path):
+    path = tmp_path / "sn_database.db"
+    with sqlite3.connect(path) as conn:
+        conn.execute("CREATE TABLE sc_task (sys_id TEXT, number TEXT, state TEXT, sys_class_name TEXT)")
+        conn.execute("INSERT INTO sc_task VALUES ('abc', 'SCTASK0000001', '3', 'sc_task')")
+
+    async def scenario(mirror):
+        return await mirror.get("SCTASK0000001")
+
+    assert with_mirror(tmp_path, scenario)["state"] == "3"
+    with sqlite3.connect(path) as conn:
+        conn.execute("UPDATE sc_task SET state = '1'")
+    assert with_mirror(tmp_path, scenario)["state"] == "3"
+
+
+def test_reconcile_fetches_only_rows_whose_stamps_moved(tmp_path, monkeypatch):
+    tickets = [make_ticket(i, updated_on=f"2026-01-01 00:00:0{i}") for i in (1, 2)]
+    app = create_app([dict(ticket) for ticket in tickets])
+
+    async def scenario(mirror):
+        client = ServiceNowClient("http://servicenow.test", transport=httpx.ASGITransport(app=app))
+        monkeypatch.setattr(servicenow_mirror, "get_servicenow_client", lambda: client)
+        client.mirror = mirror
+        try:
+            await mirror.upsert("sc_task", tickets)
+            app.state.records[tickets[1]["sys_id"]].update(state="3", sys_updated_on="2026-01-02 00:00:00")
+            refreshed = await mirror.reconcile_once()
+            return refreshed, await mirror.get("SCTASK0000002"), await mirror.get("SCTASK0000001")
+        finally:
+            await client.close()
+
+    refreshed, moved, unchanged = with_mirror(tmp_path, scenario)
+    assert refreshed == 1
+    assert moved["state"] == "3"
+    assert unchanged["state"] == "1"
+    fetched = [params.get("sysparm_fields") for method, _, params in app.state.requests if method == "GET"]
+    assert fetched == ["sys_id,sys_updated_on,sys_mod_count", None]
+
+
+def test_reconcile_revisits_recently_closed_rows(tmp_path, monkeypatch):
+    closed = make_ticket(1, state="3", updated_on="2026-01-01 00:00:01")
+    closed["active"] = "false"
+    old = make_ticket(2, state="3", updated_on="2026-01-01 00:00:02")
+    old["active"] = "false"
+    app = create_app([dict(closed), dict(old)])
+
+    async def scenario(mirror):
+        client = ServiceNowClient("http://servicenow.test", transport=httpx.ASGITransport(app=app))
+        monkeypatch.setattr(servicenow_mirror, "get_servicenow_client", lambda: client)
+        client.mirror = mirror
+        try:
+            await mirror.upsert("sc_task", [closed, old])
+            await mirror._conn.execute("UPDATE records SET synced_at = synced_at - 2 * 86400 WHERE sys_id = ?",
+                                       (old["sys_id"],))
+            for record in (closed, old):
+                app.state.records[record["sys_id"]].update(state="1", active="true",
+                                                           sys_updated_on="2026-01-02 00:00:00")
+            refreshed = await mirror.reconcile_once()
+            return refreshed, await mirror.get("SCTASK0000001"), await mirror.get("SCTASK0000002")
+        finally:
+            await client.close()
+
+    refreshed, reopened, too_old = with_mirror(tmp_path, scenario)
+    assert refreshed == 1
+    assert (reopened["state"], reopened["active"]) == ("1", "true")
+    assert too_old["state"] == "3"
+
+
+class Graph:
+    """aget_state/ainvoke stand-in holding one thread's snapshot."""
+
+    def __init__(self, values=None, next=()):
+        self.snapshot = SimpleNamespace(values=values or {}, next=next, created_at=None)
+        self.invoked = []
+
+    async def aget_state(self, config):
+        return self.snapshot
+
+    async def ainvoke(self, payload, config):
+        self.invoked.append(payload)
+        return {"flow_status": "completed"}
+
+
+def task(state=None, active=None):
+    ticket = {"sys_id": "abc", "number": "SCTASK0000001"}
+    if state is not None:
+        ticket["state"] = state
+    if active is not None:
+        ticket["active"] = active
+    return {"result": [ticket]}
+
+
+@pytest.fixture
+def mirrored(tmp_path, monkeypatch):
+    """Run a scenario with a mirror holding ticket SCTASK0000001 in `state`."""
+    def scenario_with(state, scenario):
+        async def wrapped(mirror):
+            await mirror.upsert("sc_task", [record(state=state)])
+            monkeypatch.setattr(flow_logic, "servicenow_mirror", lambda: mirror)
+            return await scenario()
+
+        return with_mirror(tmp_path, wrapped)
+
+    return scenario_with
+
+
+def test_interrupted_run_of_a_closed_ticket_is_not_resumed(mirrored):
+    graph = Graph({"run_id": "r1", "task_response": task()}, next=("execute_action",))
+    result = mirrored("3", lambda: flow_logic.start_or_resume(graph, "task_SCTASK0000001"))
+    assert result is None
+    assert graph.invoked == []
+
+
+def test_interrupted_run_of_an_open_ticket_is_resumed(mirrored):
+    graph = Graph({"run_id": "r1", "task_response": task()}, next=("execute_action",))
+    result = mirrored("2", lambda: flow_logic.start_or_resume(graph, "task_SCTASK0000001"))
+    assert result == {"flow_status": "completed"}
+    assert graph.invoked == [None]
+
+
+@pytest.mark.parametrize("submitted", [task(state="3"), task(state="2", active="false")])
+def test_repeat_submission_of_a_closed_ticket_returns_the_last_run(mirrored, submitted):
+    finished = {"run_id": "r1", "flow_status": "completed", "task_response": task()}
+    graph = Graph(finished)
+    result = mirrored("1", lambda: flow_logic.start_or_resume(graph, "task_SCTASK0000001", submitted))
+    assert result is finished
+    assert graph.invoked == []
+
+
+def test_submitted_state_wins_over_the_mirror(mirrored):
+    graph = Graph({"run_id": "r1", "flow_status": "completed", "task_response": task()})
+    result = mirrored("3", lambda: flow_logic.start_or_resume(graph, "task_SCTASK0000001", task(state="1")))
+    assert result == {"flow_status": "completed"}
+    assert graph.invoked == [{"task_response": task(state="1")}]
+
+
+def test_a_stale_closed_mirror_row_does_not_swallow_a_submission(mirrored):
+    # The reopened ticket's payload is still queued for the mirror, which shows it closed.
+    graph = Graph({"run_id": "r1", "flow_status": "completed", "task_response": task()})
+    mirrored("3", lambda: flow_logic.start_or_resume(graph, "task_SCTASK0000001", task()))
+    assert graph.invoked == [{"task_response": task()}]
+
+
+def test_a_new_submission_resumes_an_interrupted_run_of_a_reopened_ticket(mirrored):
+    graph = Graph({"run_id": "r1", "task_response": task()}, next=("execute_action",))
+    mirrored("3", lambda: flow_logic.start_or_resume(graph, "task_SCTASK0000001", task(state="1", active="true")))
+    assert graph.invoked == [None]
+
+
+def test_without_a_mirror_submissions_always_run(monkeypatch):
+    monkeypatch.setattr(flow_logic, "servicenow_mirror", lambda: None)
+    graph = Graph({"run_id": "r1", "flow_status": "completed", "task_response": task()})
+    run(flow_logic.start_or_resume(graph, "task_SCTASK0000001", task()))
+    assert graph.invoked == [{"task_response": task()}]
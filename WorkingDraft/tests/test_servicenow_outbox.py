@@ -0,0 +1,181 @@
+import json
+import asyncio
+import sqlite3
+
+import httpx
+import pytest
+
+import servicenow_outbox
+from servicenow_client import ServiceNowClient
+from servicenow_outbox import ServiceNowOutbox, merge_updates
+
+
+def run(coroutine):
+    return asyncio.run(coroutine)
+
+
+class FakeInstance:
+    """Records PUTs; answers with the queued status codes, then 200."""
+
+    def __init__(self, statuses=()):
+        self.puts = []
+        self.statuses = list(statuses)
+
+    def handler(self, request):
+        self.puts.append((request.url.path, json.loads(request.content)))
+        status = self.statuses.pop(0) if self.statuses else 200
+        return httpx.Response(status, json={"result": {}})
+
+
+@pytest.fixture
+def instance(monkeypatch):
+    instance = FakeInstance()
+    client = ServiceNowClient("https://instance.example", transport=httpx.MockTransport(instance.handler))
+    monkeypatch.setattr(servicenow_outbox, "get_servicenow_client", lambda: client)
+    monkeypatch.setattr(servicenow_outbox, "SERVICENOW_OUTBOX_FLUSH_INTERVAL", 3600)
+    return instance
+
+
+def test_merge_updates_keeps_latest_fields_and_appends_notes():
+    merged = merge_updates([
+        {"state": "2", "work_notes": "first"},
+        {"work_notes": ""},
+        {"state": "3", "assigned_to": "bot", "work_notes": "second"},
+    ])
+    assert merged == {"state": "3", "assigned_to": "bot", "work_notes": "first\n\nsecond"}
+
+
+def test_updates_for_one_record_are_sent_as_one_request(tmp_path, instance):
+    async def scenario():
+        outbox = ServiceNowOutbox(str(tmp_path / "outbox.sqlite"))
+        await outbox.start()
+        await outbox.enqueue("sc_task", "a", {"work_notes": "one"})
+        await outbox.enqueue("sc_task", "b", {"state": "3"})
+        await outbox.enqueue("sc_task", "a", {"work_notes": "two", "state": "3"})
+        await outbox.flush()
+        stats = outbox.stats()
+        await outbox.close()
+        return stats
+
+    stats = run(scenario())
+    assert stats["pending"] == 0
+    assert sorted(instance.puts) == [
+        ("/api/now/table/sc_task/a", {"work_notes": "one\n\ntwo", "state": "3"}),
+        ("/api/now/table/sc_task/b", {"state": "3"}),
+    ]
+
+
+def test_failed_update_is_kept_and_retried_in_order(tmp_path, instance):
+    instance.statuses = [503]
+
+    async def scenario():
+        outbox = ServiceNowOutbox(str(tmp_path / "outbox.sqlite"))
+        await outbox.start()
+        await outbox.enqueue("sc_task", "a", {"work_notes": "one"})
+        await outbox.flush()
+        after_failure = outbox.stats()["pending"]
+        await outbox.enqueue("sc_task", "a", {"work_notes": "two"})
+        # Still in backoff: the newer update must not overtake the failed one.
+        await outbox.flush()
+        puts_during_backoff = len(instance.puts)
+        await outbox._conn.execute("UPDATE outbox SET next_attempt_at = 0")
+        await outbox.flush()
+        stats = outbox.stats()
+        await outbox.close()
+        return after_failure, puts_during_backoff, stats
+
+    after_failure, puts_during_backoff, stats = run(scenario())
+    assert after_failure == 1
+    assert puts_during_backoff == 1
+    assert instance.puts[-1] == ("/api/now/table/sc_task/a", {"work_notes": "one\n\ntwo"})
+    assert stats["pending"] == 0
+
+
+def test_update_is_parked_after_max_attempts(tmp_path, instance, monkeypatch):
+    monkeypatch.setattr(servicenow_outbox, "SERVICENOW_OUTBOX_MAX_ATTEMPTS", 1)
+    instance.statuses = [400]
+    path = str(tmp_path / "outbox.sqlite")
+
+    async def scenario():
+        outbox = ServiceNowOutbox(path)
+        await outbox.start()
+        await outbox.enqueue("sc_task", "a", {"state": "3"})
+        await outbox.flush()
+        await outbox.close()
+
+    run(scenario())
+    with sqlite3.connect(path) as conn:
+        assert conn.execute("SELECT COUNT(*) FROM outbox").fetchone()[0] == 0
+        dead = conn.execute("SELECT sys_id, body, error FROM outbox_dead").fetchall()
+    assert dead[0][:2] == ("a", '{"state": "3"}')
+    assert dead[0][2].startswith("HTTP 400")
+
+
+def test_updates_left_by_a_previous_process_are_replayed(tmp_path, instance, monkeypatch):
+    path = str(tmp_path / "outbox.sqlite")
+
+    async def crashed_process():
+        outbox = ServiceNowOutbox(path)
+        await outbox.start()
+        await outbox.enqueue("sc_task", "a", {"work_notes": "before the crash"})
+        # Simulate a crash: drop the connection without the final flush.
+        outbox._task.cancel()
+        await outbox._conn.close()
+        outbox._conn = None
+
+    async def restarted_process():
+        outbox = ServiceNowOutbox(path)
+        await outbox.start()
+        pending = outbox.stats()["pending"]
+        await outbox.flush()
+        await outbox.close()
+        return pending
+
+    run(crashed_process())
+    assert instance.puts == []
+    assert run(restarted_process()) == 1
+    assert instance.puts == [("/api/now/table/sc_task/a", {"work_notes": "before the crash"})]
+
+
+def test_two_processes_flushing_together_send_each_update_once(tmp_path, instance):
+    path = str(tmp_path / "outbox.sqlite")
+
+    async def scenario():
+        outboxes = [ServiceNowOutbox(path), ServiceNowOutbox(path)]
+        for outbox in outboxes:
+            await outbox.start()
+        for i in range(10):
+            await outboxes[i % 2].enqueue("sc_task", f"r{i}", {"work_notes": f"note {i}"})
+        await asyncio.gather(*(outbox.flush() for outbox in outboxes))
+        for outbox in outboxes:
+            await outbox.close()
+
+    run(scenario())
+    assert sorted(path for path, _ in instance.puts) == sorted(f"/api/now/table/sc_task/r{i}" for i in range(10))
+
+
+def test_record_claimed_by_another_process_waits_for_its_claim(tmp_path, instance):
+    path = str(tmp_path / "outbox.sqlite")
+
+    async def scenario():
+        dead = ServiceNowOutbox(path, claim_ttl=0.3)
+        await dead.start()
+        await dead.enqueue("sc_task", "a", {"work_notes": "one"})
+        # The process claimed the record and died before sending it.
+        await dead._claim("a")
+        dead._task.cancel()
+        await dead._conn.close()
+        dead._conn = None
+
+        survivor = ServiceNowOutbox(path)
+        await survivor.start()
+        await survivor.enqueue("sc_task", "a", {"work_notes": "two"})
+        await survivor.flush()
+        puts_while_claimed = len(instance.puts)
+        await asyncio.sleep(0.3)
+        await survivor.flush()
+        await survivor.close()
+        return puts_while_claimed
+
+    assert run(scenario()) == 0
+    assert instance.puts == [("/api/now/table/sc_task/a", {"work_notes": "one\n\ntwo"})]
@@ -0,0 +1,263 @@
+import asyncio
+import textwrap
+
+import httpx
+import pytest
+
+import ingest
+import flow_catalog
+import servicenow_poller
+from flow_catalog import FlowCatalog
+from fake_servicenow import create_app, make_ticket, matches
+from servicenow_client import ServiceNowClient
+from servicenow_poller import ServiceNowPoller, build_query, poll_fields
+
+CATALOG = """
+flows:
+  - short_description: "AD Group Creation - Security"
+    flow_name: "SecurityGroupCreation"
+    reassignment_group: "grp-1"
+  - short_description: "Domain Account"
+    match: prefix
+    flow_name: "ADAccountCreation"
+    reassignment_group: "grp-2"
+    ingest_fields: [state, assignment_group]
+  - short_description: "^Mailbox (Creation|Request)$"
+    match: regex
+    flow_name: "Mailbox"
+    reassignment_group: "grp-3"
+"""
+
+
+def run(coroutine):
+    return asyncio.run(coroutine)
+
+
+def ticket(index, updated_on, short_description="AD Group Creation - Security", **fields):
+    return {**make_ticket(index, short_description, updated_on=updated_on), **fields}
+
+
+@pytest.fixture
+def catalog(tmp_path, monkeypatch):
+    path = tmp_path / "flow_details.yml"
+    path.write_text(textwrap.dedent(CATALOG))
+    loaded = FlowCatalog(str(path))
+    monkeypatch.setattr(flow_catalog, "FLOW_CATALOG_CHECK_INTERVAL", 0)
+    monkeypatch.setattr(servicenow_poller, "get_flow_catalog", lambda: loaded)
+    monkeypatch.setattr(ingest, "get_flow_catalog", lambda: loaded)
+    return loaded
+
+
+@pytest.fixture
+def instance(catalog, monkeypatch):
+    """A fake ServiceNow instance; add tickets to `instance.state.records`."""
+    app = create_app()
+    client = ServiceNowClient("http://servicenow.test", transport=httpx.ASGITransport(app=app))
+    monkeypatch.setattr(servicenow_poller, "get_servicenow_client", lambda: client)
+
+    def add(*tickets):
+        for record in tickets:
+            app.state.records[record["sys_id"]] = record
+
+    app.add = add
+    return app
+
+
+class Recorder:
+    """dispatch() stand-in: records ticket numbers, failing on the numbers in `fail`."""
+
+    def __init__(self, fail=()):
+        self.numbers = []
+        self.payloads = []
+        self.fail = set(fail)
+
+    async def __call__(self, number, task_response):
+        if number in self.fail:
+            raise RuntimeError("queue unavailable")
+        self.numbers.append(number)
+        self.payloads.append(task_response)
+
+
+def poll(tmp_path, dispatch, **options):
+    async def scenario():
+        poller = ServiceNowPoller(dispatch, interval=0, path=str(tmp_path / "poller.sqlite"), **options)
+        await poller.start()
+        try:
+            try:
+                return await poller.poll_once(), poller.stats()
+            except RuntimeError as e:
+                return e, poller.stats()
+        finally:
+            await poller.close()
+
+    return run(scenario())
+
+
+def test_build_query_matches_exact_and_prefix_entries(catalog):
+    query = build_query(catalog.entries(), "2026-01-01 00:00:00")
+    assert query == (
+        "active=true^stateIN1^sys_updated_on>=2026-01-01 00:00:00"
+        "^short_description=AD Group Creation - Security^ORshort_descriptionSTARTSWITHDomain Account"
+        "^ORDERBYsys_updated_on"
+    )
+    assert matches(ticket(1, "2026-01-02 00:00:00"), query)
+    assert matches(ticket(2, "2026-01-02 00:00:00", "Domain Account Creation"), query)
+    assert not matches(ticket(3, "2026-01-02 00:00:00", "Mailbox Creation"), query)
+    assert not matches(ticket(4, "2025-12-31 00:00:00"), query)
+    assert not matches(ticket(5, "2026-01-02 00:00:00", state="3"), query)
+
+
+def test_build_query_escapes_carets():
+    query = build_query([{"short_description": "a^b"}], states="")
+    assert query == "active=true^short_description=a^^b^ORDERBYsys_updated_on"
+    assert matches({"active": "true", "short_description": "a^b"}, query)
+
+
+def test_poll_fields_add_ingest_fields(catalog):
+    fields = poll_fields(catalog.entries())
+    assert fields[:len(ingest.CORE_FIELDS)] == list(ingest.CORE_FIELDS)
+    assert fields[-2:] == ["assignment_group", "sys_updated_on"]
+    assert fields.count("state") == 1
+
+
+def test_poll_pages_through_matching_tickets_oldest_first(tmp_path, instance):
+    instance.add(*(ticket(i, f"2026-01-01 00:00:0{9 - i}") for i in range(7)))
+    instance.add(ticket(7, "2026-01-01 00:00:00", "Unrelated request"))
+    recorder = Recorder()
+    dispatched, stats = poll(tmp_path, recorder, page_size=3)
+    assert dispatched == 7
+    assert recorder.numbers == [f"SCTASK{i:07d}" for i in reversed(range(7))]
+    assert stats["high_water"] == "2026-01-01 00:00:09"
+    gets = [params for method, _, params in instance.state.requests if method == "GET"]
+    assert [params["sysparm_offset"] for params in gets] == ["0", "3", "6"]
+    assert "u_field_0" not in recorder.payloads[0]["result"][0]
+
+
+def test_restart_resumes_from_the_saved_mark(tmp_path, instance):
+    instance.add(ticket(1, "2026-01-01 00:00:01"), ticket(2, "2026-01-01 00:00:02"))
+    first = Recorder()
+    poll(tmp_path, first)
+    instance.add(ticket(3, "2026-01-01 00:00:03"))
+    second = Recorder()
+    poll(tmp_path, second)
+    assert first.numbers == ["SCTASK0000001", "SCTASK0000002"]
+    assert second.numbers == ["SCTASK0000003"]
+
+
+def test_failed_hand_off_leaves_the_mark_before_the_ticket(tmp_path, instance):
+    instance.add(*(ticket(i, f"2026-01-01 00:00:0{i}") for i in (1, 2, 3)))
+    failing = Recorder(fail={"SCTASK0000002"})
+    error, stats = poll(tmp_path, failing)
+    assert isinstance(error, RuntimeError)
+    assert failing.numbers == ["SCTASK0000001"]
+    assert stats["high_water"] == "2026-01-01 00:00:01"
+
+    retry = Recorder()
+    poll(tmp_path, retry)
+    assert retry.numbers == ["SCTASK0000002", "SCTASK0000003"]
+
+
+def test_tickets_sharing_the_mark_timestamp_are_not_lost_or_repeated(tmp_path, instance):
+    instance.add(*(ticket(i, "2026-01-01 00:00:05") for i in (1, 2, 3)))
+    failing = Recorder(fail={"SCTASK0000002"})
+    poll(tmp_path, failing)
+    retry = Recorder()
+    poll(tmp_path, retry)
+    again = Recorder()
+    poll(tmp_path, again)
+    assert failing.numbers == ["SCTASK0000001"]
+    assert retry.numbers == ["SCTASK0000002", "SCTASK0000003"]
+    assert again.numbers == []
+
+
+def test_crash_during_hand_off_does_not_lose_the_ticket(tmp_path, instance):
+    instance.add(ticket(1, "2026-01-01 00:00:01"), ticket(2, "2026-01-01 00:00:02"))
+    handed_off = []
+
+    async def stuck(number, task_response):
+        if number == "SCTASK0000002":
+            await asyncio.Event().wait()
+        handed_off.append(number)
+
+    async def scenario():
+        poller = ServiceNowPoller(stuck, interval=0, path=str(tmp_path / "poller.sqlite"))
+        await poller.start()
+        cycle = asyncio.create_task(poller.poll_once())
+        while not handed_off:
+            await asyncio.sleep(0.01)
+        await asyncio.sleep(0.05)
+        cycle.cancel()
+        await asyncio.gather(cycle, return_exceptions=True)
+        await poller.close()
+
+    run(scenario())
+    retry = Recorder()
+    poll(tmp_path, retry)
+    assert handed_off == ["SCTASK0000001"]
+    assert retry.numbers == ["SCTASK0000002"]
+
+
+def test_invalid_and_unmatched_tickets_are_skipped_but_passed(tmp_path, instance):
+    broken = ticket(1, "2026-01-01 00:00:01")
+    broken["number"] = None
+    instance.add(broken, ticket(2, "2026-01-01 00:00:02", "Domain Account Creation"))
+    recorder = Recorder()
+    dispatched, stats = poll(tmp_path, recorder)
+    assert dispatched == 1
+    assert recorder.numbers == ["SCTASK0000002"]
+    assert recorder.payloads[0]["result"][0]["state"] == "1"
+    assert stats["high_water"] == "2026-01-01 00:00:02"
+
+
+def test_only_the_lease_holder_polls(tmp_path, instance):
+    instance.add(ticket(1, "2026-01-01 00:00:01"))
+    path = str(tmp_path / "poller.sqlite")
+    leader, standby = Recorder(), Recorder()
+
+    async def scenario():
+        pollers = [ServiceNowPoller(recorder, interval=0, path=path) for recorder in (leader, standby)]
+        for poller in pollers:
+            await poller.start()
+        try:
+            counts = [await poller.poll_once() for poller in pollers]
+            instance.add(ticket(2, "2026-01-01 00:00:02"))
+            # The leader hands the lease on when it stops; the standby continues from its mark.
+            await pollers[0].close()
+            counts.append(await pollers[1].poll_once())
+            return counts, pollers[1].stats()
+        finally:
+            for poller in pollers:
+                await poller.close()
+
+    counts, stats = run(scenario())
+    assert counts == [1, 0, 1]
+    assert leader.numbers == ["SCTASK0000001"]
+    assert standby.numbers == ["SCTASK0000002"]
+    assert stats["leader"] is True
+    assert stats["standby"] == 1
+
+
+def test_lease_of_a_dead_poller_is_taken_over_once_it_expires(tmp_path, instance):
+    instance.add(ticket(1, "2026-01-01 00:00:01"))
+    path = str(tmp_path / "poller.sqlite")
+    survivor = Recorder()
+
+    async def scenario():
+        dead = ServiceNowPoller(Recorder(), interval=0, path=path, lease_ttl=0.3)
+        await dead.start()
+        await dead.poll_once()
+        # Killed: the connection goes away without handing the lease on.
+        await dead._conn.close()
+        dead._conn = None
+        instance.add(ticket(2, "2026-01-01 00:00:02"))
+        poller = ServiceNowPoller(survivor, interval=0, path=path, lease_ttl=0.3)
+        await poller.start()
+        try:
+            before_expiry = await poller.poll_once()
+            await asyncio.sleep(0.3)
+            return before_expiry, await poller.poll_once()
+        finally:
+            await poller.close()
+
+    assert run(scenario()) == (0, 1)
+    assert survivor.numbers == ["SCTASK0000002"]
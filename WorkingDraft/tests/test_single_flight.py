@@ -0,0 +1,140 @@
+import asyncio
+
+import pytest
+
+import single_flight
+from single_flight import SingleFlight
+
+
+def run(coroutine):
+    return asyncio.run(coroutine)
+
+
+class Flow:
+    """factory() stand-in: counts runs and finishes when `release` is set."""
+
+    def __init__(self, result=None, error=None):
+        self.result = {"flow_status": "completed"} if result is None else result
+        self.error = error
+        self.runs = 0
+        self.release = asyncio.Event()
+
+    async def __call__(self):
+        self.runs += 1
+        await self.release.wait()
+        if self.error is not None:
+            raise self.error
+        return self.result
+
+
+def test_submissions_while_running_share_one_run():
+    async def scenario():
+        flights, flow = SingleFlight(window=60), Flow()
+        callers = [asyncio.create_task(flights.run("task_1", flow)) for _ in range(3)]
+        await asyncio.sleep(0)
+        flow.release.set()
+        results = await asyncio.gather(*callers)
+        return flow.runs, results, flights.stats()
+
+    runs, results, stats = run(scenario())
+    assert runs == 1
+    assert results == [{"flow_status": "completed"}] * 3
+    assert results[0] is not results[1]
+    assert stats == {"started": 1, "coalesced_running": 2, "coalesced_finished": 0, "running": 0, "finished": 1}
+
+
+def test_finished_result_is_reused_only_within_the_window(monkeypatch):
+    now = [1000.0]
+    monkeypatch.setattr(single_flight.time, "monotonic", lambda: now[0])
+
+    async def scenario():
+        flights, flow = SingleFlight(window=10), Flow()
+        flow.release.set()
+        first = await flights.run("task_1", flow)
+        first["flow_status"] = "changed"
+        again = await flights.run("task_1", flow)
+        now[0] += 10
+        await flights.run("task_1", flow)
+        return flow.runs, again
+
+    runs, again = run(scenario())
+    assert again == {"flow_status": "completed"}
+    assert runs == 2
+
+
+def test_zero_window_only_coalesces_running_flows():
+    async def scenario():
+        flights, flow = SingleFlight(window=0), Flow()
+        flow.release.set()
+        await flights.run("task_1", flow)
+        await flights.run("task_1", flow)
+        return flow.runs, flights.stats()["finished"]
+
+    assert run(scenario()) == (2, 0)
+
+
+def test_failed_runs_are_not_kept():
+    async def scenario():
+        flights, failing = SingleFlight(window=60), Flow(error=RuntimeError("boom"))
+        failing.release.set()
+        with pytest.raises(RuntimeError):
+            await flights.run("task_1", failing)
+        retry = Flow()
+        retry.release.set()
+        return await flights.run("task_1", retry), retry.runs
+
+    assert run(scenario()) == ({"flow_status": "completed"}, 1)
+
+
+def test_none_result_is_passed_through():
+    runs = []
+
+    async def nothing_to_resume():
+        runs.append(1)
+
+    async def scenario():
+        flights = SingleFlight(window=60)
+        return await flights.run("task_1", nothing_to_resume), await flights.run("task_1", nothing_to_resume)
+
+    assert run(scenario()) == (None, None)
+    assert len(runs) == 2
+
+
+def test_cancelled_caller_does_not_cancel_the_run():
+    async def scenario():
+        flights, flow = SingleFlight(window=60), Flow()
+        leaving = asyncio.create_task(flights.run("task_1", flow))
+        staying = asyncio.create_task(flights.run("task_1", flow))
+        await asyncio.sleep(0)
+        leaving.cancel()
+        await asyncio.gather(leaving, return_exceptions=True)
+        flow.release.set()
+        return await staying, flow.runs
+
+    assert run(scenario()) == ({"flow_status": "completed"}, 1)
+
+
+def test_oldest_finished_results_are_evicted():
+    async def scenario():
+        flights = SingleFlight(window=60, max_entries=2)
+        for key in ("task_1", "task_2", "task_3"):
+            flow = Flow()
+            flow.release.set()
+            await flights.run(key, flow)
+        return set(flights._finished)
+
+    assert run(scenario()) == {"task_2", "task_3"}
+
+
+def test_close_cancels_runs_in_flight():
+    async def scenario():
+        flights, flow = SingleFlight(window=60), Flow()
+        caller = asyncio.create_task(flights.run("task_1", flow))
+        await asyncio.sleep(0)
+        await flights.close()
+        outcome = (await asyncio.gather(caller, return_exceptions=True))[0]
+        return outcome, flights.stats()
+
+    outcome, stats = run(scenario())
+    assert isinstance(outcome, asyncio.CancelledError)
+    assert (stats["running"], stats["finished"]) == (0, 0)
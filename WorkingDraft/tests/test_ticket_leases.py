@@ -0,0 +1,179 @@
+import asyncio
+
+import pytest
+
+import ticket_leases
+from ticket_leases import LeaseManager, MemoryLeaseStore, SqliteLeaseStore, TicketLeasedError, open_lease_store
+
+
+def run(coroutine):
+    return asyncio.run(coroutine)
+
+
+@pytest.fixture(params=["sqlite", "memory"])
+def make_store(request, tmp_path):
+    """Build lease stores of one backend; sqlite ones share a file, as worker processes do."""
+    shared = MemoryLeaseStore()
+
+    def make():
+        return SqliteLeaseStore(str(tmp_path / "leases.sqlite")) if request.param == "sqlite" else shared
+
+    return make
+
+
+def with_stores(make_store, scenario, count=2):
+    async def wrapper():
+        stores = [make_store() for _ in range(count)]
+        for store in stores:
+            await store.start()
+        try:
+            return await scenario(*stores)
+        finally:
+            for store in stores:
+                await store.close()
+
+    return run(wrapper())
+
+
+def test_a_live_lease_is_exclusive_and_an_expired_one_can_be_taken_over(make_store):
+    async def scenario(first, second):
+        return [
+            await first.acquire("task_1", "a", ttl=0.2),
+            await second.acquire("task_1", "b", ttl=0.2),
+            await first.acquire("task_1", "a", ttl=0.2),
+            await asyncio.sleep(0.3),
+            await second.acquire("task_1", "b", ttl=0.2),
+        ]
+
+    acquired, busy, renewed, _, takeover = with_stores(make_store, scenario)
+    assert (acquired, busy, renewed, takeover) == ((True, False), (False, False), (True, False), (True, True))
+
+
+def test_renew_reports_only_the_leases_still_owned(make_store):
+    async def scenario(first, second):
+        await first.acquire("task_1", "a", ttl=0.2)
+        await first.acquire("task_2", "a", ttl=0.2)
+        await asyncio.sleep(0.3)
+        await second.acquire("task_2", "b", ttl=30)
+        return await first.renew(["task_1", "task_2"], "a", ttl=30), await first.expired()
+
+    kept, expired = with_stores(make_store, scenario)
+    assert kept == {"task_1"}
+    assert expired == []
+
+
+def test_release_drops_the_lease_or_leaves_it_expired(make_store):
+    async def scenario(store, _):
+        await store.acquire("task_1", "a", ttl=30)
+        await store.acquire("task_2", "a", ttl=30)
+        await store.release("task_1", "a")
+        await store.release("task_2", "a", expire_only=True)
+        await store.release("task_2", "someone else")
+        return await store.expired(), await store.acquire("task_1", "b", ttl=30)
+
+    expired, fresh = with_stores(make_store, scenario)
+    assert expired == ["task_2"]
+    assert fresh == (True, False)
+
+
+def test_unknown_backend_is_rejected():
+    with pytest.raises(ValueError):
+        open_lease_store("redis")
+
+
+def with_managers(tmp_path, scenario, count=2, **options):
+    async def wrapper():
+        managers = [LeaseManager(SqliteLeaseStore(str(tmp_path / "leases.sqlite")), owner=f"worker-{i}", **options)
+                    for i in range(count)]
+        for manager in managers:
+            await manager.start()
+        try:
+            return await scenario(*managers)
+        finally:
+            for manager in managers:
+                await manager.close()
+
+    return run(wrapper())
+
+
+def test_hold_without_wait_fails_while_another_worker_runs_the_ticket(tmp_path):
+    async def scenario(first, second):
+        async with first.hold("task_1"):
+            with pytest.raises(TicketLeasedError):
+                async with second.hold("task_1", wait=False):
+                    pass
+        async with second.hold("task_1", wait=False) as waited:
+            return waited, second.stats()
+
+    waited, stats = with_managers(tmp_path, scenario)
+    assert waited is False
+    assert (stats["acquired"], stats["busy"]) == (1, 1)
+
+
+def test_hold_waits_for_the_other_worker_to_finish(tmp_path, monkeypatch):
+    monkeypatch.setattr(ticket_leases, "LEASE_WAIT_INTERVAL", 0.01)
+
+    async def scenario(first, second):
+        release = asyncio.Event()
+
+        async def running():
+            async with first.hold("task_1"):
+                await release.wait()
+
+        task = asyncio.create_task(running())
+        await asyncio.sleep(0.05)
+
+        async def waiting():
+            async with second.hold("task_1") as waited:
+                return waited
+
+        waiter = asyncio.create_task(waiting())
+        await asyncio.sleep(0.05)
+        release.set()
+        await task
+        return await waiter
+
+    assert with_managers(tmp_path, scenario) is True
+
+
+def test_a_lost_lease_cancels_the_local_run(tmp_path):
+    async def scenario(first, second):
+        async def running():
+            async with first.hold("task_1"):
+                await asyncio.Event().wait()
+
+        task = asyncio.create_task(running())
+        await asyncio.sleep(0.05)
+        # The owner stalled past the ttl and another worker took the ticket over.
+        await first.store.release("task_1", "worker-0", expire_only=True)
+        assert await second.try_acquire("task_1")
+        outcome = (await asyncio.gather(asyncio.wait_for(task, 5), return_exceptions=True))[0]
+        return outcome, first.stats()
+
+    outcome, stats = with_managers(tmp_path, scenario, heartbeat_interval=0.05)
+    assert isinstance(outcome, asyncio.CancelledError)
+    assert stats["lost"] == 1
+
+
+def test_leases_left_expired_by_a_dead_worker_are_handed_to_on_expired(tmp_path):
+    taken_over = []
+
+    async def on_expired(thread_id):
+        taken_over.append(thread_id)
+
+    async def scenario():
+        dead = SqliteLeaseStore(str(tmp_path / "leases.sqlite"))
+        await dead.start()
+        await dead.acquire("task_1", "dead-worker", ttl=0.1)
+        await dead.close()
+        manager = LeaseManager(SqliteLeaseStore(str(tmp_path / "leases.sqlite")), heartbeat_interval=0.05,
+                               on_expired=on_expired)
+        await manager.start()
+        try:
+            while not taken_over:
+                await asyncio.sleep(0.01)
+        finally:
+            await manager.close()
+
+    run(asyncio.wait_for(scenario(), 5))
+    assert taken_over[0] == "task_1"
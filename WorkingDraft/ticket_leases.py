@@ -0,0 +1,330 @@
+import os
+import time
+import uuid
+import socket
+import asyncio
+import logging
+from contextlib import asynccontextmanager
+
+import aiosqlite
+
+import metrics
+
+# -----------------------------------------------------------------------
+# Lease Configuration
+# -----------------------------------------------------------------------
+# sqlite: a ticket_leases table shared by every worker process on the host
+# (in the checkpoint database unless LEASE_DB_PATH says otherwise);
+# memory: single-process only.
+LEASE_BACKEND = os.getenv("LEASE_BACKEND", "sqlite").lower()
+LEASE_DB_PATH = os.getenv("LEASE_DB_PATH") or os.getenv("DATABASE_PATH") or "state_db/ticket_leases.sqlite"
+# A lease not renewed for this many seconds may be taken over by another process.
+LEASE_TTL = float(os.getenv("LEASE_TTL", "30"))
+# How often held leases are renewed and expired leases are looked for.
+LEASE_HEARTBEAT_INTERVAL = float(os.getenv("LEASE_HEARTBEAT_INTERVAL", str(LEASE_TTL / 3)))
+# A submission for a ticket another process owns waits for it this long (seconds).
+LEASE_WAIT_TIMEOUT = float(os.getenv("LEASE_WAIT_TIMEOUT", "3600"))
+LEASE_WAIT_INTERVAL = float(os.getenv("LEASE_WAIT_INTERVAL", "1"))
+
+LEASE_BACKENDS = ("sqlite", "memory")
+
+lease_acquisitions_total = metrics.counter(
+    "ticket_lease_acquisitions_total", "Ticket lease requests by result (acquired, takeover, busy).", ("result",)
+)
+leases_lost_total = metrics.counter(
+    "ticket_leases_lost_total", "Leases found owned by another process at renewal; their flow runs were cancelled."
+)
+leases_held_gauge = metrics.gauge(
+    "ticket_leases_held", "Ticket leases held by this process."
+)
+
+
+class TicketLeasedError(Exception):
+    """Raised when a ticket is owned by another process and could not be leased."""
+
+
+def make_owner_id() -> str:
+    """Identifies this process in the lease table, e.g. "host:1234:1a2b3c4d"."""
+    return f"{socket.gethostname()}:{os.getpid()}:{uuid.uuid4().hex[:8]}"
+
+
+class SqliteLeaseStore:
+    """
+    ticket_leases table: one row per leased thread_id with its owner and expiry.
+
+    Acquisition is a single conditional upsert that only replaces a row that
+    has expired or is already ours, so two processes can never both win.
+    """
+
+    def __init__(self, path: str = LEASE_DB_PATH):
+        self.path = path
+        self._conn = None
+
+    async def start(self):
+        directory = os.path.dirname(self.path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        self._conn = await aiosqlite.connect(self.path)
+        await self._conn.executescript(
+            """
+            PRAGMA journal_mode=WAL;
+            PRAGMA busy_timeout=5000;
+            CREATE TABLE IF NOT EXISTS ticket_leases (
+                thread_id TEXT PRIMARY KEY,
+                owner TEXT NOT NULL,
+                expires_at REAL NOT NULL,
+                acquired_at REAL NOT NULL
+            );
+            CREATE INDEX IF NOT EXISTS ticket_leases_expires ON ticket_leases (expires_at);
+            """
+        )
+
+    async def acquire(self, thread_id: str, owner: str, ttl: float):
+        """Return (acquired, took_over): took_over when an expired lease of another owner was replaced."""
+        now = time.time()
+        async with self._conn.execute(
+            "SELECT owner FROM ticket_leases WHERE thread_id = ?", (thread_id,)
+        ) as cursor:
+            row = await cursor.fetchone()
+        cursor = await self._conn.execute(
+            "INSERT INTO ticket_leases (thread_id, owner, expires_at, acquired_at) VALUES (?, ?, ?, ?) "
+            "ON CONFLICT(thread_id) DO UPDATE SET owner = excluded.owner, expires_at = excluded.expires_at, "
+            "acquired_at = excluded.acquired_at "
+            "WHERE ticket_leases.expires_at < ? OR ticket_leases.owner = excluded.owner",
+            (thread_id, owner, now + ttl, now, now),
+        )
+        acquired = cursor.rowcount == 1
+        await self._conn.commit()
+        return acquired, acquired and row is not None and row[0] != owner
+
+    async def renew(self, thread_ids: list, owner: str, ttl: float) -> set:
+        """Extend our leases on `thread_ids` and return the ones we still own."""
+        if not thread_ids:
+            return set()
+        marks = ",".join("?" * len(thread_ids))
+        await self._conn.execute(
+            f"UPDATE ticket_leases SET expires_at = ? WHERE owner = ? AND thread_id IN ({marks})",
+            (time.time() + ttl, owner, *thread_ids),
+        )
+        await self._conn.commit()
+        async with self._conn.execute(
+            f"SELECT thread_id FROM ticket_leases WHERE owner = ? AND thread_id IN ({marks})", (owner, *thread_ids)
+        ) as cursor:
+            return {row[0] for row in await cursor.fetchall()}
+
+    async def release(self, thread_id: str, owner: str, expire_only: bool = False):
+        """Drop our lease, or with `expire_only` leave it expired so another process takes the ticket over."""
+        if expire_only:
+            await self._conn.execute(
+                "UPDATE ticket_leases SET expires_at = 0 WHERE thread_id = ? AND owner = ?", (thread_id, owner)
+            )
+        else:
+            await self._conn.execute("DELETE FROM ticket_leases WHERE thread_id = ? AND owner = ?", (thread_id, owner))
+        await self._conn.commit()
+
+    async def expired(self) -> list:
+        async with self._conn.execute(
+            "SELECT thread_id FROM ticket_leases WHERE expires_at < ? ORDER BY expires_at", (time.time(),)
+        ) as cursor:
+            return [row[0] for row in await cursor.fetchall()]
+
+    async def close(self):
+        if self._conn is not None:
+            await self._conn.close()
+            self._conn = None
+
+
+class MemoryLeaseStore:
+    """Same interface as SqliteLeaseStore, for a single process (dev, benchmarks)."""
+
+    def __init__(self):
+        self._leases = {}
+
+    async def start(self):
+        pass
+
+    async def acquire(self, thread_id: str, owner: str, ttl: float):
+        now = time.time()
+        current = self._leases.get(thread_id)
+        if current is not None and current[0] != owner and current[1] >= now:
+            return False, False
+        self._leases[thread_id] = (owner, now + ttl)
+        return True, current is not None and current[0] != owner
+
+    async def renew(self, thread_ids: list, owner: str, ttl: float) -> set:
+        kept = {thread_id for thread_id in thread_ids if self._leases.get(thread_id, (None,))[0] == owner}
+        for thread_id in kept:
+            self._leases[thread_id] = (owner, time.time() + ttl)
+        return kept
+
+    async def release(self, thread_id: str, owner: str, expire_only: bool = False):
+        if self._leases.get(thread_id, (None,))[0] == owner:
+            if expire_only:
+                self._leases[thread_id] = (owner, 0)
+            else:
+                del self._leases[thread_id]
+
+    async def expired(self) -> list:
+        now = time.time()
+        return [thread_id for thread_id, (_, expires_at) in self._leases.items() if expires_at < now]
+
+    async def close(self):
+        self._leases.clear()
+
+
+def open_lease_store(backend: str = LEASE_BACKEND, path: str = LEASE_DB_PATH):
+    if backend == "sqlite":
+        return SqliteLeaseStore(path)
+    if backend == "memory":
+        return MemoryLeaseStore()
+    raise ValueError(f"Unknown LEASE_BACKEND '{backend}', expected one of {', '.join(LEASE_BACKENDS)}")
+
+
+class LeaseManager:
+    """
+    Grants this process exclusive ownership of a ticket's thread_id while it
+    runs the flow, so several worker processes can share one checkpoint store.
+
+    Held leases are renewed every LEASE_HEARTBEAT_INTERVAL. A lease found to
+    belong to someone else at renewal (this process stalled past LEASE_TTL
+    and the ticket was taken over) cancels the local run. Expired leases
+    left by a crashed process are handed to `on_expired(thread_id)`, which
+    resumes the flow here.
+    """
+
+    def __init__(self, store, owner: str = None, ttl: float = LEASE_TTL,
+                 heartbeat_interval: float = LEASE_HEARTBEAT_INTERVAL, on_expired=None):
+        self.store = store
+        self.owner = owner or make_owner_id()
+        self.ttl = ttl
+        self.heartbeat_interval = heartbeat_interval
+        self.on_expired = on_expired
+        self._held = {}
+        self._task = None
+        self._takeovers = {}
+        self._counts = {"acquired": 0, "takeovers": 0, "busy": 0, "lost": 0, "waits": 0}
+
+    async def start(self):
+        await self.store.start()
+        self._task = asyncio.create_task(self._heartbeat())
+
+    async def try_acquire(self, thread_id: str) -> bool:
+        acquired, took_over = await self.store.acquire(thread_id, self.owner, self.ttl)
+        if not acquired:
+            self._counts["busy"] += 1
+            lease_acquisitions_total.inc(result="busy")
+            return False
+        result = "takeover" if took_over else "acquired"
+        self._counts["takeovers" if took_over else "acquired"] += 1
+        lease_acquisitions_total.inc(result=result)
+        if took_over:
+            logging.info(f"Took over the expired lease on {thread_id}.")
+        return True
+
+    @asynccontextmanager
+    async def hold(self, thread_id: str, wait: bool = True, timeout: float = LEASE_WAIT_TIMEOUT):
+        """
+        Own `thread_id` for the duration of the block; yields True when the
+        lease had to be waited for (another process was running the ticket).
+        Without `wait`, or after `timeout` seconds, raises TicketLeasedError.
+        """
+        waited = False
+        give_up = time.monotonic() + timeout
+        while not await self.try_acquire(thread_id):
+            if not wait or time.monotonic() >= give_up:
+                raise TicketLeasedError(f"{thread_id} is being processed by another worker.")
+            if not waited:
+                waited = True
+                self._counts["waits"] += 1
+            await asyncio.sleep(LEASE_WAIT_INTERVAL)
+        self._held[thread_id] = asyncio.current_task()
+        leases_held_gauge.set(len(self._held))
+        cancelled = False
+        try:
+            yield waited
+        except asyncio.CancelledError:
+            cancelled = True
+            raise
+        finally:
+            self._held.pop(thread_id, None)
+            leases_held_gauge.set(len(self._held))
+            # A run cancelled at shutdown leaves its lease expired, so another
+            # worker picks the ticket up instead of waiting for LEASE_TTL.
+            await asyncio.shield(self.store.release(thread_id, self.owner, expire_only=cancelled))
+
+    async def _heartbeat(self):
+        while True:
+            await asyncio.sleep(self.heartbeat_interval)
+            try:
+                await self._renew()
+                if self.on_expired is not None:
+                    await self._take_over_expired()
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                logging.error(f"Ticket lease heartbeat failed: {e}")
+
+    async def _renew(self):
+        held = dict(self._held)
+        kept = await self.store.renew(list(held), self.owner, self.ttl)
+        for thread_id, task in held.items():
+            if thread_id not in kept and self._held.get(thread_id) is task:
+                logging.error(f"Lost the lease on {thread_id} to another worker; cancelling the local run.")
+                self._counts["lost"] += 1
+                leases_lost_total.inc()
+                self._held.pop(thread_id, None)
+                if task is not None:
+                    task.cancel()
+
+    async def _take_over_expired(self):
+        for thread_id in await self.store.expired():
+            if thread_id in self._held or thread_id in self._takeovers:
+                continue
+            task = asyncio.ensure_future(self.on_expired(thread_id))
+            self._takeovers[thread_id] = task
+            task.add_done_callback(lambda done, thread_id=thread_id: self._takeovers.pop(thread_id, None))
+
+    def stats(self) -> dict:
+        return {**self._counts, "owner": self.owner, "held": len(self._held), "ttl": self.ttl}
+
+    async def close(self):
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+        takeovers = list(self._takeovers.values())
+        for task in takeovers:
+            task.cancel()
+        if takeovers:
+            await asyncio.gather(*takeovers, return_exceptions=True)
+        await self.store.close()
+
+
+_leases = None
+_leases_lock = asyncio.Lock()
+
+
+async def get_lease_manager() -> LeaseManager:
+    """Return the process-wide lease manager, opening its store on first use."""
+    global _leases
+    if _leases is None:
+        async with _leases_lock:
+            if _leases is None:
+                leases = LeaseManager(open_lease_store())
+                await leases.start()
+                _leases = leases
+    return _leases
+
+
+def lease_stats():
+    return _leases.stats() if _leases is not None else None
+
+
+async def close_lease_manager():
+    global _leases
+    if _leases is not None:
+        await _leases.close()
+        _leases = None
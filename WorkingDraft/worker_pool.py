@@ -0,0 +1,228 @@
+import json
+import time
+import asyncio
+import logging
+
+from script_scheduler import process_group_options, kill_process_tree
+
+# Job output travels back as a single JSON line, so allow long lines.
+STREAM_LIMIT = 64 * 1024 * 1024
+
+
+class HostWorkerError(Exception):
+    """Raised when a pool host dies or answers with something unreadable."""
+
+
+class HostWorker:
+    """
+    A single long-lived host process: it answers a handshake and then every
+    job line written to its stdin with one `marker`-prefixed JSON line on
+    stdout. Subclasses provide the command line and the job encoding.
+    """
+
+    label = "Host"
+    marker = b""
+    error = HostWorkerError
+
+    def __init__(self, executable: str, start_timeout: float):
+        self.executable = executable
+        self.start_timeout = start_timeout
+        self.process = None
+        self.jobs = 0
+
+    def command(self) -> list:
+        raise NotImplementedError
+
+    @property
+    def alive(self) -> bool:
+        return self.process is not None and self.process.returncode is None
+
+    async def start(self):
+        self.process = await asyncio.create_subprocess_exec(
+            *self.command(),
+            stdin=asyncio.subprocess.PIPE,
+            stdout=asyncio.subprocess.PIPE,
+            stderr=asyncio.subprocess.DEVNULL,
+            limit=STREAM_LIMIT,
+            **process_group_options(),
+        )
+        try:
+            ready = await asyncio.wait_for(self._read_response(), self.start_timeout)
+        except Exception:
+            await self.kill()
+            raise
+        if not ready.get("Ready"):
+            await self.kill()
+            raise self.error(f"Unexpected {self.label} host handshake: {ready}")
+        logging.debug(f"{self.label} worker started (pid={self.process.pid}).")
+
+    async def _read_response(self) -> dict:
+        while True:
+            line = await self.process.stdout.readline()
+            if not line:
+                raise self.error(f"{self.label} worker exited unexpectedly.")
+            line = line.strip()
+            if not line.startswith(self.marker):
+                continue
+            try:
+                return json.loads(line[len(self.marker):].decode("utf-8"))
+            except (UnicodeDecodeError, json.JSONDecodeError) as e:
+                raise self.error(f"Unreadable {self.label} worker response: {e}")
+
+    async def request(self, job: bytes) -> dict:
+        """Send one encoded job line to the host and wait for its reply."""
+        self.jobs += 1
+        try:
+            self.process.stdin.write(job + b"\n")
+            await self.process.stdin.drain()
+        except (BrokenPipeError, ConnectionResetError) as e:
+            raise self.error(f"{self.label} worker is not accepting jobs: {e}")
+        return await self._read_response()
+
+    async def kill(self):
+        """Kill the host and anything the running job started; used when a job times out or is abandoned."""
+        if self.process is None:
+            return
+        await kill_process_tree(self.process)
+        await self.process.wait()
+        self.process = None
+
+    async def close(self):
+        if self.process is None:
+            return
+        if self.process.returncode is None:
+            try:
+                self.process.stdin.close()
+                await asyncio.wait_for(self.process.wait(), 5)
+            except Exception:
+                await kill_process_tree(self.process)
+                await self.process.wait()
+        self.process = None
+
+
+class HostPool:
+    """
+    Fixed-size pool of warm host workers.
+
+    The idle queue always holds `size` slots; a slot is either a running worker
+    or None, in which case a fresh worker is started when the slot is checked
+    out. Workers are recycled after `max_jobs` jobs, as soon as they crash, and
+    when their job times out or is cancelled. Subclasses create the workers
+    and set the metrics the pool reports to.
+    """
+
+    label = "Host"
+    # Makes the OutputMessage of the Timeout / Error results the pool itself produces
+    empty_output = str
+    wait_seconds = None
+    jobs_total = None
+    recycles_total = None
+
+    def __init__(self, size: int, max_jobs: int):
+        self.size = max(1, size)
+        self.max_jobs = max_jobs
+        self._idle = asyncio.Queue()
+        self._busy = 0
+        self._waiting = 0
+        self._closed = False
+        self._closing = set()
+        for _ in range(self.size):
+            self._idle.put_nowait(None)
+
+    def _new_worker(self) -> HostWorker:
+        raise NotImplementedError
+
+    async def start(self):
+        """Pre-warm every slot so the first actions do not pay the startup cost."""
+        slots = [self._idle.get_nowait() for _ in range(self._idle.qsize())]
+        started = await asyncio.gather(*(self._spawn() for _ in slots), return_exceptions=True)
+        for worker in started:
+            if isinstance(worker, Exception):
+                logging.error(f"Failed to pre-warm {self.label} worker: {worker}")
+                worker = None
+            self._idle.put_nowait(worker)
+
+    async def _spawn(self) -> HostWorker:
+        worker = self._new_worker()
+        await worker.start()
+        return worker
+
+    async def _run_job(self, call, timeout: float = None) -> dict:
+        """
+        Run `call(worker)` on a free worker. A job still running after
+        `timeout` seconds (waiting for a worker excluded) gets Status "Timeout";
+        its host is killed together with any processes the job started, and
+        the slot is refilled with a fresh worker.
+        """
+        wait_start = time.perf_counter()
+        self._waiting += 1
+        try:
+            worker = await self._idle.get()
+        finally:
+            self._waiting -= 1
+        self.wait_seconds.observe(time.perf_counter() - wait_start)
+        self._busy += 1
+        completed = False
+        try:
+            if worker is None or not worker.alive:
+                worker = await self._spawn()
+            try:
+                result = await asyncio.wait_for(call(worker), timeout or None)
+            except asyncio.TimeoutError:
+                logging.error(f"{self.label} job exceeded its {timeout:.1f}s timeout; killing worker pid {worker.process.pid}.")
+                await worker.kill()
+                self.jobs_total.inc(status="Timeout")
+                self.recycles_total.inc(reason="timeout")
+                return {"Status": "Timeout", "OutputMessage": self.empty_output(),
+                        "ErrorMessage": f"Script timed out after {timeout:.1f} seconds"}
+            except asyncio.CancelledError:
+                await worker.kill()
+                raise
+            completed = True
+            self.jobs_total.inc(status=result["Status"])
+            return result
+        except (HostWorkerError, OSError, asyncio.TimeoutError) as e:
+            logging.error(f"{self.label} worker failed: {e}")
+            self.jobs_total.inc(status="Crashed")
+            return {"Status": "Error", "OutputMessage": self.empty_output(), "ErrorMessage": str(e)}
+        finally:
+            self._busy -= 1
+            self._idle.put_nowait(self._release(worker, completed))
+
+    def _release(self, worker, completed: bool):
+        """Return the slot to hand back to the idle queue, retiring the worker if needed."""
+        if worker is None or worker.process is None:
+            # Empty slot, or a worker already killed after a timeout or cancellation
+            return None
+        reason = None
+        if self._closed:
+            reason = "shutdown"
+        elif not completed or not worker.alive:
+            # A crashed or interrupted host may still have a reply in flight.
+            reason = "crash"
+        elif worker.jobs >= self.max_jobs:
+            reason = "max_jobs"
+        if reason is None:
+            return worker
+        self.recycles_total.inc(reason=reason)
+        task = asyncio.ensure_future(worker.close() if reason != "crash" else worker.kill())
+        self._closing.add(task)
+        task.add_done_callback(self._closing.discard)
+        return None
+
+    def stats(self) -> dict:
+        return {
+            "size": self.size,
+            "busy": self._busy,
+            "idle": self._idle.qsize(),
+            "waiting": self._waiting,
+        }
+
+    async def close(self):
+        self._closed = True
+        while not self._idle.empty():
+            worker = self._idle.get_nowait()
+            if worker is not None:
+                await worker.close()
+        if self._closing:
+            await asyncio.gather(*self._closing, return_exceptions=True)
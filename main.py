@@ -213,8 +213,11 @@
 
 
 import os
+import sys
 import json
+import signal
 import logging
+import subprocess
 import yaml
 import asyncio
 import shlex
@@ -237,6 +240,9 @@ try:
 except Exception as e:
     logging.error(f"Failed to load script mappings: {e}")
 
+# Seconds a script may run before it and its child processes are killed (0 disables).
+SCRIPT_TIMEOUT = float(os.getenv("SCRIPT_TIMEOUT", "600"))
+
 # -----------------------------------------------------------------------------
 # Command Formatting Function
 # -----------------------------------------------------------------------------
@@ -263,13 +269,38 @@ def format_command(interpreter_template: str, script_path: str, args: List[str],
         command = f"{command} {formatted_args}"
     return command
 
+# -----------------------------------------------------------------------------
+# Process Tree Kill
+# -----------------------------------------------------------------------------
+async def kill_process_tree(process) -> None:
+    """
+    Kills the shell and everything it started. The shell runs in its own
+    process group (session on POSIX), so the interpreter it launched goes too.
+    """
+    if process.returncode is not None:
+        return
+    try:
+        if sys.platform == "win32":
+            killer = await asyncio.create_subprocess_exec("taskkill", "/F", "/T", "/PID", str(process.pid))
+            await killer.wait()
+        else:
+            os.killpg(process.pid, signal.SIGKILL)
+    except OSError as e:
+        logging.error(f"Failed to kill process tree {process.pid}: {e}")
+    try:
+        process.kill()
+    except ProcessLookupError:
+        pass
+
 # -----------------------------------------------------------------------------
 # Script Runner
 # -----------------------------------------------------------------------------
-async def run_script(script_path: str, config_file_path: str) -> Dict[str, str]:
+async def run_script(script_path: str, config_file_path: str, timeout: float = SCRIPT_TIMEOUT) -> Dict[str, str]:
     """
     Runs a script based on its file extension using the appropriate interpreter.
     Returns a dictionary with keys: Status, OutputMessage, and ErrorMessage.
+    A script still running after `timeout` seconds is killed with its whole
+    process tree and reported with Status "Timeout".
     """
     logging.debug(f"Running script: {script_path} with config file: {config_file_path}")
     ext = os.path.splitext(script_path)[1].lower()
@@ -290,12 +321,23 @@ async def run_script(script_path: str, config_file_path: str) -> Dict[str, str]:
     logging.debug(f"Executing command: {command}")
 
     try:
+        if sys.platform == "win32":
+            group = {"creationflags": subprocess.CREATE_NEW_PROCESS_GROUP}
+        else:
+            group = {"start_new_session": True}
         process = await asyncio.create_subprocess_shell(
             command,
             stdout=asyncio.subprocess.PIPE,
-            stderr=asyncio.subprocess.PIPE
+            stderr=asyncio.subprocess.PIPE,
+            **group
         )
-        stdout, stderr = await process.communicate()
+        try:
+            stdout, stderr = await asyncio.wait_for(process.communicate(), timeout or None)
+        except asyncio.TimeoutError:
+            logging.error(f"Script timed out after {timeout:.1f} seconds: {script_path}")
+            await kill_process_tree(process)
+            await process.wait()
+            return {"Status": "Timeout", "OutputMessage": "", "ErrorMessage": f"Script timed out after {timeout:.1f} seconds"}
         stdout_decoded = stdout.decode().strip() if stdout else ""
         stderr_decoded = stderr.decode().strip() if stderr else ""
 
@@ -348,7 +390,7 @@ async def execute_flow_script(state: Dict[str, Any]) -> Dict[str, Any]:
                 "OutputMessage": result.get("OutputMessage", ""),
                 "ErrorMessage": result.get("ErrorMessage", "")
             })
-            if result.get("Status") == "Error":
+            if result.get("Status") in ("Error", "Timeout"):
                 logging.error(f"Error executing {action_name}: {result.get('ErrorMessage')}")
                 state["worknote_content"] = f"Error in {action_name}: {result.get('ErrorMessage')}"
                 state["error_occurred"] = True